@@ -40,6 +40,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # <--- WhiteNoise gere o CSS na nuvem
+    'logistica.middleware.MetricasMiddleware', # Só mede se METRICAS_ATIVAS=True
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -74,14 +75,20 @@ WSGI_APPLICATION = 'core_rotas.wsgi.application'
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
 if DATABASE_URL:
-    # Se encontrou a URL (Railway), liga-se ao PostgreSQL profissional
+    # Se encontrou a URL (Railway), liga-se ao PostgreSQL profissional.
+    # Em ASGI cada pedido usa threads diferentes, por isso as ligações persistentes
+    # (por thread) ficariam órfãs: usamos o pool do psycopg 3, partilhado pelo
+    # processo, que também serve as queries em paralelo do dashboard e do cockpit.
     DATABASES = {
         'default': dj_database_url.config(
             default=DATABASE_URL,
-            conn_max_age=600,
-            conn_health_checks=True,
+            conn_max_age=0,
         )
     }
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN', '2')),
+        'max_size': int(os.environ.get('DB_POOL_MAX', '10')),
+    }
 else:
     # Se não encontrou (Seu PC), usa o ficheiro SQLite local
     DATABASES = {
@@ -91,6 +98,87 @@ else:
         }
     }
 
+# ==============================================================================
+# CACHE (LISTAS DE REFERÊNCIA)
+# ==============================================================================
+# Em ficheiros e não em memória: assim todos os workers do gunicorn partilham
+# o mesmo cache e a invalidação feita por um deles vale para os outros. Fica numa
+# pasta do projeto (criada só com permissões do dono) e não na pasta temporária
+# do sistema, que outros utilizadores da máquina podem ler ou preparar.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, 'var', 'cache')),
+    }
+}
+
+# ==============================================================================
+# MÉTRICAS DE DESEMPENHO (OPT-IN)
+# ==============================================================================
+# Tempos por view (p50/p95/p99) em /dashboard/metricas/. O ficheiro SQLite é
+# partilhado pelos workers do gunicorn e fica em var/, como o cache (não na pasta
+# temporária do sistema); pedidos acima do limite vão para o log com o SQL.
+METRICAS_ATIVAS = os.environ.get('METRICAS_ATIVAS', 'False') == 'True'
+METRICAS_ARQUIVO = os.environ.get('METRICAS_ARQUIVO', os.path.join(BASE_DIR, 'var', 'metricas.sqlite3'))
+METRICAS_LIMITE_LENTO_MS = int(os.environ.get('METRICAS_LIMITE_LENTO_MS', '1000'))
+
+# ==============================================================================
+# VIEWS ASSÍNCRONAS (ASGI)
+# ==============================================================================
+# Produção corre core_rotas.asgi com workers uvicorn (Procfile). O dashboard e o
+# cockpit lançam as suas queries independentes em paralelo, cada uma na sua
+# ligação; False volta a corrê-las em sequência (comparação/depuração).
+CONSULTAS_CONCORRENTES = os.environ.get('CONSULTAS_CONCORRENTES', 'True') == 'True'
+
+# Pub/sub dos eventos da lista do motoqueiro (SSE). Em memória só chega aos
+# pedidos do mesmo processo; com PostgreSQL passa pelo LISTEN/NOTIFY do banco
+# e chega a todos os workers.
+EVENTOS_BACKEND = os.environ.get(
+    'EVENTOS_BACKEND',
+    'logistica.eventos.PostgresNotify' if DATABASE_URL else 'logistica.eventos.MemoriaLocal',
+)
+
+# ==============================================================================
+# ROTEIRIZAÇÃO
+# ==============================================================================
+# Ponto de partida das rotas antes do primeiro check-in (ex: "-3.7319,-38.5267", o depósito).
+# Vazio: o percurso começa pelo cliente mais periférico.
+_origem_rotas = os.environ.get('ROTEIRIZACAO_ORIGEM', '')
+ROTEIRIZACAO_ORIGEM = tuple(float(v) for v in _origem_rotas.split(',')) if _origem_rotas else None
+
+# ==============================================================================
+# GEOCODIFICAÇÃO
+# ==============================================================================
+# Backend que dá coordenadas aos clientes sem GPS (logistica/geocodificacao.py).
+# O padrão lê um gazetteer local (centros de ruas e bairros, sem rede); sem o
+# ficheiro usa os clientes com GPS do próprio banco (manage.py gerar_gazetteer).
+GEOCODIFICACAO_BACKEND = os.environ.get('GEOCODIFICACAO_BACKEND', 'logistica.geocodificacao.GazetteerLocal')
+GEOCODIFICACAO_GAZETTEER = os.environ.get('GEOCODIFICACAO_GAZETTEER', os.path.join(BASE_DIR, 'dados', 'gazetteer.csv'))
+
+# ==============================================================================
+# TELEFONES E IDENTIFICAÇÃO DE CHAMADAS
+# ==============================================================================
+# DDD assumido nos telefones cadastrados sem ele (Fortaleza). A central telefónica
+# consulta /api/chamadas/identificar/ com o cabeçalho X-Chave-Central; vazio, só
+# os utilizadores com sessão iniciada (staff) podem consultar.
+TELEFONE_DDD_PADRAO = os.environ.get('TELEFONE_DDD_PADRAO', '85')
+CENTRAL_TELEFONICA_CHAVE = os.environ.get('CENTRAL_TELEFONICA_CHAVE', '')
+
+# ==============================================================================
+# PREVISÃO DE PROCURA
+# ==============================================================================
+# Clientes por dia na lista proposta a cada motoqueiro pelo comando noturno
+# prever_procura (logistica/previsao.py).
+PREVISAO_CAPACIDADE_MOTOQUEIRO = int(os.environ.get('PREVISAO_CAPACIDADE_MOTOQUEIRO', '40'))
+
+# ==============================================================================
+# FICHEIROS ENVIADOS (IMPORTAÇÕES EM SEGUNDO PLANO)
+# ==============================================================================
+# Os CSV enviados ficam aqui até o worker (processar_tarefas) os importar. Não são
+# servidos pela web. A web e o worker têm de ver a mesma pasta (um volume partilhado)
+# ou, em serviços separados, um storage remoto configurado em STORAGES['default'].
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', os.path.join(BASE_DIR, 'var', 'media'))
+
 # ==============================================================================
 # VALIDAÇÃO DE SENHAS
 # ==============================================================================
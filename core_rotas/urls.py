@@ -5,14 +5,36 @@ from django.urls import path, include
 from logistica.views import (
     home, 
     registrar_visita, 
+    sincronizar_visitas,
+    sincronizar_baixas,
+    eventos_motoqueiro,
+    cartao_visita,
     dash_comercial, 
+    dash_comercial_proximos,
     registrar_ligacao,
     dashboard, 
+    dashboard_historico,
+    estatisticas_cache,
+    precos_concorrencia,
+    metricas_desempenho,
     relatorio_auditoria, 
+    auditoria_ligacoes,
+    auditoria_visitas,
+    auditoria_visita_detalhe,
+    exportar_ligacoes,
+    exportar_visitas,
     distribuir_rotas, 
     gerenciar_carteiras, 
     detalhes_carteira,
+    carteira_membros,
+    carteira_clientes_livres,
     cadastrar_cliente,
+    buscar_clientes,
+    duplicados_clientes,
+    identificar_chamada,
+    tarefas_recentes,
+    tarefa_detalhe,
+    tarefa_estado,
     detalhes_cliente # <--- NOVA IMPORTAÇÃO DO CRM AQUI
 )
 
@@ -28,19 +50,41 @@ urlpatterns = [
 
     # --- MÓDULO OPERACIONAL (MOTOQUEIRO) ---
     path('visita/<int:id_visita>/', registrar_visita, name='registrar_visita'),
+    path('api/sincronizar/visitas/', sincronizar_visitas, name='sincronizar_visitas'),
+    path('api/sincronizar/baixas/', sincronizar_baixas, name='sincronizar_baixas'),
+    path('motoqueiro/eventos/', eventos_motoqueiro, name='eventos_motoqueiro'),
+    path('visita/<int:id_visita>/cartao/', cartao_visita, name='cartao_visita'),
     
     # --- MÓDULO COMERCIAL (ESTAGIÁRIO) ---
     path('comercial/', dash_comercial, name='dash_comercial'),
+    path('comercial/proximos/', dash_comercial_proximos, name='dash_comercial_proximos'),
     path('comercial/ligar/<int:cliente_id>/', registrar_ligacao, name='registrar_ligacao'),
     
     # --- MÓDULO GERENCIAL (DONO/GERENTE) ---
     path('dashboard/', dashboard, name='dashboard'),
+    path('dashboard/historico/', dashboard_historico, name='dashboard_historico'),
+    path('dashboard/cache/', estatisticas_cache, name='estatisticas_cache'),
+    path('dashboard/concorrencia/precos/', precos_concorrencia, name='precos_concorrencia'),
+    path('dashboard/metricas/', metricas_desempenho, name='metricas_desempenho'),
     path('auditoria/', relatorio_auditoria, name='relatorio_auditoria'),
+    path('auditoria/ligacoes/', auditoria_ligacoes, name='auditoria_ligacoes'),
+    path('auditoria/visitas/', auditoria_visitas, name='auditoria_visitas'),
+    path('auditoria/visitas/<int:id_visita>/', auditoria_visita_detalhe, name='auditoria_visita_detalhe'),
+    path('auditoria/exportar/ligacoes/', exportar_ligacoes, name='exportar_ligacoes'),
+    path('auditoria/exportar/visitas/', exportar_visitas, name='exportar_visitas'),
     path('planejamento/', distribuir_rotas, name='distribuir_rotas'),
+    path('tarefas/', tarefas_recentes, name='tarefas_recentes'),
+    path('tarefas/<int:id_tarefa>/', tarefa_detalhe, name='tarefa_detalhe'),
+    path('tarefas/<int:id_tarefa>/estado/', tarefa_estado, name='tarefa_estado'),
     
     # --- CADASTROS E GESTÃO DE CARTEIRAS ---
     path('cliente/novo/', cadastrar_cliente, name='cadastrar_cliente'),
+    path('cliente/busca/', buscar_clientes, name='buscar_clientes'),
+    path('clientes/duplicados/', duplicados_clientes, name='duplicados_clientes'),
+    path('api/chamadas/identificar/', identificar_chamada, name='identificar_chamada'),
     path('cliente/<int:id_cliente>/', detalhes_cliente, name='detalhes_cliente'), # <--- NOVA ROTA DO CRM AQUI
     path('carteiras/', gerenciar_carteiras, name='gerenciar_carteiras'),
     path('carteiras/<int:id_carteira>/', detalhes_carteira, name='detalhes_carteira'),
+    path('carteiras/<int:id_carteira>/membros/', carteira_membros, name='carteira_membros'),
+    path('carteiras/<int:id_carteira>/livres/', carteira_clientes_livres, name='carteira_clientes_livres'),
 ]
\ No newline at end of file
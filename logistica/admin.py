@@ -1,4 +1,5 @@
 from django.contrib import admin
+from . import busca
 from .models import Cliente, Rota, Visita
 
 # Configuração opcional para deixar a lista mais bonita
@@ -6,6 +7,12 @@ class ClienteAdmin(admin.ModelAdmin):
     list_display = ('nome', 'telefone', 'divida_atual')
     search_fields = ('nome',)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Pelos trigramas e colunas normalizadas (logistica/busca.py) em vez de LIKE '%termo%' na tabela inteira
+        if not search_term.strip():
+            return queryset, False
+        return busca.filtrar(queryset, search_term, limite_candidatos=None), False
+
 class RotaAdmin(admin.ModelAdmin):
     list_display = ('nome', 'motoqueiro', 'data_criacao')
     list_filter = ('motoqueiro',)
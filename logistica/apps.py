@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class LogisticaConfig(AppConfig):
     name = 'logistica'
+
+    def ready(self):
+        # Liga os sinais que invalidam as listas de referência em cache
+        from . import signals  # noqa: F401
@@ -0,0 +1,62 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.shortcuts import render
+
+# ==============================================================================
+# CONSULTAS EM PARALELO NAS VIEWS ASSÍNCRONAS
+# ==============================================================================
+# O ORM do Django é síncrono: numa view async cada query vai para a mesma thread
+# (sync_to_async com thread_sensitive=True), uma atrás da outra. Para as queries
+# independentes de um painel correrem ao mesmo tempo, cada uma vai para uma
+# thread própria do executor, com a sua própria ligação ao banco (as ligações
+# do Django são por thread). O tempo da página passa a ser o da query mais
+# lenta em vez da soma de todas — ganho real contra um PostgreSQL remoto, onde
+# cada query espera pela rede. Com CONSULTAS_CONCORRENTES=False as mesmas
+# funções correm em sequência (útil para comparar e para depurar).
+
+
+def _isolada(funcao):
+    """Corre a função numa thread do executor, descartando ligações expiradas antes e depois."""
+    def executar():
+        close_old_connections()
+        try:
+            return funcao()
+        finally:
+            # Com CONN_MAX_AGE=0 (SQLite local) fecha a ligação; com ligações persistentes
+            # (PostgreSQL) fica aberta para a próxima tarefa desta thread
+            close_old_connections()
+    return executar
+
+
+async def em_paralelo(*funcoes):
+    """Executa funções síncronas independentes (queries) ao mesmo tempo e devolve os resultados pela ordem."""
+    if not getattr(settings, 'CONSULTAS_CONCORRENTES', True):
+        return await sync_to_async(lambda: [funcao() for funcao in funcoes])()
+    return await asyncio.gather(*(sync_to_async(_isolada(funcao), thread_sensitive=False)() for funcao in funcoes))
+
+
+async def iterar_em_thread(iteravel):
+    """
+    Consome um iterador síncrono (ex: o .iterator() do ORM) a partir do event loop, um item de
+    cada vez na thread síncrona do pedido, para um StreamingHttpResponse em ASGI não o ler todo.
+    """
+    iterador = iter(iteravel)
+    proximo = sync_to_async(next)
+    fim = object()
+    while (item := await proximo(iterador, fim)) is not fim:
+        yield item
+
+
+async def utilizador(request):
+    """Utilizador do pedido numa view async; fica também em request.user para o template não o ler de novo."""
+    usuario = await request.auser()
+    request.user = usuario
+    return usuario
+
+
+async def renderizar(request, template, context):
+    """render() numa view async: template, sessão e mensagens podem fazer queries, por isso corre na thread síncrona."""
+    return await sync_to_async(render)(request, template, context)
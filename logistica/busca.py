@@ -0,0 +1,185 @@
+from django.db import connection, transaction
+from django.db.models import CharField, Case, Count, IntegerField, Lookup, Q, Value, When
+
+from .models import Cliente, GramaBusca
+from .normalizacao import TAMANHO_GRAMA, gramas, normalizar_texto, somente_digitos
+
+# ==============================================================================
+# BUSCA DE CLIENTES (NOME, TELEFONE, ENDEREÇO E DOCUMENTO)
+# ==============================================================================
+# Cada cliente guarda as formas normalizadas dos campos pesquisáveis (nome e
+# endereço sem acentos, telefone e documento só com dígitos) e os trigramas
+# delas na tabela GramaBusca. Uma pesquisa:
+#   - começa pelo prefixo do nome (ou do telefone/documento), lido por ordem no
+#     índice da coluna: quando chega para encher a lista, termina aqui;
+#   - senão, os candidatos são os clientes que têm os trigramas mais raros da
+#     pesquisa (índice grama+cliente), confirmados palavra a palavra por LIKE.
+# Os resultados são ordenados pela qualidade do acerto (início do nome, início
+# de palavra, telefone/documento, qualquer outro sítio) e depois pelo nome.
+
+LIMITE_RESULTADOS = 20
+MINIMO_CARACTERES = 2
+
+# Os trigramas só escolhem os candidatos (o LIKE confirma): bastam os mais raros, e
+# juntar as listas dos trigramas comuns ("ria", "859") custaria mais do que a confirmação.
+# Uma pesquisa muito vaga confirma no máximo LIMITE_CANDIDATOS (quem escreve mais afina-a)
+GRAMAS_POR_PESQUISA = 3
+LIMITE_CANDIDATOS = 5000
+
+
+@CharField.register_lookup
+class Prefixo(Lookup):
+    """
+    `campo__prefixo='abc'`: o valor começa por 'abc', usando o índice da coluna.
+    No SQLite o LIKE ignora os índices (não distingue maiúsculas): usa-se GLOB.
+    No Postgres o LIKE 'abc%' usa o índice varchar_pattern_ops que o Django cria com db_index.
+    Só serve para as colunas normalizadas (sem curingas do LIKE/GLOB).
+    """
+    lookup_name = 'prefixo'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        curinga = '*' if connection.vendor == 'sqlite' else '%'
+        operador = 'GLOB' if connection.vendor == 'sqlite' else 'LIKE'
+        return f"{lhs} {operador} {rhs}", [*lhs_params, *(f"{valor}{curinga}" for valor in rhs_params)]
+
+
+def interpretar(texto):
+    """
+    Devolve as palavras normalizadas da pesquisa. Um texto sem letras ("(11) 98765-4321")
+    é um telefone ou documento: os dígitos formam uma única palavra.
+    """
+    normalizado = normalizar_texto(texto)
+    if normalizado and not any(caractere.isalpha() for caractere in normalizado):
+        digitos = somente_digitos(normalizado)
+        return [digitos] if digitos else []
+    return normalizado.split()
+
+
+def _em_algum_campo(palavra):
+    return (
+        Q(nome_busca__contains=palavra) | Q(endereco_busca__contains=palavra)
+        | Q(telefone_busca__contains=palavra) | Q(documento_busca__contains=palavra)
+    )
+
+
+def _no_inicio_de_palavra(palavra):
+    return Q(nome_busca__prefixo=palavra) | Q(nome_busca__contains=f" {palavra}")
+
+
+def _gramas_mais_raros(palavras):
+    """Os trigramas da pesquisa com menos clientes (lista vazia se algum não existir: não há resultados)."""
+    pedidos = set().union(*(gramas(palavra) for palavra in palavras))
+    frequencias = dict(
+        GramaBusca.objects.filter(grama__in=pedidos).values_list('grama').annotate(clientes=Count('id'))
+    )
+    if len(frequencias) < len(pedidos):
+        return []
+    return sorted(pedidos, key=frequencias.get)[:GRAMAS_POR_PESQUISA]
+
+
+def filtrar(queryset, texto, limite_candidatos=LIMITE_CANDIDATOS):
+    """
+    Restringe o queryset aos clientes que contêm todas as palavras da pesquisa (em qualquer campo).
+    Para o typeahead basta confirmar os primeiros `limite_candidatos`; None filtra-os todos (admin).
+    """
+    palavras = interpretar(texto)
+    if not palavras or len(''.join(palavras)) < MINIMO_CARACTERES:
+        return queryset.none()
+
+    if any(len(palavra) >= TAMANHO_GRAMA for palavra in palavras):
+        raros = _gramas_mais_raros(palavras)
+        if not raros:
+            return queryset.none()
+        candidatos = (
+            GramaBusca.objects.filter(grama__in=raros)
+            .values('cliente_id').annotate(encontrados=Count('id'))
+            .filter(encontrados=len(raros)).order_by('cliente_id').values('cliente_id')
+        )
+        if limite_candidatos is not None:
+            candidatos = candidatos[:limite_candidatos]
+        queryset = queryset.filter(id__in=candidatos)
+    else:
+        # Só palavras curtas: sem trigramas, vale o prefixo do nome ou de um telefone/documento
+        queryset = queryset.filter(
+            Q(nome_busca__prefixo=' '.join(palavras))
+            | Q(telefone_busca__prefixo=palavras[0]) | Q(documento_busca__prefixo=palavras[0])
+        )
+
+    for palavra in palavras:
+        # Os trigramas não garantem a ordem das letras nem as palavras curtas: confirma-se cada uma
+        condicao = _em_algum_campo(palavra) if len(palavra) >= TAMANHO_GRAMA else _no_inicio_de_palavra(palavra)
+        queryset = queryset.filter(condicao)
+    return queryset
+
+
+def ordenar_por_relevancia(queryset, texto):
+    """Anota `relevancia` (maior é melhor) e ordena por ela e pelo nome."""
+    palavras = interpretar(texto)
+    if not palavras:
+        return queryset
+
+    def pontos(condicao, valor):
+        return Case(When(condicao, then=Value(valor)), default=Value(0), output_field=IntegerField())
+
+    # Nome começado pela pesquisa > telefone/documento começado por ela > cada palavra no início
+    # de uma palavra do nome (ou, valendo menos, no meio do nome)
+    relevancia = pontos(Q(nome_busca__prefixo=' '.join(palavras)), 8)
+    relevancia += pontos(Q(telefone_busca__prefixo=palavras[0]) | Q(documento_busca__prefixo=palavras[0]), 6)
+    for palavra in palavras:
+        relevancia += Case(
+            When(_no_inicio_de_palavra(palavra), then=Value(2)),
+            When(nome_busca__contains=palavra, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    return queryset.annotate(relevancia=relevancia).order_by('-relevancia', 'nome_busca', 'id')
+
+
+def buscar(texto, queryset=None, limite=LIMITE_RESULTADOS):
+    """Os `limite` clientes que melhor correspondem à pesquisa (typeahead)."""
+    queryset = Cliente.objects.all() if queryset is None else queryset
+    palavras = interpretar(texto)
+    frase = ' '.join(palavras)
+    if len(frase) < MINIMO_CARACTERES:
+        return []
+
+    # Atalho: havendo clientes suficientes cujo nome (ou telefone/documento) começa pela pesquisa,
+    # não são precisos os trigramas: são os mais relevantes e saem já ordenados do índice da coluna
+    prefixo = 'telefone_busca' if frase.isdigit() else 'nome_busca'
+    primeiros = list(queryset.filter(**{f'{prefixo}__prefixo': frase}).order_by(prefixo, 'id')[:limite])
+    if len(primeiros) >= limite:
+        return primeiros
+
+    return list(ordenar_por_relevancia(filtrar(queryset, texto), texto)[:limite])
+
+
+def reindexar_clientes(tamanho_lote=2000, progresso=None):
+    """Recalcula as colunas normalizadas e os trigramas de todos os clientes (mudança das regras de normalização)."""
+    campos = ['nome_busca', 'telefone_busca', 'documento_busca', 'endereco_busca', 'telefone_e164']
+    tabela = connection.ops.quote_name(Cliente._meta.db_table)
+    # Um UPDATE por id em executemany: o bulk_update (um CASE por linha) é quadrático no SQLite
+    sql_update = f"UPDATE {tabela} SET {', '.join(f'{connection.ops.quote_name(campo)} = %s' for campo in campos)} WHERE id = %s"
+
+    total = Cliente.objects.count()
+    ultimo_id = 0
+    feitos = 0
+    while True:
+        lote = list(
+            Cliente.objects.filter(id__gt=ultimo_id).order_by('id')
+            .only('id', 'nome', 'telefone', 'documento', 'endereco', 'bairro')[:tamanho_lote]
+        )
+        if not lote:
+            break
+        for cliente in lote:
+            cliente.atualizar_campos_busca()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.executemany(sql_update, [[getattr(cliente, campo) for campo in campos] + [cliente.id] for cliente in lote])
+            GramaBusca.objects.reindexar(lote)
+        ultimo_id = lote[-1].id
+        feitos += len(lote)
+        if progresso:
+            progresso(feitos, total)
+    return feitos
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db.models import F, OuterRef, Subquery
+from django.urls import reverse
+
+from .models import Cliente, Visita
+from .normalizacao import telefone_e164
+
+# ==============================================================================
+# IDENTIFICAÇÃO DE CHAMADAS (CALLER ID)
+# ==============================================================================
+# Quando um cliente liga para o depósito, a central telefónica pergunta quem é
+# pelo número que recebeu. O número é reduzido à forma canónica (+55 DDD número,
+# a coluna indexada Cliente.telefone_e164) e o cartão do cliente (dívida, última
+# compra, próxima compra prevista e visita em aberto) sai de uma única consulta.
+# Os cartões ficam num LRU em memória do processo: a mesma chamada é consultada
+# várias vezes (toque, atendimento, transferência) e os números desconhecidos
+# também ficam guardados. O save() de um cliente apaga os seus cartões (sinal em
+# logistica/signals.py); o que muda noutro worker ou sem save() (uma visita nova)
+# expira ao fim de VALIDADE_CACHE segundos.
+
+TAMANHO_CACHE = 20_000        # Números guardados por processo (cada cartão ocupa ~1 KB)
+VALIDADE_CACHE = 60           # Segundos
+MAXIMO_CLIENTES = 5           # Um telefone partilhado (família, duplicados) devolve vários cartões
+
+
+class CacheLRU:
+    """LRU com validade, seguro entre threads, que apaga as entradas de um cliente quando ele muda."""
+
+    def __init__(self, tamanho_maximo, validade):
+        self.tamanho_maximo = tamanho_maximo
+        self.validade = validade
+        self._itens = OrderedDict()               # chave -> (expira_em, valor, ids dos clientes)
+        self._chaves_do_cliente = defaultdict(set)
+        self._trinco = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave):
+        with self._trinco:
+            item = self._itens.get(chave)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    self._remover(chave)
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return item[1]
+
+    def guardar(self, chave, valor, clientes_ids):
+        with self._trinco:
+            self._remover(chave)
+            self._itens[chave] = (time.monotonic() + self.validade, valor, tuple(clientes_ids))
+            for cliente_id in clientes_ids:
+                self._chaves_do_cliente[cliente_id].add(chave)
+            while len(self._itens) > self.tamanho_maximo:
+                self._remover(next(iter(self._itens)))
+
+    def invalidar(self, clientes_ids=(), chaves=()):
+        """Apaga as entradas que mostram estes clientes e as destas chaves."""
+        with self._trinco:
+            for cliente_id in clientes_ids:
+                for chave in list(self._chaves_do_cliente.get(cliente_id, ())):
+                    self._remover(chave)
+            for chave in chaves:
+                self._remover(chave)
+
+    def limpar(self):
+        with self._trinco:
+            self._itens.clear()
+            self._chaves_do_cliente.clear()
+
+    def _remover(self, chave):
+        item = self._itens.pop(chave, None)
+        if item is None:
+            return
+        for cliente_id in item[2]:
+            chaves = self._chaves_do_cliente.get(cliente_id)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._chaves_do_cliente[cliente_id]
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            'itens': len(self._itens),
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'taxa_acerto': round(100 * self.acertos / total, 1) if total else None,
+        }
+
+
+cache_cartoes = CacheLRU(TAMANHO_CACHE, VALIDADE_CACHE)
+
+
+def _consultar(e164):
+    """Os cartões dos clientes com este telefone, numa só consulta (a visita em aberto vem por subconsultas)."""
+    abertas = Visita.objects.filter(cliente=OuterRef('pk'), status='PENDENTE').order_by('-id')
+    linhas = (
+        Cliente.objects.filter(telefone_e164=e164)
+        .annotate(
+            visita_id=Subquery(abertas.values('id')[:1]),
+            visita_rota=Subquery(abertas.values('rota__nome')[:1]),
+            visita_motoqueiro=Subquery(abertas.values('rota__motoqueiro__username')[:1]),
+        )
+        .order_by(F('data_ultima_venda').desc(nulls_last=True), 'id')
+        .values(
+            'id', 'nome', 'telefone', 'endereco', 'bairro', 'divida_atual',
+            'data_ultima_venda', 'data_proxima_compra', 'ciclo_consumo_dias',
+            'visita_id', 'visita_rota', 'visita_motoqueiro',
+        )[:MAXIMO_CLIENTES]
+    )
+    return [
+        {
+            'id': linha['id'],
+            'nome': linha['nome'],
+            'telefone': linha['telefone'],
+            'endereco': linha['endereco'],
+            'bairro': linha['bairro'],
+            'divida': str(linha['divida_atual']),
+            'ultima_compra': linha['data_ultima_venda'].isoformat() if linha['data_ultima_venda'] else None,
+            'proxima_compra': linha['data_proxima_compra'].isoformat() if linha['data_proxima_compra'] else None,
+            'ciclo_dias': linha['ciclo_consumo_dias'],
+            'visita_aberta': {
+                'id': linha['visita_id'],
+                'rota': linha['visita_rota'],
+                'motoqueiro': linha['visita_motoqueiro'],
+            } if linha['visita_id'] else None,
+            'url_ficha': reverse('detalhes_cliente', args=[linha['id']]),
+        }
+        for linha in linhas
+    ]
+
+
+def identificar(telefone):
+    """(telefone canónico, cartões dos clientes) de quem liga; ('', []) se o número não for válido."""
+    e164 = telefone_e164(telefone, settings.TELEFONE_DDD_PADRAO)
+    if not e164:
+        return '', []
+    cartoes = cache_cartoes.obter(e164)
+    if cartoes is None:
+        cartoes = _consultar(e164)
+        cache_cartoes.guardar(e164, cartoes, [cartao['id'] for cartao in cartoes])
+    return e164, cartoes
+
+
+def invalidar_cliente(cliente):
+    """Apaga os cartões do cliente e o do seu telefone atual (que podia estar guardado como desconhecido)."""
+    cache_cartoes.invalidar(clientes_ids=[cliente.pk], chaves=[cliente.telefone_e164] if cliente.telefone_e164 else [])
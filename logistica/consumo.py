@@ -0,0 +1,64 @@
+import datetime
+import statistics
+
+from django.utils import timezone
+
+from .models import Cliente
+
+# ==============================================================================
+# INTELIGÊNCIA DE CONSUMO (CICLO MEDIANO ENTRE COMPRAS)
+# ==============================================================================
+# O Cliente guarda as suas últimas compras em `historico_compras`, por isso cada
+# venda atualiza o ciclo sem consultar as visitas: lê a lista que já está em
+# memória, calcula a mediana e grava tudo num único UPDATE.
+
+JANELA_COMPRAS = 10          # Amostragem sólida para a mediana
+MINIMO_COMPRAS_CICLO = 3     # Só começa a mapear após a 3ª compra (mínimo de 2 intervalos)
+
+CAMPOS_CICLO = ['historico_compras', 'ciclo_consumo_dias', 'data_ultima_venda', 'data_proxima_compra', 'data_virada']
+
+
+def calcular_ciclo(datas):
+    """Mediana (em dias inteiros) dos intervalos entre compras, ou None se não houver amostra."""
+    if len(datas) < MINIMO_COMPRAS_CICLO:
+        return None
+    intervalos = [(depois - antes).days for antes, depois in zip(datas, datas[1:])]
+    intervalos = [dias for dias in intervalos if dias > 0]
+    if not intervalos:
+        return None
+    # Usa a Mediana (ignora compras anormais/churrascos)
+    return int(statistics.median(intervalos))
+
+
+def reiniciar_ciclo(cliente):
+    """Volta o cliente ao estado de quem nunca comprou (ciclo padrão, sem histórico nem datas)."""
+    for campo, valor in campos_sem_compras().items():
+        setattr(cliente, campo, valor)
+
+
+def campos_sem_compras():
+    return {
+        'historico_compras': [],
+        'ciclo_consumo_dias': Cliente._meta.get_field('ciclo_consumo_dias').get_default(),
+        'data_ultima_venda': None,
+        'data_proxima_compra': None,
+        'data_virada': None,
+    }
+
+
+def aplicar_compras(cliente, datas):
+    """Atualiza em memória o histórico, o ciclo e as datas derivadas do cliente."""
+    datas = sorted(datas)[-JANELA_COMPRAS:]
+    cliente.historico_compras = [d.isoformat() for d in datas]
+    cliente.ciclo_consumo_dias = calcular_ciclo(datas) or cliente.ciclo_consumo_dias
+    if datas and (not cliente.data_ultima_venda or datas[-1] > cliente.data_ultima_venda):
+        cliente.data_ultima_venda = datas[-1]
+    cliente.atualizar_datas_ciclo()
+
+
+def registrar_compra(cliente, data=None):
+    """Regista uma venda ao cliente e recalcula o ciclo com um único UPDATE das colunas afetadas."""
+    data = data or timezone.localdate()
+    datas = [datetime.date.fromisoformat(d) for d in cliente.historico_compras]
+    aplicar_compras(cliente, datas + [data])
+    Cliente.objects.filter(pk=cliente.pk).update(**{campo: getattr(cliente, campo) for campo in CAMPOS_CICLO})
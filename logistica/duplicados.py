@@ -0,0 +1,396 @@
+import datetime
+import functools
+import re
+import time
+from collections import Counter, defaultdict, namedtuple
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+
+from . import referencias
+from .consumo import aplicar_compras
+from .fila import sincronizar_fila
+from .models import Carteira, Cliente, FilaContato, FusaoCliente, Ligacao, ParDuplicado, Visita
+from .normalizacao import DIGITOS_TELEFONE, normalizar_bairro
+
+# ==============================================================================
+# DETEÇÃO E FUSÃO DE CLIENTES DUPLICADOS
+# ==============================================================================
+# O mesmo cliente aparece várias vezes ("JOSE DA SILVA" e "José Silva", com e
+# sem o 9 no telefone). Comparar todos com todos seria N²: cada cliente recebe
+# chaves de bloco (últimos dígitos do telefone, documento, som do nome + bairro)
+# e só se comparam os clientes que partilham uma chave. Os pares pontuados acima
+# do limiar ficam em ParDuplicado para o gerente rever; a fusão passa visitas,
+# ligações e carteiras dos duplicados para o principal com UPDATEs em conjunto,
+# guiados pela tabela FusaoCliente (que fica como registo do que foi fundido).
+
+LIMIAR_SUGESTAO = 0.75        # Pares abaixo disto não são guardados
+LIMIAR_FUSAO_AUTOMATICA = 0.92  # Sugestão para a fusão em massa (telefone ou documento iguais e nome quase igual)
+TAMANHO_MAXIMO_BLOCO = 30     # Blocos maiores (nomes muito comuns) comparam só os vizinhos por ordem alfabética
+JANELA_VIZINHOS = 8
+GRUPOS_POR_LOTE = 200
+ENDERECO_MINIMO = 0.8         # Homónimos com telefones diferentes só são o mesmo cliente no mesmo endereço
+TETO_SEM_TELEFONE = 0.9       # Sem telefone num dos lados nada confirma o par: fica para revisão, abaixo da fusão automática
+
+PARTICULAS = {'da', 'de', 'do', 'das', 'dos', 'e'}
+
+# Grafias com o mesmo som (português do Brasil), aplicadas por ordem
+REGRAS_FONETICAS = [
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'[cs]h'), 'x'),
+    (re.compile(r'lh'), 'li'),
+    (re.compile(r'nh'), 'ni'),
+    (re.compile(r'th'), 't'),
+    (re.compile(r'qu|ck'), 'k'),
+    (re.compile(r'gu(?=[ei])'), 'g'),
+    (re.compile(r'c(?=[eiy])'), 's'),
+    (re.compile(r'g(?=[eiy])'), 'j'),
+    (re.compile(r'c'), 'k'),
+    (re.compile(r'y'), 'i'),
+    (re.compile(r'w'), 'v'),
+    (re.compile(r'z'), 's'),
+    (re.compile(r'h'), ''),
+    (re.compile(r'ou'), 'o'),
+    (re.compile(r'ei'), 'e'),
+    (re.compile(r'l(?![aeiou])'), 'u'),     # Cavalcante / Cavaucante
+    (re.compile(r'm$'), 'n'),
+    (re.compile(r'(.)\1+'), r'\1'),          # Letras dobradas
+]
+
+Registo = namedtuple('Registo', ['id', 'nome', 'telefone', 'documento', 'endereco', 'bairro'])
+
+
+@functools.lru_cache(maxsize=50_000)
+def chave_fonetica(palavra):
+    for padrao, troca in REGRAS_FONETICAS:
+        palavra = padrao.sub(troca, palavra)
+    return palavra
+
+
+def chave_nome(nome_busca):
+    """Som do primeiro e do último nome ("jose da silva" e "JOSÉ SILVA" dão o mesmo), ignorando números."""
+    palavras = [palavra for palavra in nome_busca.split() if palavra not in PARTICULAS and not palavra.isdigit()]
+    if not palavras:
+        return ''
+    return f"{chave_fonetica(palavras[0])} {chave_fonetica(palavras[-1])}"
+
+
+def fim_telefone(telefone_busca):
+    return telefone_busca[-DIGITOS_TELEFONE:] if len(telefone_busca) >= DIGITOS_TELEFONE else ''
+
+
+@functools.lru_cache(maxsize=200_000)
+def _gramas(texto):
+    texto = f"  {texto} "
+    return frozenset(texto[i:i + 3] for i in range(len(texto) - 2))
+
+
+def semelhanca(texto_a, texto_b):
+    """Coeficiente de Dice dos trigramas (0 a 1), tolerante a letras trocadas e palavras a mais."""
+    if not texto_a or not texto_b:
+        return 0.0
+    if texto_a == texto_b:
+        return 1.0
+    gramas_a, gramas_b = _gramas(texto_a), _gramas(texto_b)
+    return 2 * len(gramas_a & gramas_b) / (len(gramas_a) + len(gramas_b))
+
+
+def _numeros(texto):
+    return {palavra for palavra in texto.split() if palavra.isdigit()}
+
+
+def _numeros_diferentes(texto_a, texto_b):
+    """Os dois textos têm números (porta, código no nome) e não são os mesmos."""
+    numeros_a, numeros_b = _numeros(texto_a), _numeros(texto_b)
+    return bool(numeros_a and numeros_b and numeros_a != numeros_b)
+
+
+def pontuar(a, b):
+    """(pontuação de 0 a 1, motivo) de dois registos serem o mesmo cliente."""
+    if a.documento and b.documento:
+        if a.documento == b.documento:
+            return 1.0, 'documento'
+        return 0.0, ''   # Documentos diferentes: pessoas diferentes, mesmo com o nome igual
+
+    nome = semelhanca(a.nome, b.nome)
+    if chave_nome(a.nome) == chave_nome(b.nome):
+        nome = max(nome, 0.9)
+    if a.telefone and b.telefone and fim_telefone(a.telefone) == fim_telefone(b.telefone):
+        # Mesmo telefone: basta o nome parecido (um nome muito diferente é outra pessoa da casa)
+        return 0.45 + 0.55 * nome, 'telefone'
+
+    # Sem o telefone a confirmar, números diferentes ("Maria Silva 2" e "Maria Silva 3", outra porta
+    # na mesma rua) já distinguiam os dois clientes
+    if _numeros_diferentes(a.nome, b.nome) or _numeros_diferentes(a.endereco, b.endereco):
+        return 0.0, ''
+    endereco = semelhanca(a.endereco, b.endereco)
+    if a.telefone and b.telefone:
+        # Telefones diferentes: só o nome e o endereço (quase) iguais sugerem um número novo
+        if endereco < ENDERECO_MINIMO:
+            return 0.0, ''
+        return 0.5 * nome + 0.5 * endereco, 'nome e endereço'
+    pontuacao = min(0.6 * nome + 0.4 * endereco, TETO_SEM_TELEFONE)
+    return pontuacao, 'nome e endereço' if endereco >= ENDERECO_MINIMO else 'nome'
+
+
+def _chaves_de_bloco(registo):
+    chaves = []
+    if fim_telefone(registo.telefone):
+        chaves.append('T' + fim_telefone(registo.telefone))
+    if len(registo.documento) >= 11:
+        chaves.append('D' + registo.documento)
+    nome = chave_nome(registo.nome)
+    if nome:
+        chaves.append(f"N{nome}|{registo.bairro}")
+    return chaves
+
+
+def _pares_do_bloco(registos):
+    """Todos os pares de um bloco pequeno; num bloco grande, cada um só com os vizinhos por nome."""
+    if len(registos) <= TAMANHO_MAXIMO_BLOCO:
+        for i, a in enumerate(registos):
+            for b in registos[i + 1:]:
+                yield a, b
+        return
+    registos = sorted(registos, key=lambda registo: (registo.nome, registo.id))
+    for i, a in enumerate(registos):
+        for b in registos[i + 1:i + 1 + JANELA_VIZINHOS]:
+            yield a, b
+
+
+def _carregar_registos():
+    campos = ('id', 'nome_busca', 'telefone_busca', 'documento_busca', 'endereco_busca', 'bairro')
+    for linha in Cliente.objects.values_list(*campos).order_by().iterator(chunk_size=5000):
+        yield Registo(*linha[:5], normalizar_bairro(linha[5]))
+
+
+def detectar(limiar=LIMIAR_SUGESTAO, progresso=None):
+    """
+    Procura os pares de clientes duplicados em toda a base e substitui as sugestões pendentes.
+    Os pares descartados pelo gerente mantêm-se (e não voltam a ser sugeridos).
+    """
+    inicio = time.perf_counter()
+    blocos = defaultdict(list)
+    clientes = 0
+    for registo in _carregar_registos():
+        clientes += 1
+        for chave in _chaves_de_bloco(registo):
+            blocos[chave].append(registo)
+    if progresso:
+        progresso(0, len(blocos))
+
+    comparados = set()
+    encontrados = {}
+    for numero, registos in enumerate(blocos.values(), start=1):
+        if len(registos) > 1:
+            for a, b in _pares_do_bloco(registos):
+                par = (a.id, b.id) if a.id < b.id else (b.id, a.id)
+                if par in comparados:
+                    continue
+                comparados.add(par)
+                pontuacao, motivo = pontuar(a, b)
+                if pontuacao >= limiar:
+                    encontrados[par] = (round(pontuacao, 3), motivo)
+        if progresso and numero % 5000 == 0:
+            progresso(numero, len(blocos))
+
+    with transaction.atomic():
+        ParDuplicado.objects.filter(descartado=False).delete()
+        ParDuplicado.objects.bulk_create(
+            [
+                ParDuplicado(cliente_a_id=a, cliente_b_id=b, pontuacao=pontuacao, motivo=motivo)
+                for (a, b), (pontuacao, motivo) in encontrados.items()
+            ],
+            batch_size=2000,
+            ignore_conflicts=True,   # Os descartados continuam lá
+        )
+    if progresso:
+        progresso(len(blocos), len(blocos))
+
+    return {
+        'clientes': clientes,
+        'blocos': len(blocos),
+        'comparacoes': len(comparados),
+        'pares': len(encontrados),
+        'segundos': round(time.perf_counter() - inicio, 1),
+    }
+
+# ------------------------------------------------------------------------------
+# Grupos (componentes ligadas dos pares) e escolha do cliente principal
+# ------------------------------------------------------------------------------
+
+def grupos_sugeridos(limiar=LIMIAR_SUGESTAO):
+    """Grupos de clientes ligados por pares pendentes acima do limiar, do mais certo para o menos certo."""
+    pais = {}
+
+    def raiz(cliente_id):
+        while pais.setdefault(cliente_id, cliente_id) != cliente_id:
+            pais[cliente_id] = pais[pais[cliente_id]]
+            cliente_id = pais[cliente_id]
+        return cliente_id
+
+    pares = ParDuplicado.objects.filter(descartado=False, pontuacao__gte=limiar).values_list(
+        'cliente_a_id', 'cliente_b_id', 'pontuacao', 'motivo',
+    )
+    pontuados = {}
+    for a, b, pontuacao, motivo in pares:
+        pais[raiz(a)] = raiz(b)
+        pontuados[(a, b)] = (pontuacao, motivo)
+
+    membros = defaultdict(list)
+    for cliente_id in pais:
+        membros[raiz(cliente_id)].append(cliente_id)
+    resumo = defaultdict(lambda: (0.0, set()))
+    for (a, _), (pontuacao, motivo) in pontuados.items():
+        maximo, motivos = resumo[raiz(a)]
+        resumo[raiz(a)] = (max(maximo, pontuacao), motivos | {motivo})
+
+    grupos = [
+        {'ids': sorted(ids), 'pontuacao': resumo[chave][0], 'motivos': sorted(resumo[chave][1])}
+        for chave, ids in membros.items()
+    ]
+    grupos.sort(key=lambda grupo: (-grupo['pontuacao'], grupo['ids'][0]))
+    return grupos
+
+
+def com_historico(clientes_ids):
+    """Clientes com o número de visitas e ligações (para escolher e mostrar o principal)."""
+    return Cliente.objects.filter(id__in=clientes_ids).annotate(
+        total_visitas=Count('visita', distinct=True),
+        total_ligacoes=Count('ligacao', distinct=True),
+    )
+
+
+def escolher_principais(grupos):
+    """Principal de cada grupo: o cliente com mais histórico (visitas + ligações) e, no empate, o mais antigo."""
+    ids = [cliente_id for grupo in grupos for cliente_id in grupo['ids']]
+    historico = Counter()
+    for inicio in range(0, len(ids), 5000):
+        lote = ids[inicio:inicio + 5000]
+        for modelo in (Visita, Ligacao):
+            contagens = modelo.objects.filter(cliente_id__in=lote).values_list('cliente_id').annotate(Count('id')).order_by()
+            historico.update(dict(contagens))
+    resultado = []
+    for grupo in grupos:
+        principal = min(grupo['ids'], key=lambda cliente_id: (-historico[cliente_id], cliente_id))
+        resultado.append((principal, [cliente_id for cliente_id in grupo['ids'] if cliente_id != principal]))
+    return resultado
+
+
+def descartar(clientes_ids):
+    """Marca os pares entre estes clientes como pessoas diferentes."""
+    return ParDuplicado.objects.filter(cliente_a_id__in=clientes_ids, cliente_b_id__in=clientes_ids).update(descartado=True)
+
+# ------------------------------------------------------------------------------
+# Fusão
+# ------------------------------------------------------------------------------
+
+def _absorver(principal, duplicados):
+    """Completa os dados do principal com os dos duplicados (em memória; gravado pelo save())."""
+    for duplicado in duplicados:
+        for campo in ('telefone', 'documento', 'email', 'endereco'):
+            if not getattr(principal, campo) and getattr(duplicado, campo):
+                setattr(principal, campo, getattr(duplicado, campo))
+        if not normalizar_bairro(principal.bairro) and normalizar_bairro(duplicado.bairro):
+            principal.bairro = duplicado.bairro
+        # GPS original (do telemóvel ou do CSV) vale mais do que uma posição geocodificada
+        if duplicado.latitude is not None and (principal.latitude is None or (principal.geocodificacao and not duplicado.geocodificacao)):
+            principal.latitude, principal.longitude = duplicado.latitude, duplicado.longitude
+            principal.geocodificacao = duplicado.geocodificacao
+        if duplicado.observacoes_gerais and duplicado.observacoes_gerais not in (principal.observacoes_gerais or ''):
+            principal.observacoes_gerais = '\n'.join(filter(None, [principal.observacoes_gerais, duplicado.observacoes_gerais]))
+        principal.divida_atual += duplicado.divida_atual
+
+    # As compras de todos entram no ciclo do principal
+    todos = [principal, *duplicados]
+    datas = {datetime.date.fromisoformat(data) for cliente in todos for data in cliente.historico_compras}
+    ultimas = [cliente.data_ultima_venda for cliente in todos if cliente.data_ultima_venda]
+    principal.data_ultima_venda = max(ultimas) if ultimas else None
+    aplicar_compras(principal, datas)
+
+
+def _fundir_lote(grupos, fundido_por):
+    ids = {cliente_id for principal, duplicados in grupos for cliente_id in (principal, *duplicados)}
+    clientes = Cliente.objects.in_bulk(list(ids))
+    # Um grupo pode já ter sido (parcialmente) fundido: só conta o que ainda existe
+    grupos = [
+        (principal, [duplicado for duplicado in duplicados if duplicado in clientes and duplicado != principal])
+        for principal, duplicados in grupos if principal in clientes
+    ]
+    grupos = [(principal, duplicados) for principal, duplicados in grupos if duplicados]
+    destino = {duplicado: principal for principal, duplicados in grupos for duplicado in duplicados}
+    if not destino:
+        return Counter(), set(), []
+
+    with transaction.atomic():
+        FusaoCliente.objects.bulk_create([
+            FusaoCliente(duplicado_id=duplicado, duplicado_nome=clientes[duplicado].nome[:100], principal_id=principal, fundido_por=fundido_por)
+            for duplicado, principal in destino.items()
+        ])
+        # Um UPDATE por tabela para o lote inteiro: o novo cliente vem do registo da fusão
+        novo_cliente = Subquery(
+            FusaoCliente.objects.filter(duplicado_id=OuterRef('cliente_id')).order_by('-id').values('principal_id')[:1]
+        )
+        # Fusões anteriores em que um duplicado era o principal passam a apontar para o novo principal
+        FusaoCliente.objects.filter(principal_id__in=list(destino)).update(principal_id=Subquery(
+            FusaoCliente.objects.filter(duplicado_id=OuterRef('principal_id')).order_by('-id').values('principal_id')[:1]
+        ))
+        visitas = Visita.objects.filter(cliente_id__in=list(destino)).update(cliente_id=novo_cliente)
+        ligacoes = Ligacao.objects.filter(cliente_id__in=list(destino)).update(cliente_id=novo_cliente)
+
+        Membro = Carteira.clientes.through
+        membros = {
+            (carteira_id, destino[cliente_id])
+            for carteira_id, cliente_id in Membro.objects.filter(cliente_id__in=list(destino)).values_list('carteira_id', 'cliente_id')
+        }
+        Membro.objects.bulk_create(
+            [Membro(carteira_id=carteira_id, cliente_id=cliente_id) for carteira_id, cliente_id in membros],
+            ignore_conflicts=True,
+        )
+        agentes = set(FilaContato.objects.filter(cliente_id__in=list(destino)).values_list('agente_id', flat=True))
+
+        for principal, duplicados in grupos:
+            _absorver(clientes[principal], [clientes[duplicado] for duplicado in duplicados])
+            clientes[principal].save()
+        # Apaga também as linhas da fila, os trigramas, os pares e as filiações dos duplicados
+        Cliente.objects.filter(id__in=list(destino)).delete()
+
+    totais = Counter(grupos=len(grupos), clientes=len(destino), visitas=visitas, ligacoes=ligacoes)
+    return totais, agentes, [principal for principal, _ in grupos]
+
+
+def fundir(grupos, fundido_por=None, progresso=None):
+    """
+    Funde cada (principal_id, [duplicados_ids]): o histórico e as carteiras dos duplicados passam
+    para o principal e os duplicados são apagados. Devolve os totais (grupos, clientes, visitas, ligacoes).
+    """
+    usados = set()
+    validos = []
+    for principal, duplicados in grupos:
+        # Um cliente só pode entrar numa fusão por vez (nem ser principal de um grupo e duplicado de outro)
+        ids = {principal, *duplicados}
+        if not ids & usados:
+            usados |= ids
+            validos.append((principal, list(duplicados)))
+
+    totais = Counter(grupos=0, clientes=0, visitas=0, ligacoes=0)
+    agentes = set()
+    principais = []
+    for inicio in range(0, len(validos), GRUPOS_POR_LOTE):
+        lote_totais, lote_agentes, lote_principais = _fundir_lote(validos[inicio:inicio + GRUPOS_POR_LOTE], fundido_por)
+        totais.update(lote_totais)
+        agentes |= lote_agentes
+        principais += lote_principais
+        if progresso:
+            progresso(min(inicio + GRUPOS_POR_LOTE, len(validos)), len(validos))
+
+    if principais:
+        agentes.update(
+            Carteira.objects.filter(clientes__in=principais, agente_comercial__isnull=False)
+            .values_list('agente_comercial_id', flat=True)
+        )
+        for agente_id in agentes:
+            sincronizar_fila(agente_id, principais)
+        # As filiações mudaram por bulk (sem sinais m2m_changed)
+        referencias.invalidar('carteiras', 'bairros')
+    return dict(totais)
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Visita
+from .periodos import filtro_periodo
+from .roteirizacao import ORDEM_PARAGENS
+
+# ==============================================================================
+# EVENTOS EM TEMPO REAL (LISTA DO MOTOQUEIRO)
+# ==============================================================================
+# Quando o call center fecha uma venda (ou o gerente despacha uma rota), a
+# visita nova é empurrada para a página do motoqueiro por Server-Sent Events,
+# em vez de o motoqueiro recarregar a lista inteira. As mensagens são deltas
+# JSON pequenos (ids novos / removidos e a ordem atual); a página pede só o
+# cartão de cada visita nova.
+#
+# O pub/sub é trocável (EVENTOS_BACKEND): MemoriaLocal serve um único processo
+# (runserver, testes, um worker); com vários workers do gunicorn usa-se
+# PostgresNotify, que passa as mensagens pelo LISTEN/NOTIFY do próprio banco.
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_BATIMENTO = 25      # Segundos: mantém a ligação viva em proxies que cortam ligações caladas
+PAUSA_RELIGAR = 5             # Segundos entre tentativas do ouvinte do PostgreSQL
+
+
+def canal_motoqueiro(motoqueiro_id):
+    return f"motoqueiro:{motoqueiro_id}"
+
+# ------------------------------------------------------------------------------
+# Backends de pub/sub
+# ------------------------------------------------------------------------------
+
+class Assinatura:
+    """Fila de mensagens de um canal para uma ligação SSE (vive no event loop que a criou)."""
+
+    def __init__(self, backend, canal):
+        self.backend = backend
+        self.canal = canal
+        self.loop = asyncio.get_running_loop()
+        self.fila = asyncio.Queue()
+
+    async def proxima(self):
+        return await self.fila.get()
+
+    def fechar(self):
+        self.backend.cancelar(self)
+
+
+class MemoriaLocal:
+    """Pub/sub dentro do processo. Publicar é seguro a partir de qualquer thread."""
+
+    def __init__(self):
+        self._assinaturas = defaultdict(set)
+        self._trava = threading.Lock()
+
+    def assinar(self, canal):
+        assinatura = Assinatura(self, canal)
+        with self._trava:
+            self._assinaturas[canal].add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._trava:
+            assinaturas = self._assinaturas.get(assinatura.canal)
+            if assinaturas:
+                assinaturas.discard(assinatura)
+                if not assinaturas:
+                    del self._assinaturas[assinatura.canal]
+
+    def publicar(self, canal, mensagem):
+        self._entregar(canal, mensagem)
+
+    def _entregar(self, canal, mensagem):
+        with self._trava:
+            assinaturas = list(self._assinaturas.get(canal, ()))
+        for assinatura in assinaturas:
+            try:
+                assinatura.loop.call_soon_threadsafe(assinatura.fila.put_nowait, mensagem)
+            except RuntimeError:
+                # Event loop já fechado: a ligação caiu sem passar pelo fechar()
+                self.cancelar(assinatura)
+
+
+class PostgresNotify(MemoriaLocal):
+    """
+    Publica com pg_notify e recebe com uma thread por processo em LISTEN, que entrega às
+    assinaturas locais: funciona entre workers e servidores que partilham o mesmo banco.
+    """
+
+    CANAL_BANCO = 'rotagas_eventos'
+
+    def __init__(self):
+        super().__init__()
+        self._ouvinte = None
+
+    def assinar(self, canal):
+        self._garantir_ouvinte()
+        return super().assinar(canal)
+
+    def publicar(self, canal, mensagem):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.CANAL_BANCO, json.dumps({'canal': canal, 'mensagem': mensagem})])
+
+    def _garantir_ouvinte(self):
+        with self._trava:
+            if self._ouvinte is None:
+                self._ouvinte = threading.Thread(target=self._ouvir, name='eventos-pg', daemon=True)
+                self._ouvinte.start()
+
+    def _ouvir(self):
+        import psycopg
+
+        parametros = connection.get_connection_params()
+        while True:
+            try:
+                with psycopg.connect(**parametros, autocommit=True) as ligacao:
+                    ligacao.execute(f"LISTEN {self.CANAL_BANCO}")
+                    for notificacao in ligacao.notifies():
+                        dados = json.loads(notificacao.payload)
+                        self._entregar(dados['canal'], dados['mensagem'])
+            except Exception:
+                logger.exception("Ouvinte de eventos do PostgreSQL caiu; a religar.")
+                time.sleep(PAUSA_RELIGAR)
+
+
+_backend = None
+_trava_backend = threading.Lock()
+
+
+def backend():
+    """Backend configurado em EVENTOS_BACKEND (padrão: MemoriaLocal), criado uma vez por processo."""
+    global _backend
+    with _trava_backend:
+        if _backend is None:
+            _backend = import_string(getattr(settings, 'EVENTOS_BACKEND', 'logistica.eventos.MemoriaLocal'))()
+        return _backend
+
+# ------------------------------------------------------------------------------
+# Avisos à lista do motoqueiro
+# ------------------------------------------------------------------------------
+
+def _ordem_pendentes(motoqueiro_id):
+    """Ids das visitas pendentes do dia do motoqueiro, pela ordem em que a página as mostra."""
+    return list(
+        Visita.objects.filter(
+            rota__motoqueiro_id=motoqueiro_id, status='PENDENTE',
+            **filtro_periodo('rota__data_criacao', timezone.localdate()),
+        ).order_by(*ORDEM_PARAGENS).values_list('id', flat=True)
+    )
+
+
+def avisar_motoqueiro(motoqueiro_id, novas=(), removidas=()):
+    """Empurra para a página do motoqueiro as visitas novas/removidas, depois do commit."""
+    novas, removidas = list(novas), list(removidas)
+    if not novas and not removidas:
+        return
+
+    def publicar():
+        mensagem = {'novas': novas, 'removidas': removidas}
+        if novas:
+            # A roteirização pode ter mudado a posição das outras paragens
+            mensagem['ordem'] = _ordem_pendentes(motoqueiro_id)
+        try:
+            backend().publicar(canal_motoqueiro(motoqueiro_id), mensagem)
+        except Exception:
+            # O aviso é uma conveniência: a página volta a sincronizar ao religar
+            logger.exception("Falha ao publicar evento para o motoqueiro %s.", motoqueiro_id)
+
+    transaction.on_commit(publicar)
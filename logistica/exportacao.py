@@ -0,0 +1,150 @@
+import csv
+import datetime
+import zlib
+from decimal import Decimal
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .assincrono import iterar_em_thread
+from .models import Ligacao, Visita
+from .periodos import filtro_periodo
+
+# ==============================================================================
+# EXPORTAÇÃO CSV EM STREAMING (AUDITORIA E DASHBOARD)
+# ==============================================================================
+# As linhas saem do banco em blocos (.iterator(chunk_size)) como tuplos simples
+# (values_list), são escritas em CSV e enviadas logo ao browser, opcionalmente
+# comprimidas em gzip pelo caminho. Nada acumula: a memória é a de um bloco,
+# seja o período de um dia ou de três anos.
+#
+# O CSV segue o Excel em português (separador ";", vírgula decimal e BOM UTF-8),
+# que é onde os gerentes abrem os ficheiros.
+
+LINHAS_POR_BLOCO = 2000
+SEPARADOR = ';'
+FORMATOS = ('csv', 'csv.gz')
+
+# Texto livre (observações, nomes, concorrentes) que comece por um destes caracteres seria lido
+# pelo Excel como fórmula: leva um apóstrofo à frente e fica como texto
+INICIOS_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+# (cabeçalho, campo do values_list)
+COLUNAS_LIGACOES = [
+    ('ID', 'id'),
+    ('Data/Hora', 'data_ligacao'),
+    ('Agente', 'agente__username'),
+    ('Cliente ID', 'cliente_id'),
+    ('Cliente', 'cliente__nome'),
+    ('Telefone', 'cliente__telefone'),
+    ('Bairro', 'cliente__bairro'),
+    ('Resultado', 'resultado'),
+    ('Motivo Não Venda', 'motivo_nao_venda'),
+    ('Concorrente', 'concorrente_empresa'),
+    ('Preço Concorrente', 'concorrente_preco'),
+    ('Data Retorno', 'data_retorno'),
+    ('Observação', 'observacao'),
+]
+
+COLUNAS_VISITAS = [
+    ('ID', 'id'),
+    ('Data/Hora', 'data_visita'),
+    ('Rota', 'rota__nome'),
+    ('Motoqueiro', 'rota__motoqueiro__username'),
+    ('Cliente ID', 'cliente_id'),
+    ('Cliente', 'cliente__nome'),
+    ('Bairro', 'cliente__bairro'),
+    ('Status', 'status'),
+    ('Valor Venda', 'valor_venda'),
+    ('Forma Pagamento', 'forma_pagamento'),
+    ('Botijão', 'tipo_botijao'),
+    ('Valor Recebido', 'valor_recebido'),
+    ('Motivo Não Venda', 'motivo_nao_venda'),
+    ('Concorrente', 'concorrente_empresa'),
+    ('Preço Concorrente', 'concorrente_preco'),
+    ('Latitude Check-in', 'latitude_checkin'),
+    ('Longitude Check-in', 'longitude_checkin'),
+    ('Observação', 'observacao'),
+]
+
+
+class _Eco:
+    """Pseudo-ficheiro para o csv.writer: devolve a linha em vez de a guardar."""
+
+    def write(self, valor):
+        return valor
+
+
+def texto_seguro(valor):
+    """Neutraliza a injeção de fórmulas (CSV injection) numa célula de texto."""
+    return "'" + valor if valor.startswith(INICIOS_FORMULA) else valor
+
+
+def _formatadores():
+    """Conversão de cada tipo de valor para a célula do CSV (o fuso é lido uma única vez)."""
+    fuso = timezone.get_current_timezone()
+    decimal_virgula = lambda valor: str(valor).replace('.', ',')
+    return {
+        type(None): lambda valor: '',
+        str: texto_seguro,
+        datetime.datetime: lambda valor: valor.astimezone(fuso).strftime('%Y-%m-%d %H:%M:%S'),
+        Decimal: decimal_virgula,
+        float: decimal_virgula,
+    }
+
+
+def linhas_csv(queryset, colunas):
+    """Gera o CSV em blocos de texto (cabeçalho incluído), lendo o queryset em blocos."""
+    escritor = csv.writer(_Eco(), delimiter=SEPARADOR)
+    yield '\ufeff' + escritor.writerow([cabecalho for cabecalho, _ in colunas])
+
+    formatadores = _formatadores()
+    sem_conversao = lambda valor: valor
+    bloco = []
+    campos = [campo for _, campo in colunas]
+    for linha in queryset.values_list(*campos).iterator(chunk_size=LINHAS_POR_BLOCO):
+        bloco.append(escritor.writerow([formatadores.get(type(valor), sem_conversao)(valor) for valor in linha]))
+        if len(bloco) >= LINHAS_POR_BLOCO:
+            yield ''.join(bloco)
+            bloco = []
+    if bloco:
+        yield ''.join(bloco)
+
+
+def comprimir_gzip(blocos):
+    """Comprime um fluxo de texto em gzip à medida que é gerado."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits=31: cabeçalho e rodapé gzip
+    for bloco in blocos:
+        dados = compressor.compress(bloco.encode('utf-8'))
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+
+def ligacoes_do_periodo(data_inicio, data_fim):
+    return Ligacao.objects.filter(**filtro_periodo('data_ligacao', data_inicio, data_fim)).order_by('data_ligacao', 'id')
+
+
+def visitas_do_periodo(data_inicio, data_fim):
+    # Pelo dia da rota, como o dashboard: o ficheiro exportado bate com os totais do ecrã
+    return Visita.objects.filter(**filtro_periodo('rota__data_criacao', data_inicio, data_fim)).order_by('data_visita', 'id')
+
+
+def resposta_csv(request, queryset, colunas, nome, formato='csv'):
+    """StreamingHttpResponse com o CSV (ou CSV gzip) do queryset, sem o carregar em memória."""
+    blocos = linhas_csv(queryset, colunas)
+    if formato == 'csv.gz':
+        blocos = comprimir_gzip(blocos)
+        content_type = 'application/gzip'
+    else:
+        blocos = (bloco.encode('utf-8') for bloco in blocos)
+        content_type = 'text/csv; charset=utf-8'
+
+    # Em ASGI um iterador síncrono seria lido todo para memória antes de ser enviado
+    if isinstance(request, ASGIRequest):
+        blocos = iterar_em_thread(blocos)
+
+    resposta = StreamingHttpResponse(blocos, content_type=content_type)
+    resposta['Content-Disposition'] = f'attachment; filename="{nome}.{formato}"'
+    return resposta
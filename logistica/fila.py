@@ -0,0 +1,146 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import F, Min, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Carteira, Cliente, FilaContato, Ligacao
+
+# ==============================================================================
+# FILA DE CONTACTOS DO COCKPIT COMERCIAL
+# ==============================================================================
+# Cada agente tem uma linha por cliente a contactar (das suas carteiras ou com
+# retorno agendado), com a prioridade já calculada. O cockpit só lê as primeiras
+# N linhas pelo índice (agente, -prioridade); ligações, vendas e mudanças nas
+# carteiras recalculam apenas as linhas afetadas, e a fila inteira do agente é
+# refeita uma vez por dia (porque o atraso de cada cliente muda com a data).
+
+FILA_POR_PAGINA = 30
+ORDEM_FILA = ('-prioridade', 'id')
+
+# Pesos da prioridade
+PONTOS_RETORNO = 1000            # Retorno combinado com o cliente passa à frente de tudo
+PONTOS_POR_DIA_ATRASO = 10
+DIAS_ANTECEDENCIA = 3            # Começa a subir na fila 3 dias antes da próxima compra prevista
+LIMITE_DIAS_ATRASO = 60
+PONTOS_VIRADO = 150              # Virado ainda vale a tentativa, mas atrás dos atrasados recentes
+PONTOS_SEM_HISTORICO = 100
+REAIS_POR_PONTO_DIVIDA = 5
+LIMITE_PONTOS_DIVIDA = 100
+
+
+def calcular_prioridade(cliente, data_retorno, hoje):
+    """Pontuação do cliente na fila: retorno agendado, atraso face ao ciclo e dívida em aberto."""
+    pontos = 0
+    if data_retorno:
+        pontos += PONTOS_RETORNO + max(0, min((hoje - data_retorno).days, LIMITE_DIAS_ATRASO)) * PONTOS_POR_DIA_ATRASO
+
+    if cliente['data_virada'] and cliente['data_virada'] < hoje:
+        pontos += PONTOS_VIRADO
+    elif cliente['data_proxima_compra']:
+        dias = (hoje - cliente['data_proxima_compra']).days + DIAS_ANTECEDENCIA + 1
+        pontos += max(0, min(dias, LIMITE_DIAS_ATRASO)) * PONTOS_POR_DIA_ATRASO
+    else:
+        pontos += PONTOS_SEM_HISTORICO
+
+    divida = int(cliente['divida_atual'] or 0)
+    if divida > 0:
+        pontos += min(divida // REAIS_POR_PONTO_DIVIDA, LIMITE_PONTOS_DIVIDA)
+    return pontos
+
+
+def _ultimas_ligacoes(agente_id, clientes_ids=None):
+    """Última ligação do agente a cada cliente (uma linha por cliente, via função de janela)."""
+    ligacoes = Ligacao.objects.filter(agente_id=agente_id)
+    if clientes_ids is not None:
+        ligacoes = ligacoes.filter(cliente_id__in=clientes_ids)
+    ligacoes = ligacoes.annotate(
+        posicao=Window(RowNumber(), partition_by=[F('cliente_id')], order_by=[F('data_ligacao').desc(), F('id').desc()]),
+    ).filter(posicao=1).only('id', 'cliente_id', 'resultado', 'data_retorno', 'data_ligacao')
+    return {ligacao.cliente_id: ligacao for ligacao in ligacoes}
+
+
+def _nova_entrada(agente_id, cliente, ligacao, hoje):
+    data_retorno = None
+    disponivel_em = hoje
+    if ligacao:
+        if ligacao.resultado == 'REAGENDADO' and ligacao.data_retorno:
+            data_retorno = disponivel_em = ligacao.data_retorno
+        if timezone.localtime(ligacao.data_ligacao).date() >= hoje:
+            # Já contactado hoje: só volta à fila amanhã
+            disponivel_em = max(disponivel_em, hoje + datetime.timedelta(days=1))
+
+    return FilaContato(
+        agente_id=agente_id,
+        cliente_id=cliente['id'],
+        prioridade=calcular_prioridade(cliente, data_retorno, hoje),
+        disponivel_em=disponivel_em,
+        data_retorno=data_retorno,
+        ultima_ligacao=ligacao,
+        calculado_em=hoje,
+    )
+
+
+def sincronizar_fila(agente_id, clientes_ids=None, hoje=None):
+    """Recalcula a fila do agente: inteira, ou só as linhas dos clientes indicados."""
+    hoje = hoje or timezone.localdate()
+    campos = ('id', 'data_proxima_compra', 'data_virada', 'divida_atual')
+
+    da_carteira = Cliente.objects.filter(carteiras__agente_comercial_id=agente_id)
+    if clientes_ids is not None:
+        da_carteira = da_carteira.filter(id__in=clientes_ids)
+    clientes = {c['id']: c for c in da_carteira.values(*campos).distinct()}
+
+    # Retornos agendados continuam na fila mesmo que o cliente não esteja nas carteiras do agente
+    ultimas = _ultimas_ligacoes(agente_id, clientes_ids)
+    com_retorno = [
+        cliente_id for cliente_id, ligacao in ultimas.items()
+        if ligacao.resultado == 'REAGENDADO' and ligacao.data_retorno and cliente_id not in clientes
+    ]
+    if com_retorno:
+        clientes.update({c['id']: c for c in Cliente.objects.filter(id__in=com_retorno).values(*campos)})
+
+    entradas = [_nova_entrada(agente_id, cliente, ultimas.get(cliente_id), hoje) for cliente_id, cliente in clientes.items()]
+
+    with transaction.atomic():
+        antigas = FilaContato.objects.filter(agente_id=agente_id)
+        if clientes_ids is not None:
+            antigas = antigas.filter(cliente_id__in=clientes_ids)
+        antigas.delete()
+        FilaContato.objects.bulk_create(entradas, batch_size=1000, ignore_conflicts=True)
+    return len(entradas)
+
+
+def sincronizar_cliente(cliente_id, hoje=None):
+    """Recalcula as linhas de um cliente em todas as filas onde ele aparece (ex: após uma venda)."""
+    agentes = set(
+        Carteira.objects.filter(clientes=cliente_id, agente_comercial__isnull=False).values_list('agente_comercial_id', flat=True)
+    )
+    agentes.update(FilaContato.objects.filter(cliente_id=cliente_id).values_list('agente_id', flat=True))
+    for agente_id in agentes:
+        sincronizar_fila(agente_id, [cliente_id], hoje)
+
+
+def garantir_fila_do_dia(agente_id, hoje=None):
+    """Refaz a fila do agente se ainda não foi calculada hoje (primeiro acesso do dia)."""
+    hoje = hoje or timezone.localdate()
+    calculo_mais_antigo = FilaContato.objects.filter(agente_id=agente_id).aggregate(d=Min('calculado_em'))['d']
+    if calculo_mais_antigo is None or calculo_mais_antigo < hoje:
+        sincronizar_fila(agente_id, hoje=hoje)
+
+
+def fila_disponivel(agente_id, hoje=None):
+    """Linhas que o agente pode contactar hoje (sem retorno agendado), da maior para a menor prioridade."""
+    hoje = hoje or timezone.localdate()
+    return FilaContato.objects.filter(
+        agente_id=agente_id, data_retorno__isnull=True, disponivel_em__lte=hoje,
+    ).select_related('cliente')
+
+
+def retornos_do_dia(agente_id, hoje=None):
+    """Retornos agendados já vencidos, do mais antigo para o mais recente."""
+    hoje = hoje or timezone.localdate()
+    return FilaContato.objects.filter(
+        agente_id=agente_id, data_retorno__isnull=False, disponivel_em__lte=hoje,
+    ).select_related('cliente', 'ultima_ligacao').order_by('data_retorno', 'id')
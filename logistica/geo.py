@@ -0,0 +1,97 @@
+import math
+
+import numpy as np
+
+# ==============================================================================
+# GEOMETRIA (DISTÂNCIAS SOBRE A SUPERFÍCIE DA TERRA)
+# ==============================================================================
+
+RAIO_TERRA_KM = 6371.0088
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Distância em km (círculo máximo) entre dois pontos em graus."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * RAIO_TERRA_KM * math.asin(math.sqrt(a))
+
+
+def matriz_distancias(latitudes, longitudes):
+    """Matriz NxN de distâncias haversine (km), calculada de uma vez com numpy."""
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lng = np.radians(np.asarray(longitudes, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distancias_ate(lat, lng, latitudes, longitudes):
+    """Distâncias (km) de um ponto até cada um dos pontos indicados."""
+    lat, lng = math.radians(lat), math.radians(lng)
+    lats = np.radians(np.asarray(latitudes, dtype=float))
+    lngs = np.radians(np.asarray(longitudes, dtype=float))
+    a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def tem_coordenadas(latitude, longitude):
+    """True se o par lat/lng existe e é plausível (exclui o 0,0 de GPS sem sinal)."""
+    if latitude is None or longitude is None:
+        return False
+    if latitude == 0 and longitude == 0:
+        return False
+    return -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+# ------------------------------------------------------------------------------
+# GRELHA ESPACIAL (ÍNDICE DE PROXIMIDADE SEM POSTGIS)
+# ------------------------------------------------------------------------------
+# Cada ponto cai numa célula de LADO_CELULA_GRAUS x LADO_CELULA_GRAUS, numerada
+# linha a linha: celula = linha * COLUNAS_GRELHA + coluna. Como as colunas de uma
+# mesma linha são números seguidos, uma caixa lat/lng vira um intervalo de
+# células por linha (BETWEEN sobre a coluna indexada), em SQLite ou Postgres.
+
+LADO_CELULA_GRAUS = 0.01                     # ~1,1 km no equador
+COLUNAS_GRELHA = round(360 / LADO_CELULA_GRAUS)
+LINHAS_GRELHA = round(180 / LADO_CELULA_GRAUS)
+KM_POR_GRAU = math.pi * RAIO_TERRA_KM / 180
+MAXIMO_LINHAS_CAIXA = 200                    # Caixas maiores filtram só por lat/lng (a grelha já não ajuda)
+
+
+def _linha_coluna(latitude, longitude):
+    linha = min(int((latitude + 90) / LADO_CELULA_GRAUS), LINHAS_GRELHA - 1)
+    coluna = min(int((longitude + 180) / LADO_CELULA_GRAUS), COLUNAS_GRELHA - 1)
+    return linha, coluna
+
+
+def celula_grade(latitude, longitude):
+    """Número da célula da grelha que contém o ponto (None sem coordenadas válidas)."""
+    if not tem_coordenadas(latitude, longitude):
+        return None
+    linha, coluna = _linha_coluna(latitude, longitude)
+    return linha * COLUNAS_GRELHA + coluna
+
+
+def caixa_do_raio(latitude, longitude, raio_m):
+    """Caixa (lat_min, lat_max, lng_min, lng_max) que contém o círculo de raio_m metros à volta do ponto."""
+    delta_lat = raio_m / 1000 / KM_POR_GRAU
+    # Perto dos polos o círculo abrange todas as longitudes
+    cos_lat = math.cos(math.radians(min(abs(latitude) + delta_lat, 90)))
+    delta_lng = 180 if cos_lat < 1e-6 else min(raio_m / 1000 / (KM_POR_GRAU * cos_lat), 180)
+    return (
+        max(latitude - delta_lat, -90), min(latitude + delta_lat, 90),
+        max(longitude - delta_lng, -180), min(longitude + delta_lng, 180),
+    )
+
+
+def intervalos_de_celulas(lat_min, lat_max, lng_min, lng_max):
+    """Intervalos (primeira, última) de células que cobrem a caixa, um por linha; None se a caixa for grande demais."""
+    linha_min, coluna_min = _linha_coluna(lat_min, lng_min)
+    linha_max, coluna_max = _linha_coluna(lat_max, lng_max)
+    if linha_max - linha_min + 1 > MAXIMO_LINHAS_CAIXA:
+        return None
+    return [
+        (linha * COLUNAS_GRELHA + coluna_min, linha * COLUNAS_GRELHA + coluna_max)
+        for linha in range(linha_min, linha_max + 1)
+    ]
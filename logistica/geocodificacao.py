@@ -0,0 +1,273 @@
+import csv
+import datetime
+import hashlib
+import logging
+import statistics
+from collections import Counter, defaultdict, namedtuple
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .geo import celula_grade, tem_coordenadas
+from .models import Cliente, EnderecoGeocodificado
+from .normalizacao import normalizar_endereco
+
+# ==============================================================================
+# GEOCODIFICAÇÃO EM LOTE DOS CLIENTES SEM GPS
+# ==============================================================================
+# A maioria dos clientes chega pelo CSV ou pelo cadastro rápido sem latitude e
+# longitude, e fica de fora da proximidade, da roteirização e dos territórios.
+# Esta etapa corre em segundo plano depois das importações: normaliza o
+# endereço de cada cliente sem coordenadas, procura-o primeiro no cache
+# (EnderecoGeocodificado, uma linha por endereço normalizado, falhas incluídas)
+# e só pergunta ao backend pelos endereços nunca vistos, em lotes de milhares.
+#
+# O backend é trocável (GEOCODIFICACAO_BACKEND). O padrão, GazetteerLocal, não
+# usa rede: lê um CSV com o centro de cada rua e bairro (gerado a partir dos
+# clientes com GPS pelo comando gerar_gazetteer, ou exportado de outra fonte
+# no mesmo formato). As coordenadas aproximadas ficam marcadas no cliente
+# (Cliente.geocodificacao) e nunca servem de base ao próprio gazetteer.
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE = 2000
+NAO_ENCONTRADO = 'NAO_ENCONTRADO'
+
+# Endereços não encontrados voltam a ser tentados depois disto, ou logo que a fonte mude
+# (novo ficheiro do gazetteer, mais clientes com GPS)
+REPETIR_FALHAS_APOS = datetime.timedelta(days=30)
+
+# Colunas do ficheiro do gazetteer (logradouro vazio: centro do bairro)
+COLUNAS_GAZETTEER = ('logradouro', 'bairro', 'latitude', 'longitude')
+
+Resultado = namedtuple('Resultado', ['latitude', 'longitude', 'precisao'])
+
+# ------------------------------------------------------------------------------
+# Gazetteer local (backend padrão)
+# ------------------------------------------------------------------------------
+
+def centros_do_banco():
+    """
+    Linhas do gazetteer calculadas a partir dos clientes com GPS original: mediana das
+    coordenadas por rua (dentro do bairro) e por bairro. Devolve tuplos (logradouro, bairro, lat, lng).
+    """
+    ruas = defaultdict(list)
+    bairros = defaultdict(list)
+    com_gps = Cliente.objects.filter(latitude__isnull=False, longitude__isnull=False, geocodificacao='')
+    for endereco, bairro, latitude, longitude in com_gps.values_list(
+        'endereco', 'bairro', 'latitude', 'longitude'
+    ).iterator(chunk_size=TAMANHO_LOTE):
+        if not tem_coordenadas(latitude, longitude):
+            continue
+        normalizado = normalizar_endereco(endereco, bairro)
+        if normalizado.logradouro:
+            ruas[(normalizado.logradouro, normalizado.bairro)].append((latitude, longitude))
+        if normalizado.bairro:
+            bairros[normalizado.bairro].append((latitude, longitude))
+
+    def mediana(pontos):
+        return statistics.median(p[0] for p in pontos), statistics.median(p[1] for p in pontos)
+
+    linhas = [('', bairro, *mediana(pontos)) for bairro, pontos in sorted(bairros.items())]
+    linhas += [(logradouro, bairro, *mediana(pontos)) for (logradouro, bairro), pontos in sorted(ruas.items())]
+    return linhas
+
+
+def ler_gazetteer(caminho):
+    """Lê o CSV do gazetteer (separador ';', cabeçalho logradouro;bairro;latitude;longitude)."""
+    with open(caminho, encoding='utf-8-sig', newline='') as ficheiro:
+        for linha in csv.DictReader(ficheiro, delimiter=';'):
+            try:
+                latitude, longitude = float(linha['latitude']), float(linha['longitude'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if tem_coordenadas(latitude, longitude):
+                yield linha.get('logradouro') or '', linha.get('bairro') or '', latitude, longitude
+
+
+def escrever_gazetteer(caminho, linhas):
+    caminho = Path(caminho)
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    with open(caminho, 'w', encoding='utf-8', newline='') as ficheiro:
+        escritor = csv.writer(ficheiro, delimiter=';')
+        escritor.writerow(COLUNAS_GAZETTEER)
+        escritor.writerows((logradouro, bairro, f"{lat:.6f}", f"{lng:.6f}") for logradouro, bairro, lat, lng in linhas)
+
+
+class GazetteerLocal:
+    """
+    Centro da rua (no bairro) ou, na falta dela, centro do bairro, a partir do ficheiro em
+    GEOCODIFICACAO_GAZETTEER. Sem ficheiro usa os clientes com GPS do próprio banco.
+
+    Um backend tem `fonte` (identifica a origem e a versão dos dados, gravada no cache) e
+    `geocodificar(enderecos)`.
+    """
+
+    def __init__(self, caminho=None):
+        self.caminho = Path(caminho or settings.GEOCODIFICACAO_GAZETTEER)
+        self._ruas = None
+
+    @property
+    def fonte(self):
+        self._carregar()
+        return f"gazetteer:{self._versao}"
+
+    def _carregar(self):
+        if self._ruas is not None:
+            return
+        if self.caminho.exists():
+            linhas = ler_gazetteer(self.caminho)
+        else:
+            logger.info("Gazetteer %s não existe: a usar os clientes com GPS do banco.", self.caminho)
+            linhas = centros_do_banco()
+
+        self._ruas, self._bairros = {}, {}
+        pontos_por_nome = defaultdict(set)
+        resumo = hashlib.sha1()
+        for logradouro, bairro, latitude, longitude in linhas:
+            resumo.update(f"{logradouro};{bairro};{latitude};{longitude}\n".encode())
+            normalizado = normalizar_endereco(logradouro, bairro)
+            if normalizado.logradouro:
+                self._ruas[(normalizado.logradouro, normalizado.bairro)] = (latitude, longitude)
+                pontos_por_nome[normalizado.logradouro].add((latitude, longitude))
+            elif normalizado.bairro:
+                self._bairros[normalizado.bairro] = (latitude, longitude)
+        # Rua de bairro desconhecido: só se o nome existir num único sítio da cidade
+        self._ruas_unicas = {nome: next(iter(pontos)) for nome, pontos in pontos_por_nome.items() if len(pontos) == 1}
+        self._versao = resumo.hexdigest()[:12]
+
+    def geocodificar(self, enderecos):
+        """Recebe EnderecoNormalizado e devolve {chave: Resultado} só para os encontrados."""
+        self._carregar()
+        encontrados = {}
+        for endereco in enderecos:
+            if (endereco.logradouro, endereco.bairro) in self._ruas:
+                ponto, precisao = self._ruas[(endereco.logradouro, endereco.bairro)], 'RUA'
+            elif endereco.bairro in self._bairros:
+                ponto, precisao = self._bairros[endereco.bairro], 'BAIRRO'
+            elif endereco.logradouro in self._ruas_unicas:
+                ponto, precisao = self._ruas_unicas[endereco.logradouro], 'RUA'
+            else:
+                continue
+            encontrados[endereco.chave] = Resultado(ponto[0], ponto[1], precisao)
+        return encontrados
+
+
+def obter_backend():
+    return import_string(getattr(settings, 'GEOCODIFICACAO_BACKEND', 'logistica.geocodificacao.GazetteerLocal'))()
+
+# ------------------------------------------------------------------------------
+# Etapa em lote
+# ------------------------------------------------------------------------------
+
+def _resolver(normalizados, backend, contagem):
+    """Entradas do cache para as chaves do lote; as novas (e falhas antigas) vão ao backend e ficam gravadas."""
+    chaves = {normalizado.chave for normalizado in normalizados if normalizado.chave}
+    em_cache = EnderecoGeocodificado.objects.in_bulk(list(chaves), field_name='chave')
+    limite_falhas = timezone.now() - REPETIR_FALHAS_APOS
+
+    def falha_antiga(entrada):
+        return entrada.precisao == NAO_ENCONTRADO and (entrada.fonte != backend.fonte or entrada.resolvido_em < limite_falhas)
+
+    novos = {}
+    for normalizado in normalizados:
+        entrada = em_cache.get(normalizado.chave)
+        if normalizado.chave and normalizado.chave not in novos and (entrada is None or falha_antiga(entrada)):
+            novos[normalizado.chave] = normalizado
+    contagem['enderecos_do_cache'] += len(chaves) - len(novos)
+    contagem['enderecos_no_backend'] += len(novos)
+    if not novos:
+        return em_cache
+
+    encontrados = backend.geocodificar(list(novos.values()))
+    agora = timezone.now()
+    registos = []
+    for chave in novos:
+        resultado = encontrados.get(chave)
+        registos.append(EnderecoGeocodificado(
+            chave=chave,
+            latitude=resultado.latitude if resultado else None,
+            longitude=resultado.longitude if resultado else None,
+            precisao=resultado.precisao if resultado else NAO_ENCONTRADO,
+            fonte=backend.fonte,
+            resolvido_em=agora,
+        ))
+    # Upsert: outra execução em paralelo pode ter gravado a mesma chave entretanto
+    EnderecoGeocodificado.objects.bulk_create(
+        registos, batch_size=TAMANHO_LOTE, update_conflicts=True, unique_fields=['chave'],
+        update_fields=['latitude', 'longitude', 'precisao', 'fonte', 'resolvido_em'],
+    )
+    em_cache.update((registo.chave, registo) for registo in registos)
+    return em_cache
+
+
+def geocodificar_clientes(tamanho_lote=TAMANHO_LOTE, backend=None, progresso=None, clientes_ids=None):
+    """
+    Atribui coordenadas aproximadas aos clientes sem GPS (todos, ou só os de `clientes_ids`), em lotes,
+    e devolve a contagem da execução. `progresso(processados, total)` é chamado depois de cada lote.
+    """
+    backend = backend or obter_backend()
+    pendentes = Cliente.objects.filter(latitude__isnull=True)
+    if clientes_ids is not None:
+        pendentes = pendentes.filter(id__in=clientes_ids)
+    total = pendentes.count()
+    contagem = Counter(dict.fromkeys(
+        ('processados', 'EXATA', 'RUA', 'BAIRRO', 'sem_resultado', 'enderecos_do_cache', 'enderecos_no_backend'), 0
+    ))
+    ultimo_id = 0
+    while True:
+        # Paginação pelo id: os que ficam sem resultado não voltam a ser lidos nesta execução
+        lote = list(pendentes.filter(id__gt=ultimo_id).order_by('id').values_list('id', 'endereco', 'bairro')[:tamanho_lote])
+        if not lote:
+            break
+        ultimo_id = lote[-1][0]
+
+        normalizados = {cliente_id: normalizar_endereco(endereco, bairro) for cliente_id, endereco, bairro in lote}
+        em_cache = _resolver(normalizados.values(), backend, contagem)
+
+        # Clientes da mesma rua recebem o mesmo ponto: um UPDATE por ponto em vez de um CASE por cliente
+        por_ponto = defaultdict(list)
+        for cliente_id, normalizado in normalizados.items():
+            entrada = em_cache.get(normalizado.chave)
+            if entrada is None or entrada.latitude is None:
+                contagem['sem_resultado'] += 1
+                continue
+            contagem[entrada.precisao] += 1
+            por_ponto[(entrada.latitude, entrada.longitude, entrada.precisao)].append(cliente_id)
+        with transaction.atomic():
+            for (latitude, longitude, precisao), ids in por_ponto.items():
+                # latitude__isnull: quem ganhou GPS entretanto (edição, importação) não é sobrescrito
+                Cliente.objects.filter(id__in=ids, latitude__isnull=True).update(
+                    latitude=latitude, longitude=longitude,
+                    celula_grade=celula_grade(latitude, longitude), geocodificacao=precisao,
+                )
+
+        contagem['processados'] += len(lote)
+        if progresso:
+            progresso(contagem['processados'], max(total, contagem['processados']))
+    return dict(contagem)
+
+
+def estatisticas():
+    """Cobertura de coordenadas da base e tamanho do cache de endereços."""
+    clientes = Cliente.objects.aggregate(
+        total=Count('id'),
+        com_coordenadas=Count('id', filter=Q(latitude__isnull=False)),
+        gps_original=Count('id', filter=Q(latitude__isnull=False, geocodificacao='')),
+        exatas=Count('id', filter=Q(geocodificacao='EXATA')),
+        por_rua=Count('id', filter=Q(geocodificacao='RUA')),
+        por_bairro=Count('id', filter=Q(geocodificacao='BAIRRO')),
+    )
+    cache = EnderecoGeocodificado.objects.aggregate(
+        enderecos=Count('id'),
+        falhas=Count('id', filter=Q(precisao=NAO_ENCONTRADO)),
+    )
+    clientes['sem_coordenadas'] = clientes['total'] - clientes['com_coordenadas']
+    clientes['cobertura'] = round(100 * clientes['com_coordenadas'] / clientes['total'], 1) if clientes['total'] else 0.0
+    clientes['enderecos_em_cache'] = cache['enderecos']
+    clientes['falhas_em_cache'] = cache['falhas']
+    return clientes
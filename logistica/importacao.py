@@ -0,0 +1,289 @@
+import codecs
+import csv
+import itertools
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .duplicados import LIMIAR_SUGESTAO, Registo, pontuar
+from .geo import celula_grade, tem_coordenadas
+from .models import Cliente, Carteira, GramaBusca, ParDuplicado
+from .normalizacao import campos_busca, limpar_telefone, normalizar_bairro, telefone_e164, telefones_compativeis
+from . import referencias
+
+# ==============================================================================
+# MOTOR DE IMPORTAÇÃO MASSIVA DE CLIENTES (CSV)
+# ==============================================================================
+
+TAMANHO_LOTE_PADRAO = 1000
+BAIRRO_PADRAO_IMPORTACAO = "Bairro não informado"
+
+
+def mapear_colunas(cabecalho):
+    """Identifica as colunas conhecidas a partir da linha de cabeçalho do ficheiro."""
+    col_map = {}
+    for i, col in enumerate(c.lower() for c in cabecalho):
+        if 'nome resp' in col or ('nome' in col and 'nome' not in col_map): col_map['nome'] = i
+        elif 'endere' in col: col_map['endereco'] = i
+        elif 'número' in col or 'numero' in col: col_map['numero'] = i
+        elif 'bairro' in col: col_map['bairro'] = i
+        elif 'telefone' in col: col_map['telefone'] = i
+        elif 'latitude' in col or col == 'lat': col_map['latitude'] = i
+        elif 'longitude' in col or col in ('lng', 'lon'): col_map['longitude'] = i
+    return col_map
+
+
+class ResultadoImportacao:
+    """Resumo de uma importação: contadores, rejeições por linha e débito (linhas/s)."""
+
+    def __init__(self):
+        self.linhas_lidas = 0
+        self.criados = 0
+        self.existentes = 0
+        self.vinculados = 0
+        self.para_rever = 0   # Pares de homónimos (um sem telefone) deixados para a revisão de duplicados
+        self.rejeicoes = []  # Lista de (número da linha, motivo)
+        self.segundos = 0.0
+
+    @property
+    def aceites(self):
+        return self.criados + self.existentes
+
+    @property
+    def linhas_por_segundo(self):
+        if not self.segundos:
+            return 0.0
+        return self.linhas_lidas / self.segundos
+
+    def rejeitar(self, linha, motivo):
+        self.rejeicoes.append((linha, motivo))
+
+    def __str__(self):
+        texto = f"{self.criados} novos, {self.existentes} já existentes, {len(self.rejeicoes)} rejeitados"
+        if self.para_rever:
+            texto += f", {self.para_rever} possíveis duplicados para rever"
+        return f"{texto} ({self.linhas_por_segundo:.0f} linhas/s)"
+
+
+def _ler_linhas(arquivo):
+    """Lê o ficheiro em streaming (linha a linha) e deteta o delimitador pela 1ª linha."""
+    linhas = codecs.iterdecode(arquivo, 'utf-8-sig', errors='replace')
+    primeira_linha = next(linhas, '')
+    delimiter = ';' if ';' in primeira_linha else ','
+    return csv.reader(itertools.chain([primeira_linha], linhas), delimiter=delimiter)
+
+
+def _ler_coordenada(valor):
+    """Converte '-3,7319' ou '-3.7319' em float; vazio ou inválido fica None."""
+    try:
+        return float(valor.strip().replace(',', '.')) if valor and valor.strip() else None
+    except ValueError:
+        return None
+
+
+def _extrair_cliente(row, col_map):
+    """Converte uma linha do CSV nos campos do Cliente. Devolve (dados, motivo_rejeicao)."""
+    def coluna(chave, padrao=""):
+        if chave not in col_map:
+            return padrao
+        return row[col_map[chave]]
+
+    try:
+        raw_nome = coluna('nome')
+        end = coluna('endereco')
+        num = coluna('numero')
+        bairro = coluna('bairro', BAIRRO_PADRAO_IMPORTACAO) or BAIRRO_PADRAO_IMPORTACAO
+        tel = coluna('telefone')
+        lat = _ler_coordenada(coluna('latitude'))
+        lng = _ler_coordenada(coluna('longitude'))
+    except IndexError:
+        return None, "linha com colunas em falta"
+
+    if not raw_nome:
+        return None, "nome vazio"
+    if raw_nome.isdigit():
+        return None, "nome numérico"
+
+    # GPS opcional: um par incompleto ou fora do globo é ignorado, sem rejeitar a linha
+    if not tem_coordenadas(lat, lng):
+        lat = lng = None
+
+    dados = {
+        'nome': raw_nome[:100],
+        'endereco': f"{end}, {num}".strip(' ,-')[:255],
+        'bairro': bairro[:100],
+        'telefone': limpar_telefone(tel),
+        'latitude': lat,
+        'longitude': lng,
+        # O bulk_create não passa pelo save(): a célula da grelha e as colunas da busca são calculadas aqui
+        'celula_grade': celula_grade(lat, lng),
+    }
+    dados.update(campos_busca(dados['nome'], dados['telefone'], None, dados['endereco'], dados['bairro']))
+    dados['telefone_e164'] = telefone_e164(dados['telefone'], settings.TELEFONE_DDD_PADRAO)
+    return dados, None
+
+
+def _mesmo_cliente(candidatos, telefone_busca, endereco_busca):
+    """
+    O primeiro dos candidatos (telefone, endereço, valor) com o mesmo nome que é o mesmo cliente, ou None.
+    Um telefone compatível confirma-o; sem o telefone de um dos lados, confirma-o o mesmo endereço.
+    """
+    candidatos = list(candidatos)
+    for telefone, _, valor in candidatos:
+        if telefones_compativeis(telefone, telefone_busca):
+            return valor
+    for telefone, endereco, valor in candidatos:
+        if not (telefone and telefone_busca) and endereco == endereco_busca:
+            return valor
+    return None
+
+
+def _registo(cliente):
+    return Registo(
+        cliente.pk, cliente.nome_busca, cliente.telefone_busca, cliente.documento_busca,
+        cliente.endereco_busca, normalizar_bairro(cliente.bairro),
+    )
+
+
+def _pares_sem_telefone(novos, existentes):
+    """
+    Pares de homónimos em que falta o telefone de um dos lados. Podem ser a mesma pessoa, mas nada o
+    confirma: em vez de os juntar, ficam em ParDuplicado (pontuados como na deteção) para o gerente rever.
+    """
+    pares = {}
+    for nome, clientes in novos.items():
+        anteriores = list(existentes[nome])
+        for cliente in clientes:
+            registo = _registo(cliente)
+            for outro in anteriores:
+                if outro.telefone and registo.telefone:
+                    continue   # Telefones diferentes: homónimos, clientes diferentes
+                pontuacao, motivo = pontuar(outro, registo)
+                if pontuacao >= LIMIAR_SUGESTAO:
+                    a, b = sorted((outro.id, registo.id))
+                    pares[(a, b)] = ParDuplicado(cliente_a_id=a, cliente_b_id=b, pontuacao=round(pontuacao, 3), motivo=motivo)
+            anteriores.append(registo)
+    return list(pares.values())
+
+
+def _gravar_lote(lote, carteira, resultado):
+    """Grava um lote: 1 consulta de existentes, 1 bulk_create e 1 bulk insert na tabela de ligação."""
+    # O mesmo cliente é o mesmo nome normalizado com um telefone compatível ("JOSÉ SILVA" e
+    # "Jose Silva", com e sem o 9) ou, sem telefone num dos lados, com o mesmo endereço; dois
+    # homónimos com telefones diferentes são clientes diferentes, e um homónimo sem telefone noutro
+    # endereço é criado e o par vai para a revisão de duplicados
+    existentes = defaultdict(list)
+    nomes = {dados['nome_busca'] for _, dados in lote}
+    for cliente in (
+        Cliente.objects.filter(nome_busca__in=nomes).order_by('id')
+        .only('id', 'nome_busca', 'telefone_busca', 'documento_busca', 'endereco_busca', 'bairro')
+    ):
+        existentes[cliente.nome_busca].append(_registo(cliente))
+
+    novos = defaultdict(list)
+    linhas = []   # Por linha: o id do cliente existente ou o Cliente novo
+    for _, dados in lote:
+        nome, telefone, endereco = dados['nome_busca'], dados['telefone_busca'], dados['endereco_busca']
+        pk = _mesmo_cliente(((r.telefone, r.endereco, r.id) for r in existentes[nome]), telefone, endereco)
+        if pk is not None:
+            resultado.existentes += 1
+            linhas.append(pk)
+            continue
+        # Repetido dentro do próprio ficheiro: aproveita o registo já criado
+        cliente = _mesmo_cliente(((c.telefone_busca, c.endereco_busca, c) for c in novos[nome]), telefone, endereco)
+        if cliente is None:
+            cliente = Cliente(**dados)
+            novos[nome].append(cliente)
+            resultado.criados += 1
+        else:
+            resultado.existentes += 1
+        linhas.append(cliente)
+
+    with transaction.atomic():
+        criados = Cliente.objects.bulk_create([c for lista in novos.values() for c in lista], batch_size=TAMANHO_LOTE_PADRAO)
+
+        # Bancos sem RETURNING não devolvem os IDs: recupera-os numa única consulta. Nome, telefone e
+        # endereço identificam cada cliente novo (com os três iguais, _mesmo_cliente tê-los-ia juntado)
+        if any(c.pk is None for c in criados):
+            ids = {}
+            for nome, telefone, endereco, pk in (
+                Cliente.objects.filter(nome_busca__in=list(novos)).order_by('-id')
+                .values_list('nome_busca', 'telefone_busca', 'endereco_busca', 'id')
+            ):
+                ids.setdefault((nome, telefone, endereco), pk)
+            for cliente in criados:
+                cliente.pk = ids[(cliente.nome_busca, cliente.telefone_busca, cliente.endereco_busca)]
+        GramaBusca.objects.reindexar(criados)
+
+        pares = _pares_sem_telefone(novos, existentes)
+        ParDuplicado.objects.bulk_create(pares, ignore_conflicts=True)
+        resultado.para_rever += len(pares)
+
+        if carteira is None:
+            return
+
+        Membro = Carteira.clientes.through
+        membros = {linha if isinstance(linha, int) else linha.pk for linha in linhas}
+        # Só contam os vínculos novos: quem já estava na carteira fica de fora do INSERT (o
+        # ignore_conflicts é só a rede de segurança)
+        membros -= set(
+            Membro.objects.filter(carteira_id=carteira.pk, cliente_id__in=membros).values_list('cliente_id', flat=True)
+        )
+        Membro.objects.bulk_create(
+            [Membro(carteira_id=carteira.pk, cliente_id=pk) for pk in membros],
+            batch_size=TAMANHO_LOTE_PADRAO,
+            ignore_conflicts=True,
+        )
+        resultado.vinculados += len(membros)
+
+
+def importar_clientes_csv(arquivo, carteira=None, tamanho_lote=TAMANHO_LOTE_PADRAO, progresso=None):
+    """
+    Importa clientes de um CSV em lotes (set-based), opcionalmente vinculando-os a uma Carteira.
+    Clientes já existentes (mesmo nome, sem acentos nem maiúsculas, e telefone compatível ou, sem
+    telefone de um dos lados, o mesmo endereço) são reaproveitados e nunca duplicados; homónimos
+    com outro telefone são clientes novos.
+    `progresso(linhas_lidas)`, se indicado, é chamado depois de cada lote gravado.
+    """
+    resultado = ResultadoImportacao()
+    inicio = time.perf_counter()
+
+    col_map = None
+    lote = []
+    for num_linha, row in enumerate(_ler_linhas(arquivo), start=1):
+        row = [str(c).strip() for c in row]
+        if not any(row):
+            continue
+
+        if col_map is None:
+            col_map = mapear_colunas(row)
+            if 'nome' not in col_map:
+                raise ValueError("O cabeçalho do ficheiro não tem uma coluna de nome.")
+            continue
+
+        resultado.linhas_lidas += 1
+        dados, motivo = _extrair_cliente(row, col_map)
+        if motivo:
+            resultado.rejeitar(num_linha, motivo)
+            continue
+
+        lote.append((num_linha, dados))
+        if len(lote) >= tamanho_lote:
+            _gravar_lote(lote, carteira, resultado)
+            lote = []
+            if progresso:
+                progresso(resultado.linhas_lidas)
+
+    if lote:
+        _gravar_lote(lote, carteira, resultado)
+    if progresso:
+        progresso(resultado.linhas_lidas)
+
+    # bulk_create não dispara sinais: a lista de bairros em cache tem de ser apagada aqui
+    if resultado.criados:
+        referencias.invalidar('bairros')
+
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
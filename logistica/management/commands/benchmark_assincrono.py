@@ -0,0 +1,131 @@
+import asyncio
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+# Páginas medidas e o perfil que as abre
+PAGINAS = (
+    ('dashboard', 'gerente'),
+    ('dash_comercial', 'agente'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a latência do dashboard e do cockpit servidos em modo síncrono (WSGI, queries em "
+        "sequência) e assíncrono (ASGI, queries em paralelo). Corre contra o banco configurado: "
+        "PostgreSQL com DATABASE_URL, senão o SQLite local (use --latencia-ms para simular a rede)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=20, help="Pedidos por página e modo.")
+        parser.add_argument('--latencia-ms', type=float, default=0.0, help="Atraso artificial por query (ida e volta ao banco).")
+        parser.add_argument('--gerente', help="Username do gerente (padrão: primeiro staff ativo).")
+        parser.add_argument('--agente', help="Username do agente (padrão: o primeiro com carteira).")
+
+    def handle(self, *args, **options):
+        perfis = {
+            'gerente': self._utilizador(options['gerente'], User.objects.filter(is_active=True, is_staff=True), 'gerente'),
+            'agente': self._utilizador(options['agente'], User.objects.filter(is_active=True, carteiras_comerciais__isnull=False), 'agente com carteira'),
+        }
+        latencia = options['latencia_ms'] / 1000
+        repeticoes = max(1, options['repeticoes'])
+
+        def atrasar(execute, sql, params, many, context):
+            time.sleep(latencia)
+            return execute(sql, params, many, context)
+
+        def instrumentar(connection, **kwargs):
+            # A mesma ligação (por thread) volta a emitir connection_created a cada reabertura
+            if atrasar not in connection.execute_wrappers:
+                connection.execute_wrappers.append(atrasar)
+
+        if latencia:
+            # Todas as ligações, incluindo as abertas pelas threads das queries em paralelo
+            connection_created.connect(instrumentar, dispatch_uid='benchmark_latencia')
+            for ligacao in connections.all(initialized_only=True):
+                instrumentar(ligacao)
+
+        self.stdout.write(
+            f"Banco: {connection.vendor} ({connection.settings_dict['NAME']}), latência simulada "
+            f"{options['latencia_ms']:.0f} ms/query, {repeticoes} pedidos por página e modo.\n"
+        )
+        self.stdout.write(f"{'página':16} {'modo':6} {'mediana ms':>11} {'p95 ms':>9} {'mínimo ms':>10}")
+        setup_test_environment()
+        try:
+            for nome, perfil in PAGINAS:
+                url = reverse(nome)
+                with override_settings(CONSULTAS_CONCORRENTES=False):
+                    sincrono = self._medir_sincrono(perfis[perfil], url, repeticoes)
+                with override_settings(CONSULTAS_CONCORRENTES=True):
+                    assincrono = self._medir_assincrono(perfis[perfil], url, repeticoes)
+                for modo, tempos in (('sync', sincrono), ('async', assincrono)):
+                    self.stdout.write(
+                        f"{nome:16} {modo:6} {statistics.median(tempos):11.1f} "
+                        f"{self._percentil(tempos, 95):9.1f} {min(tempos):10.1f}"
+                    )
+                ganho = statistics.median(sincrono) / statistics.median(assincrono)
+                self.stdout.write(self.style.SUCCESS(f"{nome:16} async {ganho:.2f}x mais rápido (mediana)\n"))
+        finally:
+            teardown_test_environment()
+            connection_created.disconnect(dispatch_uid='benchmark_latencia')
+            for ligacao in connections.all(initialized_only=True):
+                if atrasar in ligacao.execute_wrappers:
+                    ligacao.execute_wrappers.remove(atrasar)
+
+    # --------------------------------------------------------------------------
+
+    def _utilizador(self, username, padrao, descricao):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"Utilizador '{username}' não existe.")
+        utilizador = padrao.order_by('id').first()
+        if utilizador is None:
+            raise CommandError(f"Não há nenhum {descricao} na base (use gerar_dados_sinteticos).")
+        return utilizador
+
+    def _medir_sincrono(self, utilizador, url, repeticoes):
+        """Pedidos pelo handler WSGI (como o gunicorn síncrono)."""
+        cliente = Client()
+        cliente.force_login(utilizador)
+        self._verificar(cliente.get(url), url)   # aquecimento (fila do dia, caches)
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            cliente.get(url)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return tempos
+
+    def _medir_assincrono(self, utilizador, url, repeticoes):
+        """Pedidos pelo handler ASGI (como o uvicorn), todos no mesmo event loop."""
+        cliente = AsyncClient()
+        cliente.force_login(utilizador)
+
+        async def medir():
+            self._verificar(await cliente.get(url), url)
+            tempos = []
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                await cliente.get(url)
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            return tempos
+
+        return asyncio.run(medir())
+
+    def _verificar(self, resposta, url):
+        if resposta.status_code != 200:
+            raise CommandError(f"{url} respondeu {resposta.status_code}.")
+
+    @staticmethod
+    def _percentil(tempos, percentil):
+        ordenados = sorted(tempos)
+        return ordenados[min(len(ordenados) - 1, int(len(ordenados) * percentil / 100))]
@@ -0,0 +1,103 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+
+from logistica.geo import tem_coordenadas
+from logistica.models import Rota, Visita
+from logistica.roteirizacao import comprimento_km, ordenar_paradas
+
+# Instâncias aleatórias: Fortaleza e arredores (as mesmas referências da base sintética)
+CENTRO_LAT, CENTRO_LNG = -3.7319, -38.5267
+RAIO_GRAUS = 0.12
+LADO_BAIRRO_GRAUS = 0.04
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o comprimento do percurso (km) e o tempo de cálculo da ordem atual (bairro, nome), "
+        "do vizinho mais próximo e da roteirização completa (2-opt + Or-opt), em rotas reais ou aleatórias."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rotas', type=int, default=20, help="Quantas rotas reais (as mais recentes) medir.")
+        parser.add_argument('--minimo', type=int, default=5, help="Mínimo de paragens com GPS para usar uma rota.")
+        parser.add_argument('--aleatorio', type=int, default=0, help="Em vez de rotas reais, gera N instâncias aleatórias.")
+        parser.add_argument('--paradas', type=int, default=150, help="Paragens por instância aleatória.")
+        parser.add_argument('--semente', type=int, default=42)
+
+    def handle(self, *args, **options):
+        instancias = self._aleatorias(options) if options['aleatorio'] else self._reais(options)
+        if not instancias:
+            raise CommandError("Nenhuma rota com paragens suficientes (use --aleatorio N ou gerar_dados_sinteticos).")
+
+        totais = {'atual': 0.0, 'vizinho': 0.0, 'otimizada': 0.0}
+        tempos = []
+        self.stdout.write(f"{'instância':30} {'paragens':>8} {'atual km':>10} {'vizinho km':>11} {'otimizada km':>13} {'ganho':>7} {'ms':>8}")
+        for nome, paragens in instancias:
+            lats = [p[0] for p in paragens]
+            lngs = [p[1] for p in paragens]
+            # Ordem atual da lista do motoqueiro: bairro, nome
+            atual = sorted(range(len(paragens)), key=lambda i: (paragens[i][2], paragens[i][3]))
+            vizinho = ordenar_paradas(lats, lngs, melhorar=False)
+
+            inicio = time.perf_counter()
+            otimizada = ordenar_paradas(lats, lngs)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+
+            km = {
+                'atual': comprimento_km(lats, lngs, atual),
+                'vizinho': comprimento_km(lats, lngs, vizinho),
+                'otimizada': comprimento_km(lats, lngs, otimizada),
+            }
+            for chave, valor in km.items():
+                totais[chave] += valor
+            ganho = (1 - km['otimizada'] / km['atual']) * 100 if km['atual'] else 0
+            self.stdout.write(
+                f"{nome[:30]:30} {len(paragens):8} {km['atual']:10.1f} {km['vizinho']:11.1f} "
+                f"{km['otimizada']:13.1f} {ganho:6.0f}% {tempos[-1]:8.1f}"
+            )
+
+        ganho_total = (1 - totais['otimizada'] / totais['atual']) * 100 if totais['atual'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"\nTotal: atual {totais['atual']:.1f} km, vizinho mais próximo {totais['vizinho']:.1f} km, "
+            f"otimizada {totais['otimizada']:.1f} km ({ganho_total:.0f}% menos que a ordem atual). "
+            f"Tempo de cálculo: mediana {statistics.median(tempos):.1f} ms, máximo {max(tempos):.1f} ms."
+        ))
+
+    # --------------------------------------------------------------------------
+
+    def _reais(self, options):
+        """Paragens (lat, lng, bairro, nome) das rotas mais recentes com GPS suficiente."""
+        rotas = (
+            Rota.objects.annotate(com_gps=Count('visita', filter=Q(visita__cliente__latitude__isnull=False)))
+            .filter(com_gps__gte=options['minimo'])
+            .order_by('-data_criacao', '-id')[:options['rotas']]
+        )
+        instancias = []
+        for rota in rotas:
+            paragens = [
+                linha for linha in Visita.objects.filter(rota=rota).values_list(
+                    'cliente__latitude', 'cliente__longitude', 'cliente__bairro', 'cliente__nome'
+                )
+                if tem_coordenadas(linha[0], linha[1])
+            ]
+            if len(paragens) >= options['minimo']:
+                instancias.append((f"{rota.nome} #{rota.id}", paragens))
+        return instancias
+
+    def _aleatorias(self, options):
+        gerador = random.Random(options['semente'])
+        instancias = []
+        for numero in range(1, options['aleatorio'] + 1):
+            paragens = []
+            for indice in range(options['paradas']):
+                lat = CENTRO_LAT + gerador.uniform(-RAIO_GRAUS, RAIO_GRAUS)
+                lng = CENTRO_LNG + gerador.uniform(-RAIO_GRAUS, RAIO_GRAUS)
+                # "Bairro" = quadrícula de ~4 km, para a ordem atual agrupar vizinhos como na vida real
+                bairro = f"Bairro {int((lat - CENTRO_LAT + RAIO_GRAUS) / LADO_BAIRRO_GRAUS)}-{int((lng - CENTRO_LNG + RAIO_GRAUS) / LADO_BAIRRO_GRAUS)}"
+                paragens.append((lat, lng, bairro, f"Cliente {indice:03}"))
+            instancias.append((f"aleatória {numero}", paragens))
+        return instancias
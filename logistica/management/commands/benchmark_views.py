@@ -0,0 +1,215 @@
+import datetime
+import json
+import statistics
+import subprocess
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from logistica.models import Carteira, Cliente, Ligacao, Visita
+
+# Parâmetros de URL preenchidos com um exemplo real da base
+EXEMPLOS_PARAMETROS = {
+    'id_visita': lambda contexto: contexto['visita'],
+    'id_cliente': lambda contexto: contexto['cliente'],
+    'cliente_id': lambda contexto: contexto['cliente'],
+    'id_carteira': lambda contexto: contexto['carteira'],
+}
+
+
+def _rotas_da_aplicacao(padroes=None):
+    """URLs nomeadas do projeto (ignora os includes do admin e da autenticação)."""
+    for padrao in padroes if padroes is not None else get_resolver().url_patterns:
+        if isinstance(padrao, URLResolver):
+            continue
+        if isinstance(padrao, URLPattern) and padrao.name:
+            yield padrao
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede todas as views de core_rotas/urls.py com o cliente de testes, para cada perfil "
+        "(gerente, motoqueiro, agente): tempo, número de queries e a query mais lenta, em JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=3, help="Pedidos por view e perfil (usa-se a mediana).")
+        parser.add_argument('--dias', type=int, default=30, help="Período enviado em data_inicio/data_fim.")
+        parser.add_argument('--gerente', help="Username do gerente (padrão: primeiro staff ativo).")
+        parser.add_argument('--motoqueiro', help="Username do motoqueiro (padrão: o primeiro com rotas).")
+        parser.add_argument('--agente', help="Username do agente (padrão: o primeiro com carteira).")
+        parser.add_argument('--saida', help="Grava o JSON neste ficheiro em vez de o imprimir.")
+        parser.add_argument('--comparar', help="JSON de uma execução anterior: mostra a variação por view.")
+
+    def handle(self, *args, **options):
+        perfis = self._perfis(options)
+        hoje = timezone.localdate()
+        periodo = {
+            'data_inicio': (hoje - datetime.timedelta(days=options['dias'])).isoformat(),
+            'data_fim': hoje.isoformat(),
+        }
+
+        setup_test_environment()
+        try:
+            resultados = []
+            for padrao in _rotas_da_aplicacao():
+                for perfil, utilizador in perfis.items():
+                    url = self._url(padrao, utilizador)
+                    if url:
+                        resultados.append(self._medir(padrao.name, perfil, utilizador, url, periodo, options['repeticoes']))
+        finally:
+            teardown_test_environment()
+
+        relatorio = {
+            'commit': _commit_atual(),
+            'data': timezone.now().isoformat(),
+            'banco': connection.vendor,
+            'base': {
+                'clientes': Cliente.objects.count(),
+                'carteiras': Carteira.objects.count(),
+                'visitas': Visita.objects.count(),
+                'ligacoes': Ligacao.objects.count(),
+            },
+            'parametros': {'repeticoes': options['repeticoes'], **periodo},
+            'views': resultados,
+        }
+
+        texto = json.dumps(relatorio, ensure_ascii=False, indent=2)
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as ficheiro:
+                ficheiro.write(texto)
+            self.stderr.write(f"Relatório gravado em {options['saida']}.")
+        else:
+            self.stdout.write(texto)
+
+        if options['comparar']:
+            self._comparar(options['comparar'], resultados)
+
+    # --------------------------------------------------------------------------
+
+    def _perfis(self, options):
+        def escolher(username, padrao, descricao):
+            if username:
+                try:
+                    return User.objects.get(username=username)
+                except User.DoesNotExist:
+                    raise CommandError(f"Utilizador '{username}' não existe.")
+            utilizador = padrao.first()
+            if utilizador is None:
+                raise CommandError(f"Não há nenhum {descricao} na base (use gerar_dados_sinteticos).")
+            return utilizador
+
+        ativos = User.objects.filter(is_active=True)
+        return {
+            'gerente': escolher(options['gerente'], ativos.filter(is_staff=True).order_by('id'), 'gerente'),
+            'motoqueiro': escolher(
+                options['motoqueiro'],
+                ativos.filter(is_staff=False, rota__isnull=False).order_by('id'),
+                'motoqueiro com rotas',
+            ),
+            'agente': escolher(
+                options['agente'],
+                ativos.filter(carteiras_comerciais__isnull=False).order_by('id'),
+                'agente com carteira',
+            ),
+        }
+
+    def _url(self, padrao, utilizador):
+        """Monta a URL da view com ids de exemplo visíveis para o utilizador."""
+        parametros = list(padrao.pattern.converters)
+        if not parametros:
+            return reverse(padrao.name)
+
+        contexto = {
+            'visita': (
+                Visita.objects.filter(rota__motoqueiro=utilizador).order_by('-id').values_list('id', flat=True).first()
+                or Visita.objects.order_by('-id').values_list('id', flat=True).first()
+            ),
+            'cliente': Cliente.objects.order_by('id').values_list('id', flat=True).first(),
+            'carteira': Carteira.objects.order_by('id').values_list('id', flat=True).first(),
+        }
+        valores = {}
+        for nome in parametros:
+            exemplo = EXEMPLOS_PARAMETROS.get(nome)
+            valor = exemplo(contexto) if exemplo else None
+            if valor is None:
+                self.stderr.write(f"  {padrao.name}: sem exemplo para <{nome}>, ignorada.")
+                return None
+            valores[nome] = valor
+        return reverse(padrao.name, kwargs=valores)
+
+    def _medir(self, nome, perfil, utilizador, url, periodo, repeticoes):
+        cliente = Client()
+        cliente.force_login(utilizador)
+
+        tempos, queries, mais_lenta = [], [], None
+        estado, tamanho = None, 0
+        for _ in range(max(1, repeticoes)):
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                resposta = cliente.get(url, periodo)
+                tempos.append(time.perf_counter() - inicio)
+            queries.append(len(capturadas))
+            if resposta.streaming:
+                # Canais SSE não terminam: mede-se só até aos cabeçalhos
+                resposta.close()
+                estado, tamanho = resposta.status_code, 0
+            else:
+                estado, tamanho = resposta.status_code, len(resposta.content)
+            for query in capturadas.captured_queries:
+                if mais_lenta is None or float(query['time']) > float(mais_lenta['time']):
+                    mais_lenta = query
+
+        self.stderr.write(f"  {nome:28} {perfil:10} {estado} {statistics.median(tempos) * 1000:8.1f} ms {queries[-1]:4} queries")
+        return {
+            'view': nome,
+            'perfil': perfil,
+            'url': url,
+            'status': estado,
+            'bytes': tamanho,
+            'tempo_ms': {
+                'mediana': round(statistics.median(tempos) * 1000, 2),
+                'minimo': round(min(tempos) * 1000, 2),
+                'maximo': round(max(tempos) * 1000, 2),
+            },
+            'queries': queries[-1],
+            'query_mais_lenta': {
+                'ms': round(float(mais_lenta['time']) * 1000, 2),
+                'sql': mais_lenta['sql'],
+            } if mais_lenta else None,
+        }
+
+    def _comparar(self, caminho, resultados):
+        try:
+            with open(caminho, encoding='utf-8') as ficheiro:
+                anterior = json.load(ficheiro)
+        except (OSError, ValueError) as erro:
+            raise CommandError(f"Não foi possível ler {caminho}: {erro}")
+
+        antes = {(linha['view'], linha['perfil']): linha for linha in anterior.get('views', [])}
+        self.stderr.write(f"\nComparação com {anterior.get('commit') or caminho}:")
+        for linha in resultados:
+            base = antes.get((linha['view'], linha['perfil']))
+            if not base:
+                continue
+            t0, t1 = base['tempo_ms']['mediana'], linha['tempo_ms']['mediana']
+            variacao = f"{(t1 - t0) / t0 * 100:+6.0f}%" if t0 else "   n/a"
+            self.stderr.write(
+                f"  {linha['view']:28} {linha['perfil']:10} {t0:8.1f} -> {t1:8.1f} ms ({variacao}) "
+                f"queries {base['queries']} -> {linha['queries']}"
+            )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from logistica import duplicados
+
+
+class Command(BaseCommand):
+    help = (
+        "Procura clientes duplicados (telefone, documento, nome parecido no mesmo bairro) e grava os pares "
+        "para revisão em /clientes/duplicados/. Com --fundir-acima, funde logo os grupos com essa pontuação."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limiar', type=float, default=duplicados.LIMIAR_SUGESTAO, help="Pontuação mínima (0 a 1) de um par sugerido.")
+        parser.add_argument('--fundir-acima', type=float, default=None, help="Funde os grupos com pelo menos esta pontuação (ex.: 0.92).")
+
+    def handle(self, *args, **options):
+        if not 0 < options['limiar'] <= 1:
+            raise CommandError("O limiar tem de estar entre 0 e 1.")
+
+        estatisticas = duplicados.detectar(
+            limiar=options['limiar'],
+            progresso=lambda feitos, total: self.stdout.write(f"{feitos} de {total} blocos...", ending='\r'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{estatisticas['pares']} pares entre {estatisticas['clientes']} clientes "
+            f"({estatisticas['comparacoes']} comparações em {estatisticas['blocos']} blocos, {estatisticas['segundos']}s)."
+        ))
+
+        if options['fundir_acima'] is not None:
+            grupos = duplicados.escolher_principais(duplicados.grupos_sugeridos(options['fundir_acima']))
+            totais = duplicados.fundir(
+                grupos,
+                progresso=lambda feitos, total: self.stdout.write(f"{feitos} de {total} grupos...", ending='\r'),
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"{totais['clientes']} clientes fundidos em {totais['grupos']} "
+                f"({totais['visitas']} visitas e {totais['ligacoes']} ligações transferidas)."
+            ))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from logistica import geocodificacao
+
+
+class Command(BaseCommand):
+    help = (
+        "Dá coordenadas aproximadas (centro da rua ou do bairro) aos clientes sem GPS, em lotes, pelo "
+        "backend GEOCODIFICACAO_BACKEND e com cache por endereço normalizado. Mostra a cobertura no fim."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=geocodificacao.TAMANHO_LOTE, help="Clientes por lote.")
+        parser.add_argument('--estatisticas', action='store_true', help="Só mostra a cobertura atual, sem geocodificar.")
+
+    def handle(self, *args, **options):
+        if not options['estatisticas']:
+            inicio = time.perf_counter()
+            execucao = geocodificacao.geocodificar_clientes(tamanho_lote=max(1, options['lote']))
+            segundos = time.perf_counter() - inicio
+            self.stdout.write(
+                f"{execucao['processados']} clientes sem GPS analisados em {segundos:.1f}s: "
+                f"{execucao['EXATA']} no número, {execucao['RUA']} na rua, "
+                f"{execucao['BAIRRO']} no bairro, {execucao['sem_resultado']} sem resultado."
+            )
+            self.stdout.write(
+                f"Endereços: {execucao['enderecos_do_cache']} do cache, "
+                f"{execucao['enderecos_no_backend']} perguntados ao backend.\n"
+            )
+
+        cobertura = geocodificacao.estatisticas()
+        self.stdout.write(
+            f"Cobertura: {cobertura['com_coordenadas']} de {cobertura['total']} clientes com coordenadas "
+            f"({cobertura['cobertura']}%) — {cobertura['gps_original']} GPS original, "
+            f"{cobertura['exatas'] + cobertura['por_rua']} pela rua, {cobertura['por_bairro']} pelo bairro; "
+            f"{cobertura['sem_coordenadas']} sem coordenadas."
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Cache: {cobertura['enderecos_em_cache']} endereços ({cobertura['falhas_em_cache']} não encontrados)."
+        ))
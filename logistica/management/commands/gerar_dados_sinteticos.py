@@ -0,0 +1,271 @@
+import contextlib
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from logistica import referencias
+from logistica.geo import celula_grade
+from logistica.models import Carteira, Cliente, GramaBusca, Ligacao, Rota, Visita
+from logistica.resumos import reconstruir_resumos
+
+# Referências da base sintética (Fortaleza e arredores)
+CENTRO_LAT, CENTRO_LNG = -3.7319, -38.5267
+RAIO_GRAUS = 0.12
+BAIRROS = [
+    'Aldeota', 'Meireles', 'Centro', 'Benfica', 'Fátima', 'Messejana', 'Parangaba', 'Montese',
+    'Jacarecanga', 'Barra do Ceará', 'Pici', 'Antônio Bezerra', 'Conjunto Ceará', 'Mondubim',
+    'Passaré', 'Cajazeiras', 'Cidade dos Funcionários', 'Papicu', 'Varjota', 'Joaquim Távora',
+    'Serrinha', 'Itaperi', 'Bom Jardim', 'Granja Portugal', 'Vila Velha', 'Quintino Cunha',
+    'Henrique Jorge', 'João XXIII', 'Jangurussu', 'Lagoa Redonda',
+]
+NOMES = ['Maria', 'José', 'Ana', 'João', 'Francisca', 'Antônio', 'Raimunda', 'Francisco', 'Fátima', 'Paulo',
+         'Luzia', 'Carlos', 'Socorro', 'Pedro', 'Rita', 'Manoel', 'Aparecida', 'Luiz', 'Helena', 'Marcos']
+APELIDOS = ['Silva', 'Santos', 'Oliveira', 'Sousa', 'Lima', 'Pereira', 'Costa', 'Ferreira', 'Almeida', 'Rodrigues',
+            'Gomes', 'Ribeiro', 'Carvalho', 'Araújo', 'Barbosa', 'Holanda', 'Bezerra', 'Cavalcante', 'Freitas', 'Moura']
+CONCORRENTES = ['Azul (Ultragaz)', 'Prata (Liquigás)', 'Dourado (Nacional)', 'Verde (Copagaz)']
+FORMAS_PAGAMENTO = ['Dinheiro', 'PIX', 'Cartão', 'Fiado']
+PREFIXO_MOTOQUEIRO = 'sint_moto_'
+PREFIXO_AGENTE = 'sint_agente_'
+PREFIXO_CARTEIRA = 'Sintética '
+
+TAMANHO_LOTE = 10000
+
+
+@contextlib.contextmanager
+def datas_manuais(*campos):
+    """Desliga temporariamente auto_now/auto_now_add dos campos, para gravar datas do passado."""
+    originais = [(campo, campo.auto_now, campo.auto_now_add) for campo in campos]
+    try:
+        for campo, _, _ in originais:
+            campo.auto_now = campo.auto_now_add = False
+        yield
+    finally:
+        for campo, auto_now, auto_now_add in originais:
+            campo.auto_now, campo.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera uma base sintética reprodutível (mesma semente = mesmos dados) para medir as views "
+        "à escala de produção: clientes com GPS, carteiras, rotas, visitas e ligações ao longo de um ano."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=100000)
+        parser.add_argument('--carteiras', type=int, default=300)
+        parser.add_argument('--motoqueiros', type=int, default=40)
+        parser.add_argument('--agentes', type=int, default=20)
+        parser.add_argument('--visitas', type=int, default=2000000, help="Total de visitas no período.")
+        parser.add_argument('--ligacoes', type=int, default=2000000, help="Total de ligações no período.")
+        parser.add_argument('--dias', type=int, default=365, help="Dias de histórico até --fim.")
+        parser.add_argument('--fim', help="Último dia do histórico (AAAA-MM-DD). Padrão: hoje.")
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--limpar', action='store_true', help="Apaga uma base sintética anterior antes de gerar.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['semente'])
+        self.tz = timezone.get_current_timezone()
+        try:
+            self.fim = datetime.date.fromisoformat(options['fim']) if options['fim'] else timezone.localdate()
+        except ValueError:
+            raise CommandError(f"Data inválida: {options['fim']} (use AAAA-MM-DD)")
+        self.dias = [self.fim - datetime.timedelta(days=n) for n in range(options['dias'] - 1, -1, -1)]
+        inicio = time.perf_counter()
+
+        if options['limpar']:
+            self._limpar()
+        elif User.objects.filter(username__startswith=PREFIXO_MOTOQUEIRO).exists():
+            raise CommandError("Já existe uma base sintética. Use --limpar para a gerar de novo.")
+
+        motoqueiros, agentes = self._utilizadores(options['motoqueiros'], options['agentes'])
+        clientes_ids = self._clientes(options['clientes'])
+        carteiras = self._carteiras(options['carteiras'], clientes_ids, motoqueiros, agentes)
+        self._visitas(options['visitas'], motoqueiros, carteiras)
+        self._ligacoes(options['ligacoes'], agentes, carteiras)
+
+        # Dados derivados: ciclo de consumo, resumos do dashboard e listas em cache
+        call_command('recalcular_ciclos', stdout=self.stdout)
+        reconstruir_resumos(self.dias[0], self.dias[-1])
+        referencias.invalidar()
+
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f"Base sintética gerada em {segundos:.0f}s (semente {options['semente']})."))
+
+    # --------------------------------------------------------------------------
+
+    def _limpar(self):
+        self.stdout.write("A apagar a base sintética anterior...")
+        sinteticos = User.objects.filter(username__startswith='sint_')
+        clientes = Cliente.objects.filter(carteiras__nome__startswith=PREFIXO_CARTEIRA)
+        Ligacao.objects.filter(agente__in=sinteticos).delete()
+        Visita.objects.filter(rota__motoqueiro__in=sinteticos).delete()
+        Cliente.objects.filter(id__in=clientes.values('id')).delete()
+        Carteira.objects.filter(nome__startswith=PREFIXO_CARTEIRA).delete()
+        sinteticos.delete()
+
+    def _momento(self, dia, hora_inicio=8, hora_fim=19):
+        """Instante aleatório dentro do horário de trabalho do dia (com fuso)."""
+        segundos = self.rng.randint(hora_inicio * 3600, hora_fim * 3600 - 1)
+        ingenuo = datetime.datetime.combine(dia, datetime.time()) + datetime.timedelta(seconds=segundos)
+        return timezone.make_aware(ingenuo, self.tz)
+
+    def _utilizadores(self, n_motoqueiros, n_agentes):
+        grupo_agentes, _ = Group.objects.get_or_create(name='Agentes Comerciais')
+        grupo_motoqueiros, _ = Group.objects.get_or_create(name='Motoqueiros')
+        motoqueiros = User.objects.bulk_create(
+            [User(username=f'{PREFIXO_MOTOQUEIRO}{n:03d}', password='!') for n in range(1, n_motoqueiros + 1)]
+        )
+        agentes = User.objects.bulk_create(
+            [User(username=f'{PREFIXO_AGENTE}{n:03d}', password='!') for n in range(1, n_agentes + 1)]
+        )
+        grupo_motoqueiros.user_set.add(*motoqueiros)
+        grupo_agentes.user_set.add(*agentes)
+        self.stdout.write(f"  {len(motoqueiros)} motoqueiros e {len(agentes)} agentes.")
+        return motoqueiros, agentes
+
+    def _clientes(self, total):
+        ids = []
+        for inicio in range(0, total, TAMANHO_LOTE):
+            lote = []
+            for n in range(inicio, min(inicio + TAMANHO_LOTE, total)):
+                cliente = Cliente(
+                    nome=f"{self.rng.choice(NOMES)} {self.rng.choice(APELIDOS)} {n:06d}",
+                    endereco=f"Rua {self.rng.choice(APELIDOS)}, {self.rng.randint(1, 3000)}",
+                    bairro=self.rng.choice(BAIRROS),
+                    telefone=f"859{self.rng.randint(10000000, 99999999)}",
+                    latitude=round(CENTRO_LAT + self.rng.uniform(-RAIO_GRAUS, RAIO_GRAUS), 6),
+                    longitude=round(CENTRO_LNG + self.rng.uniform(-RAIO_GRAUS, RAIO_GRAUS), 6),
+                    divida_atual=Decimal(self.rng.choice([0] * 9 + [self.rng.randint(20, 400)])),
+                )
+                cliente.celula_grade = celula_grade(cliente.latitude, cliente.longitude)
+                # O bulk_create não passa pelo save(): as colunas da busca e o telefone E.164 preenchem-se aqui
+                cliente.atualizar_campos_busca()
+                lote.append(cliente)
+            with transaction.atomic():
+                criados = Cliente.objects.bulk_create(lote)
+                GramaBusca.objects.reindexar(criados)
+            ids.extend(c.id for c in criados)
+        self.stdout.write(f"  {len(ids)} clientes.")
+        return ids
+
+    def _carteiras(self, total, clientes_ids, motoqueiros, agentes):
+        carteiras = Carteira.objects.bulk_create([
+            Carteira(
+                nome=f"{PREFIXO_CARTEIRA}{n:03d}",
+                cor_etiqueta=f"#{self.rng.randint(0, 0xFFFFFF):06X}",
+                motoqueiro=motoqueiros[n % len(motoqueiros)],
+                agente_comercial=agentes[n % len(agentes)],
+            )
+            for n in range(total)
+        ])
+        # Cada cliente pertence a uma carteira (blocos contíguos, como uma divisão por zona)
+        Membro = Carteira.clientes.through
+        por_carteira = -(-len(clientes_ids) // total)
+        membros = [
+            Membro(carteira_id=carteiras[i // por_carteira].id, cliente_id=cliente_id)
+            for i, cliente_id in enumerate(clientes_ids)
+        ]
+        with transaction.atomic():
+            Membro.objects.bulk_create(membros, batch_size=TAMANHO_LOTE)
+
+        self.clientes_por_carteira = {
+            carteira.id: clientes_ids[i * por_carteira:(i + 1) * por_carteira] for i, carteira in enumerate(carteiras)
+        }
+        self.stdout.write(f"  {len(carteiras)} carteiras.")
+        return carteiras
+
+    def _clientes_por_responsavel(self, carteiras, campo):
+        """Junta os clientes de todas as carteiras de cada motoqueiro (ou agente)."""
+        clientes = {}
+        for carteira in carteiras:
+            clientes.setdefault(getattr(carteira, campo), []).extend(self.clientes_por_carteira[carteira.id])
+        return clientes
+
+    def _visitas(self, total, motoqueiros, carteiras):
+        clientes_do_motoqueiro = self._clientes_por_responsavel(carteiras, 'motoqueiro_id')
+        por_rota = max(1, total // (len(self.dias) * len(motoqueiros)))
+        criadas = 0
+        lote = []
+        with datas_manuais(Rota._meta.get_field('data_criacao'), Visita._meta.get_field('data_visita')):
+            for dia in self.dias:
+                rotas = Rota.objects.bulk_create([
+                    Rota(nome=f"Rota {dia:%d/%m}", motoqueiro=m, data_criacao=self._momento(dia, 6, 8)) for m in motoqueiros
+                ])
+                for rota in rotas:
+                    clientes = clientes_do_motoqueiro.get(rota.motoqueiro_id)
+                    if not clientes:
+                        continue
+                    for cliente_id in self.rng.sample(clientes, min(por_rota, len(clientes))):
+                        lote.append(self._nova_visita(rota, cliente_id, dia))
+                if len(lote) >= TAMANHO_LOTE:
+                    criadas += self._gravar(Visita, lote)
+                    lote = []
+            criadas += self._gravar(Visita, lote)
+        self.stdout.write(f"  {criadas} visitas em {len(self.dias) * len(motoqueiros)} rotas.")
+
+    def _nova_visita(self, rota, cliente_id, dia):
+        visita = Visita(
+            rota=rota, cliente_id=cliente_id, data_visita=self._momento(dia),
+            valor_venda=Decimal(self.rng.choice([0, 0, 110, 115, 120])),
+        )
+        sorteio = self.rng.random()
+        if dia == self.fim and sorteio < 0.5:
+            visita.status = 'PENDENTE'
+        elif sorteio < 0.7:
+            visita.status = 'REALIZADA'
+            visita.valor_recebido = Decimal(self.rng.choice([105, 110, 115, 120]))
+            visita.forma_pagamento = self.rng.choice(FORMAS_PAGAMENTO)
+        else:
+            visita.status = 'NAO_VENDA'
+            visita.motivo_nao_venda = self.rng.choice(['NAO_PRECISA', 'NAO_PRECISA', 'CONCORRENCIA', 'OUTROS'])
+            if visita.motivo_nao_venda == 'CONCORRENCIA':
+                visita.concorrente_empresa = self.rng.choice(CONCORRENTES)
+                visita.concorrente_preco = Decimal(self.rng.randint(95, 125))
+        return visita
+
+    def _ligacoes(self, total, agentes, carteiras):
+        clientes_do_agente = self._clientes_por_responsavel(carteiras, 'agente_comercial_id')
+        por_dia = max(1, total // (len(self.dias) * len(agentes)))
+        criadas = 0
+        lote = []
+        with datas_manuais(Ligacao._meta.get_field('data_ligacao')):
+            for dia in self.dias:
+                for agente in agentes:
+                    clientes = clientes_do_agente.get(agente.id)
+                    if not clientes:
+                        continue
+                    for cliente_id in self.rng.sample(clientes, min(por_dia, len(clientes))):
+                        lote.append(self._nova_ligacao(agente, cliente_id, dia))
+                if len(lote) >= TAMANHO_LOTE:
+                    criadas += self._gravar(Ligacao, lote)
+                    lote = []
+            criadas += self._gravar(Ligacao, lote)
+        self.stdout.write(f"  {criadas} ligações.")
+
+    def _nova_ligacao(self, agente, cliente_id, dia):
+        ligacao = Ligacao(
+            agente=agente, cliente_id=cliente_id, data_ligacao=self._momento(dia),
+            resultado=self.rng.choices(
+                ['CAIXA_POSTAL', 'RECUSA', 'REAGENDADO', 'VENDA_FECHADA'], weights=[45, 30, 15, 10]
+            )[0],
+        )
+        if ligacao.resultado == 'REAGENDADO':
+            ligacao.data_retorno = dia + datetime.timedelta(days=self.rng.randint(1, 10))
+        elif ligacao.resultado == 'RECUSA':
+            ligacao.motivo_nao_venda = self.rng.choice(['NAO_PRECISA', 'CONCORRENCIA', 'OUTROS'])
+            if ligacao.motivo_nao_venda == 'CONCORRENCIA':
+                ligacao.concorrente_empresa = self.rng.choice(CONCORRENTES)
+                ligacao.concorrente_preco = Decimal(self.rng.randint(95, 125))
+        return ligacao
+
+    def _gravar(self, modelo, lote):
+        with transaction.atomic():
+            modelo.objects.bulk_create(lote, batch_size=2000)
+        return len(lote)
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from logistica.geocodificacao import centros_do_banco, escrever_gazetteer
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera o gazetteer local (centro de cada rua e bairro, pela mediana dos clientes com GPS original) "
+        "usado pela geocodificação sem rede. O ficheiro pode depois ser completado com outras fontes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--saida', default=settings.GEOCODIFICACAO_GAZETTEER, help="Caminho do CSV (padrão: GEOCODIFICACAO_GAZETTEER).")
+
+    def handle(self, *args, **options):
+        linhas = centros_do_banco()
+        if not linhas:
+            raise CommandError("Nenhum cliente com GPS original: não há de onde tirar os centros das ruas.")
+        escrever_gazetteer(options['saida'], linhas)
+        ruas = sum(1 for logradouro, *_ in linhas if logradouro)
+        self.stdout.write(self.style.SUCCESS(
+            f"Gazetteer gravado em {options['saida']}: {ruas} ruas e {len(linhas) - ruas} bairros."
+        ))
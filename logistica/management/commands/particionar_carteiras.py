@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from logistica.models import Carteira
+from logistica.territorios import CRITERIOS, FOLGA_PADRAO, aplicar, planear
+
+
+class Command(BaseCommand):
+    help = (
+        "Divide os clientes com GPS em K territórios compactos e com carga equilibrada (k-means com "
+        "capacidade) e mostra a comparação com as carteiras atuais. Só grava com --aplicar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--territorios', type=int, help="Número de territórios (padrão: nº de carteiras).")
+        parser.add_argument('--criterio', choices=sorted(CRITERIOS), default='clientes', help="O que equilibrar entre territórios.")
+        parser.add_argument('--folga', type=float, default=FOLGA_PADRAO, help="Carga máxima = média x (1 + folga).")
+        parser.add_argument('--carteiras', help="IDs (separados por vírgula) das carteiras a redistribuir (padrão: todas).")
+        parser.add_argument('--aplicar', action='store_true', help="Grava os vínculos (sem isto é só uma simulação).")
+
+    def handle(self, *args, **options):
+        carteiras = None
+        if options['carteiras']:
+            try:
+                ids = [int(valor) for valor in options['carteiras'].split(',') if valor.strip()]
+            except ValueError:
+                raise CommandError("--carteiras deve ser uma lista de IDs separados por vírgula.")
+            carteiras = list(Carteira.objects.filter(id__in=ids).order_by('id'))
+            if len(carteiras) != len(set(ids)):
+                raise CommandError("Alguma das carteiras indicadas não existe.")
+
+        inicio = time.perf_counter()
+        try:
+            plano = planear(options['territorios'], options['criterio'], carteiras, folga=options['folga'])
+        except ValueError as erro:
+            raise CommandError(str(erro))
+        segundos = time.perf_counter() - inicio
+
+        self.stdout.write(
+            f"{len(plano.clientes_ids)} clientes com GPS em {plano.k} territórios "
+            f"(critério: {CRITERIOS[plano.criterio].lower()}), calculado em {segundos:.1f}s.\n"
+        )
+        self.stdout.write(f"{'':34} {'antes':>12} {'depois':>12}")
+        for indicador, antes, depois in plano.comparacao():
+            self.stdout.write(f"{indicador:34} {antes!s:>12} {depois!s:>12}")
+
+        if not options['aplicar']:
+            self.stdout.write("\nSimulação: nada foi gravado (use --aplicar).")
+            return
+
+        inicio = time.perf_counter()
+        aplicar(plano)
+        self.stdout.write(self.style.SUCCESS(
+            f"\nVínculos gravados em {time.perf_counter() - inicio:.1f}s: "
+            + ", ".join(f"{carteira.nome} ({(plano.rotulos_depois == i).sum()})" for i, carteira in enumerate(plano.carteiras[:plano.k]))
+        ))
@@ -0,0 +1,68 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from logistica.previsao import gravar, propor
+
+DIAS_SEMANA = ('seg', 'ter', 'qua', 'qui', 'sex', 'sáb', 'dom')
+MESES = ('jan', 'fev', 'mar', 'abr', 'mai', 'jun', 'jul', 'ago', 'set', 'out', 'nov', 'dez')
+
+
+class Command(BaseCommand):
+    help = (
+        "Prevê a próxima compra de toda a base (numpy, a partir das vendas realizadas) e grava, para cada "
+        "motoqueiro, a lista dos clientes das suas carteiras que devem precisar de gás no dia. Corre à noite."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dia', help="Dia da proposta, AAAA-MM-DD (padrão: amanhã).")
+        parser.add_argument(
+            '--capacidade', type=int, default=settings.PREVISAO_CAPACIDADE_MOTOQUEIRO,
+            help="Clientes por motoqueiro no dia.",
+        )
+        parser.add_argument('--simular', action='store_true', help="Só mostra a proposta (não grava).")
+
+    def handle(self, *args, **options):
+        if options['dia']:
+            try:
+                dia = datetime.date.fromisoformat(options['dia'])
+            except ValueError:
+                raise CommandError("--dia deve estar no formato AAAA-MM-DD.")
+        else:
+            dia = timezone.localdate() + datetime.timedelta(days=1)
+
+        inicio = time.perf_counter()
+        try:
+            proposta = propor(dia, options['capacidade'])
+        except ValueError as erro:
+            raise CommandError(str(erro))
+        segundos = time.perf_counter() - inicio
+
+        modelo = proposta.modelo
+        self.stdout.write(
+            f"Previsão de {proposta.previstos} clientes para {dia:%d/%m/%Y} calculada em {segundos:.1f}s.\n"
+            f"  Provavelmente já precisam de gás: {proposta.devidos} "
+            f"(já em rota: {proposta.em_rota}, sem motoqueiro na carteira: {proposta.sem_motoqueiro})\n"
+            f"  Fator mensal do ciclo: " + " ".join(f"{mes} {fator:.2f}" for mes, fator in zip(MESES, modelo.fatores_mes)) + "\n"
+            f"  Compras por dia da semana: " + " ".join(f"{nome} {partilha:.0%}" for nome, partilha in zip(DIAS_SEMANA, modelo.partilha_dia_semana))
+        )
+
+        nomes = dict(User.objects.filter(id__in=list(proposta.devidos_por_motoqueiro)).values_list('id', 'username'))
+        self.stdout.write(f"\n{'motoqueiro':24} {'devidos':>8} {'propostos':>10}")
+        for motoqueiro_id, (devidos, propostos) in sorted(proposta.por_motoqueiro().items(), key=lambda item: nomes.get(item[0], '')):
+            self.stdout.write(f"{nomes.get(motoqueiro_id, motoqueiro_id)!s:24} {devidos:>8} {propostos:>10}")
+
+        if options['simular']:
+            self.stdout.write("\nSimulação: nada foi gravado.")
+            return
+
+        inicio = time.perf_counter()
+        total = gravar(proposta)
+        self.stdout.write(self.style.SUCCESS(
+            f"\n{total} visitas propostas para {dia:%d/%m/%Y} (capacidade {proposta.capacidade} por motoqueiro), "
+            f"gravadas em {time.perf_counter() - inicio:.1f}s."
+        ))
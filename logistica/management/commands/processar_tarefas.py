@@ -0,0 +1,100 @@
+import datetime
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from logistica import tarefas
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker das tarefas em segundo plano (importações CSV, exclusões de clientes): reserva as tarefas "
+        "pendentes na tabela Tarefa e executa-as num pool de processos. Corra-o ao lado do servidor web."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processos', type=int, default=min(4, os.cpu_count() or 1), help="Tarefas em simultâneo.")
+        parser.add_argument('--intervalo', type=float, default=1.0, help="Segundos entre consultas à fila vazia.")
+        parser.add_argument('--expirar-apos', type=int, default=120, help="Segundos sem batimento até uma tarefa ser dada como órfã.")
+        parser.add_argument('--uma-vez', action='store_true', help="Esvazia a fila e termina (cron, testes).")
+
+    def handle(self, *args, **options):
+        processos = options['processos']
+        if processos < 1:
+            raise CommandError("--processos tem de ser pelo menos 1.")
+        expirar_apos = datetime.timedelta(seconds=options['expirar_apos'])
+
+        self._parar = False
+        for sinal in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sinal, self._pedir_paragem)
+
+        self.stdout.write(f"A processar tarefas com {processos} processos (Ctrl+C termina as que estão em curso e sai).")
+        pool = self._criar_pool(processos)
+        em_curso = {}   # future -> id da tarefa
+        proxima_verificacao = 0.0
+        try:
+            while True:
+                if time.monotonic() >= proxima_verificacao:
+                    repetidas, falhadas = tarefas.recuperar_orfas(expirar_apos)
+                    if repetidas or falhadas:
+                        self.stdout.write(self.style.WARNING(f"Tarefas órfãs: {repetidas} de volta à fila, {falhadas} falhadas."))
+                    proxima_verificacao = time.monotonic() + expirar_apos.total_seconds() / 2
+
+                while not self._parar and len(em_curso) < processos:
+                    tarefa_id = tarefas.reservar()
+                    if tarefa_id is None:
+                        break
+                    self.stdout.write(f"Tarefa #{tarefa_id} iniciada.")
+                    em_curso[pool.submit(tarefas.executar, tarefa_id)] = tarefa_id
+
+                if not em_curso and (self._parar or options['uma_vez']):
+                    break
+
+                # Sem ligação aberta enquanto espera (o pedido seguinte reabre-a se preciso)
+                close_old_connections()
+                concluidas, _ = wait(em_curso, timeout=options['intervalo'], return_when=FIRST_COMPLETED)
+                tarefas.bater(em_curso.values())
+
+                for futuro in concluidas:
+                    tarefa_id = em_curso.pop(futuro)
+                    try:
+                        sucesso = futuro.result()
+                    except BrokenProcessPool:
+                        # O processo morreu (falta de memória, kill): o pool inteiro fica inutilizável
+                        tarefas.falhar(tarefa_id, "O processo da tarefa terminou inesperadamente.")
+                        sucesso = False
+                    except Exception as erro:
+                        tarefas.falhar(tarefa_id, str(erro) or erro.__class__.__name__)
+                        sucesso = False
+                    estilo = self.style.SUCCESS if sucesso else self.style.ERROR
+                    self.stdout.write(estilo(f"Tarefa #{tarefa_id} {'concluída' if sucesso else 'falhou'}."))
+
+                if any(isinstance(futuro.exception(), BrokenProcessPool) for futuro in concluidas):
+                    for futuro, tarefa_id in em_curso.items():
+                        tarefas.falhar(tarefa_id, "O processo da tarefa terminou inesperadamente.")
+                    em_curso.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self._criar_pool(processos)
+        finally:
+            pool.shutdown(wait=True)
+
+    def _criar_pool(self, processos):
+        # spawn: cada processo arranca o Django do zero, sem herdar as ligações ao banco deste
+        return ProcessPoolExecutor(
+            max_workers=processos,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+
+    def _pedir_paragem(self, sinal, frame):
+        if self._parar:
+            raise KeyboardInterrupt
+        self._parar = True
+        self.stdout.write("A terminar as tarefas em curso...")
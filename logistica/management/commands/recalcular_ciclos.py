@@ -0,0 +1,69 @@
+import itertools
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Window
+from django.db.models.functions import RowNumber, TruncDate
+
+from logistica.consumo import JANELA_COMPRAS, CAMPOS_CICLO, aplicar_compras, campos_sem_compras, reiniciar_ciclo
+from logistica.models import Cliente, Visita
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula o ciclo de consumo de toda a base numa única passagem em streaming "
+        "(use após importações em massa ou correções de histórico)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000, help="Clientes gravados por bulk_update.")
+
+    def _gravar(self, lote):
+        """Aplica as compras de um lote de clientes com 1 leitura e 1 bulk_update."""
+        clientes = Cliente.objects.only(*CAMPOS_CICLO).in_bulk(list(lote))
+        for cliente_id, datas in lote.items():
+            # Recalcula do zero: um ciclo ou uma última venda de vendas entretanto corrigidas não fica para trás
+            reiniciar_ciclo(clientes[cliente_id])
+            aplicar_compras(clientes[cliente_id], datas)
+        with transaction.atomic():
+            Cliente.objects.bulk_update(clientes.values(), CAMPOS_CICLO)
+        return len(clientes)
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+
+        # Função de janela: só as últimas N compras de cada cliente saem do banco
+        compras = (
+            Visita.objects.filter(status='REALIZADA')
+            .annotate(
+                posicao=Window(RowNumber(), partition_by=[F('cliente_id')], order_by=F('data_visita').desc()),
+                dia=TruncDate('data_visita'),
+            )
+            .filter(posicao__lte=JANELA_COMPRAS)
+            .order_by('cliente_id', 'dia')
+            .values_list('cliente_id', 'dia')
+            .iterator(chunk_size=5000)
+        )
+
+        total = 0
+        lote = {}
+        for cliente_id, linhas in itertools.groupby(compras, key=lambda linha: linha[0]):
+            lote[cliente_id] = [dia for _, dia in linhas]
+            if len(lote) >= options['lote']:
+                total += self._gravar(lote)
+                lote = {}
+        if lote:
+            total += self._gravar(lote)
+
+        # Quem já não tem nenhuma venda realizada (visitas apagadas ou corrigidas) volta ao estado inicial
+        sem_compras = Cliente.objects.filter(
+            ~Exists(Visita.objects.filter(cliente_id=OuterRef('pk'), status='REALIZADA'))
+        ).exclude(**campos_sem_compras())
+        reiniciados = sem_compras.update(**campos_sem_compras())
+
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"Ciclo de consumo recalculado para {total} clientes em {segundos:.1f}s "
+            f"({reiniciados} sem vendas voltaram ao ciclo padrão)."
+        ))
@@ -0,0 +1,53 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from logistica.models import Rota, Ligacao
+from logistica.resumos import reconstruir_resumos
+
+
+class Command(BaseCommand):
+    help = "Recalcula os resumos diários do dashboard a partir do histórico de visitas e ligações."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inicio', help="Primeiro dia (AAAA-MM-DD). Padrão: início do histórico.")
+        parser.add_argument('--fim', help="Último dia (AAAA-MM-DD). Padrão: hoje.")
+        parser.add_argument('--dias-por-lote', type=int, default=31, help="Dias recalculados por transação.")
+
+    def _ler_data(self, valor):
+        try:
+            return datetime.datetime.strptime(valor, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"Data inválida: {valor} (use AAAA-MM-DD)")
+
+    def handle(self, *args, **options):
+        hoje = timezone.localdate()
+        data_fim = self._ler_data(options['fim']) if options['fim'] else hoje
+
+        if options['inicio']:
+            data_inicio = self._ler_data(options['inicio'])
+        else:
+            primeiras = [
+                Rota.objects.aggregate(d=Min('data_criacao'))['d'],
+                Ligacao.objects.aggregate(d=Min('data_ligacao'))['d'],
+            ]
+            primeiras = [timezone.localtime(d).date() for d in primeiras if d]
+            data_inicio = min(primeiras) if primeiras else hoje
+
+        passo = datetime.timedelta(days=options['dias_por_lote'])
+        totais = {'visitas': 0, 'ligacoes': 0, 'concorrencia': 0, 'precos_concorrencia': 0}
+        inicio_lote = data_inicio
+        while inicio_lote <= data_fim:
+            fim_lote = min(inicio_lote + passo - datetime.timedelta(days=1), data_fim)
+            for chave, quantidade in reconstruir_resumos(inicio_lote, fim_lote).items():
+                totais[chave] += quantidade
+            self.stdout.write(f"  {inicio_lote:%d/%m/%Y} a {fim_lote:%d/%m/%Y} recalculado.")
+            inicio_lote = fim_lote + datetime.timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Resumos reconstruídos de {data_inicio:%d/%m/%Y} a {data_fim:%d/%m/%Y}: "
+            f"{totais['visitas']} linhas de visitas, {totais['ligacoes']} de ligações, "
+            f"{totais['concorrencia']} de concorrência e {totais['precos_concorrencia']} de preços da concorrência."
+        ))
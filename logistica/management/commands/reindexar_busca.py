@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from logistica import busca
+
+
+class Command(BaseCommand):
+    help = (
+        "Refaz as colunas normalizadas e os trigramas da busca de clientes. O índice é mantido pelo save() "
+        "e pelas importações; só é preciso depois de mudar as regras de normalização (ou o TELEFONE_DDD_PADRAO) ou de alterar clientes por SQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000, help="Clientes por lote.")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        feitos = busca.reindexar_clientes(
+            tamanho_lote=max(1, options['lote']),
+            progresso=lambda feitos, total: self.stdout.write(f"{feitos} de {total} clientes...", ending='\r'),
+        )
+        self.stdout.write(self.style.SUCCESS(f"{feitos} clientes reindexados em {time.perf_counter() - inicio:.1f}s."))
@@ -0,0 +1,328 @@
+import bisect
+import contextvars
+import heapq
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+# ==============================================================================
+# MÉTRICAS DE DESEMPENHO POR VIEW
+# ==============================================================================
+# O MetricasMiddleware mede cada pedido (tempo total, queries, tempo de SQL e de
+# renderização dos templates) e soma tudo aqui, em memória, num histograma de
+# faixas fixas por view e por hora. De X em X segundos cada worker despeja os
+# seus totais num ficheiro SQLite partilhado, onde os workers se somam entre si.
+# A memória fica limitada (nº de views x nº de faixas) e o custo por pedido é
+# só um incremento num dicionário.
+
+logger = logging.getLogger(__name__)
+
+# Limites superiores (ms) das faixas do histograma; a última faixa é "acima de 10s"
+FAIXAS_MS = [5, 10, 20, 35, 50, 75, 100, 150, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000]
+PERCENTIS = (50, 95, 99)
+QUERIES_NO_LOG = 5                 # Queries mais lentas mostradas no log de um pedido lento
+INTERVALO_GRAVACAO = 10            # Segundos entre despejos para o SQLite
+RETENCAO_HORAS = 24 * 7
+
+
+def _configuracao(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def arquivo_metricas():
+    return _configuracao('METRICAS_ARQUIVO', os.path.join(settings.BASE_DIR, 'var', 'metricas.sqlite3'))
+
+
+# ------------------------------------------------------------------------------
+# MEDIÇÃO DE UM PEDIDO
+# ------------------------------------------------------------------------------
+
+class Medicao:
+    """Tempos e queries de um único pedido."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_s = 0.0
+        self.template_s = 0.0
+        self.total_s = 0.0
+        self._mais_lentas = []
+        # As views async correm queries do mesmo pedido em várias threads
+        self._trava = threading.Lock()
+
+    def medir_query(self, execute, sql, params, many, context):
+        """execute_wrapper do Django: conta e cronometra cada query do pedido."""
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            with self._trava:
+                self.queries += 1
+                self.sql_s += duracao
+                # Guarda só o texto das N queries mais lentas (memória limitada)
+                item = (duracao, self.queries, sql)
+                if len(self._mais_lentas) < QUERIES_NO_LOG:
+                    heapq.heappush(self._mais_lentas, item)
+                elif duracao > self._mais_lentas[0][0]:
+                    heapq.heapreplace(self._mais_lentas, item)
+
+    def queries_mais_lentas(self):
+        return [(duracao, sql) for duracao, _, sql in sorted(self._mais_lentas, reverse=True)]
+
+
+medicao_atual = contextvars.ContextVar('medicao_atual', default=None)
+
+
+def _medir_query_atual(execute, sql, params, many, context):
+    medicao = medicao_atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    return medicao.medir_query(execute, sql, params, many, context)
+
+
+def _instrumentar_ligacao(connection, **kwargs):
+    if _medir_query_atual not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_query_atual)
+
+
+def instrumentar_queries():
+    """
+    Mede as queries em todas as ligações, de qualquer thread: as views async correm queries em
+    threads do executor, onde um execute_wrapper aberto na thread do pedido não chegaria. A medição
+    do pedido segue pela contextvar (o asgiref copia-a para as threads).
+    """
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(_instrumentar_ligacao, dispatch_uid='metricas_queries')
+    for ligacao in connections.all(initialized_only=True):
+        _instrumentar_ligacao(ligacao)
+
+
+def instrumentar_templates():
+    """Cronometra o render() dos templates do Django e soma o tempo na medição do pedido atual."""
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, 'medido', False):
+        return
+    render_original = Template.render
+
+    def render(self, context=None, request=None):
+        medicao = medicao_atual.get()
+        if medicao is None:
+            return render_original(self, context, request)
+        inicio = time.perf_counter()
+        try:
+            return render_original(self, context, request)
+        finally:
+            medicao.template_s += time.perf_counter() - inicio
+
+    render.medido = True
+    Template.render = render
+
+
+# ------------------------------------------------------------------------------
+# ARMAZÉM (MEMÓRIA DO WORKER + SQLITE PARTILHADO)
+# ------------------------------------------------------------------------------
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS metricas_view (
+    janela INTEGER NOT NULL,
+    view TEXT NOT NULL,
+    pedidos INTEGER NOT NULL,
+    erros INTEGER NOT NULL,
+    soma_ms REAL NOT NULL,
+    max_ms REAL NOT NULL,
+    soma_queries INTEGER NOT NULL,
+    soma_sql_ms REAL NOT NULL,
+    soma_template_ms REAL NOT NULL,
+    PRIMARY KEY (janela, view)
+);
+CREATE TABLE IF NOT EXISTS metricas_histograma (
+    janela INTEGER NOT NULL,
+    view TEXT NOT NULL,
+    faixa INTEGER NOT NULL,
+    quantidade INTEGER NOT NULL,
+    PRIMARY KEY (janela, view, faixa)
+);
+"""
+
+
+class _Agregado:
+    __slots__ = ('pedidos', 'erros', 'soma_ms', 'max_ms', 'soma_queries', 'soma_sql_ms', 'soma_template_ms', 'histograma')
+
+    def __init__(self):
+        self.pedidos = self.erros = self.soma_queries = 0
+        self.soma_ms = self.max_ms = self.soma_sql_ms = self.soma_template_ms = 0.0
+        self.histograma = [0] * (len(FAIXAS_MS) + 1)
+
+
+class Armazem:
+    """Totais por (hora, view) em memória, despejados periodicamente num SQLite comum aos workers."""
+
+    def __init__(self, arquivo=None, intervalo=INTERVALO_GRAVACAO):
+        self.arquivo = arquivo
+        self.intervalo = intervalo
+        self._pendentes = {}
+        self._trava = threading.Lock()
+        self._ultima_gravacao = time.monotonic()
+        self._esquema_criado = False
+
+    def _ligar(self):
+        arquivo = self.arquivo or arquivo_metricas()
+        if not self._esquema_criado:
+            # Como o cache em ficheiros: a pasta é criada só com permissões do dono
+            os.makedirs(os.path.dirname(os.path.abspath(arquivo)), 0o700, exist_ok=True)
+        conexao = sqlite3.connect(arquivo, timeout=5)
+        if not self._esquema_criado:
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.executescript(ESQUEMA)
+            self._esquema_criado = True
+        return conexao
+
+    def registar(self, view, status, medicao):
+        total_ms = medicao.total_s * 1000
+        janela = int(time.time() // 3600)
+        with self._trava:
+            agregado = self._pendentes.get((janela, view))
+            if agregado is None:
+                agregado = self._pendentes[(janela, view)] = _Agregado()
+            agregado.pedidos += 1
+            agregado.erros += status >= 500
+            agregado.soma_ms += total_ms
+            agregado.max_ms = max(agregado.max_ms, total_ms)
+            agregado.soma_queries += medicao.queries
+            agregado.soma_sql_ms += medicao.sql_s * 1000
+            agregado.soma_template_ms += medicao.template_s * 1000
+            agregado.histograma[bisect.bisect_left(FAIXAS_MS, total_ms)] += 1
+            gravar = time.monotonic() - self._ultima_gravacao >= self.intervalo
+        if gravar:
+            self.gravar()
+
+    def gravar(self):
+        """Soma os totais pendentes deste worker no SQLite partilhado."""
+        with self._trava:
+            pendentes, self._pendentes = self._pendentes, {}
+            self._ultima_gravacao = time.monotonic()
+        if not pendentes:
+            return
+        try:
+            conexao = self._ligar()
+            with conexao:
+                conexao.executemany(
+                    """
+                    INSERT INTO metricas_view VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (janela, view) DO UPDATE SET
+                        pedidos = pedidos + excluded.pedidos,
+                        erros = erros + excluded.erros,
+                        soma_ms = soma_ms + excluded.soma_ms,
+                        max_ms = MAX(max_ms, excluded.max_ms),
+                        soma_queries = soma_queries + excluded.soma_queries,
+                        soma_sql_ms = soma_sql_ms + excluded.soma_sql_ms,
+                        soma_template_ms = soma_template_ms + excluded.soma_template_ms
+                    """,
+                    [
+                        (janela, view, a.pedidos, a.erros, a.soma_ms, a.max_ms, a.soma_queries, a.soma_sql_ms, a.soma_template_ms)
+                        for (janela, view), a in pendentes.items()
+                    ],
+                )
+                conexao.executemany(
+                    """
+                    INSERT INTO metricas_histograma VALUES (?, ?, ?, ?)
+                    ON CONFLICT (janela, view, faixa) DO UPDATE SET quantidade = quantidade + excluded.quantidade
+                    """,
+                    [
+                        (janela, view, faixa, quantidade)
+                        for (janela, view), a in pendentes.items()
+                        for faixa, quantidade in enumerate(a.histograma) if quantidade
+                    ],
+                )
+                limite = int(time.time() // 3600) - RETENCAO_HORAS
+                conexao.execute('DELETE FROM metricas_view WHERE janela < ?', (limite,))
+                conexao.execute('DELETE FROM metricas_histograma WHERE janela < ?', (limite,))
+            conexao.close()
+        except sqlite3.Error:
+            # As métricas nunca podem derrubar um pedido: perde-se este lote e segue
+            logger.exception("Falha ao gravar as métricas em %s", self.arquivo or arquivo_metricas())
+
+    def resumo(self, horas=24):
+        """Linhas por view das últimas `horas`, com percentis e médias, da mais lenta (p95) para a mais rápida."""
+        self.gravar()
+        desde = int(time.time() // 3600) - horas + 1
+        try:
+            conexao = self._ligar()
+            totais = conexao.execute(
+                """
+                SELECT view, SUM(pedidos), SUM(erros), SUM(soma_ms), MAX(max_ms),
+                       SUM(soma_queries), SUM(soma_sql_ms), SUM(soma_template_ms)
+                FROM metricas_view WHERE janela >= ? GROUP BY view
+                """,
+                (desde,),
+            ).fetchall()
+            faixas = conexao.execute(
+                'SELECT view, faixa, SUM(quantidade) FROM metricas_histograma WHERE janela >= ? GROUP BY view, faixa',
+                (desde,),
+            ).fetchall()
+            conexao.close()
+        except sqlite3.Error:
+            logger.exception("Falha ao ler as métricas de %s", self.arquivo or arquivo_metricas())
+            return []
+
+        histogramas = {}
+        for view, faixa, quantidade in faixas:
+            histogramas.setdefault(view, [0] * (len(FAIXAS_MS) + 1))[faixa] = quantidade
+
+        linhas = []
+        for view, pedidos, erros, soma_ms, max_ms, soma_queries, soma_sql_ms, soma_template_ms in totais:
+            histograma = histogramas.get(view, [])
+            linhas.append({
+                'view': view,
+                'pedidos': pedidos,
+                'erros': erros,
+                # A interpolação dentro da faixa nunca pode passar do máximo observado
+                **{f'p{p}': min(percentil(histograma, p) or 0, max_ms) for p in PERCENTIS},
+                'media_ms': soma_ms / pedidos,
+                'max_ms': max_ms,
+                'media_queries': soma_queries / pedidos,
+                'media_sql_ms': soma_sql_ms / pedidos,
+                'media_template_ms': soma_template_ms / pedidos,
+            })
+        return sorted(linhas, key=lambda linha: linha['p95'] or 0, reverse=True)
+
+
+def percentil(histograma, p):
+    """Estimativa do percentil p (ms) por interpolação linear dentro da faixa do histograma."""
+    total = sum(histograma)
+    if not total:
+        return None
+    alvo = total * p / 100
+    acumulado = 0
+    for faixa, quantidade in enumerate(histograma):
+        if quantidade and acumulado + quantidade >= alvo:
+            if faixa == len(FAIXAS_MS):
+                return float(FAIXAS_MS[-1])
+            inferior = FAIXAS_MS[faixa - 1] if faixa else 0
+            return inferior + (FAIXAS_MS[faixa] - inferior) * (alvo - acumulado) / quantidade
+        acumulado += quantidade
+    return float(FAIXAS_MS[-1])
+
+
+armazem = Armazem()
+
+
+def registar_pedido(view, status, medicao):
+    """Soma o pedido nas métricas e regista no log os pedidos acima do limite de lentidão."""
+    armazem.registar(view, status, medicao)
+
+    limite_ms = _configuracao('METRICAS_LIMITE_LENTO_MS', 1000)
+    total_ms = medicao.total_s * 1000
+    if total_ms >= limite_ms:
+        detalhes = "\n".join(f"    {duracao * 1000:8.1f} ms  {sql}" for duracao, sql in medicao.queries_mais_lentas())
+        logger.warning(
+            "Pedido lento: %s %.0f ms (%d queries, %.0f ms de SQL, %.0f ms de template)\n%s",
+            view, total_ms, medicao.queries, medicao.sql_s * 1000, medicao.template_s * 1000, detalhes,
+        )
@@ -0,0 +1,55 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metricas
+
+
+class MetricasMiddleware:
+    """Mede tempo, queries e renderização de cada pedido por view (ativado com METRICAS_ATIVAS)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICAS_ATIVAS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # Em ASGI a cadeia é async: medimos sem forçar a mudança para uma thread síncrona
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+        metricas.instrumentar_templates()
+        metricas.instrumentar_queries()
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self._medir_async(request)
+        medicao = metricas.Medicao()
+        token = metricas.medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metricas.medicao_atual.reset(token)
+        medicao.total_s = time.perf_counter() - inicio
+        return self._registar(request, response, medicao)
+
+    async def _medir_async(self, request):
+        medicao = metricas.Medicao()
+        token = metricas.medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metricas.medicao_atual.reset(token)
+        medicao.total_s = time.perf_counter() - inicio
+        return self._registar(request, response, medicao)
+
+    def _registar(self, request, response, medicao):
+        rota = getattr(request, 'resolver_match', None)
+        view = rota.view_name if rota else '(sem rota)'
+        metricas.registar_pedido(view, response.status_code, medicao)
+        return response
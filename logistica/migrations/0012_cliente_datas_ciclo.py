@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-17 02:52
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def preencher_datas_ciclo(apps, schema_editor):
+    """Calcula as datas derivadas do ciclo para os clientes já existentes."""
+    Cliente = apps.get_model('logistica', 'Cliente')
+    lote = []
+    for cliente in Cliente.objects.exclude(data_ultima_venda__isnull=True).only('id', 'data_ultima_venda', 'ciclo_consumo_dias').iterator(chunk_size=2000):
+        cliente.data_proxima_compra = cliente.data_ultima_venda + timedelta(days=cliente.ciclo_consumo_dias)
+        cliente.data_virada = cliente.data_ultima_venda + timedelta(days=cliente.ciclo_consumo_dias * 3)
+        lote.append(cliente)
+        if len(lote) >= 2000:
+            Cliente.objects.bulk_update(lote, ['data_proxima_compra', 'data_virada'])
+            lote = []
+    if lote:
+        Cliente.objects.bulk_update(lote, ['data_proxima_compra', 'data_virada'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0011_ligacao_concorrente_empresa_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='data_proxima_compra',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='data_virada',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(preencher_datas_ciclo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0012_cliente_datas_ciclo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ligacao',
+            index=models.Index(fields=['agente', 'data_ligacao'], name='ligacao_agente_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ligacao',
+            index=models.Index(fields=['agente', 'resultado', 'data_retorno'], name='ligacao_agente_retorno_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rota',
+            index=models.Index(fields=['motoqueiro', 'data_criacao'], name='rota_motoqueiro_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visita',
+            index=models.Index(fields=['rota', 'status'], name='visita_rota_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visita',
+            index=models.Index(fields=['data_visita'], name='visita_data_idx'),
+        ),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:40
+
+import itertools
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+TAMANHO_LOTE = 2000
+
+
+def gravar_em_lotes(modelo, linhas):
+    """Grava os resumos em lotes de TAMANHO_LOTE à medida que os grupos são lidos."""
+    linhas = iter(linhas)
+    for lote in iter(lambda: list(itertools.islice(linhas, TAMANHO_LOTE)), []):
+        modelo.objects.bulk_create(lote)
+
+
+def preencher_resumos(apps, schema_editor):
+    """Soma nos resumos as visitas e ligações já gravadas: daqui em diante as views só somam as novas."""
+    Visita = apps.get_model('logistica', 'Visita')
+    Ligacao = apps.get_model('logistica', 'Ligacao')
+    ResumoDiarioVisitas = apps.get_model('logistica', 'ResumoDiarioVisitas')
+    ResumoDiarioLigacoes = apps.get_model('logistica', 'ResumoDiarioLigacoes')
+    ResumoDiarioConcorrencia = apps.get_model('logistica', 'ResumoDiarioConcorrencia')
+    motivo = Coalesce('motivo_nao_venda', Value(''))
+
+    visitas = Visita.objects.values(
+        'status', dia=TruncDate('rota__data_criacao'), motoqueiro=F('rota__motoqueiro_id'), motivo=motivo,
+    ).annotate(quantidade=Count('id'), valor=Sum('valor_recebido')).order_by()
+    gravar_em_lotes(ResumoDiarioVisitas, (
+        ResumoDiarioVisitas(
+            dia=linha['dia'], motoqueiro_id=linha['motoqueiro'], status=linha['status'], motivo_nao_venda=linha['motivo'],
+            quantidade=linha['quantidade'], valor_recebido=linha['valor'] or 0,
+        )
+        for linha in visitas.iterator(chunk_size=TAMANHO_LOTE)
+    ))
+
+    ligacoes = Ligacao.objects.values(
+        'agente_id', 'resultado', dia=TruncDate('data_ligacao'), motivo=motivo,
+    ).annotate(quantidade=Count('id')).order_by()
+    gravar_em_lotes(ResumoDiarioLigacoes, (
+        ResumoDiarioLigacoes(
+            dia=linha['dia'], agente_id=linha['agente_id'], resultado=linha['resultado'], motivo_nao_venda=linha['motivo'],
+            quantidade=linha['quantidade'],
+        )
+        for linha in ligacoes.iterator(chunk_size=TAMANHO_LOTE)
+    ))
+
+    # O dia de uma visita é o da rota, como nos resumos das visitas
+    for modelo, origem, campo_dia in ((Visita, 'VISITA', 'rota__data_criacao'), (Ligacao, 'LIGACAO', 'data_ligacao')):
+        recusas = modelo.objects.filter(motivo_nao_venda='CONCORRENCIA', concorrente_empresa__gt='').values(
+            'concorrente_empresa', dia=TruncDate(campo_dia),
+        ).annotate(quantidade=Count('id')).order_by()
+        gravar_em_lotes(ResumoDiarioConcorrencia, (
+            ResumoDiarioConcorrencia(dia=linha['dia'], origem=origem, concorrente_empresa=linha['concorrente_empresa'], quantidade=linha['quantidade'])
+            for linha in recusas.iterator(chunk_size=TAMANHO_LOTE)
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0013_indices_consultas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoDiarioConcorrencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('origem', models.CharField(choices=[('VISITA', 'Motoqueiro (Rua)'), ('LIGACAO', 'Call Center (Telefone)')], max_length=10)),
+                ('concorrente_empresa', models.CharField(max_length=50)),
+                ('quantidade', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dia', 'origem', 'concorrente_empresa'), name='resumo_concorrencia_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumoDiarioLigacoes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('resultado', models.CharField(choices=[('VENDA_FECHADA', 'Venda Fechada'), ('RECUSA', 'Recusa / Concorrência'), ('CAIXA_POSTAL', 'Sem Atender / Caixa Postal'), ('REAGENDADO', 'Retornar Depois')], max_length=20)),
+                ('motivo_nao_venda', models.CharField(blank=True, default='', max_length=50)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('agente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dia', 'agente', 'resultado', 'motivo_nao_venda'), name='resumo_ligacoes_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumoDiarioVisitas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('REALIZADA', 'Realizada'), ('NAO_VENDA', 'Não Venda / Recusa')], max_length=20)),
+                ('motivo_nao_venda', models.CharField(blank=True, default='', max_length=50)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('valor_recebido', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('motoqueiro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dia', 'motoqueiro', 'status', 'motivo_nao_venda'), name='resumo_visitas_unico')],
+            },
+        ),
+        migrations.RunPython(preencher_resumos, migrations.RunPython.noop),
+    ]
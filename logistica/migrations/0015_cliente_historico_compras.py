@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-17 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0014_resumos_diarios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='historico_compras',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
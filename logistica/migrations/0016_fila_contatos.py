@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-17 05:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0015_cliente_historico_compras'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilaContato',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prioridade', models.IntegerField(default=0)),
+                ('disponivel_em', models.DateField()),
+                ('data_retorno', models.DateField(blank=True, null=True)),
+                ('calculado_em', models.DateField()),
+                ('agente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='logistica.cliente')),
+                ('ultima_ligacao', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='logistica.ligacao')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['agente', '-prioridade', 'id'], name='fila_agente_prioridade_idx'), models.Index(fields=['agente', 'calculado_em'], name='fila_agente_calculo_idx')],
+                'constraints': [models.UniqueConstraint(fields=('agente', 'cliente'), name='fila_agente_cliente_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-17 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0016_fila_contatos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visita',
+            name='ordem',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
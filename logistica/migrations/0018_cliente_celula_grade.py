@@ -0,0 +1,50 @@
+# Generated by Django 6.0.1 on 2026-10-17 11:20
+
+from django.db import migrations, models
+
+# Cópia congelada de logistica.geo.celula_grade (como estava nesta migração): a numeração das
+# células gravada aqui não pode mudar se a grelha do módulo mudar
+
+LADO_CELULA_GRAUS = 0.01
+COLUNAS_GRELHA = 36000
+LINHAS_GRELHA = 18000
+
+
+def celula_grade(latitude, longitude):
+    if latitude is None or longitude is None or (latitude == 0 and longitude == 0):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    linha = min(int((latitude + 90) / LADO_CELULA_GRAUS), LINHAS_GRELHA - 1)
+    coluna = min(int((longitude + 180) / LADO_CELULA_GRAUS), COLUNAS_GRELHA - 1)
+    return linha * COLUNAS_GRELHA + coluna
+
+
+def preencher_celulas(apps, schema_editor):
+    """Calcula a célula da grelha espacial dos clientes que já têm GPS."""
+    Cliente = apps.get_model('logistica', 'Cliente')
+    lote = []
+    for cliente in Cliente.objects.exclude(latitude__isnull=True).exclude(longitude__isnull=True).only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        cliente.celula_grade = celula_grade(cliente.latitude, cliente.longitude)
+        lote.append(cliente)
+        if len(lote) >= 2000:
+            Cliente.objects.bulk_update(lote, ['celula_grade'])
+            lote = []
+    if lote:
+        Cliente.objects.bulk_update(lote, ['celula_grade'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0017_visita_ordem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='celula_grade',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(preencher_celulas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0018_cliente_celula_grade'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visita',
+            name='atualizada_em',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='visita',
+            name='data_visita',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='BaixaSincronizada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=64)),
+                ('momento', models.DateTimeField(help_text='Hora da baixa no telemóvel')),
+                ('recebida_em', models.DateTimeField(auto_now_add=True)),
+                ('motoqueiro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('visita', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='logistica.visita')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('motoqueiro', 'chave'), name='baixa_motoqueiro_chave_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0019_sincronizacao_offline'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('IMPORTAR_CLIENTES', 'Importação de clientes (CSV)'), ('EXCLUIR_CLIENTE', 'Exclusão de cliente')], max_length=30)),
+                ('estado', models.CharField(choices=[('PENDENTE', 'Na fila'), ('EXECUTANDO', 'Em execução'), ('CONCLUIDA', 'Concluída'), ('FALHOU', 'Falhou')], default='PENDENTE', max_length=20)),
+                ('descricao', models.CharField(max_length=255)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('arquivo', models.BinaryField(blank=True, null=True)),
+                ('progresso_atual', models.PositiveIntegerField(default=0)),
+                ('progresso_total', models.PositiveIntegerField(default=0)),
+                ('mensagem', models.CharField(blank=True, default='', max_length=255)),
+                ('resultado', models.JSONField(blank=True, default=dict)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('criada_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciada_em', models.DateTimeField(blank=True, null=True)),
+                ('concluida_em', models.DateTimeField(blank=True, null=True)),
+                ('batimento', models.DateTimeField(blank=True, null=True)),
+                ('criada_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'id'], name='tarefa_estado_idx')],
+            },
+        ),
+    ]
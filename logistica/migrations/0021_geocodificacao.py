@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-17 13:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0020_tarefas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnderecoGeocodificado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(help_text='logradouro número|bairro (normalizados)', max_length=255, unique=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('precisao', models.CharField(choices=[('EXATA', 'Número da porta'), ('RUA', 'Centro da rua'), ('BAIRRO', 'Centro do bairro'), ('NAO_ENCONTRADO', 'Não encontrado')], max_length=15)),
+                ('fonte', models.CharField(max_length=50)),
+                ('resolvido_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='geocodificacao',
+            field=models.CharField(blank=True, default='', editable=False, max_length=15),
+        ),
+        migrations.AlterField(
+            model_name='tarefa',
+            name='tipo',
+            field=models.CharField(choices=[('IMPORTAR_CLIENTES', 'Importação de clientes (CSV)'), ('EXCLUIR_CLIENTE', 'Exclusão de cliente'), ('GEOCODIFICAR', 'Geocodificação de endereços')], max_length=30),
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 6.0.1 on 2026-10-17 14:05
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Cópia congelada de logistica.normalizacao (como estava nesta migração): se o módulo mudar, a
+# migração continua a gravar exatamente o que gravava
+
+_NAO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+_NAO_DIGITO = re.compile(r'\D+')
+
+
+def normalizar_texto(texto):
+    sem_acentos = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode('ascii')
+    return _NAO_ALFANUMERICO.sub(' ', sem_acentos.lower()).strip()
+
+
+def somente_digitos(texto):
+    return _NAO_DIGITO.sub('', texto or '')
+
+
+def campos_busca(nome, telefone, documento, endereco, bairro):
+    return {
+        'nome_busca': normalizar_texto(nome)[:100],
+        'telefone_busca': somente_digitos(telefone)[:20],
+        'documento_busca': somente_digitos(documento)[:20],
+        'endereco_busca': f"{normalizar_texto(endereco)} {normalizar_texto(bairro)}".strip()[:255],
+    }
+
+
+def gramas_busca(nome_busca, telefone_busca, documento_busca, endereco_busca):
+    texto = f"{nome_busca} {telefone_busca} {documento_busca} {endereco_busca}"
+    return {palavra[i:i + 3] for palavra in texto.split() for i in range(len(palavra) - 2)}
+
+
+def indexar_clientes(apps, schema_editor):
+    """Preenche as colunas normalizadas e os trigramas da busca dos clientes existentes."""
+    Cliente = apps.get_model('logistica', 'Cliente')
+    GramaBusca = apps.get_model('logistica', 'GramaBusca')
+    campos = ['nome_busca', 'telefone_busca', 'documento_busca', 'endereco_busca']
+    nome = schema_editor.quote_name
+    sql_insert = f"INSERT INTO {nome(GramaBusca._meta.db_table)} (grama, cliente_id) VALUES (%s, %s)"
+    sql_update = f"UPDATE {nome(Cliente._meta.db_table)} SET {', '.join(f'{nome(campo)} = %s' for campo in campos)} WHERE id = %s"
+    ultimo_id = 0
+    while True:
+        lote = list(Cliente.objects.filter(id__gt=ultimo_id).order_by('id').only('id', 'nome', 'telefone', 'documento', 'endereco', 'bairro')[:2000])
+        if not lote:
+            break
+        colunas, gramas = [], []
+        for cliente in lote:
+            valores = campos_busca(cliente.nome, cliente.telefone, cliente.documento, cliente.endereco, cliente.bairro)
+            colunas.append([valores[campo] for campo in campos] + [cliente.id])
+            gramas += [(grama, cliente.id) for grama in gramas_busca(*(valores[campo] for campo in campos))]
+        # executemany em SQL simples: o bulk_update (um CASE por linha) é quadrático no SQLite e
+        # instanciar um modelo por trigrama custaria mais do que o próprio INSERT
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(sql_update, colunas)
+            cursor.executemany(sql_insert, gramas)
+        ultimo_id = lote[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0021_geocodificacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='documento_busca',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='endereco_busca',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='nome_busca',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='telefone_busca',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.CreateModel(
+            name='GramaBusca',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grama', models.CharField(max_length=3)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='logistica.cliente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['grama', 'cliente'], name='grama_busca_idx')],
+            },
+        ),
+        migrations.RunPython(indexar_clientes, migrations.RunPython.noop),
+    ]
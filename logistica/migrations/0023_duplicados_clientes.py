@@ -0,0 +1,49 @@
+# Generated by Django 6.0.1 on 2026-10-17 14:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0022_busca_clientes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tarefa',
+            name='tipo',
+            field=models.CharField(choices=[('IMPORTAR_CLIENTES', 'Importação de clientes (CSV)'), ('EXCLUIR_CLIENTE', 'Exclusão de cliente'), ('GEOCODIFICAR', 'Geocodificação de endereços'), ('DETECTAR_DUPLICADOS', 'Deteção de clientes duplicados'), ('FUNDIR_DUPLICADOS', 'Fusão de clientes duplicados')], max_length=30),
+        ),
+        migrations.CreateModel(
+            name='FusaoCliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('duplicado_id', models.IntegerField(db_index=True)),
+                ('duplicado_nome', models.CharField(max_length=100)),
+                ('fundido_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('fundido_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('principal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fusoes', to='logistica.cliente')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ParDuplicado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pontuacao', models.FloatField(help_text='0 a 1: semelhança do nome, do telefone, do endereço e do documento')),
+                ('motivo', models.CharField(max_length=30)),
+                ('descartado', models.BooleanField(default=False)),
+                ('detectado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('cliente_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='logistica.cliente')),
+                ('cliente_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='logistica.cliente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descartado', '-pontuacao'], name='par_duplicado_pontuacao_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cliente_a', 'cliente_b'), name='par_duplicado_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 6.0.1 on 2026-10-17 15:10
+
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Cópia congelada de logistica.normalizacao.telefone_e164 (como estava nesta migração)
+
+_NAO_DIGITO = re.compile(r'\D+')
+
+
+def telefone_e164(telefone, ddd_padrao=''):
+    digitos = _NAO_DIGITO.sub('', telefone or '')
+    if digitos.startswith('00'):
+        digitos = digitos[2:]
+        if not digitos.startswith('55'):
+            return ''
+    elif digitos.startswith('0'):
+        digitos = digitos[1:]
+        if len(digitos) in (12, 13):
+            digitos = digitos[2:]
+    if len(digitos) in (12, 13) and digitos.startswith('55'):
+        digitos = digitos[2:]
+    if len(digitos) in (8, 9) and ddd_padrao:
+        digitos = ddd_padrao + digitos
+    if len(digitos) == 10 and digitos[2] in '6789':
+        digitos = digitos[:2] + '9' + digitos[2:]
+    if len(digitos) not in (10, 11) or digitos[0] == '0':
+        return ''
+    return f"+55{digitos}"
+
+
+def preencher_telefone_e164(apps, schema_editor):
+    """Calcula o telefone canónico dos clientes existentes."""
+    Cliente = apps.get_model('logistica', 'Cliente')
+    nome = schema_editor.quote_name
+    sql_update = f"UPDATE {nome(Cliente._meta.db_table)} SET {nome('telefone_e164')} = %s WHERE id = %s"
+    ultimo_id = 0
+    while True:
+        lote = list(Cliente.objects.filter(id__gt=ultimo_id).order_by('id').values_list('id', 'telefone')[:5000])
+        if not lote:
+            break
+        # Sem telefone canónico a coluna fica com o padrão ('') e não precisa de UPDATE
+        valores = [
+            (e164, cliente_id)
+            for cliente_id, telefone in lote
+            if (e164 := telefone_e164(telefone, settings.TELEFONE_DDD_PADRAO))
+        ]
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(sql_update, valores)
+        ultimo_id = lote[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0023_duplicados_clientes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='telefone_e164',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=16),
+        ),
+        migrations.RunPython(preencher_telefone_e164, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,152 @@
+# Generated by Django 6.0.1 on 2026-10-17 15:45
+
+import re
+import unicodedata
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+# Cópia congelada de logistica.normalizacao e logistica.precos (como estavam nesta migração): se os
+# módulos mudarem, a migração continua a gravar exatamente o que gravava
+
+ABREVIATURAS = {
+    'r': 'rua', 'av': 'avenida', 'ave': 'avenida', 'tv': 'travessa', 'trav': 'travessa',
+    'al': 'alameda', 'pc': 'praca', 'pca': 'praca', 'pq': 'parque', 'rod': 'rodovia',
+    'estr': 'estrada', 'vl': 'vila', 'cj': 'conjunto', 'conj': 'conjunto', 'lot': 'loteamento',
+    'dr': 'doutor', 'dra': 'doutora', 'prof': 'professor', 'profa': 'professora', 'pe': 'padre',
+    'sto': 'santo', 'sta': 'santa', 'eng': 'engenheiro', 'gen': 'general', 'cel': 'coronel',
+    'des': 'desembargador', 'pres': 'presidente', 'mal': 'marechal', 'ten': 'tenente',
+}
+VAZIOS = {'', 'nao informado', 'bairro nao informado', 'endereco nao informado', 'sem endereco', 'sn', 's n'}
+
+_NAO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+
+
+def normalizar_texto(texto):
+    sem_acentos = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode('ascii')
+    return _NAO_ALFANUMERICO.sub(' ', sem_acentos.lower()).strip()
+
+
+def normalizar_bairro(bairro):
+    bairro = ' '.join(ABREVIATURAS.get(palavra, palavra) for palavra in normalizar_texto(bairro).split())
+    return '' if bairro in VAZIOS else bairro
+
+
+def somar(precos, preco):
+    precos = dict(precos)
+    chave = f"{Decimal(preco):.2f}"
+    precos[chave] = precos.get(chave, 0) + 1
+    return precos
+
+
+def campos_resumo(quantidade, precos):
+    valores = sorted(Decimal(chave) for chave, total in precos.items() if total > 0)
+    return {
+        'quantidade': quantidade,
+        'com_preco': sum(precos.values()),
+        'preco_minimo': valores[0] if valores else None,
+        'preco_maximo': valores[-1] if valores else None,
+        'precos': precos,
+    }
+
+
+def agrupar(observacoes, grupos):
+    """Acumula em grupos {(dia, concorrente, bairro): (quantidade, histograma)} as observações (dia, concorrente, bairro, preço ou None)."""
+    for dia, concorrente, bairro, preco in observacoes:
+        quantidade, histograma = grupos.get((dia, concorrente, bairro), (0, {}))
+        if preco is not None:
+            histograma = somar(histograma, preco)
+        grupos[(dia, concorrente, bairro)] = (quantidade + 1, histograma)
+
+
+TAMANHO_LOTE = 2000
+
+
+def registar_historico(apps, schema_editor):
+    """Cria as observações das recusas por concorrência já gravadas e os resumos diários dos preços."""
+    Visita = apps.get_model('logistica', 'Visita')
+    Ligacao = apps.get_model('logistica', 'Ligacao')
+    ObservacaoConcorrente = apps.get_model('logistica', 'ObservacaoConcorrente')
+    ResumoDiarioPrecoConcorrente = apps.get_model('logistica', 'ResumoDiarioPrecoConcorrente')
+
+    # As observações são gravadas em lotes à medida que são lidas; só os grupos do resumo (um por
+    # dia, concorrente e bairro) ficam em memória até ao fim
+    recusas = {'motivo_nao_venda': 'CONCORRENCIA', 'concorrente_empresa__gt': ''}
+    grupos = {}
+    lote = []
+
+    def gravar_lote():
+        ObservacaoConcorrente.objects.bulk_create(lote, batch_size=TAMANHO_LOTE)
+        agrupar(((o.dia, o.concorrente, o.bairro, o.preco) for o in lote), grupos)
+        lote.clear()
+
+    for modelo, origem, campo_momento in ((Visita, 'VISITA', 'data_visita'), (Ligacao, 'LIGACAO', 'data_ligacao')):
+        linhas = modelo.objects.filter(**recusas).values_list('id', campo_momento, 'concorrente_empresa', 'concorrente_preco', 'cliente__bairro')
+        for registo_id, momento, empresa, preco, bairro in linhas.iterator(chunk_size=TAMANHO_LOTE):
+            lote.append(ObservacaoConcorrente(
+                dia=timezone.localtime(momento).date(),
+                origem=origem,
+                concorrente=normalizar_texto(empresa)[:50],
+                concorrente_empresa=empresa[:50],
+                bairro=normalizar_bairro(bairro)[:100],
+                preco=preco if preco and preco > 0 else None,
+                **{f'{origem.lower()}_id': registo_id},
+            ))
+            if len(lote) >= TAMANHO_LOTE:
+                gravar_lote()
+    gravar_lote()
+
+    ResumoDiarioPrecoConcorrente.objects.bulk_create(
+        (
+            ResumoDiarioPrecoConcorrente(dia=dia, concorrente=nome, bairro=bairro, **campos_resumo(*valores))
+            for (dia, nome, bairro), valores in grupos.items()
+        ),
+        batch_size=TAMANHO_LOTE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0024_telefone_e164'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoDiarioPrecoConcorrente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('concorrente', models.CharField(max_length=50)),
+                ('bairro', models.CharField(blank=True, default='', max_length=100)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('com_preco', models.IntegerField(default=0)),
+                ('preco_minimo', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('preco_maximo', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('precos', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dia', 'concorrente', 'bairro'), name='resumo_preco_concorrente_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ObservacaoConcorrente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('origem', models.CharField(choices=[('VISITA', 'Motoqueiro (Rua)'), ('LIGACAO', 'Call Center (Telefone)')], max_length=10)),
+                ('concorrente', models.CharField(max_length=50)),
+                ('concorrente_empresa', models.CharField(max_length=50)),
+                ('bairro', models.CharField(blank=True, default='', max_length=100)),
+                ('preco', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('ligacao', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='observacao_concorrente', to='logistica.ligacao')),
+                ('visita', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='observacao_concorrente', to='logistica.visita')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dia', 'concorrente'], name='observacao_dia_concorrente_idx')],
+            },
+        ),
+        migrations.RunPython(registar_historico, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-17 16:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0025_precos_concorrencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropostaVisita',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('posicao', models.PositiveIntegerField()),
+                ('probabilidade', models.FloatField(help_text='Probabilidade de o cliente já precisar de gás no dia (0 a 1)')),
+                ('confianca', models.FloatField(help_text='0 a 1: quantidade e regularidade das compras do cliente')),
+                ('data_prevista', models.DateField()),
+                ('margem_dias', models.PositiveIntegerField(help_text='A compra deve cair em data_prevista ± margem (80%)')),
+                ('gerada_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('carteira', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='logistica.carteira')),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='propostas', to='logistica.cliente')),
+                ('motoqueiro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dia', 'motoqueiro', 'posicao'], name='proposta_dia_motoqueiro_idx')],
+                'constraints': [models.UniqueConstraint(fields=('dia', 'cliente'), name='proposta_visita_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-17 17:05
+
+from django.core.files.base import ContentFile
+from django.db import migrations, models
+
+
+def mover_arquivos_para_storage(apps, schema_editor):
+    """Os CSV ainda na fila passam da coluna binária para ficheiros no storage."""
+    Tarefa = apps.get_model('logistica', 'Tarefa')
+    pendentes = Tarefa.objects.filter(arquivo_antigo__isnull=False, estado__in=('PENDENTE', 'EXECUTANDO')).only('id')
+    for tarefa in pendentes.iterator(chunk_size=1):
+        conteudo = Tarefa.objects.filter(pk=tarefa.pk).values_list('arquivo_antigo', flat=True).first()
+        tarefa.arquivo.save(f'tarefa_{tarefa.pk}.csv', ContentFile(bytes(conteudo)), save=False)
+        Tarefa.objects.filter(pk=tarefa.pk).update(arquivo=tarefa.arquivo.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0026_propostas_visita'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='tarefa',
+            old_name='arquivo',
+            new_name='arquivo_antigo',
+        ),
+        migrations.AddField(
+            model_name='tarefa',
+            name='arquivo',
+            field=models.FileField(blank=True, max_length=255, upload_to='tarefas/%Y/%m/'),
+        ),
+        migrations.RunPython(mover_arquivos_para_storage, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='tarefa',
+            name='arquivo_antigo',
+        ),
+    ]
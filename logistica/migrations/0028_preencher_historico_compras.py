@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-17 17:20
+
+import itertools
+
+from django.db import migrations
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber, TruncDate
+
+JANELA_COMPRAS = 10   # Cópia congelada de logistica.consumo.JANELA_COMPRAS
+
+
+def preencher_historico_compras(apps, schema_editor):
+    """Preenche o histórico das últimas compras (vendas realizadas) dos clientes que já existiam na 0015."""
+    Cliente = apps.get_model('logistica', 'Cliente')
+    Visita = apps.get_model('logistica', 'Visita')
+    compras = (
+        Visita.objects.filter(status='REALIZADA')
+        .annotate(
+            posicao=Window(RowNumber(), partition_by=[F('cliente_id')], order_by=F('data_visita').desc()),
+            dia=TruncDate('data_visita'),
+        )
+        .filter(posicao__lte=JANELA_COMPRAS)
+        .order_by('cliente_id', 'dia')
+        .values_list('cliente_id', 'dia')
+        .iterator(chunk_size=5000)
+    )
+    lote = []
+    for cliente_id, linhas in itertools.groupby(compras, key=lambda linha: linha[0]):
+        lote.append(Cliente(id=cliente_id, historico_compras=[dia.isoformat() for _, dia in linhas]))
+        if len(lote) >= 1000:
+            Cliente.objects.bulk_update(lote, ['historico_compras'])
+            lote = []
+    if lote:
+        Cliente.objects.bulk_update(lote, ['historico_compras'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistica', '0027_tarefa_arquivo_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_historico_compras, migrations.RunPython.noop),
+    ]
@@ -1,17 +1,90 @@
-from django.db import models
+import math
+
+from django.conf import settings
+from django.db import connections, models
+from django.db.models import BooleanField, Count, ExpressionWrapper, FloatField, Prefetch, Q
+from django.db.models.functions import Cos, Power, Radians, Sin
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
 
+from .geo import RAIO_TERRA_KM, caixa_do_raio, celula_grade, intervalos_de_celulas
+from .normalizacao import campos_busca, gramas_busca, telefone_e164
+
+# Um cliente passa a "virado" (provavelmente comprou na concorrência) após 3 ciclos sem comprar
+MULTIPLICADOR_CICLO_VIRADO = 3
+
+# Campos pesquisáveis do cliente e as colunas normalizadas que a busca (logistica/busca.py)
+# e a identificação de chamadas (logistica/chamadas.py) leem
+CAMPOS_PESQUISAVEIS = {'nome', 'telefone', 'documento', 'endereco', 'bairro'}
+CAMPOS_BUSCA = {'nome_busca', 'telefone_busca', 'documento_busca', 'endereco_busca', 'telefone_e164'}
+
 # ==============================================================================
 # NÚCLEO BASE (ENTIDADES PRINCIPAIS)
 # ==============================================================================
 
+class ClienteQuerySet(models.QuerySet):
+    """Filtros de ciclo de vida executados inteiramente no banco (colunas indexadas)."""
+
+    def atrasados(self, hoje=None):
+        hoje = hoje or timezone.localdate()
+        return self.filter(data_proxima_compra__lt=hoje)
+
+    def virados(self, hoje=None):
+        hoje = hoje or timezone.localdate()
+        return self.filter(data_virada__lt=hoje)
+
+    def sem_historico(self):
+        return self.filter(data_ultima_venda__isnull=True)
+
+    def com_estado_ciclo(self, hoje=None):
+        """Anota as flags de atraso/virada calculadas no SQL (lidas por is_atrasado, is_virado e tags_visuais)."""
+        hoje = hoje or timezone.localdate()
+        return self.annotate(
+            ciclo_atrasado=ExpressionWrapper(Q(data_proxima_compra__lt=hoje), output_field=BooleanField()),
+            ciclo_virado=ExpressionWrapper(Q(data_virada__lt=hoje), output_field=BooleanField()),
+        )
+
+    def para_planeamento(self):
+        """Linhas da Mesa de Planeamento: flags do ciclo e carteiras de todos os clientes da página numa só consulta."""
+        return self.com_estado_ciclo().prefetch_related(
+            Prefetch('carteiras', queryset=Carteira.objects.only('id', 'nome', 'cor_etiqueta').order_by('nome'))
+        )
+
+    def dentro_da_caixa(self, lat_min, lat_max, lng_min, lng_max):
+        """Clientes dentro da caixa lat/lng, lendo só as células da grelha que a cobrem."""
+        filtro = Q(latitude__range=(lat_min, lat_max), longitude__range=(lng_min, lng_max))
+        intervalos = intervalos_de_celulas(lat_min, lat_max, lng_min, lng_max)
+        if intervalos is not None:
+            celulas = Q()
+            for primeira, ultima in intervalos:
+                celulas |= Q(celula_grade__range=(primeira, ultima))
+            filtro &= celulas
+        return self.filter(filtro)
+
+    def perto_de(self, latitude, longitude, raio_m):
+        """Clientes a até raio_m metros do ponto (caixa pela grelha, depois distância exata), tudo no SQL."""
+        # Haversine sem o asin/sqrt finais (monótonos): a distância <= raio equivale a
+        # sin²(Δlat/2) + cos(lat)·cos(lat0)·sin²(Δlng/2) <= sin²(raio / 2R)
+        lat0, lng0 = math.radians(latitude), math.radians(longitude)
+        termo_lat = Power(Sin((Radians('latitude') - lat0) / 2), 2)
+        termo_lng = Power(Sin((Radians('longitude') - lng0) / 2), 2)
+        limite = math.sin(min(raio_m / 1000 / (2 * RAIO_TERRA_KM), math.pi / 2)) ** 2
+        return self.dentro_da_caixa(*caixa_do_raio(latitude, longitude, raio_m)).alias(
+            haversine=ExpressionWrapper(
+                termo_lat + math.cos(lat0) * Cos(Radians('latitude')) * termo_lng, output_field=FloatField(),
+            ),
+        ).filter(haversine__lte=limite)
+
+
 class Cliente(models.Model):
     nome = models.CharField(max_length=100)
     endereco = models.CharField(max_length=255)
     bairro = models.CharField(max_length=100, default="Não Informado")
     telefone = models.CharField(max_length=20)
+    # Telefone canónico (+55 DDD número) que identifica quem liga para o depósito. Não é único:
+    # uma família partilha o telefone e a base ainda tem duplicados por fundir
+    telefone_e164 = models.CharField(max_length=16, blank=True, default='', db_index=True, editable=False)
     
     # --- NOVOS CAMPOS DE CADASTRO ESTENDIDO ---
     documento = models.CharField(max_length=20, blank=True, null=True, help_text="CPF ou CNPJ")
@@ -22,6 +95,12 @@ class Cliente(models.Model):
     # GPS
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
+
+    # Célula da grelha espacial (logistica/geo.py) para as consultas de proximidade
+    celula_grade = models.IntegerField(blank=True, null=True, db_index=True, editable=False)
+
+    # Precisão das coordenadas obtidas pela geocodificação do endereço (vazio: GPS/CSV originais)
+    geocodificacao = models.CharField(max_length=15, blank=True, default='', editable=False)
     
     # Financeiro
     divida_atual = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
@@ -30,32 +109,75 @@ class Cliente(models.Model):
     ciclo_consumo_dias = models.IntegerField(default=30, help_text="Média de dias entre as compras")
     data_ultima_venda = models.DateField(blank=True, null=True)
 
+    # Últimas datas de compra (ISO, da mais antiga para a mais recente) usadas na mediana do ciclo
+    historico_compras = models.JSONField(default=list, blank=True, editable=False)
+
+    # Datas derivadas do ciclo (persistidas e indexadas para filtrar direto no SQL)
+    data_proxima_compra = models.DateField(blank=True, null=True, db_index=True, editable=False)
+    data_virada = models.DateField(blank=True, null=True, db_index=True, editable=False)
+
+    # Busca: formas normalizadas (sem acentos, só dígitos) mantidas pelo save() e indexadas por prefixo
+    nome_busca = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
+    telefone_busca = models.CharField(max_length=20, blank=True, default='', db_index=True, editable=False)
+    documento_busca = models.CharField(max_length=20, blank=True, default='', db_index=True, editable=False)
+    endereco_busca = models.CharField(max_length=255, blank=True, default='', editable=False)
+
+    objects = ClienteQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.nome} - {self.bairro}"
 
+    def atualizar_datas_ciclo(self):
+        """Recalcula as datas derivadas a partir da última venda e do ciclo de consumo."""
+        if self.data_ultima_venda:
+            self.data_proxima_compra = self.data_ultima_venda + timedelta(days=self.ciclo_consumo_dias)
+            self.data_virada = self.data_ultima_venda + timedelta(days=self.ciclo_consumo_dias * MULTIPLICADOR_CICLO_VIRADO)
+        else:
+            self.data_proxima_compra = None
+            self.data_virada = None
+
+    def atualizar_campos_busca(self):
+        for campo, valor in campos_busca(self.nome, self.telefone, self.documento, self.endereco, self.bairro).items():
+            setattr(self, campo, valor)
+        self.telefone_e164 = telefone_e164(self.telefone, settings.TELEFONE_DDD_PADRAO)
+
+    def save(self, *args, **kwargs):
+        self.atualizar_datas_ciclo()
+        self.celula_grade = celula_grade(self.latitude, self.longitude)
+        self.atualizar_campos_busca()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'data_ultima_venda', 'ciclo_consumo_dias'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'data_proxima_compra', 'data_virada'}
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'celula_grade'}
+        reindexar = update_fields is None or bool(CAMPOS_PESQUISAVEIS & set(update_fields))
+        if update_fields is not None and reindexar:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | CAMPOS_BUSCA
+        super().save(*args, **kwargs)
+        if reindexar:
+            GramaBusca.objects.reindexar([self])
+
     @property
     def dias_desde_ultima_compra(self):
         if not self.data_ultima_venda:
             return None
-        return (timezone.now().date() - self.data_ultima_venda).days
+        return (timezone.localdate() - self.data_ultima_venda).days
 
     @property
     def is_atrasado(self):
-        if not self.data_ultima_venda:
+        if 'ciclo_atrasado' in self.__dict__:
+            return bool(self.ciclo_atrasado)
+        if not self.data_proxima_compra:
             return False 
-        return self.dias_desde_ultima_compra > self.ciclo_consumo_dias
+        return self.data_proxima_compra < timezone.localdate()
 
     @property
     def is_virado(self):
-        if not self.data_ultima_venda:
+        if 'ciclo_virado' in self.__dict__:
+            return bool(self.ciclo_virado)
+        if not self.data_virada:
             return False
-        return self.dias_desde_ultima_compra > (self.ciclo_consumo_dias * 3)
-
-    @property
-    def data_proxima_compra(self):
-        if self.data_ultima_venda:
-            return self.data_ultima_venda + timedelta(days=self.ciclo_consumo_dias)
-        return None
+        return self.data_virada < timezone.localdate()
 
     @property
     def tags_visuais(self):
@@ -68,6 +190,46 @@ class Cliente(models.Model):
             tags.append({'texto': 'ATRASADO', 'cor': 'warning', 'icone': 'fa-clock'})
         return tags
 
+class GramaBuscaQuerySet(models.QuerySet):
+
+    def reindexar(self, clientes):
+        """Refaz os trigramas dos clientes indicados (com os campos *_busca já preenchidos)."""
+        clientes = [cliente for cliente in clientes if cliente.pk is not None]
+        self.filter(cliente_id__in=[cliente.pk for cliente in clientes]).delete()
+        linhas = [
+            (grama, cliente.pk)
+            for cliente in clientes
+            for grama in gramas_busca(cliente.nome_busca, cliente.telefone_busca, cliente.documento_busca, cliente.endereco_busca)
+        ]
+        # São dezenas de trigramas por cliente: um INSERT em executemany evita instanciar um modelo por linha
+        conexao = connections[self.db]
+        tabela = conexao.ops.quote_name(self.model._meta.db_table)
+        with conexao.cursor() as cursor:
+            cursor.executemany(f"INSERT INTO {tabela} (grama, cliente_id) VALUES (%s, %s)", linhas)
+
+
+class GramaBusca(models.Model):
+    """Índice invertido da busca: cada trigrama do nome, endereço, telefone e documento aponta para o cliente."""
+    grama = models.CharField(max_length=3)
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='+')
+
+    objects = GramaBuscaQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['grama', 'cliente'], name='grama_busca_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.grama} - {self.cliente_id}"
+
+class CarteiraQuerySet(models.QuerySet):
+
+    def com_resumo(self):
+        """Listagem de carteiras: responsáveis e número de clientes vinculados, sem consultas por carteira."""
+        return self.select_related('agente_comercial', 'motoqueiro').annotate(total_clientes=Count('clientes', distinct=True))
+
+
 class Carteira(models.Model):
     nome = models.CharField(max_length=50)
     cor_etiqueta = models.CharField(max_length=7, default="#F26522")
@@ -75,6 +237,8 @@ class Carteira(models.Model):
     agente_comercial = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='carteiras_comerciais')
     clientes = models.ManyToManyField(Cliente, blank=True, related_name='carteiras')
 
+    objects = CarteiraQuerySet.as_manager()
+
     def __str__(self):
         return self.nome
 
@@ -87,6 +251,11 @@ class Rota(models.Model):
     motoqueiro = models.ForeignKey(User, on_delete=models.CASCADE)
     data_criacao = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['motoqueiro', 'data_criacao'], name='rota_motoqueiro_data_idx'),
+        ]
+
     def __str__(self):
         return f"{self.nome} - {self.motoqueiro.username}"
 
@@ -118,11 +287,40 @@ class Visita(models.Model):
     concorrente_empresa = models.CharField(max_length=50, blank=True, null=True)
     concorrente_preco = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     observacao = models.TextField(blank=True, null=True)
-    data_visita = models.DateTimeField(auto_now=True)
+    # Momento da baixa: na sincronização offline é a hora do telemóvel, não a da chegada ao servidor
+    data_visita = models.DateTimeField(default=timezone.now)
+
+    # Carimbo de versão para o download delta da sincronização (logistica/sincronizacao.py)
+    atualizada_em = models.DateTimeField(auto_now=True)
+
+    # Posição na sequência de paragens calculada por logistica/roteirizacao.py
+    ordem = models.PositiveIntegerField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['rota', 'status'], name='visita_rota_status_idx'),
+            models.Index(fields=['data_visita'], name='visita_data_idx'),
+        ]
 
     def __str__(self):
         return f"{self.cliente.nome} - {self.status}"
 
+class BaixaSincronizada(models.Model):
+    """Baixa recebida por lote do telemóvel; a chave (gerada no aparelho) torna o reenvio idempotente."""
+    motoqueiro = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    chave = models.CharField(max_length=64)
+    visita = models.ForeignKey(Visita, on_delete=models.CASCADE, related_name='+')
+    momento = models.DateTimeField(help_text="Hora da baixa no telemóvel")
+    recebida_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['motoqueiro', 'chave'], name='baixa_motoqueiro_chave_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.motoqueiro_id} - {self.chave}"
+
 # ==============================================================================
 # NÚCLEO COMERCIAL (MUNDO VIRTUAL)
 # ==============================================================================
@@ -147,5 +345,285 @@ class Ligacao(models.Model):
     concorrente_empresa = models.CharField(max_length=50, blank=True, null=True)
     concorrente_preco = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['agente', 'data_ligacao'], name='ligacao_agente_data_idx'),
+            models.Index(fields=['agente', 'resultado', 'data_retorno'], name='ligacao_agente_retorno_idx'),
+        ]
+
+    def __str__(self):
+        return f"Ligação para {self.cliente.nome} - {self.get_resultado_display()}"
+
+class FilaContato(models.Model):
+    """Fila de ligações de cada agente, com a prioridade já calculada (mantida por logistica.fila)."""
+    agente = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='+')
+    prioridade = models.IntegerField(default=0)
+
+    # O cliente só aparece no cockpit a partir desta data (dia seguinte ao contacto ou data do retorno)
+    disponivel_em = models.DateField()
+    data_retorno = models.DateField(blank=True, null=True)
+    ultima_ligacao = models.ForeignKey(Ligacao, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    calculado_em = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['agente', 'cliente'], name='fila_agente_cliente_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['agente', '-prioridade', 'id'], name='fila_agente_prioridade_idx'),
+            models.Index(fields=['agente', 'calculado_em'], name='fila_agente_calculo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.agente_id} - {self.cliente_id}: {self.prioridade}"
+
+# ==============================================================================
+# RESUMOS DIÁRIOS (ROLLUPS DO DASHBOARD, MANTIDOS INCREMENTALMENTE)
+# ==============================================================================
+
+class ResumoDiarioVisitas(models.Model):
+    """Quantidade e valor recebido por dia da rota, motoqueiro, status e motivo de não venda."""
+    dia = models.DateField()
+    motoqueiro = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    status = models.CharField(max_length=20, choices=Visita.STATUS_CHOICES)
+    motivo_nao_venda = models.CharField(max_length=50, blank=True, default='')
+    quantidade = models.IntegerField(default=0)
+    valor_recebido = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'motoqueiro', 'status', 'motivo_nao_venda'], name='resumo_visitas_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} - {self.motoqueiro_id} - {self.status}: {self.quantidade}"
+
+class ResumoDiarioLigacoes(models.Model):
+    """Quantidade de ligações por dia, agente, resultado e motivo de não venda."""
+    dia = models.DateField()
+    agente = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    resultado = models.CharField(max_length=20, choices=Ligacao.RESULTADO_CHOICES)
+    motivo_nao_venda = models.CharField(max_length=50, blank=True, default='')
+    quantidade = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'agente', 'resultado', 'motivo_nao_venda'], name='resumo_ligacoes_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} - {self.agente_id} - {self.resultado}: {self.quantidade}"
+
+class ResumoDiarioConcorrencia(models.Model):
+    """Vendas perdidas para cada concorrente por dia, separadas pela origem (Rua ou Telefone)."""
+    ORIGEM_CHOICES = [
+        ('VISITA', 'Motoqueiro (Rua)'),
+        ('LIGACAO', 'Call Center (Telefone)'),
+    ]
+
+    dia = models.DateField()
+    origem = models.CharField(max_length=10, choices=ORIGEM_CHOICES)
+    concorrente_empresa = models.CharField(max_length=50)
+    quantidade = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'origem', 'concorrente_empresa'], name='resumo_concorrencia_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} - {self.concorrente_empresa}: {self.quantidade}"
+
+class ObservacaoConcorrente(models.Model):
+    """Um concorrente (e o preço dele, se o cliente o disse) relatado numa recusa, na rua ou ao telefone."""
+    dia = models.DateField()
+    origem = models.CharField(max_length=10, choices=ResumoDiarioConcorrencia.ORIGEM_CHOICES)
+    # Nome e bairro normalizados: "NACIONAL GÁS" e "nacional gas " são o mesmo concorrente nos resumos
+    concorrente = models.CharField(max_length=50)
+    concorrente_empresa = models.CharField(max_length=50)
+    bairro = models.CharField(max_length=100, blank=True, default='')
+    preco = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    visita = models.OneToOneField(Visita, on_delete=models.CASCADE, blank=True, null=True, related_name='observacao_concorrente')
+    ligacao = models.OneToOneField(Ligacao, on_delete=models.CASCADE, blank=True, null=True, related_name='observacao_concorrente')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dia', 'concorrente'], name='observacao_dia_concorrente_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} - {self.concorrente} ({self.bairro}): {self.preco}"
+
+class ResumoDiarioPrecoConcorrente(models.Model):
+    """Observações e preços de cada concorrente por dia e bairro; `precos` é o histograma {"105.00": 3} da mediana."""
+    dia = models.DateField()
+    concorrente = models.CharField(max_length=50)
+    bairro = models.CharField(max_length=100, blank=True, default='')
+    quantidade = models.IntegerField(default=0)
+    com_preco = models.IntegerField(default=0)
+    preco_minimo = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    preco_maximo = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    precos = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'concorrente', 'bairro'], name='resumo_preco_concorrente_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} - {self.concorrente} ({self.bairro}): {self.quantidade}"
+
+# ==============================================================================
+# GEOCODIFICAÇÃO DE ENDEREÇOS
+# ==============================================================================
+
+class EnderecoGeocodificado(models.Model):
+    """Cache da geocodificação por endereço normalizado (logistica/geocodificacao.py), incluindo as falhas."""
+    PRECISAO_CHOICES = [
+        ('EXATA', 'Número da porta'),
+        ('RUA', 'Centro da rua'),
+        ('BAIRRO', 'Centro do bairro'),
+        ('NAO_ENCONTRADO', 'Não encontrado'),
+    ]
+
+    chave = models.CharField(max_length=255, unique=True, help_text="logradouro número|bairro (normalizados)")
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    precisao = models.CharField(max_length=15, choices=PRECISAO_CHOICES)
+    fonte = models.CharField(max_length=50)
+    resolvido_em = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.chave}: {self.precisao}"
+
+# ==============================================================================
+# CLIENTES DUPLICADOS (DETEÇÃO E FUSÃO)
+# ==============================================================================
+
+class ParDuplicado(models.Model):
+    """Dois clientes que parecem a mesma pessoa (logistica/duplicados.py), à espera de fusão ou descarte."""
+    # cliente_a tem sempre o id menor
+    cliente_a = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='+')
+    cliente_b = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='+')
+    pontuacao = models.FloatField(help_text="0 a 1: semelhança do nome, do telefone, do endereço e do documento")
+    motivo = models.CharField(max_length=30)
+    # Marcado pelo gerente como pessoas diferentes: não volta a ser sugerido
+    descartado = models.BooleanField(default=False)
+    detectado_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cliente_a', 'cliente_b'], name='par_duplicado_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['descartado', '-pontuacao'], name='par_duplicado_pontuacao_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.cliente_a_id} ~ {self.cliente_b_id}: {self.pontuacao:.2f}"
+
+class FusaoCliente(models.Model):
+    """Registo de cada cliente absorvido por outro: de onde vieram as visitas e ligações do principal."""
+    # O duplicado é apagado na fusão: fica só o id e o nome que tinha
+    duplicado_id = models.IntegerField(db_index=True)
+    duplicado_nome = models.CharField(max_length=100)
+    principal = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='fusoes')
+    fundido_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    fundido_em = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.duplicado_id} ({self.duplicado_nome}) -> {self.principal_id}"
+
+# ==============================================================================
+# PREVISÃO DE PROCURA (PROPOSTAS DE ROTA)
+# ==============================================================================
+
+class PropostaVisita(models.Model):
+    """Cliente que deve precisar de gás no dia, proposto ao motoqueiro da sua carteira (logistica/previsao.py)."""
+    dia = models.DateField()
+    motoqueiro = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    carteira = models.ForeignKey(Carteira, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='propostas')
+    # 1 = o mais provável; a lista de cada motoqueiro para na sua capacidade diária
+    posicao = models.PositiveIntegerField()
+    probabilidade = models.FloatField(help_text="Probabilidade de o cliente já precisar de gás no dia (0 a 1)")
+    confianca = models.FloatField(help_text="0 a 1: quantidade e regularidade das compras do cliente")
+    data_prevista = models.DateField()
+    margem_dias = models.PositiveIntegerField(help_text="A compra deve cair em data_prevista ± margem (80%)")
+    gerada_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'cliente'], name='proposta_visita_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['dia', 'motoqueiro', 'posicao'], name='proposta_dia_motoqueiro_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} - {self.motoqueiro_id} #{self.posicao}: {self.cliente_id}"
+
+# ==============================================================================
+# TAREFAS EM SEGUNDO PLANO (IMPORTAÇÕES E EXCLUSÕES PESADAS)
+# ==============================================================================
+
+class Tarefa(models.Model):
+    """Trabalho pesado enfileirado pela web e executado pelo comando processar_tarefas (logistica/tarefas.py)."""
+    TIPO_CHOICES = [
+        ('IMPORTAR_CLIENTES', 'Importação de clientes (CSV)'),
+        ('EXCLUIR_CLIENTE', 'Exclusão de cliente'),
+        ('GEOCODIFICAR', 'Geocodificação de endereços'),
+        ('DETECTAR_DUPLICADOS', 'Deteção de clientes duplicados'),
+        ('FUNDIR_DUPLICADOS', 'Fusão de clientes duplicados'),
+    ]
+    ESTADO_CHOICES = [
+        ('PENDENTE', 'Na fila'),
+        ('EXECUTANDO', 'Em execução'),
+        ('CONCLUIDA', 'Concluída'),
+        ('FALHOU', 'Falhou'),
+    ]
+
+    tipo = models.CharField(max_length=30, choices=TIPO_CHOICES)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDENTE')
+    criada_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    descricao = models.CharField(max_length=255)
+
+    # Entrada: parâmetros em JSON e, nas importações, o ficheiro enviado, guardado no storage
+    # (MEDIA_ROOT) e lido pelo worker em streaming; é apagado quando a tarefa termina
+    parametros = models.JSONField(default=dict, blank=True)
+    arquivo = models.FileField(upload_to='tarefas/%Y/%m/', blank=True, max_length=255)
+
+    # Progresso (atualizado pelo processo que executa, no máximo algumas vezes por segundo)
+    progresso_atual = models.PositiveIntegerField(default=0)
+    progresso_total = models.PositiveIntegerField(default=0)
+    mensagem = models.CharField(max_length=255, blank=True, default='')
+    resultado = models.JSONField(default=dict, blank=True)
+    erro = models.TextField(blank=True, default='')
+
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    criada_em = models.DateTimeField(auto_now_add=True)
+    iniciada_em = models.DateTimeField(blank=True, null=True)
+    concluida_em = models.DateTimeField(blank=True, null=True)
+    # Sinal de vida do processo: uma tarefa EXECUTANDO sem batimento recente ficou órfã
+    batimento = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'id'], name='tarefa_estado_idx'),
+        ]
+
+    @property
+    def percentual(self):
+        if self.estado == 'CONCLUIDA':
+            return 100
+        if not self.progresso_total:
+            return 0
+        return min(100, int(self.progresso_atual * 100 / self.progresso_total))
+
+    @property
+    def terminada(self):
+        return self.estado in ('CONCLUIDA', 'FALHOU')
+
     def __str__(self):
-        return f"Ligação para {self.cliente.nome} - {self.get_resultado_display()}"
\ No newline at end of file
+        return f"#{self.id} {self.get_tipo_display()} - {self.estado}"
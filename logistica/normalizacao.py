@@ -0,0 +1,159 @@
+import re
+import unicodedata
+from collections import namedtuple
+
+# ==============================================================================
+# NORMALIZAÇÃO DE TEXTO E ENDEREÇOS
+# ==============================================================================
+# O mesmo endereço chega escrito de muitas formas ("R. José Martins, 173",
+# "RUA JOSE MARTINS,173 - CASA"). Antes de comparar, tudo passa para minúsculas
+# sem acentos nem pontuação, com as abreviaturas por extenso: é esta forma que
+# serve de chave ao cache de geocodificação e às colunas da busca de clientes.
+
+# Abreviaturas comuns nos cadastros (tipo de logradouro e títulos)
+ABREVIATURAS = {
+    'r': 'rua', 'av': 'avenida', 'ave': 'avenida', 'tv': 'travessa', 'trav': 'travessa',
+    'al': 'alameda', 'pc': 'praca', 'pca': 'praca', 'pq': 'parque', 'rod': 'rodovia',
+    'estr': 'estrada', 'vl': 'vila', 'cj': 'conjunto', 'conj': 'conjunto', 'lot': 'loteamento',
+    'dr': 'doutor', 'dra': 'doutora', 'prof': 'professor', 'profa': 'professora', 'pe': 'padre',
+    'sto': 'santo', 'sta': 'santa', 'eng': 'engenheiro', 'gen': 'general', 'cel': 'coronel',
+    'des': 'desembargador', 'pres': 'presidente', 'mal': 'marechal', 'ten': 'tenente',
+}
+
+# Valores de preenchimento que não identificam nenhum lugar
+VAZIOS = {'', 'nao informado', 'bairro nao informado', 'endereco nao informado', 'sem endereco', 'sn', 's n'}
+
+_NAO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+_NUMERO = re.compile(r'^(\d+)[a-z]?$')
+_NAO_DIGITO = re.compile(r'\D+')
+
+EnderecoNormalizado = namedtuple('EnderecoNormalizado', ['chave', 'logradouro', 'numero', 'bairro'])
+
+
+def sem_acentos(texto):
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+
+
+def normalizar_texto(texto):
+    """Minúsculas, sem acentos, pontuação trocada por espaço e espaços repetidos colapsados."""
+    return _NAO_ALFANUMERICO.sub(' ', sem_acentos(texto or '').lower()).strip()
+
+
+def somente_digitos(texto):
+    return _NAO_DIGITO.sub('', texto or '')
+
+
+# Os telefones comparam-se pelo fim do número: ignora o DDD, o 55 e o 9 acrescentado aos celulares
+DIGITOS_TELEFONE = 8
+
+
+def telefones_compativeis(telefone_a, telefone_b):
+    """
+    Dois telefones (só dígitos) confirmam a mesma pessoa: existem os dois e terminam igual.
+    Um telefone em falta é desconhecido, não compatível: não chega para juntar dois homónimos.
+    """
+    return bool(telefone_a and telefone_b) and telefone_a[-DIGITOS_TELEFONE:] == telefone_b[-DIGITOS_TELEFONE:]
+
+
+def limpar_telefone(valor):
+    """Remove a máscara do telefone (espaços, traços e parênteses): é assim que fica gravado no Cliente."""
+    return (valor or '').replace(' ', '').replace('-', '').replace('(', '').replace(')', '')[:20]
+
+# ------------------------------------------------------------------------------
+# Telefone canónico (E.164) para a identificação de chamadas (logistica/chamadas.py)
+# ------------------------------------------------------------------------------
+
+CODIGO_PAIS = '55'
+
+
+def telefone_e164(telefone, ddd_padrao=''):
+    """
+    "+55" + DDD + número: "(85) 98765-4321", "085 98765-4321", "0 21 85 98765-4321" (operadora),
+    "+55 85 98765-4321" e "98765-4321" (com o DDD padrão) dão todos "+5585987654321".
+    Os celulares antigos de 8 dígitos ganham o 9. Devolve '' se não for um telefone brasileiro completo.
+    """
+    digitos = somente_digitos(telefone)
+    if digitos.startswith('00'):
+        # Discagem internacional: só interessa o Brasil
+        digitos = digitos[2:]
+        if not digitos.startswith(CODIGO_PAIS):
+            return ''
+    elif digitos.startswith('0'):
+        # Prefixo nacional, às vezes seguido do código de 2 dígitos da operadora
+        digitos = digitos[1:]
+        if len(digitos) in (12, 13):
+            digitos = digitos[2:]
+    if len(digitos) in (12, 13) and digitos.startswith(CODIGO_PAIS):
+        digitos = digitos[len(CODIGO_PAIS):]
+    if len(digitos) in (8, 9) and ddd_padrao:
+        digitos = ddd_padrao + digitos
+    if len(digitos) == 10 and digitos[2] in '6789':
+        digitos = digitos[:2] + '9' + digitos[2:]
+    if len(digitos) not in (10, 11) or digitos[0] == '0':
+        return ''
+    return f"+{CODIGO_PAIS}{digitos}"
+
+
+def _expandir(texto):
+    return ' '.join(ABREVIATURAS.get(palavra, palavra) for palavra in texto.split())
+
+
+def normalizar_bairro(bairro):
+    bairro = _expandir(normalizar_texto(bairro))
+    return '' if bairro in VAZIOS else bairro
+
+
+def normalizar_endereco(endereco, bairro=''):
+    """
+    Separa "logradouro, número - complemento" em logradouro e número normalizados, mais o bairro.
+    A chave junta os três e identifica o endereço no cache de geocodificação ('' se não há nada útil).
+    """
+    partes = (endereco or '').split(',', 1)
+    logradouro = _expandir(normalizar_texto(partes[0]))
+    resto = normalizar_texto(partes[1]).split() if len(partes) > 1 else []
+    if not resto:
+        # Sem vírgula: "Rua Tupi 1789" tem o número no fim (mas "Rua 612" é só o nome)
+        palavras = logradouro.split()
+        if len(palavras) > 2 and _NUMERO.match(palavras[-1]):
+            logradouro, resto = ' '.join(palavras[:-1]), palavras[-1:]
+
+    numero = ''
+    if resto and _NUMERO.match(resto[0]):
+        numero = _NUMERO.match(resto[0]).group(1)
+
+    if logradouro in VAZIOS:
+        logradouro = ''
+    bairro = normalizar_bairro(bairro)
+    chave = f"{logradouro} {numero}".strip() + f"|{bairro}" if logradouro or bairro else ''
+    return EnderecoNormalizado(chave[:255], logradouro, numero, bairro)
+
+
+# ------------------------------------------------------------------------------
+# Colunas e trigramas da busca de clientes (logistica/busca.py)
+# ------------------------------------------------------------------------------
+
+TAMANHO_GRAMA = 3
+
+
+def campos_busca(nome, telefone, documento, endereco, bairro):
+    """Formas normalizadas gravadas no Cliente para a busca (nome e endereço sem acentos, só os dígitos do telefone e documento)."""
+    return {
+        'nome_busca': normalizar_texto(nome)[:100],
+        'telefone_busca': somente_digitos(telefone)[:20],
+        'documento_busca': somente_digitos(documento)[:20],
+        'endereco_busca': f"{normalizar_texto(endereco)} {normalizar_texto(bairro)}".strip()[:255],
+    }
+
+
+def gramas(texto):
+    """Trigramas de cada palavra com 3 ou mais caracteres."""
+    return {
+        palavra[i:i + TAMANHO_GRAMA]
+        for palavra in texto.split()
+        for i in range(len(palavra) - TAMANHO_GRAMA + 1)
+    }
+
+
+def gramas_busca(nome_busca, telefone_busca, documento_busca, endereco_busca):
+    """Conjunto de trigramas que indexa um cliente (um cliente encontra-se por qualquer pedaço destes campos)."""
+    return gramas(f"{nome_busca} {telefone_busca} {documento_busca} {endereco_busca}")
@@ -0,0 +1,98 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.db.models import Q
+from django.urls import reverse
+
+# ==============================================================================
+# PAGINAÇÃO POR CURSOR (KEYSET)
+# ==============================================================================
+# Em vez de OFFSET (que obriga o banco a ler e descartar todas as linhas
+# anteriores), cada página começa logo a seguir à última linha da página
+# anterior, usando o índice da ordenação. O custo é o mesmo na 1ª e na 100ª página.
+
+TAMANHO_PAGINA_PADRAO = 50
+
+
+def _serializar(valor):
+    if isinstance(valor, (datetime.datetime, datetime.date)):
+        return valor.isoformat()
+    return valor
+
+
+def codificar_cursor(valores):
+    """Transforma os valores da última linha num cursor opaco seguro para URLs."""
+    bruto = json.dumps([_serializar(v) for v in valores], separators=(',', ':'))
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Devolve os valores do cursor, ou None se estiver vazio ou corrompido."""
+    if not cursor:
+        return None
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valores = json.loads(bruto)
+    except (binascii.Error, ValueError):
+        return None
+    return valores if isinstance(valores, list) else None
+
+
+def _filtro_apos(ordenacao, valores):
+    """Constrói a condição lexicográfica "linha vem depois de `valores`" para a ordenação dada."""
+    condicao = Q()
+    iguais = {}
+    for campo, valor in zip(ordenacao, valores):
+        nome = campo.lstrip('-')
+        operador = 'lt' if campo.startswith('-') else 'gt'
+        condicao |= Q(**iguais, **{f'{nome}__{operador}': valor})
+        iguais[nome] = valor
+    return condicao
+
+
+class PaginaCursor:
+    """Uma página de resultados e o cursor para pedir a seguinte."""
+
+    def __init__(self, itens, proximo_cursor):
+        self.itens = itens
+        self.proximo_cursor = proximo_cursor
+
+    @property
+    def tem_mais(self):
+        return self.proximo_cursor is not None
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+
+def paginar_por_cursor(queryset, ordenacao, cursor=None, tamanho=TAMANHO_PAGINA_PADRAO):
+    """
+    Devolve uma PaginaCursor com até `tamanho` itens do queryset, ordenados por `ordenacao`.
+    A ordenação deve terminar num campo único (ex: 'id') e não pode ter campos nulos.
+    """
+    valores = decodificar_cursor(cursor)
+    queryset = queryset.order_by(*ordenacao)
+    if valores and len(valores) == len(ordenacao):
+        queryset = queryset.filter(_filtro_apos(ordenacao, valores))
+
+    itens = list(queryset[:tamanho + 1])
+    proximo_cursor = None
+    if len(itens) > tamanho:
+        itens = itens[:tamanho]
+        ultimo = itens[-1]
+        proximo_cursor = codificar_cursor([getattr(ultimo, campo.lstrip('-')) for campo in ordenacao])
+    return PaginaCursor(itens, proximo_cursor)
+
+
+def url_proxima_pagina(request, nome_url, pagina, *args):
+    """URL do fragmento com a página seguinte, preservando os filtros atuais do GET."""
+    if not pagina.tem_mais:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = pagina.proximo_cursor
+    return f"{reverse(nome_url, args=args)}?{params.urlencode()}"
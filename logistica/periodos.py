@@ -0,0 +1,44 @@
+import datetime
+
+from django.utils import timezone
+
+# ==============================================================================
+# PERÍODOS DE DATAS (LIMITES COMPATÍVEIS COM ÍNDICES)
+# ==============================================================================
+# Filtros como `data_ligacao__date=hoje` obrigam o banco a converter o fuso de
+# cada linha antes de comparar, o que impede o uso de índices. Aqui convertemos
+# o período local uma única vez em limites aware semiabertos [início, fim).
+
+
+def limites_periodo(data_inicio, data_fim=None):
+    """Converte o período local [data_inicio, data_fim] em limites aware [início, fim)."""
+    data_fim = data_fim or data_inicio
+    tz = timezone.get_current_timezone()
+    inicio = timezone.make_aware(datetime.datetime.combine(data_inicio, datetime.time.min), tz)
+    fim = timezone.make_aware(datetime.datetime.combine(data_fim + datetime.timedelta(days=1), datetime.time.min), tz)
+    return inicio, fim
+
+
+def filtro_periodo(campo, data_inicio, data_fim=None):
+    """Gera os kwargs `campo__gte`/`campo__lt` para usar direto num .filter()."""
+    inicio, fim = limites_periodo(data_inicio, data_fim)
+    return {f'{campo}__gte': inicio, f'{campo}__lt': fim}
+
+
+def ler_periodo(request):
+    """Lê `data_inicio`/`data_fim` do GET (padrão: hoje) e garante início <= fim."""
+    hoje = timezone.localdate()
+    data_inicio_str = request.GET.get('data_inicio')
+    data_fim_str = request.GET.get('data_fim')
+
+    try:
+        data_inicio = datetime.datetime.strptime(data_inicio_str, '%Y-%m-%d').date() if data_inicio_str else hoje
+        data_fim = datetime.datetime.strptime(data_fim_str, '%Y-%m-%d').date() if data_fim_str else hoje
+    except ValueError:
+        data_inicio = hoje
+        data_fim = hoje
+
+    # Prevenção: Inverte as datas se o utilizador colocar o fim antes do início
+    if data_inicio > data_fim: 
+        data_inicio, data_fim = data_fim, data_inicio
+    return data_inicio, data_fim
@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+# ==============================================================================
+# HISTOGRAMAS DE PREÇOS (MEDIANA INCREMENTAL)
+# ==============================================================================
+# A mediana não se soma nem se subtrai como uma contagem. Os preços do gás
+# repetem-se muito (poucos valores em centavos), por isso cada resumo guarda o
+# histograma {"105.00": 3, "110.00": 1}: uma observação nova ou retirada mexe
+# numa chave, e a mediana de qualquer período sai da soma dos histogramas dos
+# dias, sem voltar às visitas e ligações. Funções puras (usadas também pelas migrações).
+
+
+def chave_preco(preco):
+    return f"{Decimal(preco):.2f}"
+
+
+def somar(precos, preco, sinal=1):
+    """Histograma com o preço somado (sinal=1) ou retirado (sinal=-1); as chaves a zero desaparecem."""
+    precos = dict(precos)
+    chave = chave_preco(preco)
+    quantidade = precos.get(chave, 0) + sinal
+    if quantidade > 0:
+        precos[chave] = quantidade
+    else:
+        precos.pop(chave, None)
+    return precos
+
+
+def juntar(histogramas):
+    total = {}
+    for precos in histogramas:
+        for chave, quantidade in precos.items():
+            total[chave] = total.get(chave, 0) + quantidade
+    return total
+
+
+def resumir(precos):
+    """(quantidade, mínimo, mediana, máximo) do histograma; sem preços, (0, None, None, None)."""
+    valores = sorted((Decimal(chave), quantidade) for chave, quantidade in precos.items() if quantidade > 0)
+    total = sum(quantidade for _, quantidade in valores)
+    if not total:
+        return 0, None, None, None
+
+    def na_posicao(posicao):
+        acumulado = 0
+        for preco, quantidade in valores:
+            acumulado += quantidade
+            if acumulado > posicao:
+                return preco
+
+    # Com um total par, a mediana é a média dos dois preços do meio
+    mediana = (na_posicao((total - 1) // 2) + na_posicao(total // 2)) / 2
+    return total, valores[0][0], mediana.quantize(Decimal('0.01')), valores[-1][0]
+
+
+def campos_resumo(quantidade, precos):
+    """Colunas de um ResumoDiarioPrecoConcorrente com estas observações e este histograma."""
+    com_preco, minimo, _, maximo = resumir(precos)
+    return {'quantidade': quantidade, 'com_preco': com_preco, 'preco_minimo': minimo, 'preco_maximo': maximo, 'precos': precos}
+
+
+def agrupar(observacoes):
+    """{(dia, concorrente, bairro): colunas do resumo} das observações (dia, concorrente, bairro, preço ou None)."""
+    grupos = {}
+    for dia, concorrente, bairro, preco in observacoes:
+        quantidade, histograma = grupos.get((dia, concorrente, bairro), (0, {}))
+        if preco is not None:
+            histograma = somar(histograma, preco)
+        grupos[(dia, concorrente, bairro)] = (quantidade + 1, histograma)
+    return {chave: campos_resumo(*valores) for chave, valores in grupos.items()}
@@ -0,0 +1,329 @@
+import datetime
+import math
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .consumo import JANELA_COMPRAS
+from .models import MULTIPLICADOR_CICLO_VIRADO, Carteira, Cliente, PropostaVisita, Visita
+from .periodos import filtro_periodo
+
+# ==============================================================================
+# PREVISÃO DE PROCURA EM LOTE (PROPOSTA DE ROTAS DO DIA SEGUINTE)
+# ==============================================================================
+# consumo.py atualiza o ciclo mediano venda a venda, um cliente de cada vez. Aqui
+# a base inteira é prevista de uma só vez, a partir de todas as vendas realizadas
+# lidas numa única consulta para arrays numpy:
+#  - ciclo: mediana das últimas compras do cliente, puxada para o ciclo cadastrado
+#    quando há poucas; a dispersão (MAD) dos intervalos dá a margem e a confiança;
+#  - sazonalidade: em cada mês os intervalos encurtam ou alongam face ao ciclo de
+#    cada cliente (fator mensal medido na própria base);
+#  - dia da semana: a preferência de cada cliente pelos dias em que costuma comprar,
+#    suavizada pela distribuição de toda a base.
+# Probabilidade de já precisar de gás no dia x confiança x fator do dia da semana
+# ordena os clientes de cada motoqueiro, e a lista para na capacidade diária.
+# Só há operações por grupo (ordenações, bincount): 100 mil clientes em segundos.
+
+PESO_CICLO_CADASTRADO = 1     # O ciclo cadastrado vale como um intervalo observado
+PESO_DESVIO_BASE = 2          # A irregularidade típica da base vale como dois intervalos
+PESO_SAZONAL = 50             # Intervalos de um mês para o fator mensal valer metade
+ITERACOES_SAZONAL = 3
+PESO_SEMANA = 3               # Compras do cliente para a sua preferência de dia valer metade
+MARGEM_MINIMA_DIAS = 2.0      # Desvio mínimo: um botijão nunca acaba no dia exato
+ESCALA_MAD = 1.4826           # MAD -> desvio-padrão de uma normal
+ERRO_MEDIANA = math.pi / 2    # Variância da mediana de n amostras = (pi / 2) x variância / n
+Z_MARGEM = 1.2816             # ± 1,28 desvios = 80% das compras
+PROBABILIDADE_MINIMA = 0.5    # Só entra quem provavelmente já precisa (data prevista até ao dia)
+HISTORICO_DIAS = 730          # Vendas lidas: 10 compras de um ciclo de 60 dias cabem em dois anos
+
+EPOCA_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+# ------------------------------------------------------------------------------
+# ALGORITMO (SÓ NUMPY)
+# ------------------------------------------------------------------------------
+
+def _meses(ordinais):
+    """Mês (0 = janeiro) de cada dia ordinal."""
+    dias = (np.rint(ordinais).astype(np.int64) - EPOCA_ORDINAL).astype('datetime64[D]')
+    return dias.astype('datetime64[M]').astype(np.int64) % 12
+
+
+def _dias_semana(ordinais):
+    """Dia da semana (0 = segunda, como date.weekday()) de cada dia ordinal."""
+    return (np.asarray(ordinais, dtype=np.int64) - 1) % 7
+
+
+def _mediana_por_grupo(grupos, valores, k):
+    """Mediana dos valores de cada grupo 0..k-1 (NaN nos grupos vazios), com uma só ordenação."""
+    valores = np.asarray(valores, dtype=float)[np.lexsort((valores, grupos))]
+    contagem = np.bincount(grupos, minlength=k)
+    inicio = np.cumsum(contagem) - contagem
+    mediana = np.full(k, np.nan)
+    com = contagem > 0
+    baixo = inicio[com] + (contagem[com] - 1) // 2
+    alto = inicio[com] + contagem[com] // 2
+    mediana[com] = (valores[baixo] + valores[alto]) / 2
+    return mediana
+
+
+def _encolher(observado, quantidade, alvo, peso):
+    """Média do valor observado (com `quantidade` amostras) e do alvo (com `peso`); sem amostras, o alvo."""
+    observado = np.where(quantidade > 0, observado, 0.0)
+    return (quantidade * observado + peso * alvo) / (quantidade + peso)
+
+
+def _posicoes_no_grupo(grupos):
+    """Posição (0, 1, ...) de cada elemento dentro do seu grupo, num array já ordenado pelo grupo."""
+    if not len(grupos):
+        return np.zeros(0, dtype=np.int64)
+    novo = np.r_[True, grupos[1:] != grupos[:-1]]
+    inicios = np.flatnonzero(novo)
+    return np.arange(len(grupos)) - inicios[np.cumsum(novo) - 1]
+
+
+class ModeloProcura:
+    """Ciclo, desvio e hábitos de compra de cada cliente, em arrays alinhados com clientes_ids."""
+
+    def __init__(self, clientes_ids, ultima_compra, ciclo, desvio, intervalos, compras_por_dia_semana, fatores_mes, partilha_dia_semana):
+        self.clientes_ids = clientes_ids
+        self.ultima_compra = ultima_compra                    # Dia ordinal
+        self.ciclo = ciclo                                    # Dias (sem sazonalidade)
+        self.desvio = desvio
+        self.intervalos = intervalos                          # Intervalos observados nas últimas compras
+        self.compras_por_dia_semana = compras_por_dia_semana  # (clientes x 7)
+        self.fatores_mes = fatores_mes                        # Multiplicador do ciclo em cada mês
+        self.partilha_dia_semana = partilha_dia_semana        # Fração das compras da base em cada dia
+
+    @property
+    def confianca(self):
+        """0 a 1: cresce com o número de intervalos observados e cai com a irregularidade deles."""
+        return self.intervalos / (self.intervalos + 2) / (1 + self.desvio / self.ciclo)
+
+    def prever(self, dia):
+        """(probabilidade de já precisar de gás no dia, prioridade, dia previsto, desvio, virado) de cada cliente."""
+        alvo = dia.toordinal()
+        fator = self.fatores_mes[_meses(self.ultima_compra + self.ciclo / 2)]
+        ciclo = self.ciclo * fator
+        desvio = self.desvio * fator
+        previsto = self.ultima_compra + ciclo
+        # Aproximação logística da função de distribuição normal (erro < 0,01)
+        probabilidade = 1 / (1 + np.exp(-1.702 * (alvo - previsto) / desvio))
+
+        semana = _dias_semana(alvo)
+        compras = self.compras_por_dia_semana.sum(axis=1)
+        fator_semana = 7 * (self.compras_por_dia_semana[:, semana] + PESO_SEMANA * self.partilha_dia_semana[semana]) / (compras + PESO_SEMANA)
+
+        # Três ciclos sem comprar: virado (é trabalho da prospeção, não da rota)
+        virado = alvo - self.ultima_compra > MULTIPLICADOR_CICLO_VIRADO * ciclo
+        prioridade = np.where(virado, 0.0, probabilidade * self.confianca * fator_semana)
+        return probabilidade, prioridade, previsto, desvio, virado
+
+
+def ajustar(clientes_ids, ultimas_vendas, ciclos_cadastrados, compras_clientes, compras_dias):
+    """
+    Ajusta o modelo de toda a base. clientes_ids vem ordenado; as compras (cliente, dia ordinal)
+    vêm de carregar_compras(). As compras de clientes que não estão em clientes_ids são ignoradas.
+    """
+    clientes_ids = np.asarray(clientes_ids, dtype=np.int64)
+    k = len(clientes_ids)
+    ciclos_cadastrados = np.maximum(np.asarray(ciclos_cadastrados, dtype=float), 1.0)
+
+    posicao = np.searchsorted(clientes_ids, compras_clientes)
+    conhecido = posicao < k
+    conhecido[conhecido] = clientes_ids[posicao[conhecido]] == compras_clientes[conhecido]
+    grupo, dias = posicao[conhecido], compras_dias[conhecido]
+
+    ultima_compra = np.asarray(ultimas_vendas, dtype=np.int64).copy()
+    np.maximum.at(ultima_compra, grupo, dias)
+
+    # Intervalos entre compras seguidas do mesmo cliente (as compras vêm ordenadas por cliente e dia)
+    seguido = grupo[1:] == grupo[:-1]
+    intervalos = (dias[1:] - dias[:-1])[seguido].astype(float)
+    grupo_intervalo = grupo[1:][seguido]
+    quantidade = np.bincount(grupo_intervalo, minlength=k)
+
+    # Sazonalidade: num mês os intervalos encurtam ou alongam face ao ciclo do cliente (pelo mês a
+    # meio do intervalo, quando o gás foi gasto). Cada cliente só viu parte do ano, por isso o ciclo
+    # (sem sazonalidade) e os fatores mensais estimam-se alternadamente.
+    meses = _meses(dias[:-1][seguido] + intervalos / 2)
+    por_mes = np.bincount(meses, minlength=12)
+    fatores_mes = np.ones(12)
+    for _ in range(ITERACOES_SAZONAL):
+        ajustados = intervalos / fatores_mes[meses]
+        mediana = _mediana_por_grupo(grupo_intervalo, ajustados, k)
+        ciclo = _encolher(mediana, quantidade, ciclos_cadastrados, PESO_CICLO_CADASTRADO)
+        razoes = intervalos / ciclo[grupo_intervalo]
+        fatores_mes = _encolher(_mediana_por_grupo(meses, razoes, 12), por_mes, 1.0, PESO_SAZONAL)
+    mad = _mediana_por_grupo(grupo_intervalo, np.abs(ajustados - mediana[grupo_intervalo]), k)
+
+    # Quem tem poucos intervalos herda a irregularidade típica da base (desvio / ciclo)
+    medido = quantidade >= 2
+    relativo = ESCALA_MAD * mad[medido] / ciclo[medido]
+    variacao_base = float(np.median(relativo)) if len(relativo) else 0.25
+    desvio = _encolher(ESCALA_MAD * mad, np.where(medido, quantidade, 0), variacao_base * ciclo, PESO_DESVIO_BASE)
+    # O próprio ciclo (mediana de poucos intervalos) também é incerto: erro-padrão da mediana
+    desvio = np.maximum(desvio * np.sqrt(1 + ERRO_MEDIANA / (quantidade + PESO_CICLO_CADASTRADO)), MARGEM_MINIMA_DIAS)
+
+    semana = _dias_semana(dias)
+    compras_por_dia_semana = np.bincount(grupo * 7 + semana, minlength=k * 7).reshape(k, 7)
+    partilha_dia_semana = np.bincount(semana, minlength=7) / len(semana) if len(semana) else np.full(7, 1 / 7)
+
+    return ModeloProcura(
+        clientes_ids=clientes_ids,
+        ultima_compra=ultima_compra,
+        ciclo=ciclo,
+        desvio=desvio,
+        intervalos=quantidade,
+        compras_por_dia_semana=compras_por_dia_semana,
+        fatores_mes=fatores_mes,
+        partilha_dia_semana=partilha_dia_semana,
+    )
+
+
+def escolher(prioridade, elegivel, motoqueiros, clientes_ids, capacidade):
+    """Índices dos clientes elegíveis que entram na lista de cada motoqueiro (por prioridade, até à capacidade)."""
+    indices = np.flatnonzero(elegivel)
+    indices = indices[np.lexsort((clientes_ids[indices], -prioridade[indices], motoqueiros[indices]))]
+    posicoes = _posicoes_no_grupo(motoqueiros[indices])
+    dentro = posicoes < capacidade
+    return indices[dentro], posicoes[dentro] + 1
+
+
+# ------------------------------------------------------------------------------
+# PROPOSTA SOBRE O BANCO
+# ------------------------------------------------------------------------------
+
+def carregar_compras(dia):
+    """
+    As vendas realizadas dos últimos HISTORICO_DIAS antes do dia, numa só consulta: arrays (cliente,
+    dia ordinal) ordenados por cliente e dia, uma compra por dia e só as últimas JANELA_COMPRAS de cada cliente.
+    """
+    linhas = list(
+        Visita.objects.filter(status='REALIZADA', **filtro_periodo('data_visita', dia - datetime.timedelta(days=HISTORICO_DIAS), dia))
+        .annotate(dia=TruncDate('data_visita'))
+        .values_list('cliente_id', 'dia')
+    )
+    clientes = np.fromiter((linha[0] for linha in linhas), dtype=np.int64, count=len(linhas))
+    dias = np.fromiter((linha[1].toordinal() for linha in linhas), dtype=np.int64, count=len(linhas))
+    if not len(dias):
+        return clientes, dias
+
+    ordem = np.lexsort((dias, clientes))
+    clientes, dias = clientes[ordem], dias[ordem]
+    # Duas entregas no mesmo dia são uma só compra
+    nova = np.r_[True, (clientes[1:] != clientes[:-1]) | (dias[1:] != dias[:-1])]
+    clientes, dias = clientes[nova], dias[nova]
+
+    # Contadas do fim: a mesma janela que a mediana de consumo.py usa
+    posicoes = _posicoes_no_grupo(clientes[::-1])[::-1]
+    recentes = posicoes < JANELA_COMPRAS
+    return clientes[recentes], dias[recentes]
+
+
+class PropostaRotas:
+    """Lista proposta de cada motoqueiro para um dia, com o resumo da previsão de toda a base."""
+
+    def __init__(self, dia, capacidade, modelo, previstos, devidos, sem_motoqueiro, em_rota, devidos_por_motoqueiro, linhas):
+        self.dia = dia
+        self.capacidade = capacidade
+        self.modelo = modelo
+        self.previstos = previstos                            # Clientes com última venda (previstos)
+        self.devidos = devidos                                # Provavelmente já precisam no dia
+        self.sem_motoqueiro = sem_motoqueiro                  # ... mas nenhuma carteira deles tem motoqueiro
+        self.em_rota = em_rota                                # ... mas já têm uma visita pendente
+        self.devidos_por_motoqueiro = devidos_por_motoqueiro  # {motoqueiro_id: devidos}
+        self.linhas = linhas                                  # Dicts com os campos de PropostaVisita
+
+    def por_motoqueiro(self):
+        """{motoqueiro_id: (devidos, propostos)}."""
+        propostos = {}
+        for linha in self.linhas:
+            propostos[linha['motoqueiro_id']] = propostos.get(linha['motoqueiro_id'], 0) + 1
+        return {
+            motoqueiro_id: (devidos, propostos.get(motoqueiro_id, 0))
+            for motoqueiro_id, devidos in self.devidos_por_motoqueiro.items()
+        }
+
+
+def propor(dia, capacidade):
+    """Calcula (sem gravar) a lista do dia de cada motoqueiro: os clientes mais prováveis das suas carteiras."""
+    if capacidade < 1:
+        raise ValueError("A capacidade tem de ser de pelo menos 1 cliente por motoqueiro.")
+
+    clientes = list(
+        Cliente.objects.filter(data_ultima_venda__isnull=False)
+        .order_by('id')
+        .values_list('id', 'data_ultima_venda', 'ciclo_consumo_dias')
+    )
+    clientes_ids = np.fromiter((linha[0] for linha in clientes), dtype=np.int64, count=len(clientes))
+    ultimas_vendas = np.fromiter((linha[1].toordinal() for linha in clientes), dtype=np.int64, count=len(clientes))
+    ciclos = np.fromiter((linha[2] or 0 for linha in clientes), dtype=float, count=len(clientes))
+
+    modelo = ajustar(clientes_ids, ultimas_vendas, ciclos, *carregar_compras(dia))
+    probabilidade, prioridade, previsto, desvio, virado = modelo.prever(dia)
+
+    # Motoqueiro e carteira de cada cliente: a primeira carteira (menor id) que tem motoqueiro
+    vinculos = list(
+        Carteira.clientes.through.objects.filter(carteira__motoqueiro__isnull=False)
+        .order_by('cliente_id', 'carteira_id')
+        .values_list('cliente_id', 'carteira_id', 'carteira__motoqueiro_id')
+    )
+    motoqueiros = np.full(len(clientes_ids), -1, dtype=np.int64)
+    carteiras = np.full(len(clientes_ids), -1, dtype=np.int64)
+    if vinculos and len(clientes_ids):
+        membros, carteiras_ids, motoqueiros_ids = (np.array(coluna, dtype=np.int64) for coluna in zip(*vinculos))
+        membros, primeiro = np.unique(membros, return_index=True)
+        posicao = np.searchsorted(clientes_ids, membros).clip(max=len(clientes_ids) - 1)
+        conhecido = clientes_ids[posicao] == membros
+        motoqueiros[posicao[conhecido]] = motoqueiros_ids[primeiro[conhecido]]
+        carteiras[posicao[conhecido]] = carteiras_ids[primeiro[conhecido]]
+
+    pendentes = np.fromiter(
+        Visita.objects.filter(status='PENDENTE').values_list('cliente_id', flat=True).distinct(), dtype=np.int64
+    )
+    em_rota = np.isin(clientes_ids, pendentes)
+
+    devidos = (probabilidade >= PROBABILIDADE_MINIMA) & ~virado
+    elegivel = devidos & ~em_rota & (motoqueiros >= 0)
+    indices, posicoes = escolher(prioridade, elegivel, motoqueiros, clientes_ids, capacidade)
+
+    motoqueiros_devidos, quantidades = np.unique(motoqueiros[elegivel], return_counts=True)
+    confianca = modelo.confianca
+    gerada_em = timezone.now()
+    return PropostaRotas(
+        dia=dia,
+        capacidade=capacidade,
+        modelo=modelo,
+        previstos=len(clientes_ids),
+        devidos=int(devidos.sum()),
+        sem_motoqueiro=int((devidos & ~em_rota & (motoqueiros < 0)).sum()),
+        em_rota=int((devidos & em_rota).sum()),
+        devidos_por_motoqueiro=dict(zip(motoqueiros_devidos.tolist(), quantidades.tolist())),
+        linhas=[
+            {
+                'dia': dia,
+                'motoqueiro_id': int(motoqueiros[i]),
+                'carteira_id': int(carteiras[i]),
+                'cliente_id': int(clientes_ids[i]),
+                'posicao': int(posicao),
+                'probabilidade': round(float(probabilidade[i]), 3),
+                'confianca': round(float(confianca[i]), 3),
+                'data_prevista': datetime.date.fromordinal(int(round(previsto[i]))),
+                'margem_dias': math.ceil(Z_MARGEM * desvio[i]),
+                'gerada_em': gerada_em,
+            }
+            for i, posicao in zip(indices.tolist(), posicoes.tolist())
+        ],
+    )
+
+
+@transaction.atomic
+def gravar(proposta):
+    """Substitui as propostas do dia pelas calculadas (e apaga as de dias que já passaram)."""
+    PropostaVisita.objects.filter(Q(dia=proposta.dia) | Q(dia__lt=timezone.localdate())).delete()
+    PropostaVisita.objects.bulk_create([PropostaVisita(**linha) for linha in proposta.linhas], batch_size=2000)
+    return len(proposta.linhas)
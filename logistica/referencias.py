@@ -0,0 +1,105 @@
+import threading
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from .models import Cliente, Carteira
+
+# ==============================================================================
+# LISTAS DE REFERÊNCIA EM CACHE (MOTOQUEIROS, AGENTES, BAIRROS, CARTEIRAS)
+# ==============================================================================
+# Estas listas alimentam dropdowns e filtros em quase todos os ecrãs, mas mudam
+# raramente. Ficam guardadas no cache do Django e são apagadas pelos sinais em
+# logistica/signals.py sempre que um User, Group, Cliente ou Carteira muda.
+# Só se guardam valores simples (id e nome, nunca instâncias de User com o hash
+# da senha). Os contadores de acertos/falhas são do processo: o incr do cache em
+# ficheiros é um get + set e perdia contagens com pedidos em simultâneo.
+
+PREFIXO = 'referencias'
+TEMPO_CACHE = 60 * 60 * 6       # Rede de segurança: mesmo sem sinal, nada fica mais de 6h em cache
+
+LISTAS = ('motoqueiros', 'agentes', 'bairros', 'carteiras')
+
+
+def _chave(nome):
+    return f'{PREFIXO}:{nome}'
+
+
+_contadores = Counter()
+_trinco_contadores = threading.Lock()
+
+
+def _contar(nome, evento):
+    with _trinco_contadores:
+        _contadores[(nome, evento)] += 1
+
+
+def _lembrar(nome, carregar):
+    """Devolve a lista em cache ou carrega-a do banco (contabilizando o acerto ou a falha)."""
+    valor = cache.get(_chave(nome))
+    if valor is not None:
+        _contar(nome, 'acertos')
+        return valor
+    _contar(nome, 'falhas')
+    valor = carregar()
+    cache.set(_chave(nome), valor, TEMPO_CACHE)
+    return valor
+
+
+def invalidar(*nomes):
+    """Apaga do cache as listas indicadas (todas, se nenhuma for indicada)."""
+    cache.delete_many([_chave(nome) for nome in (nomes or LISTAS)])
+
+
+def motoqueiros():
+    """Utilizadores ativos que fazem entregas (nem staff, nem agentes comerciais)."""
+    return _lembrar('motoqueiros', lambda: list(
+        User.objects.filter(
+            is_active=True,
+            is_staff=False,
+            is_superuser=False
+        ).exclude(groups__name='Agentes Comerciais').order_by('username').values('id', 'username')
+    ))
+
+
+def agentes():
+    """Utilizadores ativos que podem ficar responsáveis pela prospeção de uma carteira."""
+    return _lembrar('agentes', lambda: list(
+        User.objects.filter(
+            is_active=True
+        ).exclude(groups__name='Motoqueiros').exclude(is_superuser=True).order_by('username').values('id', 'username')
+    ))
+
+
+def bairros():
+    """Bairros distintos da base de clientes, por ordem alfabética."""
+    return _lembrar('bairros', lambda: list(
+        Cliente.objects.values_list('bairro', flat=True).distinct().order_by('bairro')
+    ))
+
+
+def carteiras():
+    """Carteiras (id, nome e cor) por ordem alfabética."""
+    return _lembrar('carteiras', lambda: list(
+        Carteira.objects.order_by('nome').values('id', 'nome', 'cor_etiqueta')
+    ))
+
+
+def estatisticas():
+    """Acertos, falhas e taxa de acerto de cada lista neste processo."""
+    with _trinco_contadores:
+        contadores = dict(_contadores)
+    linhas = []
+    for nome in LISTAS:
+        acertos = contadores.get((nome, 'acertos'), 0)
+        falhas = contadores.get((nome, 'falhas'), 0)
+        total = acertos + falhas
+        linhas.append({
+            'lista': nome,
+            'acertos': acertos,
+            'falhas': falhas,
+            'taxa_acerto': round(100 * acertos / total, 1) if total else None,
+            'em_cache': cache.get(_chave(nome)) is not None,
+        })
+    return linhas
@@ -0,0 +1,305 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from . import precos
+from .models import (
+    Visita, Ligacao, ResumoDiarioVisitas, ResumoDiarioLigacoes, ResumoDiarioConcorrencia,
+    ObservacaoConcorrente, ResumoDiarioPrecoConcorrente,
+)
+from .normalizacao import normalizar_bairro, normalizar_texto
+from .periodos import filtro_periodo
+
+# ==============================================================================
+# RESUMOS DIÁRIOS DO DASHBOARD
+# ==============================================================================
+# Cada baixa, despacho ou ligação soma/subtrai uma unidade na linha do seu dia,
+# dentro da mesma transação da operação. Assim o dashboard lê algumas centenas
+# de linhas por ano em vez de varrer todas as visitas e ligações do período.
+
+
+def _acumular(modelo, chaves, **incrementos):
+    """Soma os incrementos na linha identificada por `chaves` (criando-a se preciso)."""
+    linha, _ = modelo.objects.get_or_create(**chaves)
+    modelo.objects.filter(pk=linha.pk).update(**{campo: F(campo) + valor for campo, valor in incrementos.items()})
+
+
+def contabilizar_visita(visita, sinal=1):
+    """Soma (sinal=1) ou retira (sinal=-1) o estado atual da visita dos resumos do dia da rota."""
+    dia = timezone.localtime(visita.rota.data_criacao).date()
+    _acumular(
+        ResumoDiarioVisitas,
+        {
+            'dia': dia,
+            'motoqueiro_id': visita.rota.motoqueiro_id,
+            'status': visita.status,
+            'motivo_nao_venda': visita.motivo_nao_venda or '',
+        },
+        quantidade=sinal,
+        valor_recebido=sinal * (visita.valor_recebido or Decimal('0.00')),
+    )
+    if visita.motivo_nao_venda == 'CONCORRENCIA' and visita.concorrente_empresa:
+        _acumular(
+            ResumoDiarioConcorrencia,
+            {'dia': dia, 'origem': 'VISITA', 'concorrente_empresa': visita.concorrente_empresa},
+            quantidade=sinal,
+        )
+        _observar_concorrente(visita, 'VISITA', sinal)
+
+
+def contabilizar_visitas_criadas(rota, quantidade):
+    """Regista num único incremento as novas visitas pendentes despachadas para uma rota."""
+    if not quantidade:
+        return
+    _acumular(
+        ResumoDiarioVisitas,
+        {
+            'dia': timezone.localtime(rota.data_criacao).date(),
+            'motoqueiro_id': rota.motoqueiro_id,
+            'status': 'PENDENTE',
+            'motivo_nao_venda': '',
+        },
+        quantidade=quantidade,
+    )
+
+
+def contabilizar_ligacao(ligacao, sinal=1):
+    """Soma (ou retira) uma ligação dos resumos do seu dia."""
+    dia = timezone.localtime(ligacao.data_ligacao).date()
+    _acumular(
+        ResumoDiarioLigacoes,
+        {
+            'dia': dia,
+            'agente_id': ligacao.agente_id,
+            'resultado': ligacao.resultado,
+            'motivo_nao_venda': ligacao.motivo_nao_venda or '',
+        },
+        quantidade=sinal,
+    )
+    if ligacao.motivo_nao_venda == 'CONCORRENCIA' and ligacao.concorrente_empresa:
+        _acumular(
+            ResumoDiarioConcorrencia,
+            {'dia': dia, 'origem': 'LIGACAO', 'concorrente_empresa': ligacao.concorrente_empresa},
+            quantidade=sinal,
+        )
+        _observar_concorrente(ligacao, 'LIGACAO', sinal)
+
+
+def _retirar(modelo, chaves, **decrementos):
+    """Subtrai os decrementos da linha identificada por `chaves` (somada quando as operações aconteceram)."""
+    modelo.objects.filter(**chaves).update(**{campo: F(campo) - valor for campo, valor in decrementos.items()})
+
+
+def descontar(visitas, ligacoes):
+    """
+    Retira dos resumos as visitas e ligações dos querysets (antes de as excluir): uma consulta agrupada
+    por tabela e um UPDATE por linha do resumo, seja qual for o número de visitas e ligações.
+    """
+    for linha in _agrupar_visitas(visitas):
+        _retirar(
+            ResumoDiarioVisitas,
+            {k: linha[k] for k in ('dia', 'motoqueiro_id', 'status', 'motivo_nao_venda')},
+            quantidade=linha['quantidade'],
+            valor_recebido=linha['valor_recebido'] or Decimal('0.00'),
+        )
+    for linha in _agrupar_ligacoes(ligacoes):
+        _retirar(
+            ResumoDiarioLigacoes,
+            {k: linha[k] for k in ('dia', 'agente_id', 'resultado', 'motivo_nao_venda')},
+            quantidade=linha['quantidade'],
+        )
+    for origem, linhas in (('VISITA', visitas), ('LIGACAO', ligacoes)):
+        for linha in _agrupar_concorrencia(linhas, origem):
+            _retirar(
+                ResumoDiarioConcorrencia,
+                {k: linha[k] for k in ('dia', 'origem', 'concorrente_empresa')},
+                quantidade=linha['quantidade'],
+            )
+    # As observações apagam-se em cascata com as visitas e ligações: só é preciso retirá-las dos resumos
+    grupos = defaultdict(list)
+    observacoes = ObservacaoConcorrente.objects.filter(Q(visita__in=visitas) | Q(ligacao__in=ligacoes))
+    for dia, concorrente, bairro, preco in observacoes.values_list('dia', 'concorrente', 'bairro', 'preco'):
+        grupos[(dia, concorrente, bairro)].append(preco)
+    for (dia, concorrente, bairro), lista in grupos.items():
+        _acumular_precos({'dia': dia, 'concorrente': concorrente, 'bairro': bairro}, lista, -1)
+
+# ------------------------------------------------------------------------------
+# Preços da concorrência (observação por recusa e resumo por dia e bairro)
+# ------------------------------------------------------------------------------
+# O dia da observação é o da recusa (data_visita / data_ligacao), não o da rota:
+# é nesse dia que o cliente disse o preço.
+
+def _acumular_precos(chaves, lista, sinal):
+    """Soma (ou retira) observações (os preços, None sem preço) no resumo de um dia, concorrente e bairro."""
+    with transaction.atomic():
+        ResumoDiarioPrecoConcorrente.objects.get_or_create(**chaves)
+        # O histograma não é um contador: lê-se e grava-se com a linha bloqueada
+        linha = ResumoDiarioPrecoConcorrente.objects.select_for_update().get(**chaves)
+        histograma = linha.precos
+        for preco in lista:
+            if preco is not None:
+                histograma = precos.somar(histograma, preco, sinal)
+        for campo, valor in precos.campos_resumo(linha.quantidade + sinal * len(lista), histograma).items():
+            setattr(linha, campo, valor)
+        linha.save()
+
+
+def _acumular_preco(observacao, sinal):
+    """Soma (ou retira) uma observação no resumo do seu dia, concorrente e bairro."""
+    _acumular_precos({'dia': observacao.dia, 'concorrente': observacao.concorrente, 'bairro': observacao.bairro}, [observacao.preco], sinal)
+
+
+def _nova_observacao(registo, origem):
+    """A observação (por gravar) da recusa por concorrência de uma visita ou ligação."""
+    momento = registo.data_visita if origem == 'VISITA' else registo.data_ligacao
+    return ObservacaoConcorrente(
+        dia=timezone.localtime(momento).date(),
+        origem=origem,
+        concorrente=normalizar_texto(registo.concorrente_empresa)[:50],
+        concorrente_empresa=registo.concorrente_empresa[:50],
+        bairro=normalizar_bairro(registo.cliente.bairro)[:100],
+        preco=registo.concorrente_preco if registo.concorrente_preco and registo.concorrente_preco > 0 else None,
+        **{origem.lower(): registo},
+    )
+
+
+def _observar_concorrente(registo, origem, sinal):
+    """Grava (sinal=1) ou apaga (sinal=-1) a observação de uma recusa por concorrência e o seu resumo."""
+    if sinal > 0:
+        observacao = _nova_observacao(registo, origem)
+        observacao.save()
+        _acumular_preco(observacao, 1)
+        return
+    observacao = ObservacaoConcorrente.objects.filter(**{origem.lower(): registo}).first()
+    if observacao is not None:
+        _acumular_preco(observacao, -1)
+        observacao.delete()
+
+
+def tendencia_precos(data_inicio, data_fim, bairro=None, concorrente=None):
+    """
+    Preços da concorrência por semana (segunda-feira) e por bairro no período, só a partir dos resumos.
+    Cada ponto tem a quantidade de recusas, e o mínimo, a mediana e o máximo dos preços relatados.
+    """
+    linhas = ResumoDiarioPrecoConcorrente.objects.filter(dia__range=(data_inicio, data_fim), quantidade__gt=0)
+    if bairro:
+        linhas = linhas.filter(bairro=normalizar_bairro(bairro))
+    if concorrente:
+        linhas = linhas.filter(concorrente=normalizar_texto(concorrente))
+
+    por_semana, por_bairro, totais = {}, {}, {}
+    for dia, nome, nome_bairro, quantidade, histograma in linhas.values_list('dia', 'concorrente', 'bairro', 'quantidade', 'precos'):
+        semana = dia - datetime.timedelta(days=dia.weekday())
+        for grupos, chave in ((por_semana, (nome, semana)), (por_bairro, (nome_bairro, nome))):
+            grupos.setdefault(chave, [0, []])
+            grupos[chave][0] += quantidade
+            grupos[chave][1].append(histograma)
+        totais[nome] = totais.get(nome, 0) + quantidade
+
+    def ponto(total, histogramas):
+        _, minimo, mediana, maximo = precos.resumir(precos.juntar(histogramas))
+        return {
+            'quantidade': total,
+            'minimo': float(minimo) if minimo is not None else None,
+            'mediana': float(mediana) if mediana is not None else None,
+            'maximo': float(maximo) if maximo is not None else None,
+        }
+
+    semanas = sorted({semana for _, semana in por_semana})
+    concorrentes = sorted(totais, key=lambda nome: (-totais[nome], nome))
+    series = [
+        {
+            'concorrente': nome,
+            'pontos': [ponto(*por_semana[(nome, semana)]) if (nome, semana) in por_semana else None for semana in semanas],
+        }
+        for nome in concorrentes
+    ]
+    bairros = [{'bairro': nome_bairro, 'concorrente': nome, **ponto(*valores)} for (nome_bairro, nome), valores in por_bairro.items()]
+    # Os bairros com o concorrente mais barato primeiro (os sem preço relatado no fim)
+    bairros.sort(key=lambda linha: (linha['mediana'] is None, linha['mediana'] or 0, -linha['quantidade']))
+    return {'semanas': [semana.isoformat() for semana in semanas], 'series': series, 'bairros': bairros}
+
+# ==============================================================================
+# RECONSTRUÇÃO A PARTIR DO HISTÓRICO
+# ==============================================================================
+
+def _agrupar_visitas(visitas):
+    linhas = visitas.values(
+        'status',
+        dia=TruncDate('rota__data_criacao'),
+        motoqueiro_id=F('rota__motoqueiro_id'),
+        motivo=Coalesce('motivo_nao_venda', Value('')),
+    ).annotate(quantidade=Count('id'), valor=Sum('valor_recebido')).order_by()
+    for linha in linhas:
+        linha['motivo_nao_venda'] = linha.pop('motivo')
+        linha['valor_recebido'] = linha.pop('valor')
+        yield linha
+
+
+def _agrupar_ligacoes(ligacoes):
+    linhas = ligacoes.values(
+        'agente_id',
+        'resultado',
+        dia=TruncDate('data_ligacao'),
+        motivo=Coalesce('motivo_nao_venda', Value('')),
+    ).annotate(quantidade=Count('id')).order_by()
+    for linha in linhas:
+        linha['motivo_nao_venda'] = linha.pop('motivo')
+        yield linha
+
+
+def _agrupar_concorrencia(queryset, origem):
+    campo_dia = 'rota__data_criacao' if origem == 'VISITA' else 'data_ligacao'
+    linhas = queryset.filter(
+        motivo_nao_venda='CONCORRENCIA', concorrente_empresa__gt='',
+    ).values('concorrente_empresa', dia=TruncDate(campo_dia)).annotate(quantidade=Count('id')).order_by()
+    for linha in linhas:
+        linha['origem'] = origem
+        yield linha
+
+
+@transaction.atomic
+def reconstruir_resumos(data_inicio, data_fim):
+    """Apaga e recalcula os resumos do período [data_inicio, data_fim] a partir das tabelas brutas."""
+    ResumoDiarioVisitas.objects.filter(dia__range=(data_inicio, data_fim)).delete()
+    ResumoDiarioLigacoes.objects.filter(dia__range=(data_inicio, data_fim)).delete()
+    ResumoDiarioConcorrencia.objects.filter(dia__range=(data_inicio, data_fim)).delete()
+
+    visitas = Visita.objects.filter(**filtro_periodo('rota__data_criacao', data_inicio, data_fim))
+    ligacoes = Ligacao.objects.filter(**filtro_periodo('data_ligacao', data_inicio, data_fim))
+
+    totais = {}
+    totais['visitas'] = len(ResumoDiarioVisitas.objects.bulk_create(
+        [ResumoDiarioVisitas(**linha) for linha in _agrupar_visitas(visitas)], batch_size=1000
+    ))
+    totais['ligacoes'] = len(ResumoDiarioLigacoes.objects.bulk_create(
+        [ResumoDiarioLigacoes(**linha) for linha in _agrupar_ligacoes(ligacoes)], batch_size=1000
+    ))
+    totais['concorrencia'] = len(ResumoDiarioConcorrencia.objects.bulk_create(
+        [ResumoDiarioConcorrencia(**linha) for linha in _agrupar_concorrencia(visitas, 'VISITA')]
+        + [ResumoDiarioConcorrencia(**linha) for linha in _agrupar_concorrencia(ligacoes, 'LIGACAO')],
+        batch_size=1000,
+    ))
+
+    ObservacaoConcorrente.objects.filter(dia__range=(data_inicio, data_fim)).delete()
+    ResumoDiarioPrecoConcorrente.objects.filter(dia__range=(data_inicio, data_fim)).delete()
+    recusas = {'motivo_nao_venda': 'CONCORRENCIA', 'concorrente_empresa__gt': ''}
+    observacoes = [
+        _nova_observacao(visita, 'VISITA')
+        for visita in Visita.objects.filter(**filtro_periodo('data_visita', data_inicio, data_fim), **recusas).select_related('cliente')
+    ] + [
+        _nova_observacao(ligacao, 'LIGACAO')
+        for ligacao in ligacoes.filter(**recusas).select_related('cliente')
+    ]
+    ObservacaoConcorrente.objects.bulk_create(observacoes, batch_size=1000)
+    grupos = precos.agrupar((o.dia, o.concorrente, o.bairro, o.preco) for o in observacoes)
+    totais['precos_concorrencia'] = len(ResumoDiarioPrecoConcorrente.objects.bulk_create(
+        [ResumoDiarioPrecoConcorrente(dia=dia, concorrente=nome, bairro=bairro, **campos) for (dia, nome, bairro), campos in grupos.items()],
+        batch_size=1000,
+    ))
+    return totais
@@ -0,0 +1,219 @@
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .geo import distancias_ate, matriz_distancias, tem_coordenadas
+from .models import Visita
+
+# ==============================================================================
+# ROTEIRIZAÇÃO (ORDEM DAS PARAGENS DO MOTOQUEIRO)
+# ==============================================================================
+# A ordem das visitas pendentes de uma rota é calculada sobre a matriz de
+# distâncias haversine entre os clientes: vizinho mais próximo para um primeiro
+# percurso, depois 2-opt (inverter troços) e Or-opt (mudar 1 a 3 paragens de
+# sítio) até não haver melhoria. O percurso é aberto (o motoqueiro não volta ao
+# ponto de partida). Todas as melhorias possíveis são avaliadas de uma vez com
+# numpy, por isso 150 paragens resolvem-se em poucas dezenas de milissegundos.
+
+TAMANHO_MAXIMO_SEGMENTO = 3      # Or-opt: move blocos de 1, 2 ou 3 paragens seguidas
+LIMITE_MELHORIAS = 5000
+TOLERANCIA_KM = 1e-9
+
+
+def _vizinho_mais_proximo(distancias, primeiro):
+    """Percurso guloso a partir do nó 0 (ponto de partida virtual), começando por `primeiro`."""
+    total = len(distancias)
+    visitado = np.zeros(total, dtype=bool)
+    visitado[0] = visitado[primeiro] = True
+    percurso = [0, primeiro]
+    atual = primeiro
+    for _ in range(total - 2):
+        candidatos = np.where(visitado, np.inf, distancias[atual])
+        atual = int(np.argmin(candidatos))
+        visitado[atual] = True
+        percurso.append(atual)
+    return np.array(percurso)
+
+
+def _passo_2opt(distancias, percurso):
+    """Aplica a melhor inversão de troço (2-opt); devolve False se nenhuma encurta o percurso."""
+    total = len(percurso)
+    posicoes = np.arange(1, total)
+    anterior = percurso[posicoes - 1]
+    atual = percurso[posicoes]
+    seguinte = percurso[(posicoes + 1) % total]
+
+    # Inverter percurso[i..j] troca as arestas (anterior_i→atual_i) e (atual_j→seguinte_j)
+    # por (anterior_i→atual_j) e (atual_i→seguinte_j)
+    ganho = (
+        distancias[anterior[:, None], atual[None, :]]
+        + distancias[atual[:, None], seguinte[None, :]]
+        - distancias[anterior, atual][:, None]
+        - distancias[atual, seguinte][None, :]
+    )
+    ganho[np.tril_indices_from(ganho)] = np.inf
+    melhor = np.argmin(ganho)
+    i, j = np.unravel_index(melhor, ganho.shape)
+    if ganho[i, j] >= -TOLERANCIA_KM:
+        return False
+    i, j = i + 1, j + 1
+    percurso[i:j + 1] = percurso[i:j + 1][::-1].copy()
+    return True
+
+
+def _passo_oropt(distancias, percurso):
+    """Aplica a melhor mudança de um bloco de 1 a 3 paragens para outro ponto do percurso."""
+    total = len(percurso)
+    arestas = np.arange(total)
+    origem_aresta = percurso[arestas]
+    destino_aresta = percurso[(arestas + 1) % total]
+    custo_aresta = distancias[origem_aresta, destino_aresta]
+
+    melhor = (-TOLERANCIA_KM, None)
+    for tamanho in range(1, min(TAMANHO_MAXIMO_SEGMENTO, total - 2) + 1):
+        inicios = np.arange(1, total - tamanho + 1)
+        anterior = percurso[inicios - 1]
+        primeiro = percurso[inicios]
+        ultimo = percurso[inicios + tamanho - 1]
+        seguinte = percurso[(inicios + tamanho) % total]
+        poupanca = distancias[anterior, primeiro] + distancias[ultimo, seguinte] - distancias[anterior, seguinte]
+
+        for invertido in (False, True):
+            entrada, saida = (ultimo, primeiro) if invertido else (primeiro, ultimo)
+            custo = (
+                distancias[origem_aresta[None, :], entrada[:, None]]
+                + distancias[saida[:, None], destino_aresta[None, :]]
+                - custo_aresta[None, :]
+                - poupanca[:, None]
+            )
+            # Não se pode inserir o bloco numa aresta que toca nele próprio
+            proibidas = (arestas[None, :] >= inicios[:, None] - 1) & (arestas[None, :] <= inicios[:, None] + tamanho - 1)
+            custo[proibidas] = np.inf
+            posicao = np.argmin(custo)
+            linha, aresta = np.unravel_index(posicao, custo.shape)
+            if custo[linha, aresta] < melhor[0]:
+                melhor = (custo[linha, aresta], (int(inicios[linha]), tamanho, int(aresta), invertido))
+
+    if melhor[1] is None:
+        return False
+    inicio, tamanho, aresta, invertido = melhor[1]
+    bloco = percurso[inicio:inicio + tamanho]
+    if invertido:
+        bloco = bloco[::-1]
+    apos = percurso[aresta]
+    restante = np.concatenate([percurso[:inicio], percurso[inicio + tamanho:]])
+    indice = int(np.flatnonzero(restante == apos)[0]) + 1
+    percurso[:] = np.concatenate([restante[:indice], bloco, restante[indice:]])
+    return True
+
+
+def ordenar_paradas(latitudes, longitudes, origem=None, melhorar=True):
+    """
+    Ordem (índices) que minimiza o percurso aberto pelos pontos dados.
+    Com `origem` (lat, lng), o percurso começa nesse ponto; sem origem, começa numa das pontas.
+    Com melhorar=False fica só o vizinho mais próximo (útil para comparar).
+    """
+    quantidade = len(latitudes)
+    if quantidade <= 2:
+        return list(range(quantidade))
+
+    # Nó 0 = ponto de partida virtual: chegar a ele custa 0, por isso o percurso fica aberto
+    distancias = np.zeros((quantidade + 1, quantidade + 1))
+    distancias[1:, 1:] = matriz_distancias(latitudes, longitudes)
+    if origem:
+        distancias[0, 1:] = distancias_ate(origem[0], origem[1], latitudes, longitudes)
+        primeiro = int(np.argmin(distancias[0, 1:])) + 1
+    else:
+        # Sem ponto de partida, começa pelo cliente mais afastado do centro (uma das pontas)
+        centro_lat, centro_lng = float(np.mean(latitudes)), float(np.mean(longitudes))
+        primeiro = int(np.argmax(distancias_ate(centro_lat, centro_lng, latitudes, longitudes))) + 1
+
+    percurso = _vizinho_mais_proximo(distancias, primeiro)
+    for _ in range(LIMITE_MELHORIAS if melhorar else 0):
+        if not (_passo_2opt(distancias, percurso) or _passo_oropt(distancias, percurso)):
+            break
+    return [int(no) - 1 for no in percurso[1:]]
+
+
+def comprimento_km(latitudes, longitudes, ordem, origem=None):
+    """Comprimento (km) do percurso aberto que visita os pontos pela ordem dada."""
+    if not ordem:
+        return 0.0
+    lats = np.asarray(latitudes, dtype=float)[ordem]
+    lngs = np.asarray(longitudes, dtype=float)[ordem]
+    distancias = matriz_distancias(lats, lngs)
+    total = float(np.trace(distancias, offset=1))
+    if origem:
+        total += float(distancias_ate(origem[0], origem[1], lats[:1], lngs[:1])[0])
+    return total
+
+
+def ordenar_visitas(visitas, origem=None):
+    """
+    Ordena visitas (com `cliente` carregado) pelo GPS do cliente. As que não têm
+    coordenadas entram logo a seguir à última paragem do mesmo bairro, ou no fim,
+    agrupadas por bairro.
+    """
+    com_gps = [v for v in visitas if tem_coordenadas(v.cliente.latitude, v.cliente.longitude)]
+    sem_gps = sorted(
+        (v for v in visitas if not tem_coordenadas(v.cliente.latitude, v.cliente.longitude)),
+        key=lambda v: (v.cliente.bairro, v.cliente.nome),
+    )
+
+    indices = ordenar_paradas(
+        [v.cliente.latitude for v in com_gps], [v.cliente.longitude for v in com_gps], origem
+    )
+    ordenadas = [com_gps[i] for i in indices]
+
+    for visita in sem_gps:
+        posicao = len(ordenadas)
+        for indice in range(len(ordenadas) - 1, -1, -1):
+            if ordenadas[indice].cliente.bairro == visita.cliente.bairro:
+                posicao = indice + 1
+                break
+        ordenadas.insert(posicao, visita)
+    return ordenadas
+
+
+def ultimo_checkin(**filtro):
+    """(lat, lng) do check-in GPS mais recente entre as visitas do filtro, ou None."""
+    ultimo = (
+        Visita.objects.filter(latitude_checkin__isnull=False, longitude_checkin__isnull=False, **filtro)
+        .exclude(status='PENDENTE')
+        .order_by('-data_visita')
+        .values_list('latitude_checkin', 'longitude_checkin')
+        .first()
+    )
+    return ultimo if ultimo and tem_coordenadas(*ultimo) else None
+
+
+def ponto_de_partida(rota):
+    """Último check-in GPS já feito nesta rota; senão o depósito configurado (ou None)."""
+    return ultimo_checkin(rota=rota) or getattr(settings, 'ROTEIRIZACAO_ORIGEM', None)
+
+
+def sequenciar_rota(rota):
+    """Recalcula e grava a ordem (Visita.ordem) das visitas pendentes da rota."""
+    pendentes = list(
+        Visita.objects.filter(rota=rota, status='PENDENTE')
+        .select_related('cliente')
+        .only('id', 'ordem', 'cliente__latitude', 'cliente__longitude', 'cliente__bairro', 'cliente__nome')
+    )
+    ordenadas = ordenar_visitas(pendentes, ponto_de_partida(rota))
+    # Só grava (e marca como alteradas para a sincronização do telemóvel) as que mudaram de posição
+    agora = timezone.now()
+    alteradas = []
+    for posicao, visita in enumerate(ordenadas, start=1):
+        if visita.ordem != posicao:
+            visita.ordem = posicao
+            visita.atualizada_em = agora
+            alteradas.append(visita)
+    Visita.objects.bulk_update(alteradas, ['ordem', 'atualizada_em'], batch_size=500)
+    return len(ordenadas)
+
+
+# Ordenação da lista do motoqueiro: cada rota numera as suas paragens a partir de 1 e o dia pode ter
+# várias (a despachada e a "Rota Comercial"), por isso rota a rota (pela criação), depois a sequência
+# calculada e o resto por bairro
+ORDEM_PARAGENS = ('rota_id', F('ordem').asc(nulls_last=True), 'cliente__bairro', 'cliente__nome')
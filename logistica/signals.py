@@ -0,0 +1,128 @@
+import weakref
+
+from django.contrib.auth.models import Group, User
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import chamadas, referencias, resumos
+from .models import Carteira, Cliente, Ligacao, Rota, Visita
+
+# ==============================================================================
+# INVALIDAÇÃO DAS LISTAS DE REFERÊNCIA EM CACHE
+# ==============================================================================
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_utilizadores(sender, update_fields=None, **kwargs):
+    # O login só grava last_login: não muda nenhuma lista
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    referencias.invalidar('motoqueiros', 'agentes', 'carteiras')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidar_grupos(sender, **kwargs):
+    referencias.invalidar('motoqueiros', 'agentes')
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidar_grupos_do_utilizador(sender, action, **kwargs):
+    if action.startswith('post_'):
+        referencias.invalidar('motoqueiros', 'agentes')
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def invalidar_bairros(sender, **kwargs):
+    referencias.invalidar('bairros')
+
+
+@receiver(post_save, sender=Carteira)
+@receiver(post_delete, sender=Carteira)
+def invalidar_carteiras(sender, **kwargs):
+    referencias.invalidar('carteiras')
+
+
+@receiver(m2m_changed, sender=Carteira.clientes.through)
+def invalidar_carteiras_membros(sender, action, **kwargs):
+    if action.startswith('post_'):
+        referencias.invalidar('carteiras')
+
+# ==============================================================================
+# INVALIDAÇÃO DOS CARTÕES DA IDENTIFICAÇÃO DE CHAMADAS (LRU DO PROCESSO)
+# ==============================================================================
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def invalidar_cartoes_chamadas(sender, instance, **kwargs):
+    chamadas.invalidar_cliente(instance)
+
+# ==============================================================================
+# RESUMOS DIÁRIOS NAS EXCLUSÕES (ADMIN, CASCATAS E QUERYSETS)
+# ==============================================================================
+# As views somam e retiram cada operação dos resumos na própria transação. Uma
+# exclusão pode vir de qualquer lado (admin, cascata de uma rota, de um cliente
+# ou de um utilizador): o pre_delete corre dentro da transação do DELETE, com as
+# linhas (e as observações de preço presas a elas) ainda no banco. O pre_delete
+# chega uma vez por linha; a primeira retira de uma vez, agrupadas, todas as
+# visitas e ligações que a exclusão (a `origin`) apaga, e as seguintes só
+# confirmam que a sua linha já foi retirada.
+
+# Caminho de cada origem até às visitas e ligações que a sua exclusão apaga em cascata
+CASCATAS = {
+    Visita: ('pk', None),
+    Ligacao: (None, 'pk'),
+    Rota: ('rota', None),
+    Cliente: ('cliente', 'cliente'),
+    User: ('rota__motoqueiro', 'agente'),
+}
+
+# Origem da exclusão -> {modelo: ids já retirados dos resumos}
+_descontadas = weakref.WeakKeyDictionary()
+
+
+def _apagadas_por(origin):
+    """(visitas, ligacoes) que a exclusão iniciada em `origin` (objeto ou queryset) apaga."""
+    if isinstance(origin, QuerySet):
+        modelo, sufixo, valor = origin.model, '__in', origin.values('pk')
+    else:
+        modelo, sufixo, valor = type(origin), '', origin.pk
+    caminho_visitas, caminho_ligacoes = CASCATAS[modelo]
+    visitas = Visita.objects.filter(**{caminho_visitas + sufixo: valor}) if caminho_visitas else Visita.objects.none()
+    ligacoes = Ligacao.objects.filter(**{caminho_ligacoes + sufixo: valor}) if caminho_ligacoes else Ligacao.objects.none()
+    return visitas, ligacoes
+
+
+def _descontar_exclusao(instance, origin, contabilizar):
+    modelo = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if modelo not in CASCATAS:
+        contabilizar(instance, sinal=-1)
+        return
+    descontadas = _descontadas.get(origin)
+    if descontadas is not None and instance.pk in descontadas[type(instance)]:
+        return
+    # Primeira linha desta exclusão (a mesma origem pode ser reutilizada numa exclusão posterior)
+    visitas, ligacoes = _apagadas_por(origin)
+    descontadas = {
+        Visita: set(visitas.values_list('pk', flat=True)),
+        Ligacao: set(ligacoes.values_list('pk', flat=True)),
+    }
+    resumos.descontar(visitas, ligacoes)
+    if instance.pk not in descontadas[type(instance)]:
+        contabilizar(instance, sinal=-1)
+        descontadas[type(instance)].add(instance.pk)
+    _descontadas[origin] = descontadas
+
+
+@receiver(pre_delete, sender=Visita)
+def descontar_visita_excluida(sender, instance, origin=None, **kwargs):
+    _descontar_exclusao(instance, origin, resumos.contabilizar_visita)
+
+
+@receiver(pre_delete, sender=Ligacao)
+def descontar_ligacao_excluida(sender, instance, origin=None, **kwargs):
+    _descontar_exclusao(instance, origin, resumos.contabilizar_ligacao)
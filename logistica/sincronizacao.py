@@ -0,0 +1,263 @@
+import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .consumo import registrar_compra
+from .eventos import avisar_motoqueiro
+from .fila import sincronizar_cliente
+from .geo import tem_coordenadas
+from .models import BaixaSincronizada, Visita
+from .periodos import filtro_periodo
+from .resumos import contabilizar_visita
+from .roteirizacao import ORDEM_PARAGENS
+
+# ==============================================================================
+# SINCRONIZAÇÃO OFFLINE DO MOTOQUEIRO
+# ==============================================================================
+# Na rua os dados móveis falham, por isso o telemóvel guarda as baixas numa fila
+# local e envia-as num único pedido quando há rede. O servidor aplica o lote
+# numa só transação (cada item num savepoint, para um item inválido não travar
+# os outros), usa a hora do telemóvel como data da visita e regista a chave de
+# cada baixa: um lote reenviado depois de uma falha de rede não duplica nada.
+# No sentido inverso, o telemóvel descarrega só as visitas do dia alteradas
+# desde a última versão que recebeu.
+
+STATUS_PENDENTE = 'PENDENTE'
+STATUS_REALIZADA = 'REALIZADA'
+STATUS_NAO_VENDA = 'NAO_VENDA'
+
+MAXIMO_BAIXAS_POR_LOTE = 500
+TAMANHO_MAXIMO_CHAVE = 64
+
+# Uma transação que começou antes do carimbo pode gravar depois dele: o delta
+# recua esta margem (o telemóvel substitui as visitas pelo id, repetir é inofensivo)
+MARGEM_VERSAO = datetime.timedelta(seconds=30)
+
+# Relógio do telemóvel adiantado: acima disto a hora é limitada à do servidor
+TOLERANCIA_RELOGIO = datetime.timedelta(minutes=5)
+
+# ------------------------------------------------------------------------------
+# Baixa de uma visita (partilhada com o formulário de registrar_visita)
+# ------------------------------------------------------------------------------
+
+def aplicar_baixa(visita, vendeu, momento=None, valor_recebido=Decimal('0.00'), latitude=None, longitude=None,
+                  motivo_nao_venda=None, concorrente_empresa=None, concorrente_preco=Decimal('0.00'), observacao=None):
+    """Finaliza a visita (venda ou não venda) no momento indicado e atualiza resumos, ciclo e fila."""
+    momento = momento or timezone.now()
+    saiu_da_lista = visita.status == STATUS_PENDENTE
+    ja_vendida = visita.status == STATUS_REALIZADA
+
+    # Retira o estado anterior dos resumos diários (volta a somar o novo após gravar)
+    contabilizar_visita(visita, sinal=-1)
+
+    if latitude is not None and longitude is not None:
+        visita.latitude_checkin = latitude
+        visita.longitude_checkin = longitude
+
+    if vendeu:
+        visita.status = STATUS_REALIZADA
+        visita.valor_recebido = valor_recebido
+        # Recalcula a previsão de consumo na data da venda (um único UPDATE no cliente).
+        # Corrigir uma venda já registada não é uma nova compra: o histórico não muda
+        if not ja_vendida:
+            registrar_compra(visita.cliente, timezone.localtime(momento).date())
+            sincronizar_cliente(visita.cliente_id)
+    else:
+        visita.status = STATUS_NAO_VENDA
+        visita.motivo_nao_venda = motivo_nao_venda
+        visita.concorrente_empresa = concorrente_empresa
+        visita.concorrente_preco = concorrente_preco
+        visita.observacao = observacao
+
+    visita.data_visita = momento
+    visita.save()
+    contabilizar_visita(visita)
+    if saiu_da_lista:
+        # Outros aparelhos/abas do motoqueiro tiram o cartão da lista
+        avisar_motoqueiro(visita.rota.motoqueiro_id, removidas=[visita.id])
+
+# ------------------------------------------------------------------------------
+# Leitura dos itens do lote
+# ------------------------------------------------------------------------------
+
+def _ler_valor(valor):
+    """Valor monetário do JSON: número ou texto ("150,00" / "150.00"). Inválido levanta ValueError."""
+    if valor in (None, ''):
+        return Decimal('0.00')
+    if isinstance(valor, bool):
+        raise ValueError("valor inválido")
+    texto = str(valor).strip()
+    if isinstance(valor, str) and ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        numero = Decimal(texto)
+    except InvalidOperation:
+        raise ValueError(f"valor inválido: {valor!r}")
+    if not numero.is_finite() or numero < 0:
+        raise ValueError(f"valor inválido: {valor!r}")
+    return numero.quantize(Decimal('0.01'))
+
+
+def _ler_coordenadas(item):
+    """(lat, lng) do check-in, ou (None, None) se o GPS falhou no telemóvel."""
+    try:
+        latitude, longitude = float(item.get('lat')), float(item.get('lng'))
+    except (TypeError, ValueError):
+        return None, None
+    return (latitude, longitude) if tem_coordenadas(latitude, longitude) else (None, None)
+
+
+def _ler_momento(texto, visita, agora):
+    """Hora da baixa no telemóvel (ISO 8601), limitada ao intervalo [criação da rota, agora + tolerância]."""
+    if not texto:
+        return agora
+    try:
+        momento = datetime.datetime.fromisoformat(str(texto))
+    except ValueError:
+        raise ValueError(f"momento inválido: {texto!r}")
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    if momento > agora + TOLERANCIA_RELOGIO:
+        return agora
+    return max(momento, visita.rota.data_criacao)
+
+
+def _texto(item, campo, tamanho=None):
+    valor = item.get(campo)
+    if valor in (None, ''):
+        return None
+    valor = str(valor).strip()
+    return valor[:tamanho] if tamanho else valor
+
+# ------------------------------------------------------------------------------
+# Upload do lote de baixas
+# ------------------------------------------------------------------------------
+
+def aplicar_lote(motoqueiro, itens):
+    """
+    Aplica um lote de baixas do motoqueiro numa só transação e devolve o resultado de cada item,
+    pela ordem recebida: 'aplicada', 'repetida' (chave já sincronizada) ou 'rejeitada' (com o erro).
+    """
+    if not isinstance(itens, list):
+        raise ValueError("'baixas' deve ser uma lista.")
+    if len(itens) > MAXIMO_BAIXAS_POR_LOTE:
+        raise ValueError(f"Máximo de {MAXIMO_BAIXAS_POR_LOTE} baixas por lote.")
+
+    itens = [item if isinstance(item, dict) else {} for item in itens]
+    chaves = {str(item.get('chave') or '') for item in itens}
+    ids = {item['visita'] for item in itens if isinstance(item.get('visita'), int)}
+
+    # Duas consultas para o lote inteiro: chaves já recebidas e visitas do motoqueiro
+    repetidas = set(
+        BaixaSincronizada.objects.filter(motoqueiro=motoqueiro, chave__in=chaves).values_list('chave', flat=True)
+    )
+    visitas = Visita.objects.select_related('cliente', 'rota').filter(id__in=ids, rota__motoqueiro=motoqueiro).in_bulk()
+
+    agora = timezone.now()
+    resultados = [None] * len(itens)
+    with transaction.atomic():
+        for posicao, item in enumerate(itens):
+            chave = str(item.get('chave') or '')
+            if chave in repetidas:
+                resultados[posicao] = {'chave': chave, 'estado': 'repetida'}
+                continue
+            try:
+                if not chave or len(chave) > TAMANHO_MAXIMO_CHAVE:
+                    raise ValueError(f"chave obrigatória (até {TAMANHO_MAXIMO_CHAVE} caracteres)")
+                visita = visitas.get(item['visita']) if isinstance(item.get('visita'), int) else None
+                if visita is None:
+                    raise ValueError("visita inexistente ou de outro motoqueiro")
+                with transaction.atomic():
+                    _aplicar_item(motoqueiro, visita, chave, item, agora)
+            except IntegrityError:
+                # Outro pedido com a mesma chave gravou primeiro (reenvio em paralelo)
+                resultados[posicao] = {'chave': chave, 'estado': 'repetida'}
+            except ValueError as erro:
+                resultados[posicao] = {'chave': chave, 'estado': 'rejeitada', 'erro': str(erro)}
+            else:
+                resultados[posicao] = {'chave': chave, 'estado': 'aplicada', 'visita': serializar_visita(visita)}
+                repetidas.add(chave)
+    return resultados
+
+
+def _aplicar_item(motoqueiro, visita, chave, item, agora):
+    """Valida o item por inteiro antes de tocar na visita, regista a chave e aplica a baixa."""
+    if visita.status != STATUS_PENDENTE:
+        # O telemóvel só dá baixa de visitas pendentes: outra chave para a mesma visita é um conflito
+        raise ValueError("visita já finalizada")
+    resultado = item.get('resultado_venda')
+    if resultado not in ('SIM', 'NAO'):
+        raise ValueError("resultado_venda deve ser 'SIM' ou 'NAO'")
+    momento = _ler_momento(item.get('momento'), visita, agora)
+    latitude, longitude = _ler_coordenadas(item)
+    dados = {
+        'valor_recebido': _ler_valor(item.get('valor_recebido')),
+        'motivo_nao_venda': _texto(item, 'motivo_nao_venda', 50),
+        'concorrente_empresa': _texto(item, 'concorrente_empresa', 50),
+        'concorrente_preco': _ler_valor(item.get('concorrente_preco')),
+        'observacao': _texto(item, 'observacao'),
+    }
+    # A chave é gravada antes da baixa: um reenvio concorrente falha aqui e nada é aplicado duas vezes
+    BaixaSincronizada.objects.create(motoqueiro=motoqueiro, chave=chave, visita=visita, momento=momento)
+    aplicar_baixa(visita, resultado == 'SIM', momento, latitude=latitude, longitude=longitude, **dados)
+
+# ------------------------------------------------------------------------------
+# Download delta das visitas do dia
+# ------------------------------------------------------------------------------
+
+def ler_versao(texto):
+    """Converte o carimbo devolvido num download anterior; None (download completo) se inválido."""
+    if not texto:
+        return None
+    try:
+        versao = datetime.datetime.fromisoformat(texto)
+    except ValueError:
+        return None
+    return versao if timezone.is_aware(versao) else None
+
+
+def serializar_visita(visita):
+    cliente = visita.cliente
+    return {
+        'id': visita.id,
+        'rota': visita.rota_id,
+        'ordem': visita.ordem,
+        'status': visita.status,
+        'valor_venda': str(visita.valor_venda),
+        'forma_pagamento': visita.forma_pagamento,
+        'tipo_botijao': visita.tipo_botijao,
+        'valor_recebido': str(visita.valor_recebido),
+        'motivo_nao_venda': visita.motivo_nao_venda,
+        'observacao': visita.observacao,
+        'data_visita': visita.data_visita.isoformat(),
+        'cliente': {
+            'id': cliente.id,
+            'nome': cliente.nome,
+            'telefone': cliente.telefone,
+            'endereco': cliente.endereco,
+            'bairro': cliente.bairro,
+            'latitude': cliente.latitude,
+            'longitude': cliente.longitude,
+            'divida_atual': str(cliente.divida_atual),
+        },
+    }
+
+
+def visitas_do_dia(motoqueiro, desde=None):
+    """
+    Visitas do dia do motoqueiro alteradas desde a versão `desde` (todas se None), mais os ids de
+    todas as visitas do dia para o telemóvel descartar as que deixaram de existir.
+    """
+    versao = timezone.now()
+    do_dia = Visita.objects.filter(rota__motoqueiro=motoqueiro, **filtro_periodo('rota__data_criacao', timezone.localdate()))
+    alteradas = do_dia.select_related('cliente').order_by(*ORDEM_PARAGENS)
+    if desde is not None:
+        alteradas = alteradas.filter(atualizada_em__gte=desde - MARGEM_VERSAO)
+    return {
+        'versao': versao.isoformat(),
+        'completo': desde is None,
+        'visitas': [serializar_visita(visita) for visita in alteradas],
+        'ids': list(do_dia.order_by('id').values_list('id', flat=True)),
+    }
@@ -0,0 +1,313 @@
+import logging
+import signal
+import time
+
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from . import duplicados, geocodificacao
+from .fila import sincronizar_fila
+from .importacao import importar_clientes_csv
+from .models import Carteira, Cliente, Ligacao, Tarefa, Visita
+
+# ==============================================================================
+# TAREFAS EM SEGUNDO PLANO
+# ==============================================================================
+# Importações de CSV e exclusões de clientes com muito histórico podem levar
+# minutos. A view só grava uma Tarefa (com o ficheiro no storage, MEDIA_ROOT) e
+# redireciona o gerente para a barra de progresso; o comando processar_tarefas
+# reserva as tarefas pendentes e executa-as num pool de processos. Não há broker:
+# a fila é a tabela, e a reserva é um UPDATE condicional (PENDENTE -> EXECUTANDO)
+# que só um worker consegue fazer com sucesso. O web e o worker têm de partilhar o
+# MEDIA_ROOT (ou usar um storage remoto) para o worker encontrar o CSV enviado.
+
+logger = logging.getLogger(__name__)
+
+ESTADO_PENDENTE = 'PENDENTE'
+ESTADO_EXECUTANDO = 'EXECUTANDO'
+ESTADO_CONCLUIDA = 'CONCLUIDA'
+ESTADO_FALHOU = 'FALHOU'
+
+INTERVALO_PROGRESSO = 0.5     # Segundos mínimos entre duas gravações do progresso
+MAXIMO_TENTATIVAS = 2         # Uma tarefa órfã (worker morto) volta à fila uma única vez
+MAXIMO_REJEICOES_GUARDADAS = 20
+
+# Tipos que correm uma de cada vez: duas importações em paralelo não veriam os clientes
+# uma da outra (a deduplicação por nome só olha para o que já está gravado), e duas fusões
+# podiam disputar os mesmos clientes
+TIPOS_EM_SERIE = ('IMPORTAR_CLIENTES', 'GEOCODIFICAR', 'DETECTAR_DUPLICADOS', 'FUNDIR_DUPLICADOS')
+
+BLOCO_LEITURA = 1024 * 1024   # Bytes lidos de cada vez ao contar as linhas do CSV
+
+
+def enfileirar(tipo, descricao, criada_por=None, parametros=None, arquivo=None):
+    """Grava uma tarefa pendente; é executada pelo processar_tarefas depois do commit do pedido.
+
+    `arquivo` é o ficheiro enviado (UploadedFile): é copiado para o storage aos blocos, sem
+    passar inteiro pela memória.
+    """
+    tarefa = Tarefa(
+        tipo=tipo,
+        descricao=descricao[:255],
+        criada_por=criada_por,
+        parametros=parametros or {},
+    )
+    if arquivo is not None:
+        tarefa.arquivo.save(arquivo.name, arquivo, save=False)
+    tarefa.save()
+    return tarefa
+
+
+def _apagar_arquivo(nome):
+    """Remove do storage o CSV de uma tarefa terminada (já não volta a ser lido)."""
+    if nome:
+        try:
+            default_storage.delete(nome)
+        except OSError:
+            logger.warning("Não foi possível apagar o ficheiro %s da tarefa.", nome)
+
+
+def _contar_linhas(ficheiro):
+    linhas = 0
+    for bloco in iter(lambda: ficheiro.read(BLOCO_LEITURA), b''):
+        linhas += bloco.count(b'\n')
+    ficheiro.seek(0)
+    return linhas
+
+
+def enfileirar_geocodificacao(criada_por=None, cliente=None):
+    """
+    Pede a geocodificação dos clientes sem GPS, se ainda não houver uma da base inteira à espera na
+    fila. Com `cliente` (cadastro rápido ou endereço alterado na ficha) a tarefa trata só esse cliente.
+    """
+    pendente = Tarefa.objects.filter(
+        tipo='GEOCODIFICAR', estado=ESTADO_PENDENTE, parametros__clientes_ids__isnull=True,
+    ).first()
+    if pendente:
+        return pendente
+    if cliente is not None:
+        return enfileirar(
+            'GEOCODIFICAR', f"Geocodificação do cliente {cliente.nome}",
+            criada_por=criada_por, parametros={'clientes_ids': [cliente.pk]},
+        )
+    return enfileirar('GEOCODIFICAR', "Geocodificação dos clientes sem GPS", criada_por=criada_por)
+
+
+class Progresso:
+    """Regista o avanço de uma tarefa, limitando as escritas no banco a algumas por segundo."""
+
+    def __init__(self, tarefa_id):
+        self.tarefa_id = tarefa_id
+        self._ultima_escrita = 0.0
+
+    def __call__(self, atual, total=None, mensagem=None, forcar=False):
+        agora = time.monotonic()
+        if not forcar and agora - self._ultima_escrita < INTERVALO_PROGRESSO:
+            return
+        campos = {'progresso_atual': atual}
+        if total is not None:
+            campos['progresso_total'] = total
+        if mensagem is not None:
+            campos['mensagem'] = mensagem[:255]
+        Tarefa.objects.filter(pk=self.tarefa_id).update(**campos)
+        self._ultima_escrita = agora
+
+# ------------------------------------------------------------------------------
+# Executores (um por tipo; devolvem o resultado em JSON e a mensagem final)
+# ------------------------------------------------------------------------------
+
+def _importar_clientes(tarefa, progresso):
+    carteira = None
+    if tarefa.parametros.get('carteira_id'):
+        carteira = Carteira.objects.filter(pk=tarefa.parametros['carteira_id']).first()
+        if carteira is None:
+            raise ValueError("A carteira de destino já não existe.")
+
+    if not tarefa.arquivo:
+        raise ValueError("A tarefa não tem ficheiro para importar.")
+    with tarefa.arquivo.open('rb') as ficheiro:
+        # Estimativa do total pelas quebras de linha (menos o cabeçalho), contadas aos blocos
+        total = max(_contar_linhas(ficheiro) - 1, 1)
+        progresso(0, total, "A importar clientes...", forcar=True)
+
+        resultado = importar_clientes_csv(
+            ficheiro,
+            carteira=carteira,
+            progresso=lambda lidas: progresso(lidas, max(total, lidas), f"{lidas} linhas lidas"),
+        )
+    if carteira is not None and carteira.agente_comercial_id:
+        progresso(resultado.linhas_lidas, mensagem="A atualizar a fila do agente...", forcar=True)
+        sincronizar_fila(carteira.agente_comercial_id)
+    if resultado.criados:
+        # Os clientes novos quase nunca trazem GPS: a geocodificação segue na fila
+        enfileirar_geocodificacao(tarefa.criada_por)
+
+    mensagem = f"{resultado.aceites} clientes importados ({resultado})."
+    if carteira is not None:
+        mensagem = f"{resultado.aceites} clientes incorporados na carteira {carteira.nome} ({resultado})."
+    return {
+        'linhas_lidas': resultado.linhas_lidas,
+        'criados': resultado.criados,
+        'existentes': resultado.existentes,
+        'vinculados': resultado.vinculados,
+        'para_rever': resultado.para_rever,
+        'total_rejeicoes': len(resultado.rejeicoes),
+        'rejeicoes': resultado.rejeicoes[:MAXIMO_REJEICOES_GUARDADAS],
+        'segundos': round(resultado.segundos, 1),
+    }, mensagem
+
+
+def _excluir_cliente(tarefa, progresso):
+    cliente = Cliente.objects.filter(pk=tarefa.parametros.get('cliente_id')).first()
+    if cliente is None:
+        return {}, "O cliente já tinha sido excluído."
+
+    visitas = Visita.objects.filter(cliente=cliente).count()
+    ligacoes = Ligacao.objects.filter(cliente=cliente).count()
+    progresso(0, 1, f"A apagar {visitas} visitas e {ligacoes} ligações...", forcar=True)
+    # Os resumos do dashboard são acertados pelo pre_delete do cliente (logistica/signals.py)
+    with transaction.atomic():
+        cliente.delete()
+    return {'visitas': visitas, 'ligacoes': ligacoes}, f"O cliente '{cliente.nome}' foi excluído."
+
+
+def _geocodificar(tarefa, progresso):
+    progresso(0, 0, "A geocodificar os clientes sem GPS...", forcar=True)
+    execucao = geocodificacao.geocodificar_clientes(
+        progresso=lambda feitos, total: progresso(feitos, total, f"{feitos} de {total} clientes analisados"),
+        clientes_ids=tarefa.parametros.get('clientes_ids'),
+    )
+    cobertura = geocodificacao.estatisticas()
+    localizados = execucao['EXATA'] + execucao['RUA'] + execucao['BAIRRO']
+    mensagem = f"{localizados} de {execucao['processados']} clientes localizados; cobertura da base: {cobertura['cobertura']}%."
+    return {'execucao': execucao, 'cobertura': cobertura}, mensagem
+
+
+def _detectar_duplicados(tarefa, progresso):
+    progresso(0, 0, "A procurar clientes duplicados...", forcar=True)
+    estatisticas = duplicados.detectar(
+        limiar=tarefa.parametros.get('limiar', duplicados.LIMIAR_SUGESTAO),
+        progresso=lambda feitos, total: progresso(feitos, total, f"{feitos} de {total} blocos comparados"),
+    )
+    mensagem = f"{estatisticas['pares']} pares de possíveis duplicados entre {estatisticas['clientes']} clientes."
+    return estatisticas, mensagem
+
+
+def _fundir_duplicados(tarefa, progresso):
+    # Grupos escolhidos pelo gerente ([principal, [duplicados]]) ou todos os sugeridos acima de um limiar
+    grupos = tarefa.parametros.get('grupos')
+    if grupos is None:
+        sugeridos = duplicados.grupos_sugeridos(tarefa.parametros.get('limiar', duplicados.LIMIAR_FUSAO_AUTOMATICA))
+        grupos = duplicados.escolher_principais(sugeridos)
+    progresso(0, len(grupos), "A fundir clientes duplicados...", forcar=True)
+    totais = duplicados.fundir(
+        grupos,
+        fundido_por=tarefa.criada_por,
+        progresso=lambda feitos, total: progresso(feitos, total, f"{feitos} de {total} grupos fundidos"),
+    )
+    mensagem = f"{totais['clientes']} clientes duplicados fundidos em {totais['grupos']} clientes."
+    return totais, mensagem
+
+
+EXECUTORES = {
+    'IMPORTAR_CLIENTES': _importar_clientes,
+    'EXCLUIR_CLIENTE': _excluir_cliente,
+    'GEOCODIFICAR': _geocodificar,
+    'DETECTAR_DUPLICADOS': _detectar_duplicados,
+    'FUNDIR_DUPLICADOS': _fundir_duplicados,
+}
+
+# ------------------------------------------------------------------------------
+# Ciclo de vida (usado pelo comando processar_tarefas)
+# ------------------------------------------------------------------------------
+
+def reservar():
+    """Passa a tarefa pendente mais antiga para EXECUTANDO e devolve o id (None se a fila estiver vazia)."""
+    ocupados = Tarefa.objects.filter(estado=ESTADO_EXECUTANDO, tipo__in=TIPOS_EM_SERIE).values_list('tipo', flat=True)
+    candidatos = (
+        Tarefa.objects.filter(estado=ESTADO_PENDENTE).exclude(tipo__in=set(ocupados))
+        .order_by('id').values_list('id', 'tipo')[:10]
+    )
+    for tarefa_id, tipo in candidatos:
+        with transaction.atomic():
+            alvo = Tarefa.objects.filter(pk=tarefa_id, estado=ESTADO_PENDENTE)
+            if tipo in TIPOS_EM_SERIE:
+                # A leitura de `ocupados` é só um filtro: a exclusividade decide-se no próprio UPDATE,
+                # que não reserva se já houver uma do mesmo tipo a correr. No PostgreSQL o bloqueio das
+                # linhas do tipo põe em fila os workers que disputam o mesmo tipo (no SQLite a escrita
+                # já é exclusiva)
+                list(Tarefa.objects.select_for_update().filter(
+                    tipo=tipo, estado__in=(ESTADO_PENDENTE, ESTADO_EXECUTANDO),
+                ).values_list('id', flat=True))
+                alvo = alvo.filter(~Exists(Tarefa.objects.filter(tipo=OuterRef('tipo'), estado=ESTADO_EXECUTANDO)))
+            agora = timezone.now()
+            # Outro worker pode ter reservado a mesma tarefa entre a leitura e o UPDATE: só um o vê afetar 1 linha
+            reservada = alvo.update(
+                estado=ESTADO_EXECUTANDO, iniciada_em=agora, batimento=agora, tentativas=F('tentativas') + 1,
+            )
+        if reservada:
+            return tarefa_id
+    return None
+
+
+def executar(tarefa_id):
+    """Executa uma tarefa reservada (num processo do pool) e grava o desfecho."""
+    # Ctrl+C/SIGTERM chegam a todo o grupo de processos: só o worker principal decide parar,
+    # e espera que as tarefas em curso terminem
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    close_old_connections()
+    try:
+        tarefa = Tarefa.objects.get(pk=tarefa_id)
+        try:
+            resultado, mensagem = EXECUTORES[tarefa.tipo](tarefa, Progresso(tarefa_id))
+        except Exception as erro:
+            logger.exception("Tarefa %s (%s) falhou.", tarefa_id, tarefa.tipo)
+            falhar(tarefa_id, str(erro) or erro.__class__.__name__)
+            return False
+        Tarefa.objects.filter(pk=tarefa_id).update(
+            estado=ESTADO_CONCLUIDA,
+            resultado=resultado,
+            mensagem=mensagem[:255],
+            progresso_atual=F('progresso_total'),
+            concluida_em=timezone.now(),
+            arquivo='',
+        )
+        _apagar_arquivo(tarefa.arquivo.name)
+        return True
+    finally:
+        close_old_connections()
+
+
+def falhar(tarefa_id, erro):
+    nome = Tarefa.objects.filter(pk=tarefa_id).values_list('arquivo', flat=True).first()
+    Tarefa.objects.filter(pk=tarefa_id).update(
+        estado=ESTADO_FALHOU, erro=erro, mensagem="Falhou.", concluida_em=timezone.now(), arquivo='',
+    )
+    _apagar_arquivo(nome)
+
+
+def bater(tarefas_ids):
+    """Batimento das tarefas em curso neste worker (prova de que ainda não morreu)."""
+    if tarefas_ids:
+        Tarefa.objects.filter(pk__in=list(tarefas_ids), estado=ESTADO_EXECUTANDO).update(batimento=timezone.now())
+
+
+def recuperar_orfas(expirar_apos):
+    """Tarefas EXECUTANDO sem batimento há `expirar_apos` (worker morto) voltam à fila ou falham."""
+    limite = timezone.now() - expirar_apos
+    orfas = Tarefa.objects.filter(estado=ESTADO_EXECUTANDO, batimento__lt=limite)
+    repetidas = orfas.filter(tentativas__lt=MAXIMO_TENTATIVAS).update(
+        estado=ESTADO_PENDENTE, mensagem="Retomada depois de o worker parar.",
+    )
+    ids = list(orfas.values_list('id', flat=True))
+    nomes = list(Tarefa.objects.filter(pk__in=ids).exclude(arquivo='').values_list('arquivo', flat=True))
+    falhadas = orfas.filter(pk__in=ids).update(
+        estado=ESTADO_FALHOU, erro="O worker parou a meio da tarefa.", mensagem="Falhou.",
+        concluida_em=timezone.now(), arquivo='',
+    )
+    for nome in nomes:
+        _apagar_arquivo(nome)
+    return repetidas, falhadas
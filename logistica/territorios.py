@@ -0,0 +1,364 @@
+import math
+
+import numpy as np
+from django.db import transaction
+
+from .geo import KM_POR_GRAU
+from .models import Carteira, Cliente
+from .fila import sincronizar_fila
+
+# ==============================================================================
+# DIVISÃO AUTOMÁTICA DOS CLIENTES EM TERRITÓRIOS (CARTEIRAS)
+# ==============================================================================
+# k-means com limite de capacidade sobre os clientes com GPS: cada território
+# fica compacto (clientes perto do seu centro) e com carga parecida, seja em
+# número de clientes, seja em entregas esperadas por dia (1 / ciclo de consumo).
+# Começa de uma bisseção recursiva (já equilibrada) e o k-means torna-a compacta.
+# A capacidade entra como um fator por território que multiplica a distância:
+# os territórios cheios de mais ficam "mais longe" e os vazios "mais perto", até
+# a carga de todos caber na folga (o que sobrar é corrigido ponto a ponto).
+# Tudo em numpy e só contra os centros mais próximos de cada cliente, por isso
+# 100 mil clientes resolvem-se em segundos.
+
+CRITERIOS = {
+    'clientes': "Número de clientes",
+    'entregas': "Entregas esperadas por dia",
+}
+FOLGA_PADRAO = 0.05            # Carga máxima = média x (1 + folga)
+ITERACOES_PADRAO = 15
+ITERACOES_FATOR = 5            # Ajustes de carga por iteração do k-means
+ITERACOES_FATOR_FINAL = 100    # Ajustes de carga na atribuição final
+AJUSTE_FATOR = 0.3             # Expoente do ajuste: fator x (carga / média) ^ 0,3
+AJUSTE_FATOR_MINIMO = 0.02
+LIMIAR_ESTABILIDADE = 0.005    # Para quando menos de 0,5% dos clientes muda de território
+CENTROS_CANDIDATOS = 12        # Cada cliente só pode ir para um dos 12 centros mais próximos da sua zona
+TAMANHO_BLOCO = 10000          # Clientes por bloco no cálculo das distâncias (limita a memória)
+PREFIXO_NOVAS = "Território "
+
+
+# ------------------------------------------------------------------------------
+# ALGORITMO (SÓ NUMPY)
+# ------------------------------------------------------------------------------
+
+def _projetar(latitudes, longitudes):
+    """Coordenadas planas (km) numa projeção equirretangular centrada nos próprios pontos."""
+    lat = np.asarray(latitudes, dtype=float)
+    lng = np.asarray(longitudes, dtype=float)
+    cos_lat = math.cos(math.radians(float(lat.mean())))
+    return np.column_stack([lng * KM_POR_GRAU * cos_lat, lat * KM_POR_GRAU])
+
+
+def _bissecao(pontos, pesos, k):
+    """
+    Divisão inicial já equilibrada: corta o conjunto ao meio (em peso) pelo eixo mais comprido,
+    recursivamente, até haver k partes. Serve de ponto de partida ao k-means.
+    """
+    rotulos = np.empty(len(pontos), dtype=np.int64)
+    pendentes = [(np.arange(len(pontos)), k, 0)]
+    while pendentes:
+        membros, partes, primeiro = pendentes.pop()
+        if partes == 1:
+            rotulos[membros] = primeiro
+            continue
+        eixo = int(np.argmax(np.ptp(pontos[membros], axis=0)))
+        membros = membros[np.argsort(pontos[membros, eixo], kind='stable')]
+        acumulado = np.cumsum(pesos[membros])
+        esquerda = partes // 2
+        corte = int(np.searchsorted(acumulado, acumulado[-1] * esquerda / partes))
+        corte = min(max(corte, esquerda), len(membros) - (partes - esquerda))
+        pendentes.append((membros[:corte], esquerda, primeiro))
+        pendentes.append((membros[corte:], partes - esquerda, primeiro + esquerda))
+    return rotulos
+
+
+def _centros(pontos, pesos, rotulos, k, anteriores=None):
+    """Centro (média pesada) de cada território; um território vazio mantém o centro anterior."""
+    carga = np.bincount(rotulos, weights=pesos, minlength=k)
+    centros = np.zeros((k, 2)) if anteriores is None else anteriores.copy()
+    for eixo in range(2):
+        somas = np.bincount(rotulos, weights=pesos * pontos[:, eixo], minlength=k)
+        centros[:, eixo] = np.where(carga > 0, somas / np.where(carga > 0, carga, 1), centros[:, eixo])
+    return centros
+
+
+def _celulas(pontos, k):
+    """Agrupa os pontos em quadrículas ~3x menores que um território (para escolher os centros candidatos)."""
+    largura, altura = np.ptp(pontos, axis=0)
+    raio_territorio = math.sqrt(max(largura * altura, 1e-6) / k / math.pi)
+    lado = max(raio_territorio / 3, 1e-3)
+    quadriculas, celula_do_ponto = np.unique(np.floor(pontos / lado).astype(np.int64), axis=0, return_inverse=True)
+    return (quadriculas + 0.5) * lado, celula_do_ponto.ravel()
+
+
+def _centros_candidatos(centros, quantidade, celulas, celula_do_ponto):
+    """
+    Para cada ponto, os índices dos `quantidade` centros mais próximos da sua quadrícula
+    (a pré-seleção é feita por quadrícula, não por ponto: muito menos contas).
+    """
+    k = len(centros)
+    quantidade = min(quantidade, k)
+    norma_centros = (centros ** 2).sum(axis=1)
+    preselecao = np.empty((len(celulas), quantidade), dtype=np.int64)
+    for inicio in range(0, len(celulas), TAMANHO_BLOCO):
+        bloco = celulas[inicio:inicio + TAMANHO_BLOCO]
+        d2 = (bloco ** 2).sum(axis=1)[:, None] + norma_centros[None, :] - 2 * bloco @ centros.T
+        preselecao[inicio:inicio + len(bloco)] = (
+            np.argpartition(d2, quantidade - 1, axis=1)[:, :quantidade] if quantidade < k else np.arange(k)
+        )
+    return preselecao[celula_do_ponto]
+
+
+def _distancias2(pontos, centros, indices):
+    """Distância² (km²) de cada ponto a cada um dos seus centros candidatos."""
+    return (pontos[:, :1] - centros[indices, 0]) ** 2 + (pontos[:, 1:] - centros[indices, 1]) ** 2
+
+
+def _atribuir(distancias2, indices, pesos, k, folga, fatores, iteracoes):
+    """
+    Coluna do centro candidato escolhido por cada ponto: o de menor distância² x fator do
+    território. Os fatores (guardados entre iterações do k-means) sobem nos territórios cheios
+    e descem nos vazios; por ser multiplicativo, o ajuste serve a zonas densas e dispersas.
+    """
+    linhas = np.arange(len(indices))
+    alvo = pesos.sum() / k
+    ajuste, pior_anterior = AJUSTE_FATOR, np.inf
+    for _ in range(iteracoes):
+        coluna = np.argmin(distancias2 * fatores[indices], axis=1)
+        carga = np.bincount(indices[linhas, coluna], weights=pesos, minlength=k)
+        pior = np.abs(carga / alvo - 1).max()
+        if pior <= folga:
+            break
+        # A oscilar (piorou desde o passo anterior): passos mais curtos
+        if pior > pior_anterior:
+            ajuste = max(ajuste / 2, AJUSTE_FATOR_MINIMO)
+        pior_anterior = pior
+        fatores *= np.maximum(carga / alvo, 0.2) ** ajuste
+    return coluna
+
+
+def _reparar(indices, distancias2, coluna, pesos, k, capacidade):
+    """Garante a capacidade: tira dos territórios cheios os pontos que menos custa mudar para um vizinho com espaço."""
+    linhas = np.arange(len(indices))
+    rotulos = indices[linhas, coluna]
+    carga = np.bincount(rotulos, weights=pesos, minlength=k)
+    for territorio in np.flatnonzero(carga > capacidade):
+        membros = np.flatnonzero(rotulos == territorio)
+        atual = distancias2[membros, coluna[membros]]
+        alternativas = np.where(indices[membros] == territorio, np.inf, distancias2[membros])
+        for posicao in np.argsort((alternativas.min(axis=1) - atual)):
+            if carga[territorio] <= capacidade:
+                break
+            ponto = membros[posicao]
+            for destino_coluna in np.argsort(alternativas[posicao]):
+                destino = indices[ponto, destino_coluna]
+                if np.isinf(alternativas[posicao, destino_coluna]):
+                    break
+                if carga[destino] + pesos[ponto] <= capacidade:
+                    carga[territorio] -= pesos[ponto]
+                    carga[destino] += pesos[ponto]
+                    rotulos[ponto] = destino
+                    break
+    return rotulos
+
+
+def particionar(latitudes, longitudes, pesos, k, folga=FOLGA_PADRAO, iteracoes=ITERACOES_PADRAO):
+    """Rótulo (0..k-1) do território de cada ponto: territórios compactos com carga até média x (1 + folga)."""
+    pontos = _projetar(latitudes, longitudes)
+    pesos = np.asarray(pesos, dtype=float)
+    k = max(1, min(k, len(pontos)))
+    rotulos = _bissecao(pontos, pesos, k)
+    centros = _centros(pontos, pesos, rotulos, k)
+    celulas, celula_do_ponto = _celulas(pontos, k)
+    fatores = np.ones(k)
+    linhas = np.arange(len(pontos))
+
+    # Parte de uma divisão equilibrada, por isso os fatores só precisam de pequenas correções
+    for _ in range(iteracoes):
+        indices = _centros_candidatos(centros, CENTROS_CANDIDATOS, celulas, celula_do_ponto)
+        distancias2 = _distancias2(pontos, centros, indices)
+        coluna = _atribuir(distancias2, indices, pesos, k, folga, fatores, ITERACOES_FATOR)
+        novos = indices[linhas, coluna]
+        estavel = np.mean(novos != rotulos) < LIMIAR_ESTABILIDADE
+        rotulos = novos
+        centros = _centros(pontos, pesos, rotulos, k, centros)
+        if estavel:
+            break
+
+    indices = _centros_candidatos(centros, CENTROS_CANDIDATOS, celulas, celula_do_ponto)
+    distancias2 = _distancias2(pontos, centros, indices)
+    coluna = _atribuir(distancias2, indices, pesos, k, folga, fatores, ITERACOES_FATOR_FINAL)
+    return _reparar(indices, distancias2, coluna, pesos, k, pesos.sum() / k * (1 + folga))
+
+
+def avaliar(latitudes, longitudes, pesos, rotulos, k):
+    """Carga e compacidade de uma divisão (rótulo -1 = cliente sem território)."""
+    pontos = _projetar(latitudes, longitudes)
+    pesos = np.asarray(pesos, dtype=float)
+    rotulos = np.asarray(rotulos)
+    com_territorio = rotulos >= 0
+    pontos, pesos_t, rotulos_t = pontos[com_territorio], pesos[com_territorio], rotulos[com_territorio]
+
+    carga = np.bincount(rotulos_t, weights=pesos_t, minlength=k)
+    quantidade = np.bincount(rotulos_t, minlength=k)
+    usados = quantidade > 0
+    centros = np.zeros((k, 2))
+    for eixo in range(2):
+        centros[:, eixo] = np.bincount(rotulos_t, weights=pontos[:, eixo], minlength=k) / np.maximum(quantidade, 1)
+    distancias = np.sqrt(((pontos - centros[rotulos_t]) ** 2).sum(axis=1)) if len(pontos) else np.zeros(0)
+
+    cargas_usadas = carga[usados] if usados.any() else np.zeros(1)
+    return {
+        'territorios': int(usados.sum()),
+        'sem_territorio': int((~com_territorio).sum()),
+        'carga_min': float(cargas_usadas.min()),
+        'carga_max': float(cargas_usadas.max()),
+        'carga_media': float(pesos.sum() / k),
+        # Coeficiente de variação da carga entre territórios (0 = perfeitamente equilibrado)
+        'desequilibrio': float(carga.std() / carga.mean()) if carga.mean() else 0.0,
+        'distancia_media_km': float(distancias.mean()) if len(distancias) else 0.0,
+        'distancia_p95_km': float(np.percentile(distancias, 95)) if len(distancias) else 0.0,
+    }
+
+
+# ------------------------------------------------------------------------------
+# PLANO SOBRE AS CARTEIRAS DO BANCO
+# ------------------------------------------------------------------------------
+
+class PlanoTerritorios:
+    """Divisão proposta dos clientes com GPS pelas carteiras, com a avaliação antes/depois."""
+
+    def __init__(self, carteiras, k, criterio, clientes_ids, rotulos_antes, rotulos_depois, antes, depois, sobrepostos):
+        self.carteiras = carteiras            # Carteira do território i (None = carteira nova a criar)
+        self.k = k
+        self.criterio = criterio
+        self.clientes_ids = clientes_ids
+        self.rotulos_antes = rotulos_antes
+        self.rotulos_depois = rotulos_depois
+        self.antes = antes
+        self.depois = depois
+        self.sobrepostos = sobrepostos        # Clientes hoje em mais de uma das carteiras
+
+    @property
+    def descricao_criterio(self):
+        return CRITERIOS[self.criterio]
+
+    @property
+    def clientes_movidos(self):
+        return int((self.rotulos_antes != self.rotulos_depois).sum())
+
+    def comparacao(self):
+        """Linhas (indicador, antes, depois) para mostrar ao gerente."""
+        return [
+            ("Territórios com clientes", self.antes['territorios'], self.depois['territorios']),
+            ("Clientes que mudam de carteira", "", self.clientes_movidos),
+            ("Clientes com GPS sem carteira", self.antes['sem_territorio'], self.depois['sem_territorio']),
+            ("Clientes em mais de uma carteira", self.sobrepostos, 0),
+            ("Carga mínima", round(self.antes['carga_min'], 1), round(self.depois['carga_min'], 1)),
+            ("Carga máxima", round(self.antes['carga_max'], 1), round(self.depois['carga_max'], 1)),
+            ("Desequilíbrio da carga (CV)", f"{self.antes['desequilibrio']:.0%}", f"{self.depois['desequilibrio']:.0%}"),
+            ("Distância média ao centro (km)", round(self.antes['distancia_media_km'], 2), round(self.depois['distancia_media_km'], 2)),
+            ("Distância p95 ao centro (km)", round(self.antes['distancia_p95_km'], 2), round(self.depois['distancia_p95_km'], 2)),
+        ]
+
+
+def _pesos(ciclos, criterio):
+    if criterio == 'entregas':
+        return 1.0 / np.maximum(np.asarray(ciclos, dtype=float), 1.0)
+    return np.ones(len(ciclos))
+
+
+def planear(k=None, criterio='clientes', carteiras=None, folga=FOLGA_PADRAO):
+    """
+    Calcula (sem gravar) a divisão dos clientes com GPS em k territórios. Cada território herda
+    a carteira existente com quem mais partilha clientes, para manter motoqueiros e agentes.
+    """
+    if criterio not in CRITERIOS:
+        raise ValueError(f"Critério desconhecido: {criterio}")
+    carteiras = list(carteiras if carteiras is not None else Carteira.objects.order_by('id'))
+    k = k or len(carteiras)
+    if k < 1:
+        raise ValueError("Indique o número de territórios (não há carteiras para reaproveitar).")
+
+    linhas = list(
+        Cliente.objects.filter(celula_grade__isnull=False)
+        .order_by('id')
+        .values_list('id', 'latitude', 'longitude', 'ciclo_consumo_dias')
+    )
+    if len(linhas) < k:
+        raise ValueError(f"Só há {len(linhas)} clientes com GPS para {k} territórios.")
+    clientes_ids, latitudes, longitudes, ciclos = (np.array(coluna) for coluna in zip(*linhas))
+    pesos = _pesos(ciclos, criterio)
+
+    # Situação atual: carteira (entre as indicadas) de cada cliente; a primeira, se estiver em várias
+    posicao_carteira = {carteira.pk: i for i, carteira in enumerate(carteiras)}
+    posicao_cliente = {pk: i for i, pk in enumerate(clientes_ids.tolist())}
+    rotulos_antes = np.full(len(clientes_ids), -1)
+    vinculos = np.zeros(len(clientes_ids), dtype=int)
+    Membro = Carteira.clientes.through
+    for carteira_id, cliente_id in Membro.objects.filter(carteira_id__in=list(posicao_carteira)).values_list('carteira_id', 'cliente_id').iterator(chunk_size=5000):
+        i = posicao_cliente.get(cliente_id)
+        if i is None:
+            continue
+        vinculos[i] += 1
+        if rotulos_antes[i] < 0 or posicao_carteira[carteira_id] < rotulos_antes[i]:
+            rotulos_antes[i] = posicao_carteira[carteira_id]
+
+    rotulos_depois = particionar(latitudes, longitudes, pesos, k, folga=folga)
+
+    # Cada território fica com a carteira atual com que mais clientes partilha (emparelhamento guloso)
+    comuns = np.zeros((len(carteiras), k), dtype=int)
+    atuais = rotulos_antes >= 0
+    np.add.at(comuns, (rotulos_antes[atuais], rotulos_depois[atuais]), 1)
+    destino = [None] * k
+    livres_carteiras, livres_territorios = set(range(len(carteiras))), set(range(k))
+    for par in np.argsort(comuns, axis=None)[::-1]:
+        c, t = np.unravel_index(par, comuns.shape)
+        if c in livres_carteiras and t in livres_territorios:
+            destino[t] = carteiras[c]
+            livres_carteiras.discard(c)
+            livres_territorios.discard(t)
+
+    # Carteira i = território i; as que sobram (k menor que o nº de carteiras) vêm no fim e ficam
+    # sem clientes com GPS. A situação atual passa a usar a mesma numeração.
+    sobras = [carteiras[c] for c in sorted(livres_carteiras)]
+    todas = destino + sobras
+    posicao_final = {carteira.pk: i for i, carteira in enumerate(todas) if carteira is not None}
+    renumerar = np.array([posicao_final[carteira.pk] for carteira in carteiras] + [-1])
+    rotulos_antes = renumerar[rotulos_antes]
+
+    return PlanoTerritorios(
+        carteiras=todas,
+        k=k,
+        criterio=criterio,
+        clientes_ids=clientes_ids,
+        rotulos_antes=rotulos_antes,
+        rotulos_depois=rotulos_depois,
+        antes=avaliar(latitudes, longitudes, pesos, rotulos_antes, len(todas)),
+        depois=avaliar(latitudes, longitudes, pesos, rotulos_depois, k),
+        sobrepostos=int((vinculos > 1).sum()),
+    )
+
+
+@transaction.atomic
+def aplicar(plano):
+    """Grava o plano: cria as carteiras que faltam e refaz, em bloco, os vínculos dos clientes com GPS."""
+    for territorio, carteira in enumerate(plano.carteiras[:plano.k]):
+        if carteira is None:
+            plano.carteiras[territorio] = Carteira.objects.create(nome=f"{PREFIXO_NOVAS}{territorio + 1:02d}")
+
+    Membro = Carteira.clientes.through
+    carteiras_ids = [carteira.pk for carteira in plano.carteiras]
+    # Os clientes sem GPS ficam onde estão; os com GPS passam a estar em exatamente um território
+    Membro.objects.filter(carteira_id__in=carteiras_ids, cliente__celula_grade__isnull=False).delete()
+    Membro.objects.bulk_create(
+        [
+            Membro(carteira_id=plano.carteiras[territorio].pk, cliente_id=int(cliente_id))
+            for cliente_id, territorio in zip(plano.clientes_ids, plano.rotulos_depois)
+        ],
+        batch_size=5000,
+        ignore_conflicts=True,
+    )
+
+    for agente_id in {carteira.agente_comercial_id for carteira in plano.carteiras} - {None}:
+        sincronizar_fila(agente_id)
+    return plano
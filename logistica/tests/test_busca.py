@@ -0,0 +1,73 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..busca import buscar, filtrar
+from ..models import Carteira, Cliente, GramaBusca
+from .utils import CACHE_LOCAL, criar_cliente
+
+
+def nomes(clientes):
+    return [cliente.nome for cliente in clientes]
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class BuscaClientesTests(TestCase):
+
+    def setUp(self):
+        self.jose = criar_cliente("José da Silva", "(85) 99999-0001", documento="123.456.789-09")
+        self.maria = criar_cliente("Maria Souza", "(85) 98888-0002", endereco="Av. Beira Mar, 500", bairro="Meireles")
+        self.joao = criar_cliente("João Josefino", "(85) 97777-0003")
+
+    def test_ignora_acentos_e_maiusculas_e_poe_o_inicio_do_nome_primeiro(self):
+        self.assertEqual(nomes(buscar("JOSE")), ["José da Silva", "João Josefino"])
+        self.assertEqual(nomes(buscar("josé s")), ["José da Silva"])
+
+    def test_encontra_por_telefone_e_documento_com_ou_sem_pontuacao(self):
+        self.assertEqual(nomes(buscar("(85) 98888-0002")), ["Maria Souza"])
+        self.assertEqual(nomes(buscar("98888")), ["Maria Souza"])
+        self.assertEqual(nomes(buscar("0002")), ["Maria Souza"])
+        self.assertEqual(nomes(buscar("456.789")), ["José da Silva"])
+
+    def test_todas_as_palavras_tem_de_aparecer_em_algum_campo(self):
+        self.assertEqual(nomes(buscar("souza beira")), ["Maria Souza"])
+        self.assertEqual(nomes(buscar("souza meireles")), ["Maria Souza"])
+        self.assertEqual(buscar("souza flores"), [])
+
+    def test_pesquisa_curta_demais_ou_sem_correspondencia_devolve_vazio(self):
+        self.assertEqual(buscar("j"), [])
+        self.assertEqual(buscar("  "), [])
+        self.assertEqual(buscar("xyzw"), [])
+        self.assertFalse(filtrar(Cliente.objects.all(), "zz").exists())
+
+    def test_atalho_do_prefixo_respeita_o_limite(self):
+        for nome in ("Ana Lima", "Ana Costa", "Ana Dias"):
+            criar_cliente(nome)
+
+        self.assertEqual(nomes(buscar("ana", limite=2)), ["Ana Costa", "Ana Dias"])
+
+    def test_alterar_o_cliente_atualiza_o_indice_de_busca(self):
+        self.maria.nome = "Mariana Teixeira"
+        self.maria.save()
+
+        self.assertEqual(buscar("souza"), [])
+        self.assertEqual(nomes(buscar("teixeira")), ["Mariana Teixeira"])
+        self.maria.delete()
+        self.assertFalse(GramaBusca.objects.filter(cliente_id=self.maria.id).exists())
+
+    def test_agente_so_encontra_clientes_das_suas_carteiras(self):
+        agente = User.objects.create_user('agente')
+        Carteira.objects.create(nome="Centro", agente_comercial=agente).clientes.add(self.jose)
+        self.client.force_login(agente)
+
+        resultados = self.client.get(reverse('buscar_clientes'), {'q': 'jos'}).json()['resultados']
+
+        self.assertEqual([(r['nome'], r['url_ficha']) for r in resultados], [("José da Silva", None)])
+
+    def test_gerente_encontra_todos_com_link_para_a_ficha(self):
+        self.client.force_login(User.objects.create_user('gerente', is_staff=True))
+
+        resultados = self.client.get(reverse('buscar_clientes'), {'q': 'jos'}).json()['resultados']
+
+        self.assertEqual([r['nome'] for r in resultados], ["José da Silva", "João Josefino"])
+        self.assertEqual(resultados[0]['url_ficha'], reverse('detalhes_cliente', args=[self.jose.id]))
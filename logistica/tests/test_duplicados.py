@@ -0,0 +1,60 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from .. import duplicados
+from ..models import Carteira, Cliente, FusaoCliente, Ligacao, ParDuplicado, Rota, Visita
+from .utils import CACHE_LOCAL, criar_cliente
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class DuplicadosTests(TestCase):
+
+    def test_detecta_e_funde_o_historico_no_principal(self):
+        agente = User.objects.create_user('agente')
+        motoqueiro = User.objects.create_user('moto')
+        principal = criar_cliente("José da Silva", "(85) 99999-0001", endereco="Rua A, 10")
+        duplicado = criar_cliente("Jose Silva", "85 9999-0001", endereco="Rua A, 10", documento="123.456.789-00")
+        carteira = Carteira.objects.create(nome="Centro")
+        carteira.clientes.add(duplicado)
+        visita = Visita.objects.create(rota=Rota.objects.create(nome="R", motoqueiro=motoqueiro), cliente=duplicado)
+        ligacao = Ligacao.objects.create(agente=agente, cliente=duplicado, resultado='CAIXA_POSTAL')
+
+        duplicados.detectar()
+        par = ParDuplicado.objects.get()
+        self.assertEqual({par.cliente_a_id, par.cliente_b_id}, {principal.pk, duplicado.pk})
+        self.assertGreaterEqual(par.pontuacao, duplicados.LIMIAR_FUSAO_AUTOMATICA)
+
+        totais = duplicados.fundir([(principal.pk, [duplicado.pk])])
+
+        self.assertEqual(totais, {'grupos': 1, 'clientes': 1, 'visitas': 1, 'ligacoes': 1})
+        self.assertFalse(Cliente.objects.filter(pk=duplicado.pk).exists())
+        self.assertEqual(Visita.objects.get(pk=visita.pk).cliente_id, principal.pk)
+        self.assertEqual(Ligacao.objects.get(pk=ligacao.pk).cliente_id, principal.pk)
+        self.assertEqual(list(carteira.clientes.all()), [principal])
+        self.assertEqual(FusaoCliente.objects.get().duplicado_id, duplicado.pk)
+        self.assertFalse(ParDuplicado.objects.exists())
+        principal.refresh_from_db()
+        # O principal fica com os dados que lhe faltavam
+        self.assertEqual(principal.documento, "123.456.789-00")
+
+    def test_fundir_de_novo_nao_faz_nada(self):
+        principal = criar_cliente("José da Silva", "(85) 99999-0001")
+        duplicado = criar_cliente("Jose Silva", "(85) 99999-0001")
+        duplicados.fundir([(principal.pk, [duplicado.pk])])
+
+        self.assertEqual(duplicados.fundir([(principal.pk, [duplicado.pk])]), {'grupos': 0, 'clientes': 0, 'visitas': 0, 'ligacoes': 0})
+        self.assertEqual(FusaoCliente.objects.count(), 1)
+
+    def test_sem_telefone_nunca_chega_a_fusao_automatica(self):
+        com = duplicados.Registo(1, 'jose da silva', '85999990001', '', 'rua a 10 centro', 'centro')
+        sem = duplicados.Registo(2, 'jose da silva', '', '', 'rua a 10 centro', 'centro')
+
+        pontuacao, _ = duplicados.pontuar(com, sem)
+        self.assertGreaterEqual(pontuacao, duplicados.LIMIAR_SUGESTAO)
+        self.assertLess(pontuacao, duplicados.LIMIAR_FUSAO_AUTOMATICA)
+
+    def test_documentos_diferentes_sao_pessoas_diferentes(self):
+        a = duplicados.Registo(1, 'jose da silva', '85999990001', '12345678900', 'rua a 10', 'centro')
+        b = duplicados.Registo(2, 'jose da silva', '85999990001', '98765432100', 'rua a 10', 'centro')
+
+        self.assertEqual(duplicados.pontuar(a, b), (0.0, ''))
@@ -0,0 +1,53 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import eventos
+from ..models import Rota, Visita
+from .utils import CACHE_LOCAL, criar_cliente
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class EventosMotoqueiroTests(TestCase):
+
+    def setUp(self):
+        self.motoqueiro = User.objects.create_user('moto', password='senha')
+        self.rota = Rota.objects.create(nome="Manhã", motoqueiro=self.motoqueiro)
+        self.client.force_login(self.motoqueiro)
+
+    def visita(self, nome, ordem=None, rota=None, **campos):
+        return Visita.objects.create(rota=rota or self.rota, cliente=criar_cliente(nome), ordem=ordem, **campos)
+
+    def test_aviso_leva_a_mesma_ordem_que_a_pagina(self):
+        tarde = Rota.objects.create(nome="Tarde", motoqueiro=self.motoqueiro)
+        self.visita("Ana Lima")
+        self.visita("Bruno Costa", ordem=2)
+        self.visita("Carla Dias", ordem=1)
+        nova = self.visita("Abel Nunes", ordem=1, rota=tarde)
+        pagina = [v.pk for v in self.client.get(reverse('home')).context['visitas']]
+
+        with mock.patch.object(eventos.backend(), 'publicar') as publicar:
+            with self.captureOnCommitCallbacks(execute=True):
+                eventos.avisar_motoqueiro(self.motoqueiro.pk, novas=[nova.pk])
+
+        publicar.assert_called_once_with(
+            eventos.canal_motoqueiro(self.motoqueiro.pk), {'novas': [nova.pk], 'removidas': [], 'ordem': pagina},
+        )
+
+    def test_sem_mudancas_nao_publica(self):
+        with mock.patch.object(eventos.backend(), 'publicar') as publicar:
+            with self.captureOnCommitCallbacks(execute=True):
+                eventos.avisar_motoqueiro(self.motoqueiro.pk)
+
+        publicar.assert_not_called()
+
+    def test_cartao_so_para_o_dono_e_visitas_pendentes(self):
+        pendente = self.visita("Ana Lima", ordem=1)
+        feita = self.visita("Bruno Costa", status='REALIZADA')
+
+        self.assertEqual(self.client.get(reverse('cartao_visita', args=[pendente.pk])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('cartao_visita', args=[feita.pk])).status_code, 404)
+        self.client.force_login(User.objects.create_user('outro'))
+        self.assertEqual(self.client.get(reverse('cartao_visita', args=[pendente.pk])).status_code, 403)
@@ -0,0 +1,94 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..fila import ORDEM_FILA, fila_disponivel, garantir_fila_do_dia, retornos_do_dia, sincronizar_fila
+from ..models import Carteira, FilaContato
+from .utils import CACHE_LOCAL, criar_cliente
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class FilaContatoTests(TestCase):
+
+    def setUp(self):
+        self.hoje = timezone.localdate()
+        self.agente = User.objects.create_user('agente', password='senha')
+        self.carteira = Carteira.objects.create(nome="Centro", agente_comercial=self.agente)
+
+    def na_carteira(self, nome, dias_desde_venda=None, **campos):
+        if dias_desde_venda is not None:
+            campos.update(data_ultima_venda=self.hoje - datetime.timedelta(days=dias_desde_venda), ciclo_consumo_dias=30)
+        cliente = criar_cliente(nome, **campos)
+        self.carteira.clientes.add(cliente)
+        return cliente
+
+    def nomes_na_fila(self, hoje=None):
+        return [item.cliente.nome for item in fila_disponivel(self.agente.id, hoje or self.hoje).order_by(*ORDEM_FILA)]
+
+    def test_ordena_por_atraso_no_ciclo_virado_e_divida(self):
+        self.na_carteira("Em dia", dias_desde_venda=5)
+        self.na_carteira("Atrasado", dias_desde_venda=40)
+        self.na_carteira("Virado", dias_desde_venda=100)
+        self.na_carteira("Sem historico")
+        self.na_carteira("Atrasado com divida", dias_desde_venda=40, divida_atual=200)
+        criar_cliente("Fora da carteira", data_ultima_venda=self.hoje - datetime.timedelta(days=40))
+
+        sincronizar_fila(self.agente.id, hoje=self.hoje)
+
+        self.assertEqual(
+            self.nomes_na_fila(), ["Atrasado com divida", "Virado", "Atrasado", "Sem historico", "Em dia"],
+        )
+
+    def test_cliente_contactado_hoje_so_volta_a_fila_amanha(self):
+        contactado = self.na_carteira("José da Silva", dias_desde_venda=40)
+        self.na_carteira("Maria Souza", dias_desde_venda=40)
+        sincronizar_fila(self.agente.id, hoje=self.hoje)
+        self.client.force_login(self.agente)
+
+        self.client.post(reverse('registrar_ligacao', args=[contactado.pk]), {'resultado': 'NAO_ATENDEU'})
+
+        self.assertEqual(self.nomes_na_fila(), ["Maria Souza"])
+        self.assertEqual(sorted(self.nomes_na_fila(self.hoje + datetime.timedelta(days=1))), ["José da Silva", "Maria Souza"])
+
+    def test_retorno_agendado_sai_da_fila_e_vence_na_data_combinada(self):
+        fora_da_carteira = criar_cliente("Maria Souza")
+        retorno = self.hoje + datetime.timedelta(days=2)
+        self.client.force_login(self.agente)
+
+        self.client.post(
+            reverse('registrar_ligacao', args=[fora_da_carteira.pk]),
+            {'resultado': 'REAGENDADO', 'data_agendamento': retorno.isoformat()},
+        )
+
+        self.assertEqual(self.nomes_na_fila(retorno), [])
+        self.assertFalse(retornos_do_dia(self.agente.id, self.hoje).exists())
+        self.assertEqual([item.cliente for item in retornos_do_dia(self.agente.id, retorno)], [fora_da_carteira])
+
+    def test_fila_so_e_refeita_no_primeiro_acesso_do_dia(self):
+        cliente = self.na_carteira("José da Silva", dias_desde_venda=27)
+        garantir_fila_do_dia(self.agente.id, self.hoje)
+        prioridade = FilaContato.objects.get().prioridade
+
+        amanha = self.hoje + datetime.timedelta(days=1)
+        garantir_fila_do_dia(self.agente.id, self.hoje)
+        self.assertEqual(FilaContato.objects.get().calculado_em, self.hoje)
+        garantir_fila_do_dia(self.agente.id, amanha)
+
+        entrada = FilaContato.objects.get()
+        self.assertEqual((entrada.cliente, entrada.calculado_em), (cliente, amanha))
+        self.assertGreater(entrada.prioridade, prioridade)
+
+    def test_sincronizar_clientes_indicados_nao_mexe_no_resto_da_fila(self):
+        self.na_carteira("José da Silva", dias_desde_venda=40)
+        removido = self.na_carteira("Maria Souza", dias_desde_venda=40)
+        sincronizar_fila(self.agente.id, hoje=self.hoje)
+        self.carteira.clientes.remove(removido)
+        FilaContato.objects.update(calculado_em=self.hoje - datetime.timedelta(days=1))
+
+        sincronizar_fila(self.agente.id, [removido.id], hoje=self.hoje)
+
+        self.assertEqual(self.nomes_na_fila(), ["José da Silva"])
+        self.assertEqual(FilaContato.objects.get().calculado_em, self.hoje - datetime.timedelta(days=1))
@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from .. import duplicados
+from ..importacao import importar_clientes_csv
+from ..models import Carteira, Cliente, ParDuplicado
+from .utils import CACHE_LOCAL, CSV_CLIENTES, arquivo_csv, criar_cliente
+
+CSV_SEM_TELEFONE = (
+    "Nome;Endereço;Número;Bairro\n"
+    "José da Silva;Rua A;10;Centro\n"
+    "Maria Souza;Rua B;20;Aldeota\n"
+    "Maria Souza;Rua B;20;Aldeota\n"
+    "Ana Lima;Rua D;40;Meireles\n"
+)
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ImportacaoClientesTests(TestCase):
+
+    def test_importa_em_lotes_sem_duplicar_o_mesmo_cliente(self):
+        lidas = []
+        resultado = importar_clientes_csv(arquivo_csv(CSV_CLIENTES), tamanho_lote=2, progresso=lidas.append)
+
+        self.assertEqual(resultado.linhas_lidas, 5)
+        self.assertEqual(resultado.criados, 3)
+        # "JOSE DA SILVA" com o mesmo telefone (sem acentos nem máscara) é o José da Silva
+        self.assertEqual(resultado.existentes, 1)
+        self.assertEqual(resultado.rejeicoes, [(5, "nome numérico")])
+        self.assertEqual(Cliente.objects.count(), 3)
+        # Um aviso por lote gravado (a linha rejeitada não ocupa lugar no lote) e o final
+        self.assertEqual(lidas, [2, 5, 5])
+
+    def test_reimportar_o_mesmo_ficheiro_nao_cria_nem_vincula_de_novo(self):
+        carteira = Carteira.objects.create(nome="Centro")
+        primeira = importar_clientes_csv(arquivo_csv(CSV_CLIENTES), carteira=carteira)
+        segunda = importar_clientes_csv(arquivo_csv(CSV_CLIENTES), carteira=carteira)
+
+        self.assertEqual((primeira.criados, primeira.vinculados), (3, 3))
+        self.assertEqual((segunda.criados, segunda.existentes, segunda.vinculados), (0, 4, 0))
+        self.assertEqual(carteira.clientes.count(), 3)
+
+    def test_cabecalho_sem_nome_e_recusado(self):
+        with self.assertRaises(ValueError):
+            importar_clientes_csv(arquivo_csv("Endereço;Telefone\nRua A;85999990001\n"))
+
+    def test_reimportar_sem_telefone_nao_duplica(self):
+        carteira = Carteira.objects.create(nome="Centro")
+        primeira = importar_clientes_csv(arquivo_csv(CSV_SEM_TELEFONE), carteira=carteira)
+        segunda = importar_clientes_csv(arquivo_csv(CSV_SEM_TELEFONE), carteira=carteira)
+
+        # A Maria Souza repetida no próprio ficheiro (mesmo endereço) é um só cliente
+        self.assertEqual((primeira.criados, primeira.existentes, primeira.vinculados), (3, 1, 3))
+        self.assertEqual((segunda.criados, segunda.existentes, segunda.vinculados), (0, 4, 0))
+        self.assertEqual(Cliente.objects.count(), 3)
+        self.assertEqual(carteira.clientes.count(), 3)
+        self.assertFalse(ParDuplicado.objects.exists())
+
+    def test_telefone_novo_no_mesmo_endereco_e_o_mesmo_cliente(self):
+        existente = criar_cliente("José da Silva", endereco="Rua A, 10")
+        resultado = importar_clientes_csv(arquivo_csv(CSV_CLIENTES))
+
+        self.assertEqual((resultado.criados, resultado.existentes), (2, 2))
+        self.assertEqual(Cliente.objects.filter(nome_busca='jose da silva').get(), existente)
+
+    def test_homonimo_sem_telefone_noutro_endereco_fica_para_rever(self):
+        existente = criar_cliente("Carlos Pereira", endereco="Rua A")
+        csv = "Nome;Endereço;Número;Bairro;Telefone\nCarlos Pereira;Rua A;10;Centro;(85) 99999-0009\n"
+        resultado = importar_clientes_csv(arquivo_csv(csv))
+
+        self.assertEqual((resultado.criados, resultado.para_rever), (1, 1))
+        novo = Cliente.objects.exclude(pk=existente.pk).get()
+        par = ParDuplicado.objects.get()
+        self.assertEqual({par.cliente_a_id, par.cliente_b_id}, {existente.pk, novo.pk})
+        self.assertLess(par.pontuacao, duplicados.LIMIAR_FUSAO_AUTOMATICA)
+
+    def test_ids_recuperados_sem_returning(self):
+        carteira = Carteira.objects.create(nome="Centro")
+        csv = "Nome;Endereço;Número;Bairro\nJosé da Silva;Rua A;10;Centro\nJosé da Silva;Rua C;30;Centro\n"
+        sem_returning = mock.patch.object(
+            type(connection.features), 'can_return_rows_from_bulk_insert', new_callable=mock.PropertyMock, return_value=False,
+        )
+        with sem_returning:
+            resultado = importar_clientes_csv(arquivo_csv(csv), carteira=carteira)
+
+        # Dois homónimos sem telefone em endereços diferentes: cada um com o seu id na carteira
+        self.assertEqual((resultado.criados, resultado.vinculados), (2, 2))
+        self.assertEqual(set(carteira.clientes.values_list('id', flat=True)), set(Cliente.objects.values_list('id', flat=True)))
@@ -0,0 +1,94 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import Cliente, Rota, Visita
+from ..paginacao import codificar_cursor, decodificar_cursor, paginar_por_cursor
+from ..views import ORDEM_CLIENTES, ORDEM_HISTORICO_VISITAS
+from .utils import CACHE_LOCAL, criar_cliente
+
+
+def todas_as_paginas(queryset, ordenacao, tamanho):
+    paginas, cursor = [], None
+    while True:
+        pagina = paginar_por_cursor(queryset, ordenacao, cursor=cursor, tamanho=tamanho)
+        paginas.append([item.id for item in pagina])
+        if not pagina.tem_mais:
+            return paginas
+        cursor = pagina.proximo_cursor
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class PaginacaoPorCursorTests(TestCase):
+
+    def setUp(self):
+        self.rota = Rota.objects.create(nome="Rota", motoqueiro=User.objects.create_user('moto'))
+        self.cliente = criar_cliente("José da Silva")
+        agora = timezone.now().replace(microsecond=0)
+        # Várias visitas com a mesma hora: o desempate pelo id não pode repetir nem saltar linhas
+        for minutos in (0, 0, 0, 5, 5, 10, 20):
+            Visita.objects.create(rota=self.rota, cliente=self.cliente, data_visita=agora - datetime.timedelta(minutes=minutos))
+
+    def test_percorre_todas_as_linhas_na_ordem_sem_repetir_nem_saltar(self):
+        esperado = list(Visita.objects.order_by(*ORDEM_HISTORICO_VISITAS).values_list('id', flat=True))
+
+        paginas = todas_as_paginas(Visita.objects.all(), ORDEM_HISTORICO_VISITAS, tamanho=2)
+
+        self.assertEqual([len(pagina) for pagina in paginas], [2, 2, 2, 1])
+        self.assertEqual(sum(paginas, []), esperado)
+
+    def test_ordenacao_ascendente_por_varios_campos(self):
+        for nome, bairro in (("Ana", "Centro"), ("Ana", "Aldeota"), ("Bruno", "Aldeota"), ("Ana", "Centro")):
+            criar_cliente(nome, bairro=bairro)
+        esperado = list(Cliente.objects.order_by(*ORDEM_CLIENTES).values_list('id', flat=True))
+
+        self.assertEqual(sum(todas_as_paginas(Cliente.objects.all(), ORDEM_CLIENTES, tamanho=3), []), esperado)
+
+    def test_pagina_exata_nao_anuncia_pagina_seguinte(self):
+        pagina = paginar_por_cursor(Visita.objects.all(), ORDEM_HISTORICO_VISITAS, tamanho=7)
+
+        self.assertEqual(len(pagina), 7)
+        self.assertFalse(pagina.tem_mais)
+
+    def test_cursor_corrompido_ou_de_outra_ordenacao_volta_a_primeira_pagina(self):
+        primeira = [v.id for v in paginar_por_cursor(Visita.objects.all(), ORDEM_HISTORICO_VISITAS, tamanho=3)]
+
+        for cursor in ('nao-e-base64!', codificar_cursor([1])):
+            with self.subTest(cursor=cursor):
+                pagina = paginar_por_cursor(Visita.objects.all(), ORDEM_HISTORICO_VISITAS, cursor=cursor, tamanho=3)
+                self.assertEqual([v.id for v in pagina], primeira)
+
+    def test_cursor_preserva_datas_e_textos(self):
+        valores = [timezone.now().isoformat(), "Maria Souza", 42]
+
+        self.assertEqual(decodificar_cursor(codificar_cursor(valores)), valores)
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class FragmentosPaginadosTests(TestCase):
+
+    def setUp(self):
+        rota = Rota.objects.create(nome="Rota", motoqueiro=User.objects.create_user('moto'))
+        cliente = criar_cliente("José da Silva")
+        Visita.objects.bulk_create(Visita(rota=rota, cliente=cliente) for _ in range(60))
+        self.gerente = User.objects.create_user('gerente', is_staff=True)
+
+    def test_fragmento_do_historico_continua_onde_o_dashboard_parou(self):
+        self.client.force_login(self.gerente)
+        pagina = paginar_por_cursor(Visita.objects.all(), ORDEM_HISTORICO_VISITAS)
+
+        resposta = self.client.get(reverse('dashboard_historico'), {'cursor': pagina.proximo_cursor})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.context['historico']), 10)
+        self.assertIsNone(resposta.context['url_mais_historico'])
+
+    def test_fragmentos_respondem_403_a_quem_nao_e_gerente(self):
+        self.client.force_login(User.objects.create_user('agente'))
+
+        self.assertEqual(self.client.get(reverse('dashboard_historico')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('auditoria_ligacoes')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('tarefa_estado', args=[1])).status_code, 403)
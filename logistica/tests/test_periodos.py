@@ -0,0 +1,60 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from ..models import Rota, Visita
+from ..periodos import filtro_periodo, ler_periodo, limites_periodo
+from .utils import CACHE_LOCAL, criar_cliente
+
+
+def local(*args):
+    return timezone.make_aware(datetime.datetime(*args))
+
+
+class LimitesPeriodoTests(SimpleTestCase):
+
+    def test_periodo_de_um_dia_vai_da_meia_noite_local_a_meia_noite_seguinte(self):
+        inicio, fim = limites_periodo(datetime.date(2026, 3, 10))
+
+        self.assertEqual((inicio, fim), (local(2026, 3, 10), local(2026, 3, 11)))
+        # Fortaleza está a UTC-3: o dia local começa às 03:00 UTC
+        self.assertEqual(inicio.astimezone(datetime.timezone.utc).hour, 3)
+
+    def test_filtro_usa_limites_semiabertos_sobre_o_proprio_campo(self):
+        self.assertEqual(
+            filtro_periodo('data_visita', datetime.date(2026, 3, 10), datetime.date(2026, 3, 12)),
+            {'data_visita__gte': local(2026, 3, 10), 'data_visita__lt': local(2026, 3, 13)},
+        )
+
+    def test_ler_periodo_troca_datas_invertidas_e_ignora_datas_invalidas(self):
+        fabrica = RequestFactory()
+        hoje = timezone.localdate()
+
+        self.assertEqual(
+            ler_periodo(fabrica.get('/', {'data_inicio': '2026-03-12', 'data_fim': '2026-03-10'})),
+            (datetime.date(2026, 3, 10), datetime.date(2026, 3, 12)),
+        )
+        self.assertEqual(ler_periodo(fabrica.get('/', {'data_inicio': '12/03/2026'})), (hoje, hoje))
+        self.assertEqual(ler_periodo(fabrica.get('/')), (hoje, hoje))
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class FiltroPeriodoConsultaTests(TestCase):
+
+    def test_filtra_pelo_dia_local_e_nao_pelo_dia_utc(self):
+        rota = Rota.objects.create(nome="Rota", motoqueiro=User.objects.create_user('moto'))
+        cliente = criar_cliente("José da Silva")
+        momentos = {
+            'vespera': local(2026, 3, 9, 23, 59),
+            'abertura': local(2026, 3, 10, 0, 0),
+            'noite': local(2026, 3, 10, 22, 30),  # já é dia 11 em UTC
+            'dia_seguinte': local(2026, 3, 11, 0, 0),
+        }
+        for momento in momentos.values():
+            Visita.objects.create(rota=rota, cliente=cliente, data_visita=momento)
+
+        do_dia = Visita.objects.filter(**filtro_periodo('data_visita', datetime.date(2026, 3, 10)))
+
+        self.assertEqual(sorted(do_dia.values_list('data_visita', flat=True)), [momentos['abertura'], momentos['noite']])
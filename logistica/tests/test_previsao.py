@@ -0,0 +1,84 @@
+import datetime
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .. import previsao
+from ..models import Carteira, PropostaVisita, Rota, Visita
+from .utils import CACHE_LOCAL, criar_cliente
+
+
+def momento_do_dia(dia, hora=10):
+    return timezone.make_aware(datetime.datetime.combine(dia, datetime.time(hora)))
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class PrevisaoTests(TestCase):
+
+    def setUp(self):
+        self.hoje = timezone.localdate()
+        self.amanha = self.hoje + datetime.timedelta(days=1)
+        self.motoqueiro = User.objects.create_user('moto')
+        self.rota = Rota.objects.create(nome="Histórico", motoqueiro=self.motoqueiro)
+        self.carteira = Carteira.objects.create(nome="Centro", motoqueiro=self.motoqueiro)
+
+    def com_compras(self, nome, ultima, ciclo=10, compras=6, carteira=True):
+        """Cliente que comprou de `ciclo` em `ciclo` dias até `ultima`."""
+        cliente = criar_cliente(nome, data_ultima_venda=ultima, ciclo_consumo_dias=ciclo)
+        for i in range(compras):
+            dia = ultima - datetime.timedelta(days=ciclo * i)
+            Visita.objects.create(rota=self.rota, cliente=cliente, status='REALIZADA', data_visita=momento_do_dia(dia))
+        if carteira:
+            self.carteira.clientes.add(cliente)
+        return cliente
+
+    def test_propoe_quem_ja_precisa_ate_a_capacidade(self):
+        atrasado = self.com_compras("Ana Lima", self.hoje - datetime.timedelta(days=12))
+        devido = self.com_compras("Bruno Costa", self.hoje - datetime.timedelta(days=10))
+        tambem_devido = self.com_compras("Carla Dias", self.hoje - datetime.timedelta(days=10))
+        recente = self.com_compras("Davi Rocha", self.hoje - datetime.timedelta(days=1))
+        em_rota = self.com_compras("Elisa Melo", self.hoje - datetime.timedelta(days=10))
+        Visita.objects.create(rota=self.rota, cliente=em_rota)
+        sem_motoqueiro = self.com_compras("Fabio Reis", self.hoje - datetime.timedelta(days=10), carteira=False)
+
+        proposta = previsao.propor(self.amanha, capacidade=2)
+
+        propostos = [linha['cliente_id'] for linha in proposta.linhas]
+        self.assertEqual(len(propostos), 2)
+        self.assertTrue(set(propostos) <= {atrasado.pk, devido.pk, tambem_devido.pk})
+        # O mais atrasado tem a maior probabilidade: vem primeiro
+        self.assertEqual(propostos[0], atrasado.pk)
+        self.assertEqual([linha['posicao'] for linha in proposta.linhas], [1, 2])
+        self.assertNotIn(recente.pk, propostos)
+        self.assertNotIn(sem_motoqueiro.pk, propostos)
+        self.assertEqual(proposta.em_rota, 1)
+        self.assertEqual(proposta.sem_motoqueiro, 1)
+        self.assertEqual(proposta.por_motoqueiro(), {self.motoqueiro.pk: (3, 2)})
+
+    def test_gravar_substitui_a_proposta_do_dia(self):
+        self.com_compras("Ana Lima", self.hoje - datetime.timedelta(days=12))
+        self.com_compras("Bruno Costa", self.hoje - datetime.timedelta(days=10))
+
+        self.assertEqual(previsao.gravar(previsao.propor(self.amanha, capacidade=5)), 2)
+        self.assertEqual(previsao.gravar(previsao.propor(self.amanha, capacidade=1)), 1)
+        self.assertEqual(PropostaVisita.objects.filter(dia=self.amanha).count(), 1)
+
+    def test_capacidade_invalida(self):
+        with self.assertRaises(ValueError):
+            previsao.propor(self.amanha, capacidade=0)
+
+    def test_ciclo_estimado_pelas_compras(self):
+        # Um cliente compra de 10 em 10 dias com um ciclo cadastrado de 30; o outro nunca comprou
+        base = datetime.date(2026, 1, 5).toordinal()
+        compras = np.array([base + 10 * i for i in range(10)], dtype=np.int64)
+        modelo = previsao.ajustar(
+            [1, 2], [compras[-1], base], [30, 30],
+            np.ones(len(compras), dtype=np.int64), compras,
+        )
+
+        self.assertEqual(modelo.ultima_compra[0], compras[-1])
+        self.assertAlmostEqual(modelo.ciclo[0], 12, delta=1.5)
+        self.assertEqual(modelo.ciclo[1], 30)
+        self.assertGreater(modelo.confianca[0], modelo.confianca[1])
@@ -0,0 +1,143 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..models import (
+    Ligacao, ObservacaoConcorrente, ResumoDiarioConcorrencia, ResumoDiarioLigacoes, ResumoDiarioPrecoConcorrente,
+    ResumoDiarioVisitas, Rota, Visita,
+)
+from ..resumos import reconstruir_resumos
+from .utils import CACHE_LOCAL, criar_cliente
+
+
+def resumos_atuais():
+    """As linhas com movimento de todos os resumos (uma linha a zero é o mesmo que não existir)."""
+    return (
+        sorted(ResumoDiarioVisitas.objects.exclude(quantidade=0).values_list('dia', 'motoqueiro_id', 'status', 'motivo_nao_venda', 'quantidade', 'valor_recebido')),
+        sorted(ResumoDiarioLigacoes.objects.exclude(quantidade=0).values_list('dia', 'agente_id', 'resultado', 'motivo_nao_venda', 'quantidade')),
+        sorted(ResumoDiarioConcorrencia.objects.exclude(quantidade=0).values_list('dia', 'origem', 'concorrente_empresa', 'quantidade')),
+        sorted(ResumoDiarioPrecoConcorrente.objects.exclude(quantidade=0).values_list('dia', 'concorrente', 'bairro', 'quantidade', 'com_preco')),
+    )
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ResumosDiariosTests(TestCase):
+
+    def setUp(self):
+        self.agente = User.objects.create_user('agente', password='senha')
+        self.motoqueiro = User.objects.create_user('moto', password='senha')
+        self.cliente = criar_cliente("José da Silva", "(85) 99999-0001")
+
+    def assertResumosCorretos(self):
+        """Os resumos mantidos operação a operação são os que a reconstrução a partir do histórico calcula."""
+        mantidos = resumos_atuais()
+        reconstruir_resumos(datetime.date(2000, 1, 1), datetime.date(2100, 1, 1))
+        self.assertEqual(mantidos, resumos_atuais())
+
+    def ligar(self, cliente=None, **campos):
+        self.client.force_login(self.agente)
+        self.client.post(reverse('registrar_ligacao', args=[(cliente or self.cliente).pk]), campos)
+
+    def vender(self, cliente=None):
+        """Ligação com venda fechada, despachada para o motoqueiro; devolve a visita pendente."""
+        self.ligar(cliente, resultado='VENDA_FECHADA', motoqueiro_id=self.motoqueiro.pk, valor_venda='110,00')
+        return Visita.objects.filter(cliente=cliente or self.cliente).latest('id')
+
+    def recusar_por_concorrencia(self, cliente=None):
+        self.ligar(cliente, resultado='RECUSA', motivo_nao_venda='CONCORRENCIA', concorrente_empresa='Gás Rival', concorrente_preco='98,50')
+
+    def dar_baixa(self, visita, **campos):
+        self.client.force_login(self.motoqueiro)
+        self.client.post(reverse('registrar_visita', args=[visita.pk]), campos)
+
+    def test_venda_por_telefone_soma_a_ligacao_e_a_visita_despachada(self):
+        self.vender()
+
+        ligacoes = ResumoDiarioLigacoes.objects.get()
+        self.assertEqual((ligacoes.agente, ligacoes.resultado, ligacoes.quantidade), (self.agente, 'VENDA_FECHADA', 1))
+        visitas = ResumoDiarioVisitas.objects.get()
+        self.assertEqual((visitas.motoqueiro, visitas.status, visitas.quantidade), (self.motoqueiro, 'PENDENTE', 1))
+        self.assertResumosCorretos()
+
+    def test_baixa_passa_a_visita_de_pendente_para_realizada(self):
+        self.dar_baixa(self.vender(), resultado_venda='SIM', valor_recebido='110,00')
+
+        self.assertEqual(ResumoDiarioVisitas.objects.get(status='PENDENTE').quantidade, 0)
+        realizada = ResumoDiarioVisitas.objects.get(status='REALIZADA')
+        self.assertEqual((realizada.quantidade, str(realizada.valor_recebido)), (1, '110.00'))
+        self.assertResumosCorretos()
+
+    def test_recusa_por_concorrencia_soma_o_concorrente_e_o_preco(self):
+        self.recusar_por_concorrencia()
+        self.dar_baixa(self.vender(criar_cliente("Maria Souza")), resultado_venda='NAO', motivo_nao_venda='CONCORRENCIA',
+                       concorrente_empresa='Gás Rival', concorrente_preco='97,00')
+
+        self.assertEqual(
+            sorted(ResumoDiarioConcorrencia.objects.values_list('origem', 'quantidade')), [('LIGACAO', 1), ('VISITA', 1)],
+        )
+        precos = ResumoDiarioPrecoConcorrente.objects.get()
+        self.assertEqual((precos.quantidade, precos.com_preco, str(precos.preco_minimo)), (2, 2, '97.00'))
+        self.assertResumosCorretos()
+
+    def test_excluir_uma_visita_ou_ligacao_retira_a_dos_resumos(self):
+        visita = self.vender()
+        self.recusar_por_concorrencia()
+
+        visita.delete()
+        Ligacao.objects.get(resultado='RECUSA').delete()
+
+        self.assertEqual(ResumoDiarioVisitas.objects.get().quantidade, 0)
+        self.assertEqual(ResumoDiarioConcorrencia.objects.get().quantidade, 0)
+        self.assertEqual(ResumoDiarioPrecoConcorrente.objects.get().quantidade, 0)
+        self.assertResumosCorretos()
+
+    def test_excluir_o_cliente_retira_todo_o_historico_dele(self):
+        outro = criar_cliente("Maria Souza")
+        self.dar_baixa(self.vender(), resultado_venda='SIM', valor_recebido='110,00')
+        self.recusar_por_concorrencia()
+        self.vender(outro)
+
+        self.cliente.delete()
+
+        self.assertEqual(ResumoDiarioLigacoes.objects.filter(quantidade__gt=0).get().resultado, 'VENDA_FECHADA')
+        self.assertFalse(ObservacaoConcorrente.objects.exists())
+        self.assertResumosCorretos()
+
+    def test_exclusoes_em_cascata_e_por_queryset(self):
+        for nome in ("Ana Lima", "Bruno Costa", "Carla Dias"):
+            cliente = criar_cliente(nome)
+            self.vender(cliente)
+            self.recusar_por_concorrencia(cliente)
+        self.dar_baixa(Visita.objects.first(), resultado_venda='NAO', motivo_nao_venda='CONCORRENCIA', concorrente_empresa='Gás Rival')
+
+        Visita.objects.filter(pk=Visita.objects.last().pk).delete()
+        self.assertResumosCorretos()
+        Rota.objects.get().delete()
+        self.assertResumosCorretos()
+        self.agente.delete()
+        self.assertResumosCorretos()
+        self.assertFalse(ResumoDiarioConcorrencia.objects.filter(quantidade__gt=0).exists())
+
+    def test_a_mesma_queryset_pode_excluir_duas_vezes(self):
+        visitas = Visita.objects.filter(cliente=self.cliente)
+        self.vender()
+        visitas.delete()
+        self.vender()
+        visitas.delete()
+
+        self.assertEqual(ResumoDiarioVisitas.objects.get().quantidade, 0)
+        self.assertResumosCorretos()
+
+    def test_reconstrucao_refaz_os_resumos_apagados(self):
+        self.dar_baixa(self.vender(), resultado_venda='SIM', valor_recebido='110,00')
+        self.recusar_por_concorrencia()
+        antes = resumos_atuais()
+        for modelo in (ResumoDiarioVisitas, ResumoDiarioLigacoes, ResumoDiarioConcorrencia, ResumoDiarioPrecoConcorrente):
+            modelo.objects.all().delete()
+
+        totais = reconstruir_resumos(datetime.date(2000, 1, 1), datetime.date(2100, 1, 1))
+
+        self.assertEqual(resumos_atuais(), antes)
+        self.assertEqual(totais, {'visitas': 1, 'ligacoes': 2, 'concorrencia': 1, 'precos_concorrencia': 1})
@@ -0,0 +1,43 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import Rota, Visita
+from .utils import CACHE_LOCAL, criar_cliente
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class OrdemParagensTests(TestCase):
+
+    def setUp(self):
+        self.motoqueiro = User.objects.create_user('moto', password='senha')
+        self.client.force_login(self.motoqueiro)
+
+    def visita(self, rota, nome, ordem=None, **campos):
+        return Visita.objects.create(rota=rota, cliente=criar_cliente(nome), ordem=ordem, **campos)
+
+    def test_lista_do_dia_segue_a_rota_e_a_ordem_calculada(self):
+        manha = Rota.objects.create(nome="Manhã", motoqueiro=self.motoqueiro)
+        tarde = Rota.objects.create(nome="Tarde", motoqueiro=self.motoqueiro)
+        sem_ordem = self.visita(manha, "Ana Lima")
+        segunda = self.visita(manha, "Bruno Costa", ordem=2)
+        primeira = self.visita(manha, "Carla Dias", ordem=1)
+        da_tarde = self.visita(tarde, "Abel Nunes", ordem=1)
+        self.visita(manha, "Feita", status='REALIZADA')
+
+        resposta = self.client.get(reverse('home'))
+
+        # Cada rota numera as paragens a partir de 1: a da tarde não se intercala com a da manhã
+        self.assertEqual([v.pk for v in resposta.context['visitas']], [primeira.pk, segunda.pk, sem_ordem.pk, da_tarde.pk])
+
+    def test_rotas_de_outros_dias_nao_entram(self):
+        ontem = Rota.objects.create(nome="Ontem", motoqueiro=self.motoqueiro)
+        Rota.objects.filter(pk=ontem.pk).update(data_criacao=timezone.now() - datetime.timedelta(days=1))
+        self.visita(ontem, "Ana Lima", ordem=1)
+
+        resposta = self.client.get(reverse('home'))
+
+        self.assertEqual(list(resposta.context['visitas']), [])
@@ -0,0 +1,96 @@
+import json
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import sincronizacao
+from ..models import BaixaSincronizada, ResumoDiarioVisitas, Rota, Visita
+from .utils import CACHE_LOCAL, criar_cliente
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class SincronizacaoBaixasTests(TestCase):
+
+    def setUp(self):
+        self.motoqueiro = User.objects.create_user('moto', password='senha')
+        self.cliente = criar_cliente("José da Silva", "(85) 99999-0001")
+        self.rota = Rota.objects.create(nome="Rota do dia", motoqueiro=self.motoqueiro)
+        self.visita = Visita.objects.create(rota=self.rota, cliente=self.cliente)
+
+    def baixa(self, chave='a1', **campos):
+        return {'chave': chave, 'visita': self.visita.pk, 'resultado_venda': 'SIM', 'valor_recebido': '110,00', **campos}
+
+    def test_lote_reenviado_nao_aplica_duas_vezes(self):
+        primeiro = sincronizacao.aplicar_lote(self.motoqueiro, [self.baixa()])
+        segundo = sincronizacao.aplicar_lote(self.motoqueiro, [self.baixa()])
+
+        self.assertEqual(primeiro[0]['estado'], 'aplicada')
+        self.assertEqual(segundo[0], {'chave': 'a1', 'estado': 'repetida'})
+        self.visita.refresh_from_db()
+        self.cliente.refresh_from_db()
+        self.assertEqual(self.visita.status, 'REALIZADA')
+        self.assertEqual(len(self.cliente.historico_compras), 1)
+        self.assertEqual(BaixaSincronizada.objects.count(), 1)
+        resumo = ResumoDiarioVisitas.objects.get(motoqueiro=self.motoqueiro, status='REALIZADA')
+        self.assertEqual(resumo.quantidade, 1)
+        self.assertEqual(str(resumo.valor_recebido), '110.00')
+
+    def test_chave_repetida_no_mesmo_lote_so_conta_uma_vez(self):
+        resultados = sincronizacao.aplicar_lote(self.motoqueiro, [self.baixa(), self.baixa()])
+
+        self.assertEqual([r['estado'] for r in resultados], ['aplicada', 'repetida'])
+        self.assertEqual(ResumoDiarioVisitas.objects.get(status='REALIZADA').quantidade, 1)
+
+    def test_outra_chave_para_visita_ja_finalizada_e_rejeitada(self):
+        sincronizacao.aplicar_lote(self.motoqueiro, [self.baixa('a1')])
+        resultados = sincronizacao.aplicar_lote(self.motoqueiro, [self.baixa('a2', valor_recebido='90,00')])
+
+        self.assertEqual(resultados[0], {'chave': 'a2', 'estado': 'rejeitada', 'erro': 'visita já finalizada'})
+        self.cliente.refresh_from_db()
+        self.assertEqual(len(self.cliente.historico_compras), 1)
+        self.assertFalse(BaixaSincronizada.objects.filter(chave='a2').exists())
+        self.assertEqual(str(ResumoDiarioVisitas.objects.get(status='REALIZADA').valor_recebido), '110.00')
+
+    def test_corrigir_uma_venda_ja_registada_nao_conta_outra_compra(self):
+        sincronizacao.aplicar_baixa(self.visita, True, valor_recebido=Decimal('110.00'))
+        sincronizacao.aplicar_baixa(self.visita, True, valor_recebido=Decimal('100.00'))
+
+        self.cliente.refresh_from_db()
+        self.assertEqual(len(self.cliente.historico_compras), 1)
+        resumo = ResumoDiarioVisitas.objects.get(status='REALIZADA')
+        self.assertEqual((resumo.quantidade, str(resumo.valor_recebido)), (1, '100.00'))
+
+    def test_item_invalido_nao_trava_os_outros(self):
+        outra = Visita.objects.create(rota=self.rota, cliente=criar_cliente("Maria Souza", "(85) 99999-0002"))
+        resultados = sincronizacao.aplicar_lote(self.motoqueiro, [
+            self.baixa('a1', resultado_venda='TALVEZ'),
+            {'chave': 'a2', 'visita': outra.pk, 'resultado_venda': 'NAO', 'motivo_nao_venda': 'SEM_DINHEIRO'},
+        ])
+
+        self.assertEqual([r['estado'] for r in resultados], ['rejeitada', 'aplicada'])
+        self.visita.refresh_from_db()
+        self.assertEqual(self.visita.status, 'PENDENTE')
+        self.assertFalse(BaixaSincronizada.objects.filter(chave='a1').exists())
+
+    def test_visita_de_outro_motoqueiro_e_rejeitada(self):
+        outro = User.objects.create_user('outro')
+        resultados = sincronizacao.aplicar_lote(outro, [self.baixa()])
+
+        self.assertEqual(resultados[0]['estado'], 'rejeitada')
+        self.visita.refresh_from_db()
+        self.assertEqual(self.visita.status, 'PENDENTE')
+
+    def test_endpoint_devolve_o_resultado_de_cada_baixa(self):
+        self.client.force_login(self.motoqueiro)
+        url = reverse('sincronizar_baixas')
+        corpo = json.dumps({'baixas': [self.baixa()]})
+
+        primeira = self.client.post(url, corpo, content_type='application/json')
+        segunda = self.client.post(url, corpo, content_type='application/json')
+
+        self.assertEqual(primeira.status_code, 200)
+        self.assertEqual(primeira.json()['resultados'][0]['estado'], 'aplicada')
+        self.assertEqual(segunda.json()['resultados'][0]['estado'], 'repetida')
+        self.assertEqual(self.client.post(url, '[]', content_type='application/json').status_code, 400)
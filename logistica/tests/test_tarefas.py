@@ -0,0 +1,95 @@
+import shutil
+import signal
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .. import tarefas
+from ..models import Carteira, Tarefa
+from .utils import CACHE_LOCAL, CSV_CLIENTES, arquivo_csv, criar_cliente
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class TarefaImportacaoTests(TransactionTestCase):
+    """A importação pela fila, como o processar_tarefas a corre (fora de uma transação)."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        configuracao = override_settings(MEDIA_ROOT=media)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.gerente = User.objects.create_user('gerente', is_staff=True)
+
+    def executar(self, tarefa_id):
+        # O worker ignora SIGINT/SIGTERM nos processos do pool: o processo dos testes volta a ouvi-los
+        anteriores = signal.getsignal(signal.SIGINT), signal.getsignal(signal.SIGTERM)
+        try:
+            return tarefas.executar(tarefa_id)
+        finally:
+            signal.signal(signal.SIGINT, anteriores[0])
+            signal.signal(signal.SIGTERM, anteriores[1])
+
+    def test_importa_o_ficheiro_do_storage_e_apaga_o_no_fim(self):
+        carteira = Carteira.objects.create(nome="Centro")
+        tarefa = tarefas.enfileirar(
+            'IMPORTAR_CLIENTES', "Importação de clientes.csv", criada_por=self.gerente,
+            parametros={'carteira_id': carteira.pk},
+            arquivo=arquivo_csv(CSV_CLIENTES),
+        )
+        nome = tarefa.arquivo.name
+        self.assertTrue(default_storage.exists(nome))
+
+        self.assertEqual(tarefas.reservar(), tarefa.pk)
+        self.assertTrue(self.executar(tarefa.pk))
+
+        tarefa.refresh_from_db()
+        self.assertEqual(tarefa.estado, tarefas.ESTADO_CONCLUIDA)
+        self.assertEqual(tarefa.resultado['criados'], 3)
+        self.assertEqual(tarefa.resultado['vinculados'], 3)
+        self.assertEqual(tarefa.resultado['total_rejeicoes'], 1)
+        self.assertFalse(tarefa.arquivo)
+        self.assertFalse(default_storage.exists(nome))
+        self.assertEqual(carteira.clientes.count(), 3)
+        # Os clientes novos seguem para a geocodificação
+        self.assertTrue(Tarefa.objects.filter(tipo='GEOCODIFICAR', estado=tarefas.ESTADO_PENDENTE).exists())
+
+    def test_importacoes_correm_uma_de_cada_vez(self):
+        primeira = tarefas.enfileirar('IMPORTAR_CLIENTES', "a", arquivo=arquivo_csv(CSV_CLIENTES, 'a.csv'))
+        tarefas.enfileirar('IMPORTAR_CLIENTES', "b", arquivo=arquivo_csv(CSV_CLIENTES, 'b.csv'))
+
+        self.assertEqual(tarefas.reservar(), primeira.pk)
+        self.assertIsNone(tarefas.reservar())
+
+    def test_ficheiro_invalido_falha_a_tarefa_e_apaga_o_ficheiro(self):
+        tarefa = tarefas.enfileirar('IMPORTAR_CLIENTES', "x", arquivo=arquivo_csv("Endereço\nRua A\n", 'x.csv'))
+        nome = tarefa.arquivo.name
+
+        tarefas.reservar()
+        with self.assertLogs('logistica.tarefas', 'ERROR'):
+            self.assertFalse(self.executar(tarefa.pk))
+
+        tarefa.refresh_from_db()
+        self.assertEqual(tarefa.estado, tarefas.ESTADO_FALHOU)
+        self.assertFalse(default_storage.exists(nome))
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class GeocodificacaoNaFichaTests(TestCase):
+
+    def test_endereco_alterado_na_ficha_pede_a_geocodificacao_so_desse_cliente(self):
+        cliente = criar_cliente("José da Silva", latitude=-3.73, longitude=-38.52, geocodificacao='APROXIMADA')
+        criar_cliente("Maria Souza")
+        self.client.force_login(User.objects.create_user('gerente', is_staff=True))
+
+        self.client.post(reverse('detalhes_cliente', args=[cliente.id]), {
+            'acao': 'editar', 'nome': cliente.nome, 'endereco': 'Av. Beira Mar, 500', 'bairro': 'Meireles',
+        })
+
+        cliente.refresh_from_db()
+        self.assertIsNone(cliente.latitude)
+        tarefa = Tarefa.objects.get(tipo='GEOCODIFICAR')
+        self.assertEqual(tarefa.parametros, {'clientes_ids': [cliente.id]})
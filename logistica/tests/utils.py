@@ -0,0 +1,25 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from ..models import Cliente
+
+# Cache em memória: os testes não escrevem no var/cache do projeto nem veem o de outra execução
+CACHE_LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+CSV_CLIENTES = (
+    "Nome;Endereço;Número;Bairro;Telefone\n"
+    "José da Silva;Rua A;10;Centro;(85) 99999-0001\n"
+    "Maria Souza;Rua B;20;Aldeota;(85) 99999-0002\n"
+    "JOSE DA SILVA;Rua A;10;Centro;85 99999-0001\n"
+    "12345;Rua C;30;Centro;(85) 99999-0003\n"
+    "Ana Lima;Rua D;40;Meireles;(85) 99999-0004\n"
+)
+
+
+def criar_cliente(nome, telefone='', **campos):
+    campos.setdefault('endereco', 'Rua das Flores, 100')
+    campos.setdefault('bairro', 'Centro')
+    return Cliente.objects.create(nome=nome, telefone=telefone, **campos)
+
+
+def arquivo_csv(texto, nome='clientes.csv'):
+    return SimpleUploadedFile(nome, texto.encode('utf-8'))
@@ -1,11 +1,16 @@
+import asyncio
 import datetime
-import csv
-import io
-import statistics
+import hmac
 import json
 from decimal import Decimal, InvalidOperation
 
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_POST
+from asgiref.sync import sync_to_async
+from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.db.models import Sum, Count, Q
@@ -14,13 +19,44 @@ from django.db import transaction
 from django.contrib import messages
 
 # Importações dos Models locais
-from .models import Visita, Cliente, Rota, Carteira, Ligacao
+from .models import (
+    Visita, Cliente, Rota, Carteira, Ligacao, Tarefa,
+    ResumoDiarioVisitas, ResumoDiarioLigacoes, ResumoDiarioConcorrencia,
+)
+from .periodos import filtro_periodo, ler_periodo
+from .paginacao import paginar_por_cursor, url_proxima_pagina
+from . import busca, chamadas, duplicados, eventos, exportacao, metricas, referencias, sincronizacao, tarefas
+from .sincronizacao import aplicar_baixa
+from .roteirizacao import ORDEM_PARAGENS, sequenciar_rota, ultimo_checkin
+from .geo import tem_coordenadas
+from .normalizacao import limpar_telefone
+from .assincrono import em_paralelo, renderizar, utilizador
+from . import territorios
+from .resumos import contabilizar_visitas_criadas, contabilizar_ligacao, tendencia_precos
+from .fila import (
+    FILA_POR_PAGINA, ORDEM_FILA, fila_disponivel, retornos_do_dia,
+    garantir_fila_do_dia, sincronizar_fila,
+)
 
 # --- CONSTANTES DE STATUS ---
 STATUS_PENDENTE = 'PENDENTE'
 STATUS_REALIZADA = 'REALIZADA'
 STATUS_NAO_VENDA = 'NAO_VENDA'
 
+# --- PROXIMIDADE (Mesa de Planeamento) ---
+RAIOS_PROXIMIDADE_M = (300, 500, 1000, 2000, 5000)
+RAIO_PROXIMIDADE_PADRAO_M = 1000
+
+# --- CONCORRÊNCIA (tendência de preços) ---
+SEMANAS_TENDENCIA_PRECOS = 12
+
+# --- PAGINAÇÃO ---
+CLIENTES_POR_PAGINA = 200
+ORDEM_HISTORICO_VISITAS = ('-data_visita', '-id')
+ORDEM_HISTORICO_LIGACOES = ('-data_ligacao', '-id')
+ORDEM_CLIENTES = ('bairro', 'nome', 'id')
+GRUPOS_DUPLICADOS_POR_PAGINA = 50
+
 # ==============================================================================
 # FUNÇÕES UTILITÁRIAS E INTELIGÊNCIA
 # ==============================================================================
@@ -37,30 +73,35 @@ def converter_valor(valor_str):
     except (InvalidOperation, ValueError):
         return Decimal('0.00')
 
-def atualizar_inteligencia_consumo(cliente):
-    """Calcula a mediana de dias entre compras para inteligência de IA."""
-    
-    # Aumentamos para as últimas 10 compras para ter uma amostragem sólida para a mediana
-    historico = Visita.objects.filter(
-        cliente=cliente, 
-        status=STATUS_REALIZADA
-    ).order_by('-data_visita')[:10]
-
-    # Nova Regra: Só começa a mapear após a 3ª compra (mínimo de 2 intervalos)
-    if len(historico) >= 3:
-        intervalos = []
-        for i in range(len(historico) - 1):
-            delta = (historico[i].data_visita.date() - historico[i+1].data_visita.date()).days
-            if delta > 0: 
-                intervalos.append(delta)
-        
-        if intervalos:
-            # Usa a Mediana (ignora compras anormais/churrascos) e arredonda para dias inteiros
-            cliente.ciclo_consumo_dias = int(statistics.median(intervalos))
-    
-    # A data da última venda atualiza sempre, independentemente da quantidade de compras
-    cliente.data_ultima_venda = timezone.now().date()
-    cliente.save()
+def ler_filtro_proximidade(request):
+    """
+    Lê o filtro "perto de" da Mesa de Planeamento: ?ponto=lat,lng ou ?perto_motoqueiro=<id>
+    (último check-in GPS do motoqueiro) e ?raio=<metros>. Devolve ((lat, lng) ou None, raio).
+    """
+    try:
+        raio = int(request.GET.get('raio') or RAIO_PROXIMIDADE_PADRAO_M)
+    except ValueError:
+        raio = RAIO_PROXIMIDADE_PADRAO_M
+    if raio not in RAIOS_PROXIMIDADE_M:
+        raio = RAIO_PROXIMIDADE_PADRAO_M
+
+    texto_ponto = (request.GET.get('ponto') or '').strip()
+    motoqueiro_id = request.GET.get('perto_motoqueiro')
+    if texto_ponto:
+        try:
+            ponto = tuple(float(v) for v in texto_ponto.split(','))
+        except ValueError:
+            ponto = None
+        if ponto is None or len(ponto) != 2 or not tem_coordenadas(*ponto):
+            messages.warning(request, "Ponto inválido: use o formato latitude,longitude (ex: -3.7319,-38.5267).")
+            return None, raio
+        return ponto, raio
+    if motoqueiro_id:
+        ponto = ultimo_checkin(rota__motoqueiro_id=motoqueiro_id) if motoqueiro_id.isdigit() else None
+        if ponto is None:
+            messages.warning(request, "Este motoqueiro ainda não tem nenhum check-in com GPS.")
+        return ponto, raio
+    return None, raio
 
 # ==============================================================================
 # MÓDULO DE ACESSO E TRÁFEGO
@@ -79,17 +120,17 @@ def home(request):
         return redirect('dash_comercial')
 
     # 3. Motoqueiros -> Lista de entregas do dia
-    hoje = timezone.now().date()
+    hoje = timezone.localdate()
     
     visitas_pendentes = Visita.objects.select_related('cliente').filter(
         rota__motoqueiro=request.user,
-        rota__data_criacao__date=hoje,
+        **filtro_periodo('rota__data_criacao', hoje),
         status=STATUS_PENDENTE
-    ).order_by('cliente__bairro', 'cliente__nome')
+    ).order_by(*ORDEM_PARAGENS)
     
     visitas_finalizadas = Visita.objects.select_related('cliente').filter(
         rota__motoqueiro=request.user,
-        rota__data_criacao__date=hoje,
+        **filtro_periodo('rota__data_criacao', hoje),
     ).exclude(status=STATUS_PENDENTE).order_by('-data_visita')
 
     resumo_dia = visitas_finalizadas.aggregate(
@@ -120,106 +161,203 @@ def registrar_visita(request, id_visita):
         return redirect('home')
 
     if request.method == 'POST':
-        resultado_venda = request.POST.get('resultado_venda')
-        
         # Tentativa de capturar coordenadas GPS
         try:
-            visita.latitude_checkin = float(request.POST.get('lat'))
-            visita.longitude_checkin = float(request.POST.get('lng'))
+            latitude, longitude = float(request.POST.get('lat')), float(request.POST.get('lng'))
         except (TypeError, ValueError):
-            pass # Failsafe: Guarda sem GPS se o telemóvel falhar
+            latitude = longitude = None # Failsafe: Guarda sem GPS se o telemóvel falhar
 
-        if resultado_venda == 'SIM':
+        if request.POST.get('resultado_venda') == 'SIM':
             valor = converter_valor(request.POST.get('valor_recebido'))
-            visita.status = STATUS_REALIZADA
-            visita.valor_recebido = valor
             # O valor NÃO é mais deduzido da divida_atual do cliente aqui para evitar saldos negativos
-            visita.cliente.save()
-            
-            # Recalcula a previsão de consumo após a venda
-            atualizar_inteligencia_consumo(visita.cliente)
+            aplicar_baixa(visita, True, valor_recebido=valor, latitude=latitude, longitude=longitude)
             messages.success(request, f"Venda de R$ {valor} registada para {visita.cliente.nome}.")
-            
         else:
-            visita.status = STATUS_NAO_VENDA
-            visita.motivo_nao_venda = request.POST.get('motivo_nao_venda')
-            visita.concorrente_empresa = request.POST.get('concorrente_empresa')
-            visita.concorrente_preco = converter_valor(request.POST.get('concorrente_preco'))
-            visita.observacao = request.POST.get('observacao')
+            aplicar_baixa(
+                visita, False, latitude=latitude, longitude=longitude,
+                motivo_nao_venda=request.POST.get('motivo_nao_venda'),
+                concorrente_empresa=request.POST.get('concorrente_empresa'),
+                concorrente_preco=converter_valor(request.POST.get('concorrente_preco')),
+                observacao=request.POST.get('observacao'),
+            )
             messages.info(request, "Visita finalizada sem venda.")
-
-        visita.save()
         return redirect('home')
 
     return render(request, 'logistica/registrar_visita.html', {'visita': visita})
 
+@login_required
+def sincronizar_visitas(request):
+    """Download (JSON) das visitas do dia do motoqueiro alteradas desde ?desde=<versão anterior>."""
+    desde = sincronizacao.ler_versao(request.GET.get('desde'))
+    return JsonResponse(sincronizacao.visitas_do_dia(request.user, desde))
+
+@login_required
+@require_POST
+def sincronizar_baixas(request):
+    """Upload (JSON) de um lote de baixas feitas offline: {"baixas": [{"chave", "visita", "resultado_venda", ...}]}."""
+    try:
+        corpo = json.loads(request.body)
+        resultados = sincronizacao.aplicar_lote(request.user, corpo.get('baixas') if isinstance(corpo, dict) else None)
+    except ValueError as erro:
+        return JsonResponse({'erro': str(erro)}, status=400)
+    return JsonResponse({'resultados': resultados})
+
+def identificar_chamada(request):
+    """Caller ID (JSON): os cartões dos clientes com o telefone `?telefone=` (central telefónica ou staff)."""
+    chave = settings.CENTRAL_TELEFONICA_CHAVE
+    da_central = bool(chave) and hmac.compare_digest(request.headers.get('X-Chave-Central', ''), chave)
+    if not da_central and not request.user.is_staff:
+        return JsonResponse({'erro': "Sem permissão."}, status=403)
+
+    telefone, clientes = chamadas.identificar(request.GET.get('telefone', ''))
+    return JsonResponse({'telefone': telefone, 'clientes': clientes})
+
+@login_required
+def duplicados_clientes(request):
+    """Revisão dos clientes duplicados: deteção (worker), fusão de um grupo ou de todos os certos, e descarte."""
+    if not request.user.is_staff: 
+        return redirect('home')
+
+    if request.method == 'POST':
+        acao = request.POST.get('acao')
+        membros = [int(cid) for cid in request.POST.getlist('membros') if cid.isdigit()]
+
+        if acao == 'detectar':
+            tarefa = tarefas.enfileirar('DETECTAR_DUPLICADOS', "Deteção de clientes duplicados", criada_por=request.user)
+            return redirect('tarefa_detalhe', id_tarefa=tarefa.id)
+
+        elif acao == 'fundir_todos':
+            # Todos os grupos acima do limiar, cada um no cliente com mais histórico
+            tarefa = tarefas.enfileirar(
+                'FUNDIR_DUPLICADOS', "Fusão dos clientes duplicados sugeridos",
+                criada_por=request.user, parametros={'limiar': duplicados.LIMIAR_FUSAO_AUTOMATICA},
+            )
+            return redirect('tarefa_detalhe', id_tarefa=tarefa.id)
+
+        elif acao == 'fundir':
+            principal = int(request.POST.get('principal') or 0)
+            if principal in membros and len(membros) > 1:
+                # Um grupo é pequeno: funde já, sem passar pelo worker
+                totais = duplicados.fundir(
+                    [(principal, [cid for cid in membros if cid != principal])], fundido_por=request.user,
+                )
+                messages.success(request, f"{totais['clientes']} cliente(s) fundido(s) na ficha principal.")
+
+        elif acao == 'descartar' and membros:
+            duplicados.descartar(membros)
+            messages.success(request, "Sugestão descartada: os clientes ficam separados.")
+
+        return redirect(f"{reverse('duplicados_clientes')}?pagina={request.POST.get('pagina', 1)}")
+
+    pagina = Paginator(duplicados.grupos_sugeridos(), GRUPOS_DUPLICADOS_POR_PAGINA).get_page(request.GET.get('pagina'))
+
+    # Os membros de todos os grupos da página numa só consulta, com o histórico de cada um
+    ids = [cid for grupo in pagina.object_list for cid in grupo['ids']]
+    clientes = duplicados.com_historico(ids).in_bulk()
+    for grupo in pagina.object_list:
+        grupo['clientes'] = [clientes[cid] for cid in grupo['ids'] if cid in clientes]
+        grupo['principal'] = min(
+            grupo['clientes'], key=lambda cliente: (-(cliente.total_visitas + cliente.total_ligacoes), cliente.id),
+        ).id
+
+    context = {
+        'grupos': pagina.object_list,
+        'pagina': pagina,
+        'ultima_detecao': Tarefa.objects.filter(tipo='DETECTAR_DUPLICADOS').order_by('-id').first(),
+        'limiar_automatico': duplicados.LIMIAR_FUSAO_AUTOMATICA,
+    }
+    return render(request, 'logistica/duplicados.html', context)
+
+@login_required
+async def eventos_motoqueiro(request):
+    """Canal SSE da lista do motoqueiro: visitas novas/removidas e a ordem atual, em JSON (requer ASGI)."""
+    canal = eventos.canal_motoqueiro((await utilizador(request)).id)
+
+    async def fluxo():
+        # Assina só quando o fluxo começa: se a ligação cair antes, não fica nenhuma fila órfã
+        assinatura = eventos.backend().assinar(canal)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    mensagem = await asyncio.wait_for(assinatura.proxima(), eventos.INTERVALO_BATIMENTO)
+                except asyncio.TimeoutError:
+                    yield ": batimento\n\n"
+                    continue
+                yield f"event: visitas\ndata: {json.dumps(mensagem)}\n\n"
+        finally:
+            assinatura.fechar()
+
+    resposta = StreamingHttpResponse(fluxo(), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta
+
+@login_required
+def cartao_visita(request, id_visita):
+    """Fragmento com o cartão de uma visita pendente (inserido na lista pelos eventos)."""
+    # O fetch da lista insere a resposta tal como vem: erro sem HTML (o script ignora respostas não-ok),
+    # nunca um redirect que traria a página inicial inteira
+    visita = get_object_or_404(Visita.objects.select_related('cliente', 'rota'), pk=id_visita, status=STATUS_PENDENTE)
+    if visita.rota.motoqueiro_id != request.user.id and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return render(request, 'logistica/parciais/cartao_visita.html', {'visita': visita})
+
 # ==============================================================================
 # MÓDULO COMERCIAL (ESTAGIÁRIO / CALL CENTER)
 # ==============================================================================
 
 @login_required
-def dash_comercial(request):
-    """Cockpit de Alta Produtividade para o Agente Comercial."""
-    carteiras = Carteira.objects.filter(agente_comercial=request.user)
-    hoje = timezone.now().date()
-    
-    # 1. Identifica quem já foi contactado hoje
-    clientes_ja_ligados_ids = Ligacao.objects.filter(
-        agente=request.user, 
-        data_ligacao__date=hoje
-    ).values_list('cliente_id', flat=True)
-
-    # 2. Constrói a fila de Retornos (Follow-up)
-    ligacoes_retorno_brutas = Ligacao.objects.filter(
-        agente=request.user,
-        resultado='REAGENDADO',
-        data_retorno__lte=hoje
-    ).exclude(
-        cliente_id__in=clientes_ja_ligados_ids
-    ).select_related('cliente').order_by('data_retorno', '-data_ligacao')
-
-    # Desduplicação O(N) para mostrar o cliente apenas uma vez na fila de retornos
-    retornos_unicos = {}
-    for lig in ligacoes_retorno_brutas:
-        if lig.cliente_id not in retornos_unicos:
-            retornos_unicos[lig.cliente_id] = lig
-            
-    lista_retornos = list(retornos_unicos.values())
-    ids_clientes_retorno = [lig.cliente_id for lig in lista_retornos]
-
-    # 3. Constrói o Mailing Principal (Excluindo quem já foi contactado e quem está nos retornos)
-    clientes_principais = Cliente.objects.filter(
-        carteiras__in=carteiras
-    ).exclude(
-        id__in=clientes_ja_ligados_ids
-    ).exclude(
-        id__in=ids_clientes_retorno
-    ).distinct().order_by('nome') # Ordenação limpa alfabética
-
-    # 4. Métricas do Dia (KPIs)
-    ligacoes_hoje = Ligacao.objects.filter(agente=request.user, data_ligacao__date=hoje)
-    metricas = {
-        'total_feitas': ligacoes_hoje.count(),
-        'vendas_fechadas': ligacoes_hoje.filter(resultado='VENDA_FECHADA').count(),
-        'recusas': ligacoes_hoje.filter(resultado='RECUSA').count(),
-        'meta_diaria': 400
-    }
+async def dash_comercial(request):
+    """Cockpit de Alta Produtividade para o Agente Comercial (async: queries em paralelo)."""
+    hoje = timezone.localdate()
+    agente_id = (await utilizador(request)).id
+
+    # 1. A fila já vem priorizada do banco; só é refeita no primeiro acesso do dia
+    await sync_to_async(garantir_fila_do_dia)(agente_id, hoje)
+    fila = fila_disponivel(agente_id, hoje)
 
-    # Popula o Dropdown do Despacho (Modal de Venda)
-    motoqueiros = User.objects.filter(
-        is_active=True, 
-        is_staff=False, 
-        is_superuser=False
-    ).exclude(groups__name='Agentes Comerciais').order_by('username')
+    proximos, total_fila, lista_retornos, resumo, motoqueiros = await em_paralelo(
+        lambda: paginar_por_cursor(fila, ORDEM_FILA, tamanho=FILA_POR_PAGINA),
+        fila.count,
+        # 2. Retornos (Follow-up) com data vencida
+        lambda: list(retornos_do_dia(agente_id, hoje)),
+        # 3. Métricas do Dia (KPIs), lidas do resumo diário do agente
+        lambda: ResumoDiarioLigacoes.objects.filter(dia=hoje, agente_id=agente_id).aggregate(
+            total_feitas=Sum('quantidade', default=0),
+            vendas_fechadas=Sum('quantidade', filter=Q(resultado='VENDA_FECHADA'), default=0),
+            recusas=Sum('quantidade', filter=Q(resultado='RECUSA'), default=0),
+        ),
+        referencias.motoqueiros,
+    )
+    metricas = {**resumo, 'meta_diaria': 400}
 
     context = {
-        'clientes_principais': clientes_principais,
-        'clientes': clientes_principais, # Resolvendo o erro de fallback no template
+        'fila': proximos,
+        'total_fila': total_fila,
+        'url_mais_fila': url_proxima_pagina(request, 'dash_comercial_proximos', proximos),
         'lista_retornos': lista_retornos,
         'metricas': metricas,
-        'motoqueiros': motoqueiros
+        'motoqueiros': motoqueiros,
     }
-    return render(request, 'logistica/dash_comercial.html', context)
+    return await renderizar(request, 'logistica/dash_comercial.html', context)
+
+@login_required
+def dash_comercial_proximos(request):
+    """Fragmento com os próximos N contactos da fila do agente (scroll infinito do cockpit)."""
+    try:
+        tamanho = min(max(int(request.GET.get('quantidade', FILA_POR_PAGINA)), 1), 100)
+    except ValueError:
+        tamanho = FILA_POR_PAGINA
+
+    proximos = paginar_por_cursor(
+        fila_disponivel(request.user.id), ORDEM_FILA, cursor=request.GET.get('cursor'), tamanho=tamanho
+    )
+    context = {
+        'fila': proximos,
+        'url_mais_fila': url_proxima_pagina(request, 'dash_comercial_proximos', proximos),
+    }
+    return render(request, 'logistica/parciais/fila_contatos.html', context)
 
 @login_required
 @transaction.atomic
@@ -251,7 +389,7 @@ def registrar_ligacao(request, cliente_id):
                 conc_preco = converter_valor(request.POST.get('concorrente_preco'))
 
         # Regista a ligação no banco de dados para a auditoria do Gerente
-        Ligacao.objects.create(
+        ligacao = Ligacao.objects.create(
             agente=request.user, 
             cliente=cliente, 
             resultado=resultado, 
@@ -261,6 +399,8 @@ def registrar_ligacao(request, cliente_id):
             concorrente_empresa=conc_empresa,
             concorrente_preco=conc_preco
         )
+        contabilizar_ligacao(ligacao)
+        sincronizar_fila(request.user.id, [cliente.id])
 
         # Se foi venda, gera a entrega na hora
         if resultado == 'VENDA_FECHADA':
@@ -272,16 +412,16 @@ def registrar_ligacao(request, cliente_id):
                 forma_pagamento = request.POST.get('forma_pagamento', '')
                 tipo_botijao = request.POST.get('tipo_botijao', '')
                 
-                hoje = timezone.now().date()
+                hoje = timezone.localdate()
                 nome_rota = f"Rota Comercial {hoje.strftime('%d/%m')}"
                 
                 # Usa filter().first() para evitar MultipleObjectsReturned
-                rota = Rota.objects.filter(motoqueiro=motoqueiro, data_criacao__date=hoje, nome=nome_rota).first()
+                rota = Rota.objects.filter(motoqueiro=motoqueiro, nome=nome_rota, **filtro_periodo('data_criacao', hoje)).first()
                 if not rota:
                     rota = Rota.objects.create(motoqueiro=motoqueiro, nome=nome_rota)
                 
                 # Cria a Visita Pendente na rua
-                Visita.objects.create(
+                visita = Visita.objects.create(
                     rota=rota, 
                     cliente=cliente, 
                     status=STATUS_PENDENTE, 
@@ -290,6 +430,10 @@ def registrar_ligacao(request, cliente_id):
                     tipo_botijao=tipo_botijao,
                     observacao=f"Venda Telemarketing ({request.user.username}): {obs}"
                 )
+                contabilizar_visitas_criadas(rota, 1)
+                sequenciar_rota(rota)
+                # Aparece na lista do motoqueiro sem ele recarregar a página
+                eventos.avisar_motoqueiro(motoqueiro.id, novas=[visita.id])
                 messages.success(request, f"Venda despachada para o motoqueiro {motoqueiro.username}!")
             else:
                 messages.error(request, "Erro: Tem de selecionar o Motoqueiro para despachar.")
@@ -303,91 +447,54 @@ def registrar_ligacao(request, cliente_id):
 # ==============================================================================
 
 @login_required
-def dashboard(request):
-    """Painel de Receitas e Desempenho com Inteligência de Mercado Combinada."""
-    if not request.user.is_staff: 
+async def dashboard(request):
+    """Painel de Receitas e Desempenho com Inteligência de Mercado Combinada (async: queries em paralelo)."""
+    if not (await utilizador(request)).is_staff: 
         return redirect('home')
     
     # Captura as datas do filtro (GET)
-    data_inicio_str = request.GET.get('data_inicio')
-    data_fim_str = request.GET.get('data_fim')
-    hoje = timezone.now().date()
-    
-    try:
-        data_inicio = datetime.datetime.strptime(data_inicio_str, '%Y-%m-%d').date() if data_inicio_str else hoje
-        data_fim = datetime.datetime.strptime(data_fim_str, '%Y-%m-%d').date() if data_fim_str else hoje
-    except ValueError:
-        data_inicio = hoje
-        data_fim = hoje
+    data_inicio, data_fim = ler_periodo(request)
+    hoje = timezone.localdate()
 
-    # Prevenção: Inverte as datas se o utilizador colocar o fim antes do início
-    if data_inicio > data_fim: 
-        data_inicio, data_fim = data_fim, data_inicio
+    visitas_periodo = Visita.objects.filter(**filtro_periodo('rota__data_criacao', data_inicio, data_fim))
+    dias = (data_inicio, data_fim)
+    limite_inativo = hoje - datetime.timedelta(days=15)
 
-    visitas_periodo = Visita.objects.filter(
-        rota__data_criacao__date__gte=data_inicio, 
-        rota__data_criacao__date__lte=data_fim
-    )
-    
-    ligacoes_periodo = Ligacao.objects.filter(
-        data_ligacao__date__gte=data_inicio, 
-        data_ligacao__date__lte=data_fim
-    )
-    
-    resumo = visitas_periodo.aggregate(
-        total_recebido=Sum('valor_recebido'),
-        pendentes=Count('id', filter=Q(status=STATUS_PENDENTE)),
-        vendas=Count('id', filter=Q(status=STATUS_REALIZADA)),
-        total_perdas=Count('id', filter=Q(status=STATUS_NAO_VENDA)), 
-        concorrencia=Count('id', filter=Q(motivo_nao_venda='CONCORRENCIA')),
-        estoque=Count('id', filter=Q(motivo_nao_venda='NAO_PRECISA'))
+    # As consultas são independentes: correm ao mesmo tempo, cada uma com a sua ligação
+    resumo, resumo_ligacoes, dados_unificados, historico, qtd_inativos = await em_paralelo(
+        # Totais lidos dos resumos diários (algumas linhas por dia, independente do volume)
+        lambda: ResumoDiarioVisitas.objects.filter(dia__range=dias).aggregate(
+            total_recebido=Sum('valor_recebido'),
+            pendentes=Sum('quantidade', filter=Q(status=STATUS_PENDENTE), default=0),
+            vendas=Sum('quantidade', filter=Q(status=STATUS_REALIZADA), default=0),
+            total_perdas=Sum('quantidade', filter=Q(status=STATUS_NAO_VENDA), default=0), 
+            concorrencia=Sum('quantidade', filter=Q(motivo_nao_venda='CONCORRENCIA'), default=0),
+            estoque=Sum('quantidade', filter=Q(motivo_nao_venda='NAO_PRECISA'), default=0)
+        ),
+        lambda: ResumoDiarioLigacoes.objects.filter(dia__range=dias).aggregate(
+            total=Sum('quantidade', default=0),
+            recusas=Sum('quantidade', filter=Q(resultado='RECUSA'), default=0),
+        ),
+        # Inteligência da concorrência: o resumo já junta Rua + Telefone num único GROUP BY
+        lambda: list(
+            ResumoDiarioConcorrencia.objects.filter(dia__range=dias)
+            .values('concorrente_empresa')
+            .annotate(total=Sum('quantidade'))
+            .filter(total__gt=0)
+            .order_by('-total')
+        ),
+        lambda: paginar_por_cursor(
+            visitas_periodo.select_related('cliente', 'rota__motoqueiro'), ORDEM_HISTORICO_VISITAS
+        ),
+        lambda: Cliente.objects.filter(
+            Q(data_ultima_venda__lt=limite_inativo) | Q(data_ultima_venda__isnull=True)
+        ).count(),
     )
+    perdas_comercial = resumo_ligacoes['recusas']
+    qtd_ligacoes = resumo_ligacoes['total']
 
-    perdas_comercial = ligacoes_periodo.filter(resultado='RECUSA').count()
-
-    # ==========================================================
-    # INTELIGÊNCIA DA CONCORRÊNCIA (Motoqueiros + Call Center)
-    # ==========================================================
-    dados_concorrencia_visitas = list(
-        visitas_periodo.filter(motivo_nao_venda='CONCORRENCIA')
-        .exclude(concorrente_empresa__isnull=True)
-        .exclude(concorrente_empresa='')
-        .values('concorrente_empresa')
-        .annotate(total=Count('id'))
-    )
-    
-    dados_concorrencia_ligacoes = list(
-        ligacoes_periodo.filter(motivo_nao_venda='CONCORRENCIA')
-        .exclude(concorrente_empresa__isnull=True)
-        .exclude(concorrente_empresa='')
-        .values('concorrente_empresa')
-        .annotate(total=Count('id'))
-    )
-    
-    # Agrupa os dados das duas tabelas (Rua + Telefone) num único Dicionário
-    concorrencia_dict = {}
-    for item in dados_concorrencia_visitas:
-        concorrencia_dict[item['concorrente_empresa']] = item['total']
-        
-    for item in dados_concorrencia_ligacoes:
-        emp = item['concorrente_empresa']
-        concorrencia_dict[emp] = concorrencia_dict.get(emp, 0) + item['total']
-        
-    # Transforma o dicionário novamente em lista e ordena para o Gráfico
-    dados_unificados = [{'concorrente_empresa': k, 'total': v} for k, v in concorrencia_dict.items()]
-    dados_unificados.sort(key=lambda x: x['total'], reverse=True)
-    
     labels_concorrencia = json.dumps([item['concorrente_empresa'] for item in dados_unificados])
     valores_concorrencia = json.dumps([item['total'] for item in dados_unificados])
-    # ==========================================================
-
-    historico = visitas_periodo.select_related('cliente', 'rota__motoqueiro').order_by('-data_visita')
-    qtd_ligacoes = ligacoes_periodo.count()
-    
-    limite_inativo = hoje - datetime.timedelta(days=15)
-    qtd_inativos = Cliente.objects.filter(
-        Q(data_ultima_venda__lt=limite_inativo) | Q(data_ultima_venda__isnull=True)
-    ).count()
 
     context = {
         'total_dinheiro': resumo['total_recebido'] or 0,
@@ -400,6 +507,7 @@ def dashboard(request):
         'qtd_ligacoes': qtd_ligacoes,
         'qtd_inativos': qtd_inativos,
         'historico': historico,
+        'url_mais_historico': url_proxima_pagina(request, 'dashboard_historico', historico),
         'data_inicio': data_inicio,
         'data_fim': data_fim,
         
@@ -408,55 +516,180 @@ def dashboard(request):
         'valores_concorrencia': valores_concorrencia,
         'tem_dados_concorrencia': len(dados_unificados) > 0
     }
-    return render(request, 'logistica/dashboard.html', context)
+    return await renderizar(request, 'logistica/dashboard.html', context)
 
 @login_required
-def relatorio_auditoria(request):
-    """O 'Dedo Duro' - Linha do tempo de cliques e filtro de período."""
+def dashboard_historico(request):
+    """Fragmento (scroll infinito) com a página seguinte do histórico de movimentações."""
+    if not request.user.is_staff: 
+        return HttpResponseForbidden()
+
+    data_inicio, data_fim = ler_periodo(request)
+    historico = paginar_por_cursor(
+        Visita.objects.filter(**filtro_periodo('rota__data_criacao', data_inicio, data_fim))
+        .select_related('cliente', 'rota__motoqueiro'),
+        ORDEM_HISTORICO_VISITAS,
+        cursor=request.GET.get('cursor'),
+    )
+    context = {
+        'historico': historico,
+        'url_mais_historico': url_proxima_pagina(request, 'dashboard_historico', historico),
+    }
+    return render(request, 'logistica/parciais/historico_movimentacoes.html', context)
+
+@login_required
+def estatisticas_cache(request):
+    """Acertos e falhas do cache das listas de referência e dos cartões do caller ID (diagnóstico para o gerente)."""
     if not request.user.is_staff: 
         return redirect('home')
-    
-    data_inicio_str = request.GET.get('data_inicio')
-    data_fim_str = request.GET.get('data_fim')
-    hoje = timezone.now().date()
-    
+    return JsonResponse({'listas': referencias.estatisticas(), 'chamadas': chamadas.cache_cartoes.estatisticas()})
+
+@login_required
+def precos_concorrencia(request):
+    """Tendência semanal (JSON) dos preços da concorrência, por concorrente e por bairro, lida dos resumos diários."""
+    if not request.user.is_staff: 
+        return redirect('home')
+
+    data_inicio, data_fim = ler_periodo(request)
+    if not request.GET.get('data_inicio'):
+        # Sem início, as últimas semanas até ao fim (uma tendência de um só dia não diz nada)
+        data_inicio = data_fim - datetime.timedelta(weeks=SEMANAS_TENDENCIA_PRECOS)
+    tendencia = tendencia_precos(
+        data_inicio, data_fim, bairro=request.GET.get('bairro'), concorrente=request.GET.get('concorrente'),
+    )
+    return JsonResponse({'data_inicio': data_inicio.isoformat(), 'data_fim': data_fim.isoformat(), **tendencia})
+
+@login_required
+def metricas_desempenho(request):
+    """Percentis de tempo de resposta, queries e renderização por view (todos os workers)."""
+    if not request.user.is_staff: 
+        return redirect('home')
+
+    opcoes_horas = (1, 24, 168)
     try:
-        data_inicio = datetime.datetime.strptime(data_inicio_str, '%Y-%m-%d').date() if data_inicio_str else hoje
-        data_fim = datetime.datetime.strptime(data_fim_str, '%Y-%m-%d').date() if data_fim_str else hoje
+        horas = int(request.GET.get('horas', 24))
     except ValueError:
-        data_inicio = hoje
-        data_fim = hoje
+        horas = 24
+    if horas not in opcoes_horas:
+        horas = 24
+
+    context = {
+        'linhas': metricas.armazem.resumo(horas),
+        'horas': horas,
+        'opcoes_horas': opcoes_horas,
+        'metricas_ativas': settings.METRICAS_ATIVAS,
+        'limite_lento_ms': settings.METRICAS_LIMITE_LENTO_MS,
+        'cache': referencias.estatisticas(),
+    }
+    return render(request, 'logistica/metricas.html', context)
 
-    if data_inicio > data_fim: 
-        data_inicio, data_fim = data_fim, data_inicio
+@login_required
+def relatorio_auditoria(request):
+    """O 'Dedo Duro' - Linha do tempo de cliques e filtro de período."""
+    if not request.user.is_staff: 
+        return redirect('home')
+    
+    data_inicio, data_fim = ler_periodo(request)
     
-    ligacoes = Ligacao.objects.filter(
-        data_ligacao__date__gte=data_inicio, 
-        data_ligacao__date__lte=data_fim
-    ).select_related('agente', 'cliente').order_by('-data_ligacao')
+    ligacoes = paginar_por_cursor(_ligacoes_auditoria(data_inicio, data_fim), ORDEM_HISTORICO_LIGACOES)
     
-    ranking = Ligacao.objects.filter(
-        data_ligacao__date__gte=data_inicio, 
-        data_ligacao__date__lte=data_fim
+    ranking = list(Ligacao.objects.filter(
+        **filtro_periodo('data_ligacao', data_inicio, data_fim)
     ).values('agente__username').annotate(
         total=Count('id'), 
         vendas=Count('id', filter=Q(resultado='VENDA_FECHADA'))
-    ).order_by('-total')
+    ).order_by('-total'))
 
-    visitas_rua = Visita.objects.filter(
-        data_visita__date__gte=data_inicio, 
-        data_visita__date__lte=data_fim
-    ).exclude(status=STATUS_PENDENTE).select_related('cliente', 'rota__motoqueiro').order_by('-data_visita')
+    visitas_periodo = _visitas_auditoria(data_inicio, data_fim)
+    visitas_rua = paginar_por_cursor(visitas_periodo, ORDEM_HISTORICO_VISITAS)
 
     context = {
         'data_inicio': data_inicio, 
         'data_fim': data_fim, 
         'ligacoes': ligacoes, 
+        'url_mais_ligacoes': url_proxima_pagina(request, 'auditoria_ligacoes', ligacoes),
+        'total_ligacoes': sum(r['total'] for r in ranking),
         'ranking_comercial': ranking, 
-        'visitas_rua': visitas_rua
+        'visitas_rua': visitas_rua,
+        'url_mais_visitas': url_proxima_pagina(request, 'auditoria_visitas', visitas_rua),
+        'total_visitas_rua': visitas_periodo.aggregate(total=Count('id'))['total'],
     }
     return render(request, 'logistica/relatorio_auditoria.html', context)
 
+def _ligacoes_auditoria(data_inicio, data_fim):
+    return Ligacao.objects.filter(
+        **filtro_periodo('data_ligacao', data_inicio, data_fim)
+    ).select_related('agente', 'cliente')
+
+def _visitas_auditoria(data_inicio, data_fim):
+    return Visita.objects.filter(
+        **filtro_periodo('data_visita', data_inicio, data_fim)
+    ).exclude(status=STATUS_PENDENTE).select_related('cliente', 'rota__motoqueiro')
+
+@login_required
+def auditoria_ligacoes(request):
+    """Fragmento (scroll infinito) com a página seguinte do log de cliques."""
+    if not request.user.is_staff: 
+        return HttpResponseForbidden()
+
+    data_inicio, data_fim = ler_periodo(request)
+    ligacoes = paginar_por_cursor(
+        _ligacoes_auditoria(data_inicio, data_fim), ORDEM_HISTORICO_LIGACOES, cursor=request.GET.get('cursor')
+    )
+    context = {
+        'ligacoes': ligacoes,
+        'url_mais_ligacoes': url_proxima_pagina(request, 'auditoria_ligacoes', ligacoes),
+    }
+    return render(request, 'logistica/parciais/auditoria_ligacoes.html', context)
+
+@login_required
+def auditoria_visitas(request):
+    """Fragmento (scroll infinito) com a página seguinte das baixas de rua."""
+    if not request.user.is_staff: 
+        return HttpResponseForbidden()
+
+    data_inicio, data_fim = ler_periodo(request)
+    visitas_rua = paginar_por_cursor(
+        _visitas_auditoria(data_inicio, data_fim), ORDEM_HISTORICO_VISITAS, cursor=request.GET.get('cursor')
+    )
+    context = {
+        'visitas_rua': visitas_rua,
+        'url_mais_visitas': url_proxima_pagina(request, 'auditoria_visitas', visitas_rua),
+    }
+    return render(request, 'logistica/parciais/auditoria_visitas.html', context)
+
+def _exportar(request, queryset_do_periodo, colunas, nome):
+    if not request.user.is_staff: 
+        return redirect('home')
+
+    data_inicio, data_fim = ler_periodo(request)
+    formato = request.GET.get('formato', 'csv')
+    if formato not in exportacao.FORMATOS:
+        formato = 'csv'
+    return exportacao.resposta_csv(
+        request, queryset_do_periodo(data_inicio, data_fim), colunas,
+        f"{nome}_{data_inicio:%Y%m%d}_{data_fim:%Y%m%d}", formato,
+    )
+
+@login_required
+def exportar_ligacoes(request):
+    """Exporta (CSV ou CSV gzip, em streaming) as ligações do período."""
+    return _exportar(request, exportacao.ligacoes_do_periodo, exportacao.COLUNAS_LIGACOES, 'ligacoes')
+
+@login_required
+def exportar_visitas(request):
+    """Exporta (CSV ou CSV gzip, em streaming) as visitas do período."""
+    return _exportar(request, exportacao.visitas_do_periodo, exportacao.COLUNAS_VISITAS, 'visitas')
+
+@login_required
+def auditoria_visita_detalhe(request, id_visita):
+    """Corpo do modal de detalhes de uma baixa (carregado apenas ao clicar na linha)."""
+    if not request.user.is_staff: 
+        return HttpResponseForbidden()
+
+    v = get_object_or_404(Visita.objects.select_related('cliente', 'rota__motoqueiro'), pk=id_visita)
+    return render(request, 'logistica/parciais/auditoria_visita_detalhe.html', {'v': v})
+
 @login_required
 @transaction.atomic
 def distribuir_rotas(request):
@@ -470,60 +703,12 @@ def distribuir_rotas(request):
         if acao == 'importar_csv':
             arquivo = request.FILES.get('arquivo_csv')
             if arquivo:
-                try:
-                    decoded = arquivo.read().decode('utf-8', errors='replace')
-                    io_string = io.StringIO(decoded)
-                    primeira_linha = io_string.readline()
-                    delimiter = ';' if ';' in primeira_linha else ','
-                    io_string.seek(0)
-                    reader = csv.reader(io_string, delimiter=delimiter)
-                    
-                    header = []
-                    col_map = {}
-                    contagem = 0
-                    
-                    for row in reader:
-                        row_clean = [str(c).strip() for c in row if c]
-                        if not row_clean: 
-                            continue
-                            
-                        if not header:
-                            row_lower = [c.lower() for c in row_clean]
-                            header = row_lower
-                            for i, col in enumerate(header):
-                                if 'nome resp' in col or ('nome' in col and 'nome' not in col_map): col_map['nome'] = i
-                                elif 'endere' in col: col_map['endereco'] = i
-                                elif 'número' in col or 'numero' in col: col_map['numero'] = i
-                                elif 'bairro' in col: col_map['bairro'] = i
-                                elif 'telefone' in col: col_map['telefone'] = i
-                            continue
-
-                        if header and 'nome' in col_map:
-                            try:
-                                raw_nome = row_clean[col_map['nome']]
-                                if not raw_nome or raw_nome.isdigit(): 
-                                    continue
-                                    
-                                end = row_clean[col_map.get('endereco', 0)] if 'endereco' in col_map else ""
-                                num = row_clean[col_map.get('numero', 0)] if 'numero' in col_map else ""
-                                bairro = row_clean[col_map.get('bairro', 0)] if 'bairro' in col_map else "Bairro não informado"
-                                tel = row_clean[col_map.get('telefone', 0)] if 'telefone' in col_map else ""
-                                
-                                Cliente.objects.get_or_create(
-                                    nome=raw_nome[:100], 
-                                    defaults={
-                                        'endereco': f"{end}, {num}".strip(' ,-'), 
-                                        'bairro': bairro[:50], 
-                                        'telefone': tel.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')[:20]
-                                    }
-                                )
-                                contagem += 1
-                            except Exception: 
-                                continue
-                                
-                    messages.success(request, f"Sucesso! {contagem} novos clientes adicionados à base geral.")
-                except Exception as e: 
-                    messages.error(request, f"Erro na leitura: {str(e)}")
+                # A importação corre no worker (processar_tarefas); o gerente acompanha a barra de progresso
+                tarefa = tarefas.enfileirar(
+                    'IMPORTAR_CLIENTES', f"Importação de {arquivo.name} para a base geral",
+                    criada_por=request.user, arquivo=arquivo,
+                )
+                return redirect('tarefa_detalhe', id_tarefa=tarefa.id)
                     
             return redirect('distribuir_rotas')
             
@@ -532,49 +717,59 @@ def distribuir_rotas(request):
             c_ids = request.POST.getlist('clientes_ids')
             if motoqueiro_id and c_ids:
                 motoqueiro = get_object_or_404(User, id=motoqueiro_id)
-                hoje = timezone.now().date()
+                hoje = timezone.localdate()
                 nome_rota = f"Rota {hoje.strftime('%d/%m')}"
                 
-                rota = Rota.objects.filter(motoqueiro=motoqueiro, data_criacao__date=hoje, nome=nome_rota).first()
+                rota = Rota.objects.filter(motoqueiro=motoqueiro, nome=nome_rota, **filtro_periodo('data_criacao', hoje)).first()
                 if not rota:
                     rota = Rota.objects.create(nome=nome_rota, motoqueiro=motoqueiro)
                     
-                Visita.objects.bulk_create([Visita(rota=rota, cliente_id=int(cid)) for cid in c_ids])
+                novas = Visita.objects.bulk_create([Visita(rota=rota, cliente_id=int(cid)) for cid in c_ids])
+                contabilizar_visitas_criadas(rota, len(novas))
+                sequenciar_rota(rota)
+                eventos.avisar_motoqueiro(motoqueiro.id, novas=[visita.id for visita in novas])
                 messages.success(request, f"Rota enviada para {motoqueiro.username}.")
                 return redirect('distribuir_rotas')
 
     bairro = request.GET.get('bairro')
     carteira_id = request.GET.get('carteira')
     status_filter = request.GET.get('status')
+    ponto, raio = ler_filtro_proximidade(request)
     
-    clientes = Cliente.objects.all().order_by('bairro', 'nome')
+    clientes = Cliente.objects.para_planeamento().order_by('bairro', 'nome', 'id')
     if bairro: 
         clientes = clientes.filter(bairro=bairro)
     if carteira_id: 
         clientes = clientes.filter(carteiras__id=carteira_id)
+    if ponto:
+        clientes = clientes.perto_de(ponto[0], ponto[1], raio)
         
-    # Filtros de Inteligência
+    # Filtros de Inteligência (executados no SQL sobre as colunas indexadas do ciclo)
     if status_filter == 'VIRADOS': 
-        clientes = [c for c in clientes if c.is_virado]
+        clientes = clientes.virados()
     elif status_filter == 'ATRASADOS': 
-        clientes = [c for c in clientes if c.is_atrasado]
+        clientes = clientes.atrasados()
     elif status_filter == 'SEM_HISTORICO': 
-        clientes = [c for c in clientes if c.data_ultima_venda is None]
+        clientes = clientes.sem_historico()
+    elif status_filter == 'PREVISTOS':
+        # Proposta de hoje do comando noturno prever_procura, pela ordem da lista de cada motoqueiro
+        clientes = clientes.filter(propostas__dia=timezone.localdate()).order_by('propostas__motoqueiro', 'propostas__posicao')
 
-    motoqueiros = User.objects.filter(
-        is_active=True, 
-        is_staff=False, 
-        is_superuser=False
-    ).exclude(groups__name='Agentes Comerciais').order_by('username')
+    pagina = Paginator(clientes, CLIENTES_POR_PAGINA).get_page(request.GET.get('pagina'))
 
     context = {
-        'clientes': clientes, 
-        'bairros': Cliente.objects.values_list('bairro', flat=True).distinct().order_by('bairro'), 
-        'carteiras': Carteira.objects.all(), 
-        'motoqueiros': motoqueiros, 
+        'clientes': pagina.object_list, 
+        'pagina': pagina,
+        'bairros': referencias.bairros(), 
+        'carteiras': referencias.carteiras(), 
+        'motoqueiros': referencias.motoqueiros(), 
         'filtro_bairro': bairro, 
         'filtro_carteira': int(carteira_id) if carteira_id else None, 
-        'filtro_status': status_filter
+        'filtro_status': status_filter,
+        'filtro_ponto': request.GET.get('ponto', ''),
+        'filtro_perto_motoqueiro': request.GET.get('perto_motoqueiro', ''),
+        'filtro_raio': raio,
+        'raios_proximidade': RAIOS_PROXIMIDADE_M,
     }
     return render(request, 'logistica/distribuir_rotas.html', context)
 
@@ -591,12 +786,14 @@ def cadastrar_cliente(request):
     if request.method == 'POST':
         nome = request.POST.get('nome')
         if nome:
-            Cliente.objects.create(
+            cliente = Cliente.objects.create(
                 nome=nome, 
-                telefone=request.POST.get('telefone', '').replace(' ', '').replace('-', '').replace('(', '').replace(')', '')[:20], 
+                telefone=limpar_telefone(request.POST.get('telefone', '')), 
                 endereco=request.POST.get('endereco', ''), 
                 bairro=request.POST.get('bairro', 'Não Informado')
             )
+            # O cadastro rápido não tem GPS: as coordenadas vêm do endereço, em segundo plano (só deste cliente)
+            tarefas.enfileirar_geocodificacao(request.user, cliente=cliente)
             messages.success(request, f"Cliente {nome} cadastrado com sucesso!")
         else: 
             messages.error(request, "O nome é obrigatório.")
@@ -612,14 +809,49 @@ def gerenciar_carteiras(request):
         
     if request.method == 'POST':
         acao = request.POST.get('acao')
+        if acao in ('simular_territorios', 'aplicar_territorios'):
+            return dividir_territorios(request, aplicar=acao == 'aplicar_territorios')
         if acao == 'criar': 
             Carteira.objects.create(nome=request.POST.get('nome'), cor_etiqueta=request.POST.get('cor'))
         elif acao == 'excluir_carteira': 
-            Carteira.objects.filter(id=request.POST.get('id_carteira')).delete()
+            carteira = Carteira.objects.filter(id=request.POST.get('id_carteira')).first()
+            if carteira:
+                agente_id = carteira.agente_comercial_id
+                carteira.delete()
+                if agente_id:
+                    sincronizar_fila(agente_id)
             
         return redirect('gerenciar_carteiras')
         
-    return render(request, 'logistica/carteiras.html', {'carteiras': Carteira.objects.all().order_by('nome')})
+    return render(request, 'logistica/carteiras.html', {
+        'carteiras': Carteira.objects.com_resumo().order_by('nome'),
+        'criterios_territorio': territorios.CRITERIOS,
+    })
+
+
+def dividir_territorios(request, aplicar):
+    """Divide os clientes com GPS pelas carteiras (k-means equilibrado) e mostra o antes/depois."""
+    try:
+        quantidade = int(request.POST.get('territorios') or 0) or None
+    except ValueError:
+        quantidade = None
+    criterio = request.POST.get('criterio', 'clientes')
+
+    try:
+        plano = territorios.planear(quantidade, criterio)
+    except ValueError as erro:
+        messages.error(request, str(erro))
+        return redirect('gerenciar_carteiras')
+
+    if aplicar:
+        territorios.aplicar(plano)
+        messages.success(request, f"Territórios gravados: {plano.clientes_movidos} clientes mudaram de carteira.")
+    return render(request, 'logistica/carteiras.html', {
+        'carteiras': Carteira.objects.com_resumo().order_by('nome'),
+        'criterios_territorio': territorios.CRITERIOS,
+        'plano_territorios': plano,
+        'territorios_aplicados': aplicar,
+    })
 
 
 @login_required
@@ -629,10 +861,11 @@ def detalhes_carteira(request, id_carteira):
     if not request.user.is_staff: 
         return redirect('home')
         
-    carteira = get_object_or_404(Carteira, pk=id_carteira)
+    carteira = get_object_or_404(Carteira.objects.select_related('motoqueiro', 'agente_comercial'), pk=id_carteira)
     
     if request.method == 'POST':
         acao = request.POST.get('acao')
+        agente_anterior_id = carteira.agente_comercial_id
         
         # Edição de Nome da Carteira e Cor
         if acao == 'editar_carteira':
@@ -663,103 +896,96 @@ def detalhes_carteira(request, id_carteira):
             if agente_id:
                 carteira.agente_comercial = get_object_or_404(User, id=agente_id)
                 carteira.save()
+                # A carteira muda de fila: sai da do agente anterior e entra na do novo
+                for afetado_id in {agente_anterior_id, carteira.agente_comercial_id} - {None}:
+                    sincronizar_fila(afetado_id)
                 messages.success(request, f"Comercial {carteira.agente_comercial.username} definido!")
                 
         elif acao == 'remover_agente':
             carteira.agente_comercial = None
             carteira.save()
+            if agente_anterior_id:
+                sincronizar_fila(agente_anterior_id)
             messages.info(request, "Agente Comercial removido da carteira.")
             
         # Movimentação de Clientes Individuais
         elif acao == 'remover_cliente': 
-            carteira.clientes.remove(request.POST.get('remover_id'))
+            remover_id = request.POST.get('remover_id')
+            carteira.clientes.remove(remover_id)
+            if carteira.agente_comercial_id:
+                sincronizar_fila(carteira.agente_comercial_id, [remover_id])
             
         elif acao == 'adicionar_clientes':
             ids = request.POST.getlist('clientes_ids')
             if ids: 
                 carteira.clientes.add(*ids)
+                if carteira.agente_comercial_id:
+                    sincronizar_fila(carteira.agente_comercial_id, ids)
                 
         # Importação Local da Carteira
         elif acao == 'importar_csv':
             arquivo = request.FILES.get('arquivo_csv')
             if arquivo:
-                try:
-                    decoded = arquivo.read().decode('utf-8', errors='replace')
-                    io_string = io.StringIO(decoded)
-                    primeira_linha = io_string.readline()
-                    delimiter = ';' if ';' in primeira_linha else ','
-                    io_string.seek(0)
-                    reader = csv.reader(io_string, delimiter=delimiter)
-                    
-                    header = []
-                    col_map = {}
-                    contagem = 0
-                    
-                    for row in reader:
-                        row_clean = [str(c).strip() for c in row if c]
-                        if not row_clean: 
-                            continue
-                            
-                        if not header:
-                            row_lower = [c.lower() for c in row_clean]
-                            header = row_lower
-                            for i, col in enumerate(header):
-                                if 'nome resp' in col or ('nome' in col and 'nome' not in col_map): col_map['nome'] = i
-                                elif 'endere' in col: col_map['endereco'] = i
-                                elif 'número' in col or 'numero' in col: col_map['numero'] = i
-                                elif 'bairro' in col: col_map['bairro'] = i
-                                elif 'telefone' in col: col_map['telefone'] = i
-                            continue
-
-                        if header and 'nome' in col_map:
-                            try:
-                                raw_nome = row_clean[col_map['nome']]
-                                if not raw_nome or raw_nome.isdigit(): 
-                                    continue
-                                    
-                                end = row_clean[col_map.get('endereco', 0)] if 'endereco' in col_map else ""
-                                num = row_clean[col_map.get('numero', 0)] if 'numero' in col_map else ""
-                                bairro = row_clean[col_map.get('bairro', 0)] if 'bairro' in col_map else "Bairro não informado"
-                                tel = row_clean[col_map.get('telefone', 0)] if 'telefone' in col_map else ""
-                                
-                                cli_obj, _ = Cliente.objects.get_or_create(
-                                    nome=raw_nome[:100], 
-                                    defaults={
-                                        'endereco': f"{end}, {num}".strip(' ,-'), 
-                                        'bairro': bairro[:50], 
-                                        'telefone': tel.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')[:20]
-                                    }
-                                )
-                                cli_obj.carteiras.add(carteira)
-                                contagem += 1
-                            except Exception: 
-                                continue
-                                
-                    messages.success(request, f"Sucesso! {contagem} clientes incorporados nesta carteira.")
-                except Exception as e: 
-                    messages.error(request, f"Erro na leitura: {str(e)}")
+                tarefa = tarefas.enfileirar(
+                    'IMPORTAR_CLIENTES', f"Importação de {arquivo.name} para a carteira {carteira.nome}",
+                    criada_por=request.user, parametros={'carteira_id': carteira.id}, arquivo=arquivo,
+                )
+                return redirect('tarefa_detalhe', id_tarefa=tarefa.id)
                     
         return redirect('detalhes_carteira', id_carteira=id_carteira)
 
-    motoqueiros = User.objects.filter(
-        is_active=True, 
-        is_staff=False, 
-        is_superuser=False
-    ).exclude(groups__name='Agentes Comerciais').order_by('username')
-    
-    agentes = User.objects.filter(
-        is_active=True
-    ).exclude(groups__name='Motoqueiros').exclude(is_superuser=True).order_by('username')
+    # Contagens numa única agregação (sem carregar as listas completas)
+    contagens = Cliente.objects.aggregate(
+        total=Count('id', distinct=True),
+        membros=Count('id', filter=Q(carteiras=carteira), distinct=True),
+    )
+    clientes = paginar_por_cursor(carteira.clientes.com_estado_ciclo(), ORDEM_CLIENTES)
+    clientes_livres = paginar_por_cursor(Cliente.objects.exclude(carteiras=carteira), ORDEM_CLIENTES)
 
     context = {
         'carteira': carteira, 
-        'clientes': carteira.clientes.all().order_by('bairro', 'nome'), 
-        'motoqueiros': motoqueiros, 
-        'agentes': agentes, 
-        'clientes_livres': Cliente.objects.exclude(carteiras=carteira).order_by('bairro', 'nome')
+        'clientes': clientes, 
+        'url_mais_membros': url_proxima_pagina(request, 'carteira_membros', clientes, carteira.id),
+        'total_membros': contagens['membros'],
+        'motoqueiros': referencias.motoqueiros(), 
+        'agentes': referencias.agentes(), 
+        'clientes_livres': clientes_livres,
+        'url_mais_livres': url_proxima_pagina(request, 'carteira_clientes_livres', clientes_livres, carteira.id),
+        'total_livres': contagens['total'] - contagens['membros'],
     }
     return render(request, 'logistica/detalhes_carteira.html', context)
 
+@login_required
+def carteira_membros(request, id_carteira):
+    """Fragmento (scroll infinito) com a página seguinte dos membros da carteira."""
+    if not request.user.is_staff: 
+        return HttpResponseForbidden()
+
+    carteira = get_object_or_404(Carteira, pk=id_carteira)
+    clientes = paginar_por_cursor(carteira.clientes.com_estado_ciclo(), ORDEM_CLIENTES, cursor=request.GET.get('cursor'))
+    context = {
+        'carteira': carteira,
+        'clientes': clientes,
+        'url_mais_membros': url_proxima_pagina(request, 'carteira_membros', clientes, carteira.id),
+    }
+    return render(request, 'logistica/parciais/carteira_membros.html', context)
+
+@login_required
+def carteira_clientes_livres(request, id_carteira):
+    """Fragmento (scroll infinito) com a página seguinte dos clientes fora da carteira."""
+    if not request.user.is_staff: 
+        return HttpResponseForbidden()
+
+    carteira = get_object_or_404(Carteira, pk=id_carteira)
+    clientes_livres = paginar_por_cursor(
+        Cliente.objects.exclude(carteiras=carteira), ORDEM_CLIENTES, cursor=request.GET.get('cursor')
+    )
+    context = {
+        'clientes_livres': clientes_livres,
+        'url_mais_livres': url_proxima_pagina(request, 'carteira_clientes_livres', clientes_livres, carteira.id),
+    }
+    return render(request, 'logistica/parciais/carteira_clientes_livres.html', context)
+
 
 # ==============================================================================
 # PERFIL E CRM (GERENCIAMENTO INDIVIDUAL DO CLIENTE)
@@ -777,23 +1003,33 @@ def detalhes_cliente(request, id_cliente):
         acao = request.POST.get('acao')
         
         if acao == 'editar':
+            endereco_anterior = (cliente.endereco, cliente.bairro)
             cliente.nome = request.POST.get('nome', cliente.nome)
-            cliente.telefone = request.POST.get('telefone', cliente.telefone).replace(' ', '').replace('-', '').replace('(', '').replace(')', '')[:20]
+            cliente.telefone = limpar_telefone(request.POST.get('telefone', cliente.telefone))
             cliente.endereco = request.POST.get('endereco', cliente.endereco)
             cliente.bairro = request.POST.get('bairro', cliente.bairro)
             cliente.documento = request.POST.get('documento', '')
             cliente.email = request.POST.get('email', '')
             cliente.observacoes_gerais = request.POST.get('observacoes_gerais', '')
+            # Coordenadas aproximadas de um endereço antigo deixam de valer: volta a ser geocodificado
+            mudou_endereco = (cliente.endereco, cliente.bairro) != endereco_anterior
+            if mudou_endereco and cliente.geocodificacao:
+                cliente.latitude = cliente.longitude = None
+                cliente.geocodificacao = ''
             cliente.save()
+            if mudou_endereco and cliente.latitude is None:
+                tarefas.enfileirar_geocodificacao(request.user, cliente=cliente)
             
             messages.success(request, f"Ficha de {cliente.nome} atualizada com sucesso!")
             return redirect('detalhes_cliente', id_cliente=cliente.id)
             
         elif acao == 'excluir':
-            nome_apagado = cliente.nome
-            cliente.delete()
-            messages.success(request, f"O cliente '{nome_apagado}' foi excluído.")
-            return redirect('distribuir_rotas')
+            # Com muito histórico (visitas, ligações, resumos) a exclusão é pesada: vai para o worker
+            tarefa = tarefas.enfileirar(
+                'EXCLUIR_CLIENTE', f"Exclusão do cliente {cliente.nome}",
+                criada_por=request.user, parametros={'cliente_id': cliente.id},
+            )
+            return redirect('tarefa_detalhe', id_tarefa=tarefa.id)
 
     historico_visitas = Visita.objects.filter(cliente=cliente).order_by('-data_visita')[:15]
     historico_ligacoes = Ligacao.objects.filter(cliente=cliente).order_by('-data_ligacao')[:15]
@@ -803,4 +1039,75 @@ def detalhes_cliente(request, id_cliente):
         'historico_visitas': historico_visitas, 
         'historico_ligacoes': historico_ligacoes
     }
-    return render(request, 'logistica/detalhes_cliente.html', context)
\ No newline at end of file
+    return render(request, 'logistica/detalhes_cliente.html', context)
+
+@login_required
+def buscar_clientes(request):
+    """Typeahead (JSON): os clientes que melhor correspondem a `q`. Os agentes só veem os das suas carteiras."""
+    clientes = Cliente.objects.all()
+    if not request.user.is_staff:
+        membros = Carteira.clientes.through.objects.filter(carteira__agente_comercial=request.user)
+        clientes = clientes.filter(id__in=membros.values('cliente_id'))
+
+    resultados = [
+        {
+            'id': cliente.id,
+            'nome': cliente.nome,
+            'telefone': cliente.telefone,
+            'endereco': cliente.endereco,
+            'bairro': cliente.bairro,
+            'url_ligacao': reverse('registrar_ligacao', args=[cliente.id]),
+            'url_ficha': reverse('detalhes_cliente', args=[cliente.id]) if request.user.is_staff else None,
+        }
+        for cliente in busca.buscar(request.GET.get('q', ''), clientes)
+    ]
+    return JsonResponse({'resultados': resultados})
+
+# ==============================================================================
+# TAREFAS EM SEGUNDO PLANO (PROGRESSO DAS IMPORTAÇÕES E EXCLUSÕES)
+# ==============================================================================
+
+TAREFAS_RECENTES = 30
+
+def _destino_tarefa(tarefa):
+    """Ecrã para onde o gerente volta no fim da tarefa."""
+    if tarefa.tipo == 'IMPORTAR_CLIENTES' and tarefa.parametros.get('carteira_id'):
+        return reverse('detalhes_carteira', args=[tarefa.parametros['carteira_id']])
+    if tarefa.tipo in ('DETECTAR_DUPLICADOS', 'FUNDIR_DUPLICADOS'):
+        return reverse('duplicados_clientes')
+    return reverse('distribuir_rotas')
+
+@login_required
+def tarefas_recentes(request):
+    """Lista das últimas tarefas em segundo plano e do seu estado."""
+    if not request.user.is_staff: 
+        return redirect('home')
+
+    lista = Tarefa.objects.select_related('criada_por').order_by('-id')[:TAREFAS_RECENTES]
+    return render(request, 'logistica/tarefas.html', {'tarefas': lista})
+
+@login_required
+def tarefa_detalhe(request, id_tarefa):
+    """Barra de progresso de uma tarefa (atualizada por tarefa_estado) e o resultado no fim."""
+    if not request.user.is_staff: 
+        return redirect('home')
+
+    tarefa = get_object_or_404(Tarefa.objects.select_related('criada_por'), pk=id_tarefa)
+    return render(request, 'logistica/tarefa.html', {'tarefa': tarefa, 'url_destino': _destino_tarefa(tarefa)})
+
+@login_required
+def tarefa_estado(request, id_tarefa):
+    """Estado e progresso (JSON) de uma tarefa, consultado pela página enquanto ela corre."""
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+
+    tarefa = get_object_or_404(Tarefa.objects, pk=id_tarefa)
+    return JsonResponse({
+        'estado': tarefa.estado,
+        'estado_display': tarefa.get_estado_display(),
+        'percentual': tarefa.percentual,
+        'progresso_atual': tarefa.progresso_atual,
+        'progresso_total': tarefa.progresso_total,
+        'mensagem': tarefa.mensagem,
+        'terminada': tarefa.terminada,
+    })